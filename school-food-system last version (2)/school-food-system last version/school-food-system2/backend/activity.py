@@ -0,0 +1,222 @@
+"""User activity log.
+
+Events are cheap to record and plentiful (page views, clicks, logins), so the
+request that produces one only appends it to an in-memory buffer. A
+background thread writes the buffer with one `executemany` + commit when
+`flush_interval` seconds have passed or `max_buffer` events are waiting.
+
+Rows live in one table per calendar month (`activity_YYYYMM`, append-only,
+indexed on `(user_id, ts)`). Retention drops whole month tables older than
+`retention_months`, which costs the same no matter how many rows they hold.
+Reads page backwards through the month tables with a `(ts, id)` keyset.
+
+Events still in the buffer when the process dies are lost; that is the
+trade-off for keeping commits out of the request path.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Optional
+
+from db import connect
+
+logger = logging.getLogger(__name__)
+
+TABLE_PREFIX = "activity_"
+_TABLE_RE = re.compile(r"^activity_(\d{6})$")
+
+TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    ts TEXT NOT NULL,
+    action TEXT NOT NULL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_{table}_user_ts ON {table}(user_id, ts);
+"""
+
+
+def _now_ts() -> str:
+    # Millisecond precision keeps events of one request burst in order.
+    return datetime.utcnow().isoformat(timespec="milliseconds")
+
+
+def table_for(ts: str) -> str:
+    return TABLE_PREFIX + ts[:4] + ts[5:7]
+
+
+def month_tables(conn: sqlite3.Connection) -> list[str]:
+    """Existing activity tables, newest month first."""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'activity\\_%' ESCAPE '\\'"
+    ).fetchall()
+    return sorted((r[0] for r in rows if _TABLE_RE.match(r[0])), reverse=True)
+
+
+class ActivityLog:
+    """In-memory buffer in front of the month tables, flushed by a daemon thread."""
+
+    def __init__(self, db_path: str, flush_interval: float = 1.0, max_buffer: int = 500,
+                 retention_months: int = 6) -> None:
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retention_months = retention_months
+        # Bounded so that a stuck DB cannot eat the process' memory; oldest events go first.
+        self._buffer: deque[tuple[int, str, str, Optional[str]]] = deque(maxlen=max_buffer * 20)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._known_tables: set[str] = set()
+        self._last_retention = 0.0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="activity-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- writing ----
+    def log(self, user_id: int, action: str, details: Any = None) -> dict[str, Any]:
+        """Buffer one event; never touches the DB."""
+        ts = _now_ts()
+        event = (int(user_id), ts, str(action)[:100],
+                 json.dumps(details, ensure_ascii=False) if details not in (None, {}) else None)
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.max_buffer
+        if full:
+            self._wake.set()
+        return {"userId": event[0], "timestamp": ts, "action": event[2], "details": details}
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self) -> int:
+        """Write buffered events; returns how many. Safe to call from any thread."""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._buffer)
+                self._buffer.clear()
+            if not batch:
+                return 0
+
+            by_table: dict[str, list[tuple[int, str, str, Optional[str]]]] = {}
+            for event in batch:
+                by_table.setdefault(table_for(event[1]), []).append(event)
+
+            conn = connect(self.db_path)
+            try:
+                for table, rows in by_table.items():
+                    if table not in self._known_tables:
+                        conn.executescript(TABLE_SQL.format(table=table))
+                        self._known_tables.add(table)
+                    conn.executemany(
+                        f"INSERT INTO {table} (user_id, ts, action, details) VALUES (?, ?, ?, ?)", rows
+                    )
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                with self._lock:
+                    # Put the batch back in front of anything logged meanwhile; retried next tick.
+                    newer = list(self._buffer)
+                    self._buffer.clear()
+                    self._buffer.extend(batch + newer)
+                logger.exception("activity flush failed; %d events kept for retry", len(batch))
+                return 0
+            finally:
+                conn.close()
+            return len(batch)
+
+    def enforce_retention(self, now: Optional[datetime] = None) -> list[str]:
+        """Drop month tables older than `retention_months`; returns dropped names."""
+        now = now or datetime.utcnow()
+        months = now.year * 12 + now.month - 1 - (self.retention_months - 1)
+        oldest_kept = f"{TABLE_PREFIX}{months // 12:04d}{months % 12 + 1:02d}"
+        conn = connect(self.db_path)
+        try:
+            dropped = [t for t in month_tables(conn) if t < oldest_kept]
+            for table in dropped:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.commit()
+        finally:
+            conn.close()
+        self._known_tables.difference_update(dropped)
+        return dropped
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._last_retention > 3600:
+                    self._last_retention = time.monotonic()
+                    self.enforce_retention()
+            except Exception:
+                logger.exception("activity flush thread error")
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+
+def read_page(conn: sqlite3.Connection, user_id: int, before: Optional[tuple[str, int]] = None,
+              limit: int = 50) -> tuple[list[dict[str, Any]], Optional[str]]:
+    """Newest-first page of a user's events.
+
+    `before` is the `(ts, id)` of the last event of the previous page; the
+    returned cursor encodes the same for the next page (None at the end).
+    """
+    items: list[dict[str, Any]] = []
+    rows_seen: list[tuple[str, int]] = []
+    for table in month_tables(conn):
+        if before is not None and table > table_for(before[0]):
+            continue
+        sql = f"SELECT id, user_id, ts, action, details FROM {table} WHERE user_id = ?"
+        params: list[Any] = [user_id]
+        if before is not None and table == table_for(before[0]):
+            sql += " AND (ts < ? OR (ts = ? AND id < ?))"
+            params += [before[0], before[0], before[1]]
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(limit + 1 - len(items))
+        for r in conn.execute(sql, params):
+            try:
+                details = json.loads(r["details"]) if r["details"] else {}
+            except ValueError:
+                details = {}
+            items.append({"id": f"{r['ts']}|{r['id']}", "userId": r["user_id"], "timestamp": r["ts"],
+                          "action": r["action"], "details": details})
+            rows_seen.append((r["ts"], r["id"]))
+        if len(items) > limit:
+            break
+
+    if len(items) > limit:
+        items = items[:limit]
+        ts, row_id = rows_seen[limit - 1]
+        return items, f"{ts}|{row_id}"
+    return items, None
+
+
+def parse_cursor(value: Optional[str]) -> Optional[tuple[str, int]]:
+    """`"<ts>|<id>"` -> (ts, id); raises ValueError on garbage."""
+    if not value:
+        return None
+    ts, _, row_id = value.rpartition("|")
+    if not ts:
+        raise ValueError(value)
+    datetime.fromisoformat(ts)
+    return ts, int(row_id)
@@ -0,0 +1,171 @@
+"""Allergen dictionary and per-row allergen bitmasks.
+
+Every allergen named in the menu gets one row in `allergens` with its own
+bit (0..62, so a mask fits a signed 64-bit SQLite integer):
+
+- `menu_items.allergen_mask` has the bits of the dish's allergens;
+- `users.allergy_mask` has the bits of every dictionary allergen that
+  matches one of the student's allergies.
+
+A dish conflicts with a student when `m.allergen_mask & u.allergy_mask` is
+not zero, which `GET /api/menu` and the subscription orders check in SQL
+instead of parsing both JSON lists per row.
+
+Names match the way the student page always compared them: ignoring case,
+and one containing the other ("орехи" matches "грецкие орехи"). A new menu
+allergen therefore also adds its bit to the students it matches. Masks are
+NULL for rows written outside the API (seed data, bulk loaders);
+`index_missing` fills them in and runs when the app starts.
+
+    python backend/allergens.py reindex
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from typing import Any, Iterable, Optional
+
+from db import connect, initialize_database, parse_json_list, utcnow_iso
+
+MAX_ALLERGENS = 63
+
+
+def normalize(name: Any) -> str:
+    return " ".join(str(name).split()).casefold()
+
+
+def _matches(allergy: str, allergen: str) -> bool:
+    return allergy in allergen or allergen in allergy
+
+
+def load_dictionary(conn: sqlite3.Connection) -> dict[str, int]:
+    """Normalized allergen name -> bit."""
+    return {r["name"]: r["bit"] for r in conn.execute("SELECT name, bit FROM allergens")}
+
+
+def matching_mask(dictionary: dict[str, int], allergies: Iterable[Any]) -> int:
+    """Bits of the dictionary allergens that conflict with `allergies`."""
+    mask = 0
+    for allergy in {normalize(a) for a in allergies} - {""}:
+        for name, bit in dictionary.items():
+            if _matches(allergy, name):
+                mask |= 1 << bit
+    return mask
+
+
+def conflicting(allergens: list[str], dictionary: dict[str, int], mask: int) -> list[str]:
+    """The names from a dish's `allergens` whose bits are set in `mask`."""
+    return [a for a in allergens if normalize(a) in dictionary and (mask >> dictionary[normalize(a)]) & 1]
+
+
+def _add_allergens(conn: sqlite3.Connection, names: set[str]) -> dict[str, int]:
+    """Add the missing names to the dictionary; returns the new ones with their bits."""
+    known = load_dictionary(conn)
+    free = [b for b in range(MAX_ALLERGENS) if b not in set(known.values())]
+    added: dict[str, int] = {}
+    now = utcnow_iso()
+    for name in sorted(names - set(known)):
+        if not free:
+            raise ValueError(f"too many distinct allergens (max {MAX_ALLERGENS})")
+        bit = free.pop(0)
+        conn.execute("INSERT INTO allergens (name, bit, created_at) VALUES (?, ?, ?)", (name, bit, now))
+        added[name] = bit
+    if added:
+        # Students whose allergies match a new name get its bit; others are unaffected.
+        updates = []
+        for r in conn.execute(
+            "SELECT id, allergies FROM users WHERE allergy_mask IS NOT NULL AND allergies IS NOT NULL"
+        ):
+            extra = matching_mask(added, parse_json_list(r["allergies"]))
+            if extra:
+                updates.append((extra, r["id"]))
+        conn.executemany("UPDATE users SET allergy_mask = allergy_mask | ? WHERE id = ?", updates)
+    return added
+
+
+def index_menu_items(conn: sqlite3.Connection, item_ids: Optional[list[int]] = None) -> int:
+    """Set dish masks from their `allergens`: the given dishes, or every dish
+    without a mask (caller commits). Returns the number of dishes."""
+    if item_ids is None:
+        rows = conn.execute("SELECT id, allergens FROM menu_items WHERE allergen_mask IS NULL").fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT id, allergens FROM menu_items WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(item_ids),),
+        ).fetchall()
+    parsed = [(r["id"], {normalize(a) for a in parse_json_list(r["allergens"])} - {""}) for r in rows]
+    _add_allergens(conn, set().union(*(names for _, names in parsed)))
+    dictionary = load_dictionary(conn)
+    masks = []
+    for item_id, names in parsed:
+        mask = 0
+        for name in names:
+            mask |= 1 << dictionary[name]
+        masks.append((mask, item_id))
+    conn.executemany("UPDATE menu_items SET allergen_mask = ? WHERE id = ?", masks)
+    return len(masks)
+
+
+def index_user(conn: sqlite3.Connection, user_id: int) -> None:
+    """Set the student's mask from their `allergies` (caller commits)."""
+    row = conn.execute("SELECT allergies FROM users WHERE id = ?", (user_id,)).fetchone()
+    if row is None:
+        return
+    mask = matching_mask(load_dictionary(conn), parse_json_list(row["allergies"]))
+    conn.execute("UPDATE users SET allergy_mask = ? WHERE id = ?", (mask, user_id))
+
+
+def index_missing(conn: sqlite3.Connection) -> dict[str, int]:
+    """Fill in NULL masks: dishes first (they extend the dictionary), then users."""
+    try:
+        items = index_menu_items(conn)
+        dictionary = load_dictionary(conn)
+        users = conn.execute("SELECT id, allergies FROM users WHERE allergy_mask IS NULL").fetchall()
+        conn.executemany(
+            "UPDATE users SET allergy_mask = ? WHERE id = ?",
+            [(matching_mask(dictionary, parse_json_list(r["allergies"])), r["id"]) for r in users],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"menuItems": items, "users": len(users)}
+
+
+def reindex(conn: sqlite3.Connection) -> dict[str, int]:
+    """Rebuild the dictionary and every mask (after editing rows by hand)."""
+    try:
+        conn.execute("UPDATE menu_items SET allergen_mask = NULL")
+        conn.execute("UPDATE users SET allergy_mask = NULL")
+        conn.execute("DELETE FROM allergens")
+    except Exception:
+        conn.rollback()
+        raise
+    return index_missing(conn)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Allergen dictionary and masks")
+    parser.add_argument("command", choices=("reindex", "missing"))
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    initialize_database(db_path)
+    conn = connect(db_path)
+    try:
+        result = reindex(conn) if args.command == "reindex" else index_missing(conn)
+    finally:
+        conn.close()
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
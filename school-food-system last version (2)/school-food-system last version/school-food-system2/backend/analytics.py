@@ -0,0 +1,286 @@
+"""Meal coverage and nutrition analytics.
+
+Triggers on `orders` (see `db.create_meal_triggers`) keep two aggregates up
+to date as orders are placed, cancelled, moved or deleted:
+
+- `meal_cube`: orders, portions and calories per day x class x meal x
+  status x dish, sliced by `query_cube` along any of those dimensions (and
+  by week or month);
+- `meal_student_days`: one row per student and day with breakfasts,
+  lunches and calories of the orders that were not cancelled. It backs the
+  coverage heatmaps (`coverage`: students who ate, per class and day or
+  week, against the class size) and the student's weekly calories
+  (`student_weeks`).
+
+Every query reads only these tables, so a school year of 40 classes is one
+indexed scan instead of a pass over all orders. A student's day keeps the
+class they were in when the day's first order was placed; `rebuild`
+recomputes both tables from `orders` and the archived orders (keeping
+those classes), e.g. after loading orders with the triggers dropped.
+
+    python backend/analytics.py rebuild
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from typing import Any, Optional
+
+from archive import attached, orders_source
+from db import connect, initialize_database, to_rubles
+
+WEEK_SQL = "date({col}, 'weekday 0', '-6 days')"
+
+# API name -> expression over meal_cube `c`
+CUBE_DIMENSIONS = {
+    "date": "c.date",
+    "week": WEEK_SQL.format(col="c.date"),
+    "month": "substr(c.date, 1, 7)",
+    "class": "c.class",
+    "mealType": "c.meal_type",
+    "status": "c.status",
+    "menuId": "c.menu_item_id",
+}
+
+# API name -> expression over meal_student_days `d`
+COVERAGE_DIMENSIONS = {
+    "date": "d.date",
+    "week": WEEK_SQL.format(col="d.date"),
+    "month": "substr(d.date, 1, 7)",
+    "class": "d.class",
+}
+
+_ATE_SQL = {
+    None: "d.breakfasts + d.lunches > 0",
+    "breakfast": "d.breakfasts > 0",
+    "lunch": "d.lunches > 0",
+}
+
+
+def _in(column: str, values: Optional[list[Any]], params: list[Any]) -> str:
+    if not values:
+        return ""
+    params.append(json.dumps(values))
+    return f" AND {column} IN (SELECT value FROM json_each(?))"
+
+
+def query_cube(conn: sqlite3.Connection, group_by: list[str], date_from: str, date_to: str, *,
+               classes: Optional[list[str]] = None, meal_type: Optional[str] = None,
+               statuses: Optional[list[str]] = None, menu_ids: Optional[list[int]] = None) -> list[dict[str, Any]]:
+    """Orders, portions and calories in [date_from, date_to], summed per `group_by`
+    (keys of CUBE_DIMENSIONS; none gives one total row)."""
+    dims = [(name, CUBE_DIMENSIONS[name]) for name in group_by]
+    params: list[Any] = [date_from, date_to]
+    where = "c.date BETWEEN ? AND ?"
+    where += _in("c.class", classes, params)
+    if meal_type:
+        where += " AND c.meal_type = ?"
+        params.append(meal_type)
+    where += _in("c.status", statuses, params)
+    where += _in("c.menu_item_id", menu_ids, params)
+
+    select = "".join(f"{expr} AS \"{name}\", " for name, expr in dims)
+    positions = ", ".join(str(i + 1) for i in range(len(dims)))
+    group = f" GROUP BY {positions} ORDER BY {positions}" if dims else ""
+    rows = conn.execute(
+        f"SELECT {select}SUM(c.orders) AS orders, SUM(c.quantity) AS quantity, SUM(c.calories) AS calories "
+        f"FROM meal_cube c WHERE {where}{group}",
+        params,
+    ).fetchall()
+
+    result = []
+    for r in rows:
+        item = {name: r[name] for name, _ in dims}
+        item.update(orders=r["orders"] or 0, quantity=r["quantity"] or 0, calories=r["calories"] or 0)
+        result.append(item)
+    if "menuId" in group_by and result:
+        names = dict(conn.execute(
+            "SELECT id, name FROM menu_items WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(sorted({r["menuId"] for r in result})),),
+        ).fetchall())
+        for item in result:
+            item["menuName"] = names.get(item["menuId"])
+    return result
+
+
+def coverage(conn: sqlite3.Connection, group_by: list[str], date_from: str, date_to: str, *,
+             classes: Optional[list[str]] = None, meal_type: Optional[str] = None) -> list[dict[str, Any]]:
+    """Students who ate (a meal of `meal_type`, or any) per `group_by` (keys of
+    COVERAGE_DIMENSIONS), in one query.
+
+    `students` counts each student once per group, `studentDays` once per
+    day; `classSize` is the number of active students today (of the class,
+    or of all selected classes when not grouping by class).
+    """
+    dims = [(name, COVERAGE_DIMENSIONS[name]) for name in group_by]
+    params: list[Any] = []
+    size_where = _in("class", classes, params)
+    params += [date_from, date_to]
+    where = f"d.date BETWEEN ? AND ? AND {_ATE_SQL[meal_type]}" + _in("d.class", classes, params)
+
+    select = "".join(f"{expr} AS \"{name}\", " for name, expr in dims)
+    positions = ", ".join(str(i + 1) for i in range(len(dims)))
+    group = f" GROUP BY {positions}" if dims else ""
+    order = f" ORDER BY {positions}" if dims else ""
+    # Class sizes are joined once per class, not looked up per group
+    if "class" in group_by:
+        size_join, size = " LEFT JOIN sizes s ON s.class = g.class", "s.size"
+    else:
+        size_join, size = "", "(SELECT SUM(size) FROM sizes)"
+    rows = conn.execute(
+        f"""WITH sizes AS (
+                SELECT class, COUNT(1) AS size
+                FROM (SELECT COALESCE(class, '') AS class FROM users WHERE role = 'student' AND is_active = 1)
+                WHERE 1{size_where}
+                GROUP BY class)
+            SELECT g.*, {size} AS class_size
+            FROM (SELECT {select}COUNT(DISTINCT d.student_id) AS students, COUNT(1) AS student_days,
+                         COUNT(DISTINCT d.date) AS days
+                  FROM meal_student_days d WHERE {where}{group}) g{size_join}{order}""",
+        params,
+    ).fetchall()
+
+    result = []
+    for r in rows:
+        if dims and not r["student_days"]:
+            continue
+        item = {name: r[name] for name, _ in dims}
+        class_size = r["class_size"] or 0
+        item.update(
+            students=r["students"],
+            studentDays=r["student_days"],
+            days=r["days"],
+            classSize=class_size,
+            coverage=round(r["students"] / class_size, 4) if class_size else None,
+            dailyCoverage=round(r["student_days"] / (r["days"] * class_size), 4) if class_size and r["days"] else None,
+        )
+        result.append(item)
+    return result
+
+
+def student_weeks(conn: sqlite3.Connection, student_id: int, date_from: str, date_to: str) -> list[dict[str, Any]]:
+    """The student's meals and calories per week (Monday first), oldest first."""
+    rows = conn.execute(
+        f"""SELECT {WEEK_SQL.format(col="date")} AS week, COUNT(1) AS days, SUM(breakfasts) AS breakfasts,
+                   SUM(lunches) AS lunches, SUM(calories) AS calories
+            FROM meal_student_days
+            WHERE student_id = ? AND date BETWEEN ? AND ? AND breakfasts + lunches > 0
+            GROUP BY 1 ORDER BY 1""",
+        (student_id, date_from, date_to),
+    ).fetchall()
+    return [
+        {
+            "week": r["week"],
+            "days": r["days"],
+            "breakfasts": r["breakfasts"],
+            "lunches": r["lunches"],
+            "calories": r["calories"],
+            "avgDailyCalories": round(r["calories"] / r["days"]),
+        }
+        for r in rows
+    ]
+
+
+def school_summary(conn: sqlite3.Connection, date_from: str, date_to: str) -> dict[str, Any]:
+    """One school's headline numbers for [date_from, date_to] (district reports)."""
+    settings = conn.execute("SELECT school_name FROM settings WHERE id = 1").fetchone()
+    students = conn.execute("SELECT COUNT(1) FROM users WHERE role = 'student' AND is_active = 1").fetchone()[0]
+    by_status = {r["status"]: r for r in query_cube(conn, ["status"], date_from, date_to)}
+    placed = [r for status, r in by_status.items() if status != "cancelled"]
+    ate = coverage(conn, [], date_from, date_to)[0]
+    with attached(conn, date_from, date_to) as schemas:
+        revenue = conn.execute(
+            f"""SELECT COALESCE(SUM(total_price), 0) FROM {orders_source(conn, schemas)} o
+                WHERE o.order_date BETWEEN ? AND ? AND o.status IN ('paid','received')""",
+            (date_from, date_to),
+        ).fetchone()[0]
+    return {
+        "name": (settings["school_name"] if settings else "") or "",
+        "students": students,
+        "orders": sum(r["orders"] for r in placed),
+        "cancelled": by_status["cancelled"]["orders"] if "cancelled" in by_status else 0,
+        "portions": sum(r["quantity"] for r in placed),
+        "calories": sum(r["calories"] for r in placed),
+        "revenue": to_rubles(revenue),
+        "studentsAte": ate["students"],
+        "coverage": round(ate["students"] / students, 4) if students else None,
+    }
+
+
+_REBUILD_DAYS_SQL = """
+INSERT INTO meal_student_days (student_id, date, class, breakfasts, lunches, calories)
+SELECT o.student_id, o.order_date, COALESCE(k.class, u.class, ''),
+       SUM(o.meal_type = 'breakfast' AND o.status != 'cancelled'),
+       SUM(o.meal_type = 'lunch' AND o.status != 'cancelled'),
+       SUM(CASE WHEN o.status != 'cancelled' THEN COALESCE(m.calories, 0) * COALESCE(o.quantity, 1) ELSE 0 END)
+FROM {orders} o
+LEFT JOIN temp.meal_classes k ON k.student_id = o.student_id AND k.date = o.order_date
+LEFT JOIN users u ON u.id = o.student_id
+LEFT JOIN menu_items m ON m.id = o.menu_item_id
+GROUP BY o.student_id, o.order_date
+"""
+
+_REBUILD_CUBE_SQL = """
+INSERT INTO meal_cube (date, class, meal_type, status, menu_item_id, orders, quantity, calories)
+SELECT o.order_date, d.class, o.meal_type, o.status, o.menu_item_id, COUNT(1), SUM(COALESCE(o.quantity, 1)),
+       SUM(COALESCE(m.calories, 0) * COALESCE(o.quantity, 1))
+FROM {orders} o
+JOIN meal_student_days d ON d.student_id = o.student_id AND d.date = o.order_date
+LEFT JOIN menu_items m ON m.id = o.menu_item_id
+GROUP BY 1, 2, 3, 4, 5
+"""
+
+
+def rebuild(conn: sqlite3.Connection) -> dict[str, int]:
+    """Recompute both tables from `orders` and the archived orders, keeping the
+    classes already recorded."""
+    with attached(conn) as schemas:
+        orders = orders_source(conn, schemas)
+        try:
+            conn.execute("DROP TABLE IF EXISTS temp.meal_classes")
+            conn.execute("CREATE TEMP TABLE meal_classes AS SELECT student_id, date, class FROM meal_student_days")
+            conn.execute("DELETE FROM meal_cube")
+            conn.execute("DELETE FROM meal_student_days")
+            days = conn.execute(_REBUILD_DAYS_SQL.format(orders=orders)).rowcount
+            cells = conn.execute(_REBUILD_CUBE_SQL.format(orders=orders)).rowcount
+            conn.execute("DROP TABLE temp.meal_classes")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return {"studentDays": days, "cubeCells": cells}
+
+
+def build_missing(conn: sqlite3.Connection) -> Optional[dict[str, int]]:
+    """Build the tables for orders that predate them (first start after upgrading)."""
+    empty = conn.execute(
+        "SELECT EXISTS (SELECT 1 FROM orders) AND NOT EXISTS (SELECT 1 FROM meal_student_days)"
+    ).fetchone()[0]
+    return rebuild(conn) if empty else None
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Meal analytics tables")
+    parser.add_argument("command", choices=("rebuild",))
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    initialize_database(db_path)
+    conn = connect(db_path)
+    try:
+        result = rebuild(conn)
+    finally:
+        conn.close()
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
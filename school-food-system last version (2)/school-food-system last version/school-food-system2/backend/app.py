@@ -1,12 +1,41 @@
 from __future__ import annotations
 
+import json
 import os
+import random
 import sqlite3
+import time
+import uuid
+from contextlib import nullcontext
+from datetime import date, timedelta
 from typing import Any, Optional
 
-from flask import Flask, jsonify, request, send_from_directory, g
+from flask import Flask, Response, jsonify, request, send_file, send_from_directory, g, has_request_context
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from activity import ActivityLog, parse_cursor, read_page as read_activity_page
+from allergens import (
+    conflicting,
+    index_menu_items,
+    index_missing as index_allergen_masks,
+    index_user,
+    load_dictionary,
+    matching_mask,
+)
+from analytics import (
+    COVERAGE_DIMENSIONS,
+    CUBE_DIMENSIONS,
+    build_missing as build_meal_analytics,
+    coverage as meal_coverage,
+    query_cube,
+    rebuild as rebuild_meal_analytics,
+    school_summary,
+    student_weeks,
+)
+from archive import archive_orders, archive_row_to_api, archived_totals, archived_years, attached, orders_source
+from backup import backup as run_backup, list_backups
+from columnar import export as export_columnar
+from critical import event_row_to_api, sweep as sweep_critical_events
 from db import (
     initialize_database,
     connect,
@@ -14,34 +43,402 @@ from db import (
     today_str,
     parse_json_list,
     dump_json,
+    to_kopecks,
+    to_rubles,
+)
+from forecast import ForecastCache
+from ledger import (
+    PAYMENT_METHODS,
+    InsufficientFunds,
+    payment_row_to_api,
+    post_entries,
+    post_entry,
+    reconcile,
+    record_opening_balances,
+    set_balance,
+    snapshot_balances,
+    statement,
+)
+from maintenance import (
+    expire_stock,
+    optimize_database,
+    purge_notifications,
+    rollup_statistics,
+    statistics_row_to_api,
+)
+from menus import (
+    MAX_BULK_ITEMS,
+    MAX_WEEKS,
+    apply_template,
+    copy_weeks,
+    create_template,
+    insert_menu_items,
+    menu_item_values,
+    template_item_to_api,
+    template_row_to_api,
+    week_has_menu,
+    week_start,
+)
+from metrics import MetricsRegistry, STATEMENT_BUCKETS, render_prometheus
+from profiling import ProfileStore, RequestProfile
+from recorder import TrafficRecorder, snapshot_db, snapshot_path
+from scheduler import Scheduler, request_run as request_job_run
+from slowlog import SlowQueryLog
+from stock import (
+    CONSUMING_STATUSES,
+    consume_orders,
+    movement_row_to_api,
+    reconcile as reconcile_stock,
+    record_movement,
+    record_opening_stock,
+    snapshot_stock,
+)
+from subscriptions import PLAN_MEALS, add_school_days, count_school_days, run_daily as run_subscriptions_daily
+from sync import current_version, purge_tombstones, purged_through, read_changes
+from tenants import (
+    DEFAULT_TENANT,
+    ConnectionPool,
+    Tenant,
+    TenantExists,
+    TenantPathMiddleware,
+    TenantRegistry,
+    UnknownTenant,
 )
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FRONTEND_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", "school-food-system"))
-DB_PATH = os.path.join(BASE_DIR, "data", "school_food.sqlite3")
+# SCHOOL_FOOD_DB points the app at another DB file (benchmarks, replays, staging copies)
+DB_PATH = os.environ.get("SCHOOL_FOOD_DB") or os.path.join(BASE_DIR, "data", "school_food.sqlite3")
+# Students per POST /api/orders/batch (a class, or a few)
+MAX_CLASS_ORDER = 500
 
 
-def create_app() -> Flask:
+def create_app(db_path: Optional[str] = None) -> Flask:
     app = Flask(__name__)
     # Ensure UTF-8 JSON output (Flask 3 uses UTF-8 by default; this keeps backward compatibility)
     app.config["JSON_AS_ASCII"] = False
     app.config["FRONTEND_DIR"] = FRONTEND_DIR
-    app.config["DB_PATH"] = DB_PATH
-
-    # Create DB + seed demo data on first run
-    initialize_database(DB_PATH)
+    app.config["DB_PATH"] = db_path or DB_PATH
+    # Shared directory for per-worker metric snapshots (multi-process deployments)
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR") or None
+    # Statements slower than this are aggregated in the slow query log (negative = off)
+    app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", "100"))
+    # Request profiling: ring buffer location/size and the share of requests sampled (0 = admin-triggered only)
+    app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR") or os.path.join(BASE_DIR, "data", "profiles")
+    app.config["PROFILE_KEEP"] = int(os.environ.get("PROFILE_KEEP", "50"))
+    app.config["PROFILE_SAMPLE_RATE"] = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+    # Append anonymized API traffic to this JSONL file for backend/replay.py (off when empty)
+    app.config["RECORD_TRAFFIC"] = os.environ.get("RECORD_TRAFFIC") or None
+    app.config["RECORD_TRAFFIC_SALT"] = os.environ.get("RECORD_TRAFFIC_SALT") or None
+    # User activity log: buffered in memory, written every N seconds or every N events; months kept
+    app.config["ACTIVITY_FLUSH_INTERVAL"] = float(os.environ.get("ACTIVITY_FLUSH_INTERVAL", "1.0"))
+    app.config["ACTIVITY_BUFFER_SIZE"] = int(os.environ.get("ACTIVITY_BUFFER_SIZE", "500"))
+    app.config["ACTIVITY_RETENTION_MONTHS"] = int(os.environ.get("ACTIVITY_RETENTION_MONTHS", "6"))
+    # Critical events: warn about stock expiring within N days and high-urgency requests pending N hours;
+    # the time-based sweep runs at most once per CRITICAL_SWEEP_SECONDS when the events are read
+    app.config["CRITICAL_EXPIRY_DAYS"] = int(os.environ.get("CRITICAL_EXPIRY_DAYS", "3"))
+    app.config["CRITICAL_OVERDUE_HOURS"] = float(os.environ.get("CRITICAL_OVERDUE_HOURS", "24"))
+    app.config["CRITICAL_SWEEP_SECONDS"] = float(os.environ.get("CRITICAL_SWEEP_SECONDS", "60"))
+    # Demand forecast: model state cache (refreshed as days close) and smoothing factor
+    app.config["FORECAST_CACHE"] = os.environ.get("FORECAST_CACHE") or os.path.join(
+        os.path.dirname(os.path.abspath(app.config["DB_PATH"])), "forecast.npz"
+    )
+    app.config["FORECAST_ALPHA"] = float(os.environ.get("FORECAST_ALPHA", "0.3"))
+    # Orders older than N days (about a term) move nightly to per-school-year files in ARCHIVE_DIR (0: never)
+    app.config["ARCHIVE_DIR"] = os.environ.get("ARCHIVE_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(app.config["DB_PATH"])), "archive"
+    )
+    app.config["ARCHIVE_KEEP_DAYS"] = int(os.environ.get("ARCHIVE_KEEP_DAYS", "120"))
+    # Nightly online backup (backup.py) into BACKUP_DIR; the newest BACKUP_KEEP stay (0: no backups)
+    app.config["BACKUP_DIR"] = os.environ.get("BACKUP_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(app.config["DB_PATH"])), "backups"
+    )
+    app.config["BACKUP_KEEP"] = int(os.environ.get("BACKUP_KEEP", "7"))
+    app.config["BACKUP_STEP_PAGES"] = int(os.environ.get("BACKUP_STEP_PAGES", "1024"))
+    app.config["BACKUP_PAUSE_MS"] = float(os.environ.get("BACKUP_PAUSE_MS", "20"))
+    # Columnar snapshot for offline dashboards (columnar.py), appended nightly when a directory is set
+    app.config["ANALYTICS_EXPORT_DIR"] = os.environ.get("ANALYTICS_EXPORT_DIR") or None
+    # Background maintenance: one worker (lease holder) runs the jobs, at most N at a time
+    app.config["SCHEDULER_ENABLED"] = os.environ.get("SCHEDULER_ENABLED", "1") not in ("0", "false", "no")
+    app.config["SCHEDULER_WORKERS"] = int(os.environ.get("SCHEDULER_WORKERS", "2"))
+    app.config["SCHEDULER_LEASE_SECONDS"] = float(os.environ.get("SCHEDULER_LEASE_SECONDS", "30"))
+    # Read notifications older than N days are deleted (unread ones after 3 * N)
+    app.config["NOTIFICATION_RETENTION_DAYS"] = int(os.environ.get("NOTIFICATION_RETENTION_DAYS", "90"))
+    # Write off what is left of expired stock every night (off: expired stock is only reported)
+    app.config["WRITE_OFF_EXPIRED_STOCK"] = os.environ.get("WRITE_OFF_EXPIRED_STOCK", "0") in ("1", "true", "yes")
+    # Deleted rows stay in the sync change log this long; clients idle for longer reload in full
+    app.config["SYNC_TOMBSTONE_DAYS"] = int(os.environ.get("SYNC_TOMBSTONE_DAYS", "30"))
+    # Multi-school mode (tenants.py): one DB per school in TENANTS_DIR/<school>/, chosen by the
+    # /s/<school>/ path prefix or by host (<school> + TENANT_HOST_SUFFIX). Only existing schools are
+    # served; POST /api/admin/schools creates one, TENANTS limits which names may be created
+    app.config["TENANTS_DIR"] = os.environ.get("TENANTS_DIR") or None
+    app.config["TENANT_HOST_SUFFIX"] = os.environ.get("TENANT_HOST_SUFFIX") or None
+    app.config["TENANTS"] = {t.strip() for t in os.environ["TENANTS"].split(",") if t.strip()} \
+        if os.environ.get("TENANTS") else None
+    # Idle connections kept per DB file
+    app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", "8"))
+
+    slow_log = SlowQueryLog(app.config["SLOW_QUERY_MS"]) if app.config["SLOW_QUERY_MS"] >= 0 else None
+
+    # ---- DB connection per request (pooled, from the request's school) ----
+    def current_tenant() -> Tenant:
+        if not has_request_context():
+            return tenants.get(DEFAULT_TENANT)
+        if "tenant" not in g:
+            g.tenant = tenants.get(tenants.resolve(request.environ))
+        return g.tenant
 
-    # ---- DB connection per request ----
     def get_db() -> sqlite3.Connection:
         if "db" not in g:
-            g.db = connect(app.config["DB_PATH"])
+            g.db = current_tenant().pool.acquire()
+            _attach_statement_hook(g.db)
         return g.db
 
+    def _attach_statement_hook(conn) -> None:
+        profile = g.get("profile")
+        if profile is None:
+            conn.statement_hook = slow_log.record if slow_log is not None else None
+            return
+
+        def hook(c, sql, params, seconds):
+            profile.record_statement(sql, seconds)
+            if slow_log is not None:
+                slow_log.record(c, sql, params, seconds)
+
+        conn.statement_hook = hook
+
     @app.teardown_appcontext
     def close_db(exception: Optional[BaseException] = None):
         db = g.pop("db", None)
+        tenant = g.pop("tenant", None)
         if db is not None:
-            db.close()
+            (tenant or tenants.get(DEFAULT_TENANT)).pool.release(db)
+
+    # ---- Request metrics ----
+    metrics = MetricsRegistry(app.config["METRICS_DIR"])
+    app.extensions["metrics"] = metrics
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        labels = {"route": route}
+
+        metrics.inc("http_requests_total", {"method": request.method, "route": route, "status": response.status_code})
+        metrics.observe("http_request_duration_seconds", {"method": request.method, "route": route}, elapsed)
+        metrics.inc("http_response_bytes_total", labels, response.content_length or 0)
+
+        db = g.get("db")
+        stats = db.stats if db is not None else None
+        metrics.observe("http_request_sql_statements", labels, stats.statements if stats else 0, STATEMENT_BUCKETS)
+        if stats is not None:
+            metrics.inc("sql_statements_total", labels, stats.statements)
+            metrics.inc("sql_time_seconds_total", labels, stats.sql_seconds)
+            metrics.inc("sql_rows_total", labels, stats.rows)
+            metrics.inc("sqlite_lock_wait_seconds_total", labels, stats.lock_wait_seconds)
+            metrics.inc("sqlite_commits_total", labels, stats.commits)
+
+        metrics.maybe_flush()
+        return response
+
+    # ---- Schools (tenants) ----
+    def backup_dir(name: str, db_path: str) -> str:
+        if name == DEFAULT_TENANT:
+            return app.config["BACKUP_DIR"]
+        return os.path.join(os.path.dirname(os.path.abspath(db_path)), "backups")
+
+    def open_tenant(name: str, db_path: str) -> Tenant:
+        """Migrate the school's DB and start its background work."""
+        default = name == DEFAULT_TENANT
+        data_dir = os.path.dirname(os.path.abspath(db_path))
+        # Create DB + seed demo data on first run (the default DB only: schools get no demo accounts)
+        initialize_database(db_path, seed=default)
+        # Balances set outside the ledger (seed data, imports) get an opening-balance entry
+        conn = connect(db_path)
+        try:
+            record_opening_balances(conn)
+            # Same for stock levels and the stock movement ledger
+            record_opening_stock(conn)
+            conn.commit()
+            # Allergen masks for rows written outside the API
+            index_allergen_masks(conn)
+            # Meal analytics for orders placed before its tables existed
+            build_meal_analytics(conn)
+            # Also backfills events for rows written before the critical-event triggers existed
+            sweep_critical_events(conn, app.config["CRITICAL_EXPIRY_DAYS"], app.config["CRITICAL_OVERDUE_HOURS"])
+        finally:
+            conn.close()
+
+        activity = ActivityLog(
+            db_path,
+            flush_interval=app.config["ACTIVITY_FLUSH_INTERVAL"],
+            max_buffer=app.config["ACTIVITY_BUFFER_SIZE"],
+            retention_months=app.config["ACTIVITY_RETENTION_MONTHS"],
+        )
+        # The configured paths are the default DB's; a school keeps its files next to its DB
+        forecast_cache = ForecastCache(
+            app.config["FORECAST_CACHE"] if default else os.path.join(data_dir, "forecast.npz"),
+            app.config["FORECAST_ALPHA"],
+        )
+        archive_dir = app.config["ARCHIVE_DIR"] if default else os.path.join(data_dir, "archive")
+        export_dir = app.config["ANALYTICS_EXPORT_DIR"]
+        if export_dir and not default:
+            export_dir = os.path.join(export_dir, name)
+
+        # Nothing here runs in a request: the leader's scheduler threads do the work.
+        scheduler: Optional[Scheduler] = None
+        if app.config["SCHEDULER_ENABLED"]:
+            scheduler = Scheduler(db_path, metrics, max_workers=app.config["SCHEDULER_WORKERS"],
+                                  lease_ttl=app.config["SCHEDULER_LEASE_SECONDS"],
+                                  labels=None if default else {"tenant": name})
+            scheduler.add("statistics_rollup", rollup_statistics, interval=900, jitter=60)
+            scheduler.add("critical_sweep", lambda conn: {"created": sweep_critical_events(
+                conn, app.config["CRITICAL_EXPIRY_DAYS"], app.config["CRITICAL_OVERDUE_HOURS"])},
+                interval=app.config["CRITICAL_SWEEP_SECONDS"], jitter=app.config["CRITICAL_SWEEP_SECONDS"] / 10)
+            scheduler.add("subscriptions_daily", run_subscriptions_daily, cron="5 0 * * *", jitter=60)
+            scheduler.add("stock_expiry", lambda conn: expire_stock(conn, write_off=app.config["WRITE_OFF_EXPIRED_STOCK"]),
+                          cron="10 0 * * *", jitter=60)
+            scheduler.add("forecast_refresh", lambda conn: {
+                "closedThrough": forecast_cache.model(conn).closed_through or None}, cron="20 0 * * *", jitter=300)
+            if export_dir:
+                scheduler.add("columnar_export", lambda conn: export_columnar(conn, export_dir),
+                              cron="40 0 * * *", jitter=300)
+            scheduler.add("ledger_snapshot", lambda conn: {"updated": snapshot_balances(conn)}, cron="0 2 * * *", jitter=600)
+            scheduler.add("stock_snapshot", lambda conn: {"updated": snapshot_stock(conn)}, cron="15 2 * * *", jitter=600)
+            if app.config["ARCHIVE_KEEP_DAYS"] > 0:
+                scheduler.add("orders_archive", lambda conn: archive_orders(
+                    conn, archive_dir, date.today() - timedelta(days=app.config["ARCHIVE_KEEP_DAYS"])),
+                    cron="0 3 * * *", jitter=600)
+            scheduler.add("notifications_purge", lambda conn: purge_notifications(
+                conn, app.config["NOTIFICATION_RETENTION_DAYS"]), cron="30 3 * * *", jitter=600)
+            scheduler.add("sync_tombstones", lambda conn: purge_tombstones(conn, app.config["SYNC_TOMBSTONE_DAYS"]),
+                          cron="45 3 * * *", jitter=600)
+            scheduler.add("db_optimize", optimize_database, cron="0 4 * * *", jitter=600)
+            if app.config["BACKUP_KEEP"] > 0:
+                scheduler.add("db_backup", lambda conn: run_backup(
+                    conn, backup_dir(name, db_path), keep=app.config["BACKUP_KEEP"],
+                    step_pages=app.config["BACKUP_STEP_PAGES"], pause=app.config["BACKUP_PAUSE_MS"] / 1000),
+                    cron="30 4 * * *", jitter=600)
+            scheduler.start()
+        return Tenant(name, db_path, ConnectionPool(db_path, app.config["DB_POOL_SIZE"]), activity, forecast_cache,
+                      scheduler)
+
+    tenants = TenantRegistry(app.config["DB_PATH"], open_tenant, root=app.config["TENANTS_DIR"],
+                             host_suffix=app.config["TENANT_HOST_SUFFIX"], allowed=app.config["TENANTS"])
+    if tenants.enabled:
+        app.wsgi_app = TenantPathMiddleware(app.wsgi_app)
+    app.extensions["tenants"] = tenants
+    # The default DB is opened now; schools on their first request
+    app.extensions["scheduler"] = tenants.get(DEFAULT_TENANT).scheduler
+    app.extensions["activity"] = tenants.get(DEFAULT_TENANT).activity
+
+    @app.errorhandler(UnknownTenant)
+    def _unknown_tenant(exc: UnknownTenant):
+        return jsonify({"ok": False, "error": f"Школа не найдена: {exc}"}), 404
+
+    # ---- On-demand profiling ----
+    profile_store = ProfileStore(app.config["PROFILE_DIR"], app.config["PROFILE_KEEP"])
+    profile_sample_rate = app.config["PROFILE_SAMPLE_RATE"]
+
+    @app.before_request
+    def _maybe_start_profile():
+        if request.headers.get("X-Profile") == "1" or request.args.get("_profile") == "1":
+            if _require_admin() is not None:
+                # Non-admins are served normally, just not profiled.
+                return None
+            trigger = "admin"
+        elif profile_sample_rate > 0 and random.random() < profile_sample_rate:
+            trigger = "sample"
+        else:
+            return None
+
+        profile = RequestProfile.start(trigger)
+        if profile is None:
+            return None
+        g.profile = profile
+        if "db" in g:
+            _attach_statement_hook(g.db)
+        return None
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+
+        elapsed = profile.stop()
+        try:
+            profile_id = profile_store.save(profile.profiler, {
+                "method": request.method,
+                "path": request.full_path.rstrip("?"),
+                "route": request.url_rule.rule if request.url_rule is not None else None,
+                "status": response.status_code,
+                "trigger": profile.trigger,
+                "durationMs": round(elapsed * 1000, 3),
+                "sqlCount": len(profile.sql),
+                "sqlMs": round(sum(s["ms"] for s in profile.sql), 3),
+                "sql": profile.sql,
+                "createdAt": profile.started_at,
+            })
+            response.headers["X-Profile-Id"] = profile_id
+        except OSError:
+            app.logger.exception("Failed to save request profile")
+        return response
+
+    @app.teardown_request
+    def _stop_profile(exception: Optional[BaseException] = None):
+        # Only reached with a live profiler if after_request did not run.
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profile.stop()
+
+    # ---- Traffic recording (replay harness) ----
+    recorder: Optional[TrafficRecorder] = None
+    if app.config["RECORD_TRAFFIC"]:
+        recorder = TrafficRecorder(app.config["RECORD_TRAFFIC"], app.config["RECORD_TRAFFIC_SALT"])
+        snapshot = snapshot_path(app.config["RECORD_TRAFFIC"])
+        if not os.path.exists(snapshot):
+            # The state the recorded requests start from; replay runs against a copy of it.
+            snapshot_db(app.config["DB_PATH"], snapshot)
+        app.extensions["recorder"] = recorder
+
+    @app.after_request
+    def _record_traffic(response):
+        if recorder is None or not recorder.wants(request.path):
+            return response
+        elapsed = time.perf_counter() - g.request_started if "request_started" in g else 0.0
+
+        user_id = request.headers.get("X-User-Id")
+        if request.path == "/api/auth/login" and response.status_code == 200:
+            # Remember who logged in so that replay can log in as the same snapshot user.
+            user_id = ((response.get_json(silent=True) or {}).get("user") or {}).get("id")
+        body = request.get_json(silent=True) if request.is_json else None
+
+        try:
+            recorder.record({
+                # Arrival time, so that replay reproduces the original pacing
+                "ts": round(time.time() - elapsed, 4),
+                "ms": round(elapsed * 1000, 3),
+                "m": request.method,
+                "r": request.url_rule.rule if request.url_rule is not None else None,
+                "p": request.path,
+                "q": recorder.anonymize_query(request.query_string.decode("utf-8", "replace")),
+                "b": recorder.anonymize(body),
+                "s": response.status_code,
+                "u": int(user_id) if str(user_id or "").isdigit() else None,
+                "c": recorder.pseudonym(f"{request.remote_addr}|{request.user_agent.string}"),
+            })
+        except OSError:
+            app.logger.exception("Failed to record request")
+        return response
 
     # ---- Helpers (row -> API dicts) ----
     def _row_optional(row: sqlite3.Row, key: str) -> Any:
@@ -61,7 +458,7 @@ def create_app() -> Flask:
             "class": row["class"],
             "allergies": parse_json_list(row["allergies"]),
             "preferences": row["preferences"] or "",
-            "balance": float(row["balance"] or 0),
+            "balance": to_rubles(row["balance"]),
             "specialization": row["specialization"],
             "position": row["position"],
             "permissionLevel": row["permission_level"],
@@ -79,12 +476,38 @@ def create_app() -> Flask:
             "type": row["meal_type"],
             "name": row["name"],
             "description": row["description"] or "",
-            "price": float(row["price"]),
+            "price": to_rubles(row["price"]),
             "calories": row["calories"],
             "allergens": parse_json_list(row["allergens"]),
             "isAvailable": bool(row["is_available"]),
             "imageUrl": row["image_url"],
             "createdAt": row["created_at"],
+            # Present when the query joins menu_item_ratings
+            "rating": _rating_average(_row_optional(row, "review_count"), _row_optional(row, "rating_sum")),
+            "reviewCount": _row_optional(row, "review_count") or 0,
+        }
+
+    def _rating_average(count: Optional[int], total: Optional[int]) -> Optional[float]:
+        return round(total / count, 2) if count else None
+
+    def review_row_to_api(row: sqlite3.Row) -> dict[str, Any]:
+        return {
+            "id": row["id"],
+            "studentId": row["student_id"],
+            "menuItemId": row["menu_item_id"],
+            "rating": row["rating"],
+            "comment": row["comment"] or "",
+            "isApproved": bool(row["is_approved"]),
+            "createdAt": row["created_at"],
+            "studentName": _row_optional(row, "student_name"),
+            "menuName": _row_optional(row, "menu_name"),
+            # Field names used by js/student.js
+            "userId": row["student_id"],
+            "userName": _row_optional(row, "student_name"),
+            "dishId": row["menu_item_id"],
+            "dishName": _row_optional(row, "menu_name"),
+            "text": row["comment"] or "",
+            "date": row["created_at"],
         }
 
     def order_row_to_api(row: sqlite3.Row) -> dict[str, Any]:
@@ -106,8 +529,8 @@ def create_app() -> Flask:
             "dishName": menu_name,
             "type": row["meal_type"],
             "quantity": row["quantity"],
-            "price": float(row["total_price"]),
-            "total": float(row["total_price"]),
+            "price": to_rubles(row["total_price"]),
+            "total": to_rubles(row["total_price"]),
             "status": row["status"],
             "paymentType": row["payment_type"],
             "subscriptionId": row["subscription_id"],
@@ -182,7 +605,7 @@ def create_app() -> Flask:
             "workStart": row["work_start"],
             "workEnd": row["work_end"],
             "workHours": {"start": row["work_start"], "end": row["work_end"]},
-            "minBalance": row["min_balance"],
+            "minBalance": to_rubles(row["min_balance"]),
             "notificationsEnabled": bool(row["notifications_enabled"]),
             "emailNotifications": bool(row["email_notifications"]),
             "orderNotifications": bool(row["order_notifications"]),
@@ -194,6 +617,21 @@ def create_app() -> Flask:
     def api_error(message: str, status: int = 400):
         return jsonify({"ok": False, "error": message}), status
 
+    # ---- Access control ----
+    def _require_admin():
+        """Return an error response unless the caller is an active admin, else None.
+
+        There are no server-side sessions: database.js sends the id of the
+        logged-in user in the `X-User-Id` header.
+        """
+        user_id = request.headers.get("X-User-Id") or request.args.get("adminId")
+        if not user_id or not str(user_id).isdigit():
+            return api_error("Требуются права администратора", 403)
+        row = get_db().execute("SELECT role, is_active FROM users WHERE id = ?", (int(user_id),)).fetchone()
+        if not row or row["role"] != "admin" or not row["is_active"]:
+            return api_error("Требуются права администратора", 403)
+        return None
+
     # ---- API: notifications (helper) ----
     def _create_notification(db: sqlite3.Connection, user_id: int, n_type: str, title: str, message: str, link: Optional[str]):
         now = utcnow_iso()
@@ -208,6 +646,10 @@ def create_app() -> Flask:
     def api_health():
         return jsonify({"ok": True, "status": "ok"})
 
+    @app.get("/api/metrics")
+    def api_metrics():
+        return Response(render_prometheus(metrics.collect()), mimetype="text/plain; version=0.0.4")
+
     # ---- API: auth ----
     @app.post("/api/auth/login")
     def api_login():
@@ -231,6 +673,7 @@ def create_app() -> Flask:
         if role and row["role"] != role:
             return api_error("Неверная роль для данного аккаунта", 403)
 
+        current_tenant().activity.log(row["id"], "login", {"role": row["role"]})
         return jsonify({"ok": True, "user": user_row_to_api(row)})
 
     @app.post("/api/auth/register")
@@ -346,7 +789,7 @@ def create_app() -> Flask:
                     class_,
                     dump_json(allergies) if isinstance(allergies, (list, dict)) else (dump_json(parse_json_list(allergies)) if isinstance(allergies, str) and allergies else None),
                     preferences,
-                    float(balance) if balance not in (None, "") else 0.0,
+                    0,
                     specialization,
                     position,
                     permission_level,
@@ -356,8 +799,13 @@ def create_app() -> Flask:
                 ),
             )
             user_id = cur.lastrowid
+            index_user(db, user_id)
+            if balance not in (None, "") and to_kopecks(balance) != 0:
+                post_entry(db, user_id, to_kopecks(balance), description="Начальный баланс",
+                           metadata={"kind": "opening"}, allow_negative=True)
             db.commit()
         except sqlite3.IntegrityError:
+            db.rollback()
             return api_error("Пользователь с таким email или логином уже существует", 409)
 
         row = db.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
@@ -391,7 +839,6 @@ def create_app() -> Flask:
             "class": "class",
             "allergies": "allergies",
             "preferences": "preferences",
-            "balance": "balance",
             "specialization": "specialization",
             "position": "position",
             "permissionLevel": "permission_level",
@@ -414,11 +861,6 @@ def create_app() -> Flask:
                     val = dump_json(val)
                 elif isinstance(val, str):
                     val = dump_json(parse_json_list(val))
-            elif col == "balance":
-                try:
-                    val = float(val) if val not in (None, "") else 0.0
-                except Exception:
-                    return api_error("Некорректный balance", 400)
             elif col == "role":
                 if val not in ("student", "cook", "admin"):
                     return api_error("Некорректная роль", 400)
@@ -428,7 +870,15 @@ def create_app() -> Flask:
             sets.append(f"{col} = ?")
             params.append(val)
 
-        if not sets:
+        # An absolute balance (admin edit form) becomes a ledger adjustment.
+        new_balance = None
+        if "balance" in payload:
+            try:
+                new_balance = to_kopecks(payload["balance"]) if payload["balance"] not in (None, "") else 0
+            except Exception:
+                return api_error("Некорректный balance", 400)
+
+        if not sets and new_balance is None:
             return api_error("Нет поддерживаемых полей для обновления", 400)
 
         sets.append("updated_at = ?")
@@ -438,9 +888,17 @@ def create_app() -> Flask:
         db = get_db()
         try:
             db.execute(f"UPDATE users SET {', '.join(sets)} WHERE id = ?", params)
+            if "allergies" in payload:
+                index_user(db, user_id)
+            if new_balance is not None:
+                set_balance(db, user_id, new_balance, "Корректировка баланса")
             db.commit()
         except sqlite3.IntegrityError:
+            db.rollback()
             return api_error("Email или логин уже заняты", 409)
+        except LookupError:
+            db.rollback()
+            return api_error("Пользователь не найден", 404)
 
         row = db.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
         if not row:
@@ -535,74 +993,247 @@ def create_app() -> Flask:
     # ---- API: menu ----
     @app.get("/api/menu")
     def api_get_menu():
+        """Menu, optionally checked against allergies.
+
+        `date` is one day, `from`/`to` an inclusive range (a week or a month).
+        With `studentId` (that student's allergies) or `excludeAllergens`
+        (comma-separated names) every dish gets `allergyConflict` and
+        `conflictAllergens`; `safeOnly=1` leaves the conflicting dishes out.
+        """
         date_ = request.args.get("date")
         meal_type = request.args.get("type")
+        student_id = request.args.get("studentId")
+        exclude = request.args.get("excludeAllergens")
+        safe_only = request.args.get("safeOnly") in ("1", "true", "yes")
 
         db = get_db()
-        sql = "SELECT * FROM menu_items WHERE 1=1"
-        params: list[Any] = []
+        allergy_mask: Optional[int] = None
+        dictionary: dict[str, int] = {}
+        if student_id or exclude:
+            dictionary = load_dictionary(db)
+            allergy_mask = 0
+            if exclude:
+                allergy_mask = matching_mask(dictionary, exclude.split(","))
+            if student_id:
+                user = db.execute(
+                    "SELECT allergies, allergy_mask FROM users WHERE id = ?", (student_id,)
+                ).fetchone()
+                if not user:
+                    return api_error("Пользователь не найден", 404)
+                allergy_mask |= user["allergy_mask"] if user["allergy_mask"] is not None else matching_mask(
+                    dictionary, parse_json_list(user["allergies"]))
+
+        # Ratings come from the trigger-maintained aggregate: one PK lookup per dish
+        sql = (
+            "SELECT m.*, r.review_count, r.rating_sum, m.allergen_mask & ? AS conflict_mask FROM menu_items m "
+            "LEFT JOIN menu_item_ratings r ON r.menu_item_id = m.id WHERE 1=1"
+        )
+        params: list[Any] = [allergy_mask or 0]
+
+        if allergy_mask is not None and safe_only:
+            sql += " AND m.allergen_mask & ? = 0"
+            params.append(allergy_mask)
 
         if date_:
-            sql += " AND date = ?"
+            sql += " AND m.date = ?"
             params.append(date_)
+        # Week/month views: one range scan of idx_menu_date_type
+        if request.args.get("from"):
+            sql += " AND m.date >= ?"
+            params.append(request.args["from"])
+        if request.args.get("to"):
+            sql += " AND m.date <= ?"
+            params.append(request.args["to"])
 
         if meal_type:
-            sql += " AND meal_type = ?"
+            sql += " AND m.meal_type = ?"
             params.append(meal_type)
 
-        sql += " ORDER BY date DESC, id"
+        sql += " ORDER BY m.date DESC, m.id"
 
         rows = db.execute(sql, params).fetchall()
-        return jsonify({"ok": True, "menu": [menu_row_to_api(r) for r in rows]})
+        menu = [menu_row_to_api(r) for r in rows]
+        if allergy_mask is not None:
+            for item, r in zip(menu, rows):
+                item["allergyConflict"] = bool(r["conflict_mask"])
+                item["conflictAllergens"] = (
+                    conflicting(item["allergens"], dictionary, r["conflict_mask"]) if r["conflict_mask"] else []
+                )
+        return jsonify({"ok": True, "menu": menu})
 
     @app.post("/api/menu")
     def api_add_menu_item():
         payload = request.get_json(silent=True) or {}
-        date_ = payload.get("date") or today_str()
-        meal_type = payload.get("type") or payload.get("mealType")
-        name = (payload.get("name") or "").strip()
+        try:
+            values = menu_item_values(payload, today_str())
+        except ValueError as e:
+            return api_error(str(e), 400)
 
-        if meal_type not in ("breakfast", "lunch"):
-            return api_error("type must be breakfast|lunch", 400)
+        db = get_db()
+        try:
+            (item_id,) = insert_menu_items(db, [values])
+            index_menu_items(db, [item_id])
+        except ValueError as e:
+            db.rollback()
+            return api_error(str(e), 400)
+        db.commit()
+
+        row = db.execute("SELECT * FROM menu_items WHERE id = ?", (item_id,)).fetchone()
+        return jsonify({"ok": True, "item": menu_row_to_api(row)})
+
+    @app.post("/api/menu/bulk")
+    def api_add_menu_items():
+        """Many dishes in one transaction: {items: [<same fields as POST /api/menu>]}."""
+        payload = request.get_json(silent=True) or {}
+        items = payload.get("items")
+        if not isinstance(items, list) or not items:
+            return api_error("items must be a non-empty list", 400)
+        if len(items) > MAX_BULK_ITEMS:
+            return api_error(f"at most {MAX_BULK_ITEMS} items per request", 400)
+        values = []
+        for i, item in enumerate(items):
+            try:
+                values.append(menu_item_values(item if isinstance(item, dict) else {}, today_str()))
+            except ValueError as e:
+                return api_error(f"items[{i}]: {e}", 400)
+
+        db = get_db()
+        try:
+            ids = insert_menu_items(db, values)
+            index_menu_items(db, ids)
+        except ValueError as e:
+            db.rollback()
+            return api_error(str(e), 400)
+        db.commit()
+
+        rows = db.execute(
+            "SELECT * FROM menu_items WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id", (json.dumps(ids),)
+        ).fetchall()
+        return jsonify({"ok": True, "created": len(rows), "items": [menu_row_to_api(r) for r in rows]})
+
+    def _weeks_arg(payload: dict[str, Any]) -> int:
+        weeks = int(payload.get("weeks") or 1)
+        if not 1 <= weeks <= MAX_WEEKS:
+            raise ValueError(f"weeks must be 1..{MAX_WEEKS}")
+        return weeks
+
+    @app.post("/api/menu/copy")
+    def api_copy_menu_week():
+        """Copy a week's menu: {fromWeek, toWeek, weeks=1} (any date inside each week).
+
+        With `weeks` > 1 the source week is repeated in that many consecutive
+        weeks. The target weeks must have no menu yet.
+        """
+        payload = request.get_json(silent=True) or {}
+        try:
+            src = week_start(payload.get("fromWeek") or "")
+            dst = week_start(payload.get("toWeek") or "")
+            weeks = _weeks_arg(payload)
+        except ValueError:
+            return api_error(f"fromWeek, toWeek must be YYYY-MM-DD, weeks 1..{MAX_WEEKS}", 400)
+
+        db = get_db()
+        if week_has_menu(db, dst, weeks):
+            return api_error("На выбранных неделях уже есть меню", 409)
+        created = copy_weeks(db, src, dst, weeks)
+        db.commit()
+        return jsonify({"ok": True, "created": created, "from": src.isoformat(), "to": dst.isoformat(), "weeks": weeks})
+
+    @app.get("/api/menu/templates")
+    def api_menu_templates():
+        rows = get_db().execute(
+            "SELECT t.*, (SELECT COUNT(1) FROM menu_template_items i WHERE i.template_id = t.id) AS item_count "
+            "FROM menu_templates t ORDER BY t.name COLLATE NOCASE"
+        ).fetchall()
+        return jsonify({"ok": True, "templates": [template_row_to_api(r) for r in rows]})
+
+    @app.get("/api/menu/templates/<int:template_id>")
+    def api_menu_template(template_id: int):
+        db = get_db()
+        row = db.execute(
+            "SELECT t.*, (SELECT COUNT(1) FROM menu_template_items i WHERE i.template_id = t.id) AS item_count "
+            "FROM menu_templates t WHERE t.id = ?",
+            (template_id,),
+        ).fetchone()
+        if not row:
+            return api_error("Шаблон не найден", 404)
+        items = db.execute(
+            "SELECT * FROM menu_template_items WHERE template_id = ? ORDER BY day_offset, meal_type, id", (template_id,)
+        ).fetchall()
+        return jsonify({"ok": True, "template": dict(template_row_to_api(row),
+                                                     items=[template_item_to_api(i) for i in items])})
+
+    @app.post("/api/menu/templates")
+    def api_create_menu_template():
+        """New template: {name, description, fromWeek} saves a week's menu,
+        {name, description, items: [{dayOffset, type, name, price, ...}]} lists the dishes."""
+        payload = request.get_json(silent=True) or {}
+        name = (payload.get("name") or "").strip()
         if not name:
             return api_error("name required", 400)
+        week = None
+        items = []
+        if payload.get("fromWeek"):
+            try:
+                week = week_start(payload["fromWeek"])
+            except ValueError:
+                return api_error("fromWeek must be YYYY-MM-DD", 400)
+        elif isinstance(payload.get("items"), list) and payload["items"]:
+            for i, item in enumerate(payload["items"]):
+                item = item if isinstance(item, dict) else {}
+                try:
+                    offset = int(item.get("dayOffset"))
+                    if not 0 <= offset <= 6:
+                        raise ValueError
+                except (TypeError, ValueError):
+                    return api_error(f"items[{i}]: dayOffset must be 0..6", 400)
+                try:
+                    items.append(dict(menu_item_values(item, None), day_offset=offset))
+                except ValueError as e:
+                    return api_error(f"items[{i}]: {e}", 400)
+        else:
+            return api_error("fromWeek or items required", 400)
 
-        description = payload.get("description")
-        price = payload.get("price")
-        calories = payload.get("calories")
-        allergens = payload.get("allergens")
-        is_available = payload.get("isAvailable")
-        if is_available is None:
-            is_available = True
-        image_url = payload.get("imageUrl") or payload.get("image_url")
-
+        db = get_db()
         try:
-            price_f = float(price)
-        except Exception:
-            return api_error("price must be number", 400)
+            template_id = create_template(db, name, payload.get("description"), week, items)
+            db.commit()
+        except sqlite3.IntegrityError:
+            db.rollback()
+            return api_error("Шаблон с таким названием уже существует", 409)
+        return api_menu_template(template_id)
 
-        now = utcnow_iso()
+    @app.delete("/api/menu/templates/<int:template_id>")
+    def api_delete_menu_template(template_id: int):
         db = get_db()
-        cur = db.execute(
-            """INSERT INTO menu_items (date, meal_type, name, description, price, calories, allergens, is_available, image_url, created_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                date_,
-                meal_type,
-                name,
-                description,
-                price_f,
-                int(calories) if calories not in (None, "") else None,
-                dump_json(allergens) if isinstance(allergens, (list, dict)) else (dump_json(parse_json_list(allergens)) if isinstance(allergens, str) and allergens else None),
-                1 if bool(is_available) else 0,
-                image_url,
-                now,
-            ),
-        )
+        if not db.execute("DELETE FROM menu_templates WHERE id = ?", (template_id,)).rowcount:
+            return api_error("Шаблон не найден", 404)
         db.commit()
+        return jsonify({"ok": True, "deleted": True})
 
-        row = db.execute("SELECT * FROM menu_items WHERE id = ?", (cur.lastrowid,)).fetchone()
-        return jsonify({"ok": True, "item": menu_row_to_api(row)})
+    @app.post("/api/menu/templates/<int:template_id>/apply")
+    def api_apply_menu_template(template_id: int):
+        """Create the template's dishes in {weekStart, weeks=1}; the weeks must have no menu yet."""
+        payload = request.get_json(silent=True) or {}
+        try:
+            start = week_start(payload.get("weekStart") or "")
+            weeks = _weeks_arg(payload)
+        except ValueError:
+            return api_error(f"weekStart must be YYYY-MM-DD, weeks 1..{MAX_WEEKS}", 400)
+
+        db = get_db()
+        if not db.execute("SELECT 1 FROM menu_templates WHERE id = ?", (template_id,)).fetchone():
+            return api_error("Шаблон не найден", 404)
+        if week_has_menu(db, start, weeks):
+            return api_error("На выбранных неделях уже есть меню", 409)
+        try:
+            created = apply_template(db, template_id, start, weeks)
+            index_menu_items(db)
+        except ValueError as e:
+            db.rollback()
+            return api_error(str(e), 400)
+        db.commit()
+        return jsonify({"ok": True, "created": created, "weekStart": start.isoformat(), "weeks": weeks})
 
     @app.put("/api/menu/<int:item_id>")
     def api_update_menu_item(item_id: int):
@@ -637,7 +1268,7 @@ def create_app() -> Flask:
                     return api_error("type must be breakfast|lunch", 400)
             if col == "price":
                 try:
-                    val = float(val)
+                    val = to_kopecks(val)
                 except Exception:
                     return api_error("price must be number", 400)
             if col == "calories":
@@ -659,6 +1290,12 @@ def create_app() -> Flask:
         params.append(item_id)
         db = get_db()
         db.execute(f"UPDATE menu_items SET {', '.join(sets)} WHERE id = ?", params)
+        if "allergens" in payload:
+            try:
+                index_menu_items(db, [item_id])
+            except ValueError as e:
+                db.rollback()
+                return api_error(str(e), 400)
         db.commit()
 
         row = db.execute("SELECT * FROM menu_items WHERE id = ?", (item_id,)).fetchone()
@@ -677,19 +1314,154 @@ def create_app() -> Flask:
         db.commit()
         return jsonify({"ok": True, "deleted": True})
 
+    def _recipe_to_api(db: sqlite3.Connection, item_id: int) -> list[dict[str, Any]]:
+        rows = db.execute(
+            "SELECT r.inventory_id, r.quantity, i.product_name, i.unit FROM recipes r "
+            "JOIN inventory i ON i.id = r.inventory_id WHERE r.menu_item_id = ? ORDER BY i.product_name COLLATE NOCASE",
+            (item_id,),
+        ).fetchall()
+        return [
+            {"inventoryId": r["inventory_id"], "productName": r["product_name"], "quantity": float(r["quantity"]), "unit": r["unit"]}
+            for r in rows
+        ]
+
+    @app.get("/api/menu/<int:item_id>/recipe")
+    def api_get_recipe(item_id: int):
+        db = get_db()
+        if not db.execute("SELECT 1 FROM menu_items WHERE id = ?", (item_id,)).fetchone():
+            return api_error("Блюдо не найдено", 404)
+        return jsonify({"ok": True, "ingredients": _recipe_to_api(db, item_id)})
+
+    @app.put("/api/menu/<int:item_id>/recipe")
+    def api_set_recipe(item_id: int):
+        """Replace the recipe: `ingredients` = [{inventoryId, quantity per portion}]."""
+        payload = request.get_json(silent=True) or {}
+        ingredients = payload.get("ingredients")
+        if not isinstance(ingredients, list):
+            return api_error("ingredients must be a list", 400)
+        rows = []
+        try:
+            for ing in ingredients:
+                qty = float(ing["quantity"])
+                if qty <= 0:
+                    raise ValueError
+                rows.append((item_id, int(ing["inventoryId"]), qty))
+        except (KeyError, TypeError, ValueError):
+            return api_error("each ingredient needs inventoryId and a positive quantity", 400)
+
+        db = get_db()
+        if not db.execute("SELECT 1 FROM menu_items WHERE id = ?", (item_id,)).fetchone():
+            return api_error("Блюдо не найдено", 404)
+        try:
+            db.execute("DELETE FROM recipes WHERE menu_item_id = ?", (item_id,))
+            db.executemany("INSERT OR REPLACE INTO recipes (menu_item_id, inventory_id, quantity) VALUES (?, ?, ?)", rows)
+            db.commit()
+        except sqlite3.IntegrityError:
+            db.rollback()
+            return api_error("Позиция склада не найдена", 404)
+        return jsonify({"ok": True, "ingredients": _recipe_to_api(db, item_id)})
+
+    # ---- API: reviews ----
+    REVIEW_SELECT = (
+        "SELECT rv.*, u.full_name AS student_name, m.name AS menu_name FROM reviews rv "
+        "JOIN users u ON u.id = rv.student_id JOIN menu_items m ON m.id = rv.menu_item_id"
+    )
+
+    @app.get("/api/reviews")
+    def api_get_reviews():
+        student_id = request.args.get("studentId") or request.args.get("userId")
+        menu_item_id = request.args.get("menuItemId") or request.args.get("dishId")
+
+        sql = REVIEW_SELECT + " WHERE 1=1"
+        params: list[Any] = []
+        if student_id:
+            sql += " AND rv.student_id = ?"
+            params.append(int(student_id))
+        if menu_item_id:
+            sql += " AND rv.menu_item_id = ?"
+            params.append(int(menu_item_id))
+        sql += " ORDER BY rv.created_at DESC, rv.id DESC"
+
+        rows = get_db().execute(sql, params).fetchall()
+        return jsonify({"ok": True, "reviews": [review_row_to_api(r) for r in rows]})
+
+    @app.post("/api/reviews")
+    def api_add_review():
+        payload = request.get_json(silent=True) or {}
+        student_id = payload.get("studentId") or payload.get("userId")
+        menu_item_id = payload.get("menuItemId") or payload.get("dishId")
+        comment = payload.get("comment") if payload.get("comment") is not None else payload.get("text")
+
+        if not student_id or not menu_item_id:
+            return api_error("studentId and menuItemId required", 400)
+        try:
+            rating = int(payload.get("rating"))
+            if not 1 <= rating <= 5:
+                raise ValueError
+        except (TypeError, ValueError):
+            return api_error("rating must be an integer 1..5", 400)
+
+        db = get_db()
+        if not db.execute("SELECT 1 FROM menu_items WHERE id = ?", (int(menu_item_id),)).fetchone():
+            return api_error("Блюдо не найдено", 404)
+        if not db.execute("SELECT 1 FROM users WHERE id = ?", (int(student_id),)).fetchone():
+            return api_error("Пользователь не найден", 404)
+
+        cur = db.execute(
+            "INSERT INTO reviews (student_id, menu_item_id, rating, comment, is_approved, created_at) VALUES (?, ?, ?, ?, 1, ?)",
+            (int(student_id), int(menu_item_id), rating, (comment or "").strip(), utcnow_iso()),
+        )
+        db.commit()
+
+        row = db.execute(REVIEW_SELECT + " WHERE rv.id = ?", (cur.lastrowid,)).fetchone()
+        return jsonify({"ok": True, "review": review_row_to_api(row)})
+
+    @app.delete("/api/reviews/<int:review_id>")
+    def api_delete_review(review_id: int):
+        db = get_db()
+        cur = db.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
+        db.commit()
+        if cur.rowcount == 0:
+            return api_error("Отзыв не найден", 404)
+        return jsonify({"ok": True})
+
+    @app.get("/api/menu/<int:item_id>/rating")
+    def api_menu_rating(item_id: int):
+        row = get_db().execute("SELECT * FROM menu_item_ratings WHERE menu_item_id = ?", (item_id,)).fetchone()
+        count = row["review_count"] if row else 0
+        return jsonify({
+            "ok": True,
+            "menuItemId": item_id,
+            "rating": _rating_average(count, row["rating_sum"] if row else 0),
+            "reviewCount": count,
+            "histogram": {str(i): (row[f"r{i}"] if row else 0) for i in range(1, 6)},
+        })
+
     # ---- API: orders ----
     @app.get("/api/orders")
     def api_get_orders():
+        """Orders of the hot table; `history=1` adds the archived school years
+        that overlap `date` or `from`..`to` (all of them without dates)."""
         student_id = request.args.get("studentId") or request.args.get("userId")
         status = request.args.get("status")
         date_ = request.args.get("date")
+        date_from = request.args.get("from") or date_
+        date_to = request.args.get("to") or date_
+        history = request.args.get("history") in ("1", "true", "yes")
 
         db = get_db()
+        with attached(db, date_from, date_to) if history else nullcontext([]) as schemas:
+            rows = _select_orders(db, orders_source(db, schemas), student_id, status, date_from, date_to)
+        return jsonify({"ok": True, "orders": [order_row_to_api(r) for r in rows]})
+
+    def _select_orders(db: sqlite3.Connection, source: str, student_id: Optional[str], status: Optional[str],
+                       date_from: Optional[str], date_to: Optional[str]) -> list[sqlite3.Row]:
+        # LEFT JOIN: an archived order outlives the deletion of its student or dish
         sql = (
             "SELECT o.*, u.full_name AS student_name, u.class AS student_class, m.name AS menu_name "
-            "FROM orders o "
-            "JOIN users u ON u.id = o.student_id "
-            "JOIN menu_items m ON m.id = o.menu_item_id "
+            f"FROM {source} o "
+            "LEFT JOIN users u ON u.id = o.student_id "
+            "LEFT JOIN menu_items m ON m.id = o.menu_item_id "
             "WHERE 1=1"
         )
         params: list[Any] = []
@@ -700,14 +1472,15 @@ def create_app() -> Flask:
         if status:
             sql += " AND o.status = ?"
             params.append(status)
-        if date_:
-            sql += " AND o.order_date = ?"
-            params.append(date_)
+        if date_from:
+            sql += " AND o.order_date >= ?"
+            params.append(date_from)
+        if date_to:
+            sql += " AND o.order_date <= ?"
+            params.append(date_to)
 
         sql += " ORDER BY o.created_at DESC, o.id DESC"
-
-        rows = db.execute(sql, params).fetchall()
-        return jsonify({"ok": True, "orders": [order_row_to_api(r) for r in rows]})
+        return db.execute(sql, params).fetchall()
 
     @app.post("/api/orders")
     def api_add_order():
@@ -745,34 +1518,42 @@ def create_app() -> Flask:
         if not meal_type:
             meal_type = menu["meal_type"]
 
-        total_price = float(menu["price"]) * quantity_i
+        total_price = int(menu["price"]) * quantity_i
         status = payload.get("status") or "pending"
 
         if status not in ("pending", "paid", "preparing", "ready", "received", "cancelled"):
             return api_error("Некорректный status", 400)
 
         now = utcnow_iso()
-        cur = db.execute(
-            """INSERT INTO orders (student_id, menu_item_id, order_date, meal_type, quantity, total_price, status, payment_type,
-                                 subscription_id, special_instructions, received_at, created_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                int(student_id),
-                int(menu_id),
-                order_date,
-                meal_type,
-                quantity_i,
-                total_price,
-                status,
-                payment_type,
-                payload.get("subscriptionId"),
-                special,
-                payload.get("receivedAt"),
-                now,
-            ),
-        )
-        order_id = cur.lastrowid
-        db.commit()
+        try:
+            cur = db.execute(
+                """INSERT INTO orders (student_id, menu_item_id, order_date, meal_type, quantity, total_price, status, payment_type,
+                                     subscription_id, special_instructions, received_at, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    int(student_id),
+                    int(menu_id),
+                    order_date,
+                    meal_type,
+                    quantity_i,
+                    total_price,
+                    status,
+                    payment_type,
+                    payload.get("subscriptionId"),
+                    special,
+                    payload.get("receivedAt"),
+                    now,
+                ),
+            )
+            order_id = cur.lastrowid
+            if status in CONSUMING_STATUSES:
+                consume_orders(db, [order_id])
+            db.commit()
+        except sqlite3.IntegrityError:
+            # The order row and the stock movements share the transaction: undo both here,
+            # not when the pool takes the connection back
+            db.rollback()
+            return api_error("Заказ по этому абонементу на эту дату уже существует", 409)
 
         _create_notification(
             db,
@@ -790,6 +1571,143 @@ def create_app() -> Flask:
 
         return jsonify({"ok": True, "order": order_row_to_api(row)})
 
+    @app.post("/api/orders/batch")
+    def api_add_class_orders():
+        """One dish for a whole class (`className`) or a list of `studentIds` (admin only).
+
+        All students are checked at once: inactive or unknown ones, dishes with
+        their allergens, an existing order of the same dish that day and (with
+        `charge`, the default) a balance below the price are skipped. The rest
+        get their order, debit and notification in one transaction. Returns a
+        result per student.
+        """
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        payload = request.get_json(silent=True) or {}
+        class_name = (payload.get("className") or payload.get("class") or "").strip()
+        student_ids = payload.get("studentIds")
+        menu_id = payload.get("menuId") or payload.get("menu_item_id") or payload.get("dishId")
+        order_date = payload.get("date") or payload.get("orderDate") or today_str()
+        charge = payload.get("charge", True) is not False
+        special = payload.get("specialInstructions")
+
+        if not menu_id or not (class_name or student_ids):
+            return api_error("menuId and className or studentIds required", 400)
+        if student_ids is not None:
+            if not isinstance(student_ids, list) or not all(str(i).isdigit() for i in student_ids):
+                return api_error("studentIds must be a list of ids", 400)
+            student_ids = list(dict.fromkeys(int(i) for i in student_ids))
+            if len(student_ids) > MAX_CLASS_ORDER:
+                return api_error(f"at most {MAX_CLASS_ORDER} students per request", 400)
+
+        db = get_db()
+        menu = db.execute("SELECT * FROM menu_items WHERE id = ?", (int(menu_id),)).fetchone()
+        if not menu:
+            return api_error("Блюдо не найдено", 404)
+        price = int(menu["price"])
+
+        if student_ids is not None:
+            students = db.execute(
+                "SELECT id, full_name, role, is_active, balance, allergies, allergy_mask FROM users "
+                "WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(student_ids),),
+            ).fetchall()
+        else:
+            students = db.execute(
+                "SELECT id, full_name, role, is_active, balance, allergies, allergy_mask FROM users "
+                "WHERE class = ? AND role = 'student' ORDER BY full_name LIMIT ?",
+                (class_name, MAX_CLASS_ORDER),
+            ).fetchall()
+            if not students:
+                return api_error("В классе нет учеников", 404)
+            student_ids = [r["id"] for r in students]
+        by_id = {r["id"]: r for r in students}
+        ordered = {
+            r["student_id"] for r in db.execute(
+                "SELECT student_id FROM orders WHERE menu_item_id = ? AND order_date = ? AND status != 'cancelled' "
+                "AND student_id IN (SELECT value FROM json_each(?))",
+                (menu["id"], order_date, json.dumps(student_ids)),
+            )
+        }
+        dictionary = load_dictionary(db)
+        # Masks are NULL on rows written around index_user/index_menu_items (imports,
+        # direct inserts): computed from the names then, as /api/menu does.
+        menu_mask = menu["allergen_mask"] if menu["allergen_mask"] is not None else matching_mask(
+            dictionary, parse_json_list(menu["allergens"]))
+
+        results: list[dict[str, Any]] = []
+        accepted: list[sqlite3.Row] = []
+        for sid in student_ids:
+            u = by_id.get(sid)
+            result: dict[str, Any] = {"studentId": sid, "name": u["full_name"] if u else None}
+            if u is None or u["role"] != "student":
+                result["status"] = "not_found"
+                results.append(result)
+                continue
+            student_mask = u["allergy_mask"] if u["allergy_mask"] is not None else matching_mask(
+                dictionary, parse_json_list(u["allergies"]))
+            if not u["is_active"]:
+                result["status"] = "inactive"
+            elif menu_mask & student_mask:
+                result["status"] = "allergy"
+                result["conflictAllergens"] = conflicting(
+                    parse_json_list(menu["allergens"]), dictionary, menu_mask & student_mask)
+            elif sid in ordered:
+                result["status"] = "duplicate"
+            elif charge and (u["balance"] or 0) < price:
+                result["status"] = "insufficient_funds"
+            else:
+                result["status"] = "created"
+                accepted.append(u)
+            results.append(result)
+
+        now = utcnow_iso()
+        status = "paid" if charge else "pending"
+        order_ids: list[int] = []
+        try:
+            if accepted:
+                # One row at a time: each id is read back, never inferred, since it keys the debit
+                order_ids = [
+                    db.execute(
+                        """INSERT INTO orders (student_id, menu_item_id, order_date, meal_type, quantity, total_price,
+                                             status, payment_type, special_instructions, created_at)
+                           VALUES (?, ?, ?, ?, 1, ?, ?, 'one_time', ?, ?)""",
+                        (u["id"], menu["id"], order_date, menu["meal_type"], price, status, special, now),
+                    ).lastrowid
+                    for u in accepted
+                ]
+                if charge:
+                    post_entries(db, [
+                        {"user_id": u["id"], "amount": -price, "transaction_id": f"order-{oid}",
+                         "description": f"Заказ: {menu['name']}", "metadata": {"orderId": oid}}
+                        for u, oid in zip(accepted, order_ids)
+                    ])
+                db.executemany(
+                    "INSERT INTO notifications (user_id, type, title, message, is_read, link, created_at) "
+                    "VALUES (?, 'order', 'Новый заказ', ?, 0, '/student.html', ?)",
+                    [(u["id"], f"Для вас заказано '{menu['name']}' на {order_date}", now) for u in accepted],
+                )
+            db.commit()
+        except InsufficientFunds:
+            # A balance changed since it was checked: nothing was written
+            db.rollback()
+            return api_error("Баланс учеников изменился, повторите заказ", 409)
+
+        ids = iter(order_ids)
+        for result in results:
+            if result["status"] == "created":
+                result["orderId"] = next(ids)
+        return jsonify({
+            "ok": True,
+            "menuId": menu["id"],
+            "date": order_date,
+            "created": len(order_ids),
+            "skipped": len(results) - len(order_ids),
+            "totalCharged": to_rubles(price * len(order_ids)) if charge else 0.0,
+            "results": results,
+        })
+
     @app.put("/api/orders/<int:order_id>")
     def api_update_order(order_id: int):
         payload = request.get_json(silent=True) or {}
@@ -833,6 +1751,8 @@ def create_app() -> Flask:
             return api_error("Заказ не найден", 404)
 
         db.execute(f"UPDATE orders SET {', '.join(sets)} WHERE id = ?", params)
+        if payload.get("status") in CONSUMING_STATUSES:
+            consume_orders(db, [order_id])
         db.commit()
 
         new = db.execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
@@ -854,6 +1774,383 @@ def create_app() -> Flask:
 
         return jsonify({"ok": True, "order": order_row_to_api(row)})
 
+    @app.post("/api/orders/status")
+    def api_update_orders_status():
+        """Move a batch of orders (e.g. a whole service) to one status in a single transaction."""
+        payload = request.get_json(silent=True) or {}
+        status = payload.get("status")
+        order_ids = payload.get("orderIds")
+        if status not in ("pending", "paid", "preparing", "ready", "received", "cancelled"):
+            return api_error("Некорректный status", 400)
+        if not isinstance(order_ids, list) or not order_ids:
+            return api_error("orderIds must be a non-empty list", 400)
+        try:
+            ids_json = json.dumps(sorted({int(i) for i in order_ids}))
+        except (TypeError, ValueError):
+            return api_error("orderIds must be integers", 400)
+
+        db = get_db()
+        now = utcnow_iso()
+        try:
+            changed = [r[0] for r in db.execute(
+                "SELECT id FROM orders WHERE id IN (SELECT value FROM json_each(?)) AND status != ?", (ids_json, status)
+            )]
+            db.execute(
+                "UPDATE orders SET status = ?, received_at = CASE WHEN ? = 'received' THEN COALESCE(received_at, ?) ELSE received_at END "
+                "WHERE id IN (SELECT value FROM json_each(?)) AND status != ?",
+                (status, status, now, json.dumps(changed), status),
+            )
+            stock = consume_orders(db, changed) if status in CONSUMING_STATUSES else {"movements": 0, "items": 0}
+            if status == "received" and changed:
+                db.execute(
+                    """INSERT INTO notifications (user_id, type, title, message, is_read, link, created_at)
+                       SELECT student_id, 'order', 'Заказ получен', 'Ваш заказ был успешно получен', 0, '/student.html', ?
+                       FROM orders WHERE id IN (SELECT value FROM json_each(?))""",
+                    (now, json.dumps(changed)),
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return jsonify({"ok": True, "updated": len(changed), "stock": stock})
+
+
+    # ---- API: subscriptions ----
+    def subscription_row_to_api(row: sqlite3.Row) -> dict[str, Any]:
+        start, end = date.fromisoformat(row["start_date"]), date.fromisoformat(row["end_date"])
+        used_until = min(date.today(), end)
+        return {
+            "id": row["id"],
+            "studentId": row["student_id"],
+            "planType": row["plan_type"],
+            "startDate": row["start_date"],
+            "endDate": row["end_date"],
+            "price": to_rubles(row["price"]),
+            "status": row["status"],
+            "paymentId": row["payment_id"],
+            # School days covered by the plan and already passed
+            "totalDays": count_school_days(start, end),
+            "usedDays": count_school_days(start, used_until),
+            "createdAt": row["created_at"],
+        }
+
+    def _parse_plan_period(payload: dict[str, Any], default_start: date):
+        """(start, end) from startDate + days|endDate, or an error response."""
+        try:
+            start = date.fromisoformat(payload["startDate"]) if payload.get("startDate") else default_start
+            if payload.get("endDate"):
+                end = date.fromisoformat(payload["endDate"])
+            else:
+                days = int(payload.get("days") or 0)
+                if days <= 0:
+                    return None, api_error("days or endDate required", 400)
+                end = add_school_days(start, days)
+        except (TypeError, ValueError):
+            return None, api_error("startDate/endDate must be YYYY-MM-DD, days a positive integer", 400)
+        if end < start:
+            return None, api_error("endDate must not be before startDate", 400)
+        return (start, end), None
+
+    @app.get("/api/subscriptions")
+    def api_get_subscriptions():
+        student_id = request.args.get("studentId") or request.args.get("userId")
+        status = request.args.get("status")
+
+        sql = "SELECT * FROM subscriptions WHERE 1=1"
+        params: list[Any] = []
+        if student_id:
+            sql += " AND student_id = ?"
+            params.append(int(student_id))
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        sql += " ORDER BY created_at DESC, id DESC"
+
+        rows = get_db().execute(sql, params).fetchall()
+        return jsonify({"ok": True, "subscriptions": [subscription_row_to_api(r) for r in rows]})
+
+    @app.post("/api/subscriptions")
+    def api_create_subscription():
+        payload = request.get_json(silent=True) or {}
+        student_id = payload.get("studentId") or payload.get("student_id")
+        plan_type = payload.get("planType") or payload.get("plan_type")
+        if not student_id or not plan_type:
+            return api_error("studentId and planType required", 400)
+        if plan_type not in PLAN_MEALS:
+            return api_error("planType must be breakfast|lunch|full", 400)
+        try:
+            price = to_kopecks(payload.get("price") or 0)
+            if price < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return api_error("price must be a non-negative number", 400)
+
+        period, err = _parse_plan_period(payload, date.today())
+        if err:
+            return err
+        start, end = period
+
+        db = get_db()
+        student = db.execute("SELECT id, role FROM users WHERE id = ?", (int(student_id),)).fetchone()
+        if not student or student["role"] != "student":
+            return api_error("Ученик не найден", 404)
+
+        transaction_id = payload.get("transactionId") or payload.get("paymentId") or uuid.uuid4().hex
+        if db.execute("SELECT 1 FROM subscriptions WHERE payment_id = ?", (transaction_id,)).fetchone():
+            # Retried purchase: already bought and charged
+            row = db.execute("SELECT * FROM subscriptions WHERE payment_id = ?", (transaction_id,)).fetchone()
+            balance = db.execute("SELECT balance FROM users WHERE id = ?", (row["student_id"],)).fetchone()["balance"]
+            return jsonify({"ok": True, "subscription": subscription_row_to_api(row), "balance": to_rubles(balance)})
+
+        try:
+            post_entry(db, int(student_id), -price, transaction_id=transaction_id,
+                       description=f"Абонемент ({plan_type})", metadata={"kind": "subscription"})
+        except InsufficientFunds:
+            db.rollback()
+            return api_error("Недостаточно средств", 400)
+        cur = db.execute(
+            """INSERT INTO subscriptions (student_id, plan_type, start_date, end_date, price, status, payment_id, created_at)
+               VALUES (?, ?, ?, ?, ?, 'active', ?, ?)""",
+            (int(student_id), plan_type, start.isoformat(), end.isoformat(), price, transaction_id, utcnow_iso()),
+        )
+        sub_id = cur.lastrowid
+        db.commit()
+
+        row = db.execute("SELECT * FROM subscriptions WHERE id = ?", (sub_id,)).fetchone()
+        balance = db.execute("SELECT balance FROM users WHERE id = ?", (int(student_id),)).fetchone()["balance"]
+        return jsonify({"ok": True, "subscription": subscription_row_to_api(row), "balance": to_rubles(balance)})
+
+    @app.post("/api/subscriptions/<int:sub_id>/renew")
+    def api_renew_subscription(sub_id: int):
+        payload = request.get_json(silent=True) or {}
+        db = get_db()
+        row = db.execute("SELECT * FROM subscriptions WHERE id = ?", (sub_id,)).fetchone()
+        if not row:
+            return api_error("Абонемент не найден", 404)
+        if row["status"] == "cancelled":
+            return api_error("Cancelled subscription cannot be renewed", 400)
+
+        # Renewal continues after the current end date (or from today if it has already passed).
+        old_end = date.fromisoformat(row["end_date"])
+        default_start = max(old_end + timedelta(days=1), date.today())
+        if not payload.get("days") and not payload.get("endDate"):
+            payload = dict(payload, days=count_school_days(date.fromisoformat(row["start_date"]), old_end) or 1)
+        period, err = _parse_plan_period(dict(payload, startDate=default_start.isoformat()), default_start)
+        if err:
+            return err
+        _start, end = period
+        try:
+            price = to_kopecks(payload["price"]) if payload.get("price") is not None else int(row["price"])
+            if price < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return api_error("price must be a non-negative number", 400)
+
+        try:
+            _entry, created = post_entry(db, row["student_id"], -price, transaction_id=payload.get("transactionId"),
+                                         description=f"Продление абонемента ({row['plan_type']})",
+                                         metadata={"kind": "subscription", "subscriptionId": sub_id})
+        except InsufficientFunds:
+            db.rollback()
+            return api_error("Недостаточно средств", 400)
+        if not created:
+            # Retried renewal: it was already paid for and applied
+            db.rollback()
+            balance = db.execute("SELECT balance FROM users WHERE id = ?", (row["student_id"],)).fetchone()["balance"]
+            return jsonify({"ok": True, "subscription": subscription_row_to_api(row), "balance": to_rubles(balance)})
+        # A lapsed plan gets a fresh start date so that history stays contiguous.
+        new_start = row["start_date"] if row["status"] == "active" else default_start.isoformat()
+        db.execute(
+            "UPDATE subscriptions SET start_date = ?, end_date = ?, price = price + ?, status = 'active' WHERE id = ?",
+            (new_start, end.isoformat(), price, sub_id),
+        )
+        db.commit()
+
+        row = db.execute("SELECT * FROM subscriptions WHERE id = ?", (sub_id,)).fetchone()
+        balance = db.execute("SELECT balance FROM users WHERE id = ?", (row["student_id"],)).fetchone()["balance"]
+        return jsonify({"ok": True, "subscription": subscription_row_to_api(row), "balance": to_rubles(balance)})
+
+    @app.post("/api/subscriptions/<int:sub_id>/cancel")
+    def api_cancel_subscription(sub_id: int):
+        db = get_db()
+        row = db.execute("SELECT * FROM subscriptions WHERE id = ?", (sub_id,)).fetchone()
+        if not row:
+            return api_error("Абонемент не найден", 404)
+
+        db.execute("UPDATE subscriptions SET status = 'cancelled' WHERE id = ?", (sub_id,))
+        # Orders already materialized for future days are no longer wanted.
+        cur = db.execute(
+            """UPDATE orders SET status = 'cancelled'
+               WHERE subscription_id = ? AND order_date > ? AND status IN ('pending', 'paid')""",
+            (sub_id, today_str()),
+        )
+        db.commit()
+
+        row = db.execute("SELECT * FROM subscriptions WHERE id = ?", (sub_id,)).fetchone()
+        return jsonify({"ok": True, "subscription": subscription_row_to_api(row), "cancelledOrders": cur.rowcount})
+
+    @app.post("/api/admin/subscriptions/run")
+    def api_run_subscriptions():
+        """Run the daily subscription job now (normally started by cron)."""
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        payload = request.get_json(silent=True) or {}
+        try:
+            day = date.fromisoformat(payload["date"]) if payload.get("date") else None
+        except ValueError:
+            return api_error("date must be YYYY-MM-DD", 400)
+        return jsonify({"ok": True, "result": run_subscriptions_daily(get_db(), day)})
+
+    # ---- API: payments (balance ledger) ----
+    @app.post("/api/payments")
+    def api_add_payment():
+        """Credit (top-up) or debit the balance; `transactionId` makes retries safe."""
+        payload = request.get_json(silent=True) or {}
+        user_id = payload.get("userId") or payload.get("user_id")
+        kind = payload.get("type") or "credit"
+        method = payload.get("method") or payload.get("paymentMethod") or ("card" if kind == "credit" else "transfer")
+        if not user_id:
+            return api_error("userId and amount required", 400)
+        if kind not in ("credit", "debit"):
+            return api_error("type must be credit|debit", 400)
+        if method not in PAYMENT_METHODS:
+            return api_error("method must be " + "|".join(PAYMENT_METHODS), 400)
+        try:
+            amount = to_kopecks(payload.get("amount"))
+            if amount <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return api_error("amount must be a positive number", 400)
+
+        metadata = {k: payload[k] for k in ("orderId", "subscriptionId") if payload.get(k) is not None} or None
+        db = get_db()
+        try:
+            row, created = post_entry(
+                db,
+                int(user_id),
+                amount if kind == "credit" else -amount,
+                transaction_id=payload.get("transactionId"),
+                method=method,
+                description=payload.get("description"),
+                metadata=metadata,
+            )
+        except InsufficientFunds:
+            db.rollback()
+            return api_error("Недостаточно средств", 400)
+        except LookupError:
+            db.rollback()
+            return api_error("Пользователь не найден", 404)
+        db.commit()
+
+        if created and kind == "credit" and method != "transfer":
+            _create_notification(db, int(user_id), "payment", "Пополнение баланса",
+                                 f"Баланс пополнен на {to_rubles(amount):g} руб.", "/student.html")
+        balance = db.execute("SELECT balance FROM users WHERE id = ?", (int(user_id),)).fetchone()["balance"]
+        return jsonify({"ok": True, "payment": payment_row_to_api(row), "duplicate": not created,
+                        "balance": to_rubles(balance)})
+
+    @app.post("/api/payments/<transaction_id>/refund")
+    def api_refund_payment(transaction_id: str):
+        """Reverse a debit. Idempotent: the refund's own key is `<transactionId>:refund`."""
+        db = get_db()
+        original = db.execute("SELECT * FROM payments WHERE transaction_id = ?", (transaction_id,)).fetchone()
+        if not original:
+            return api_error("Платёж не найден", 404)
+        if original["amount"] >= 0:
+            return api_error("Only debits can be refunded", 400)
+
+        row, created = post_entry(
+            db,
+            original["user_id"],
+            -original["amount"],
+            transaction_id=f"{transaction_id}:refund",
+            description="Возврат: " + (original["description"] or transaction_id),
+            metadata={"kind": "refund", "refundOf": transaction_id},
+        )
+        db.commit()
+        balance = db.execute("SELECT balance FROM users WHERE id = ?", (original["user_id"],)).fetchone()["balance"]
+        return jsonify({"ok": True, "payment": payment_row_to_api(row), "duplicate": not created,
+                        "balance": to_rubles(balance)})
+
+    @app.get("/api/users/<int:user_id>/statement")
+    def api_user_statement(user_id: int):
+        """Payments newest first; pass `before` = `nextBefore` of the previous page."""
+        try:
+            before = int(request.args["before"]) if request.args.get("before") else None
+            limit = min(max(int(request.args.get("limit") or 50), 1), 500)
+        except ValueError:
+            return api_error("before and limit must be integers", 400)
+
+        db = get_db()
+        user = db.execute("SELECT balance FROM users WHERE id = ?", (user_id,)).fetchone()
+        if not user:
+            return api_error("Пользователь не найден", 404)
+        entries, next_before = statement(db, user_id, before, limit)
+        return jsonify({"ok": True, "balance": to_rubles(user["balance"]), "entries": entries, "nextBefore": next_before})
+
+    @app.post("/api/admin/ledger/snapshot")
+    def api_ledger_snapshot():
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        return jsonify({"ok": True, "updated": snapshot_balances(get_db())})
+
+    @app.get("/api/admin/ledger/reconcile")
+    def api_ledger_reconcile():
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        user_id = request.args.get("userId")
+        mismatches = reconcile(get_db(), int(user_id) if user_id and user_id.isdigit() else None)
+        return jsonify({"ok": True, "mismatches": mismatches})
+
+    # ---- API: user activity ----
+    @app.post("/api/users/<int:user_id>/activity")
+    def api_log_activity(user_id: int):
+        """Buffered: the event is written by the activity flusher, not by this request."""
+        payload = request.get_json(silent=True) or {}
+        action = (payload.get("action") or "").strip()
+        if not action:
+            return api_error("action required", 400)
+        details = payload.get("details")
+        if details is not None and not isinstance(details, dict):
+            return api_error("details must be an object", 400)
+
+        if not get_db().execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone():
+            return api_error("Пользователь не найден", 404)
+        if payload.get("timestamp"):
+            # The client clock is kept for reference; ordering uses the server time.
+            details = dict(details or {}, clientTimestamp=str(payload["timestamp"])[:40])
+        return jsonify({"ok": True, "activity": current_tenant().activity.log(user_id, action, details)}), 202
+
+    @app.get("/api/users/<int:user_id>/activity")
+    def api_user_activity(user_id: int):
+        """Newest first; pass `before` = `nextBefore` of the previous page."""
+        try:
+            before = parse_cursor(request.args.get("before"))
+            limit = min(max(int(request.args.get("limit") or 50), 1), 500)
+        except ValueError:
+            return api_error("invalid before or limit", 400)
+
+        db = get_db()
+        if not db.execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone():
+            return api_error("Пользователь не найден", 404)
+        activity = current_tenant().activity
+        if before is None and activity.pending():
+            # First page should include what was just logged.
+            activity.flush()
+        items, next_before = read_activity_page(db, user_id, before, limit)
+        return jsonify({"ok": True, "activities": items, "nextBefore": next_before})
+
+    @app.post("/api/admin/activity/retention")
+    def api_activity_retention():
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        activity = current_tenant().activity
+        activity.flush()
+        return jsonify({"ok": True, "dropped": activity.enforce_retention()})
 
     # ---- API: inventory ----
     def _compute_stock_status(quantity: float, min_quantity: float) -> str:
@@ -924,11 +2221,14 @@ def create_app() -> Flask:
         now = utcnow_iso()
         today = today_str()
         db = get_db()
+        # Quantity starts at 0 and the opening stock goes through the movement ledger
         cur = db.execute(
             'INSERT INTO inventory (product_name, category, quantity, unit, min_quantity, expiration_date, supplier, last_restocked, status, created_at, updated_at) '
-            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-            (product_name, category, qty_f, unit, min_qty_f, exp, supplier, today, status, now, now),
+            'VALUES (?, ?, 0, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (product_name, category, unit, min_qty_f, exp, supplier, today, status, now, now),
         )
+        if qty_f:
+            record_movement(db, cur.lastrowid, qty_f, 'opening', note='Начальный остаток', update_status=False)
         db.commit()
 
         row = db.execute('SELECT * FROM inventory WHERE id = ?', (cur.lastrowid,)).fetchone()
@@ -996,12 +2296,19 @@ def create_app() -> Flask:
                 if val not in ('in_stock', 'low_stock', 'out_of_stock'):
                     return api_error('status must be in_stock|low_stock|out_of_stock', 400)
 
+            if col == 'quantity':
+                # Written below as a stock movement
+                continue
             sets.append(f"{col} = ?")
             params.append(val)
 
-        if not sets:
+        if not sets and qty_new is None:
             return api_error('Нет поддерживаемых полей', 400)
 
+        reason = payload.get('reason')
+        if reason is not None and reason not in ('restock', 'adjustment', 'waste'):
+            return api_error('reason must be restock|adjustment|waste', 400)
+
         qty_eff = float(qty_new) if qty_new is not None else float(old['quantity'])
         min_eff = float(min_new) if min_new is not None else float(old['min_quantity'])
 
@@ -1019,11 +2326,84 @@ def create_app() -> Flask:
 
         params.append(item_id)
         db.execute(f"UPDATE inventory SET {', '.join(sets)} WHERE id = ?", params)
+        delta = round(qty_eff - float(old['quantity']), 3) if qty_new is not None else 0
+        if delta:
+            # A counted quantity from the cook: record the difference, status was set above
+            record_movement(db, item_id, delta, reason or ('restock' if delta > 0 else 'adjustment'),
+                            note=payload.get('note'), update_status=False)
         db.commit()
 
         row = db.execute('SELECT * FROM inventory WHERE id = ?', (item_id,)).fetchone()
         return jsonify({'ok': True, 'item': inventory_row_to_api(row)})
 
+    @app.get('/api/inventory/<int:item_id>/movements')
+    def api_inventory_movements(item_id: int):
+        """Movements newest first; pass `before` = `nextBefore` of the previous page."""
+        try:
+            before = int(request.args['before']) if request.args.get('before') else None
+            limit = min(max(int(request.args.get('limit') or 50), 1), 500)
+        except ValueError:
+            return api_error('before and limit must be integers', 400)
+
+        db = get_db()
+        if not db.execute('SELECT 1 FROM inventory WHERE id = ?', (item_id,)).fetchone():
+            return api_error('Позиция не найдена', 404)
+        sql = 'SELECT * FROM stock_movements WHERE inventory_id = ?'
+        params: list[Any] = [item_id]
+        if before is not None:
+            sql += ' AND id < ?'
+            params.append(before)
+        sql += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit + 1)
+        rows = db.execute(sql, params).fetchall()
+        next_before = rows[limit - 1]['id'] if len(rows) > limit else None
+        return jsonify({'ok': True, 'movements': [movement_row_to_api(r) for r in rows[:limit]], 'nextBefore': next_before})
+
+    @app.post('/api/inventory/<int:item_id>/movements')
+    def api_add_inventory_movement(item_id: int):
+        """Delivery (`restock`), write-off (`waste`) or correction (`adjustment`) by a signed delta."""
+        payload = request.get_json(silent=True) or {}
+        reason = payload.get('reason') or 'restock'
+        if reason not in ('restock', 'adjustment', 'waste'):
+            return api_error('reason must be restock|adjustment|waste', 400)
+        try:
+            delta = float(payload.get('delta'))
+        except (TypeError, ValueError):
+            return api_error('delta must be number', 400)
+        if not delta:
+            return api_error('delta must not be zero', 400)
+        if reason == 'restock' and delta < 0 or reason == 'waste' and delta > 0:
+            return api_error('restock must be positive, waste negative', 400)
+
+        db = get_db()
+        try:
+            movement = record_movement(db, item_id, delta, reason, note=payload.get('note'))
+        except LookupError:
+            db.rollback()
+            return api_error('Позиция не найдена', 404)
+        if reason == 'restock':
+            db.execute('UPDATE inventory SET last_restocked = ? WHERE id = ?', (today_str(), item_id))
+        db.commit()
+
+        row = db.execute('SELECT * FROM inventory WHERE id = ?', (item_id,)).fetchone()
+        return jsonify({'ok': True, 'movement': movement_row_to_api(movement), 'item': inventory_row_to_api(row)})
+
+    @app.post('/api/admin/stock/snapshot')
+    def api_stock_snapshot():
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        return jsonify({'ok': True, 'updated': snapshot_stock(get_db())})
+
+    @app.get('/api/admin/stock/reconcile')
+    def api_stock_reconcile():
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        item_id = request.args.get('inventoryId')
+        mismatches = reconcile_stock(get_db(), int(item_id) if item_id and item_id.isdigit() else None)
+        return jsonify({'ok': True, 'mismatches': mismatches})
+
     @app.delete('/api/inventory/<int:item_id>')
     def api_delete_inventory(item_id: int):
         db = get_db()
@@ -1063,6 +2443,110 @@ def create_app() -> Flask:
         rows = db.execute(sql, params).fetchall()
         return jsonify({"ok": True, "requests": [purchase_row_to_api(r) for r in rows]})
 
+    @app.get("/api/purchase_requests/groups")
+    def api_get_purchase_request_groups():
+        """Requests consolidated by product, unit and supplier (from inventory), most urgent first."""
+        status = request.args.get("status") or "pending"
+        if status not in ("pending", "approved", "rejected", "completed"):
+            return api_error("Некорректный status", 400)
+
+        db = get_db()
+        # Product names are typed by cooks: match case-insensitively (SQLite lower() is ASCII-only)
+        stock_items: dict[tuple[str, str], sqlite3.Row] = {}
+        for r in db.execute("SELECT product_name, unit, supplier FROM inventory ORDER BY id DESC"):
+            stock_items[(r["product_name"].strip().casefold(), r["unit"])] = r
+
+        urgency_rank = {"low": 1, "medium": 2, "high": 3}
+        groups: dict[tuple[str, str, Optional[str]], dict[str, Any]] = {}
+        for r in db.execute(
+            "SELECT id, cook_id, product_name, quantity, unit, urgency, created_at FROM purchase_requests "
+            "WHERE status = ? ORDER BY created_at, id",
+            (status,),
+        ):
+            product_key = r["product_name"].strip().casefold()
+            item = stock_items.get((product_key, r["unit"]))
+            supplier = (item["supplier"] or None) if item is not None else None
+            group = groups.get((product_key, r["unit"], supplier))
+            if group is None:
+                group = groups[(product_key, r["unit"], supplier)] = {
+                    "productName": item["product_name"] if item is not None else r["product_name"].strip(),
+                    "unit": r["unit"], "supplier": supplier, "inInventory": item is not None,
+                    "totalQuantity": 0.0, "requestCount": 0, "cookIds": set(), "urgency": "low",
+                    "oldestAt": r["created_at"], "requestIds": [],
+                }
+            group["totalQuantity"] += float(r["quantity"])
+            group["requestCount"] += 1
+            group["cookIds"].add(r["cook_id"])
+            group["requestIds"].append(r["id"])
+            if urgency_rank.get(r["urgency"], 2) > urgency_rank[group["urgency"]]:
+                group["urgency"] = r["urgency"]
+
+        result = []
+        for group in groups.values():
+            group["totalQuantity"] = round(group["totalQuantity"], 3)
+            group["cookCount"] = len(group.pop("cookIds"))
+            result.append(group)
+        result.sort(key=lambda g: (-urgency_rank[g["urgency"]], g["oldestAt"]))
+        return jsonify({"ok": True, "groups": result})
+
+    @app.post("/api/purchase_requests/bulk")
+    def api_bulk_update_purchase_requests():
+        """Approve or reject many requests (e.g. a consolidated group) in one transaction."""
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        payload = request.get_json(silent=True) or {}
+        status = payload.get("status")
+        if status not in ("approved", "rejected", "completed"):
+            return api_error("status must be approved|rejected|completed", 400)
+        request_ids = payload.get("requestIds")
+        if not isinstance(request_ids, list) or not request_ids:
+            return api_error("requestIds must be a non-empty list", 400)
+        try:
+            ids_json = json.dumps(sorted({int(i) for i in request_ids}))
+        except (TypeError, ValueError):
+            return api_error("requestIds must be integers", 400)
+
+        admin_id = int(request.headers.get("X-User-Id") or request.args.get("adminId"))
+        # approve/reject only pending requests; complete only approved ones
+        from_status = "approved" if status == "completed" else "pending"
+        status_text = {"approved": "одобрена", "rejected": "отклонена", "completed": "выполнена"}[status]
+        status_text_many = {"approved": "одобрены", "rejected": "отклонены", "completed": "выполнены"}[status]
+        now = utcnow_iso()
+
+        db = get_db()
+        try:
+            changed = json.dumps([r[0] for r in db.execute(
+                "SELECT id FROM purchase_requests WHERE id IN (SELECT value FROM json_each(?)) AND status = ?",
+                (ids_json, from_status),
+            )])
+            updated = db.execute(
+                """UPDATE purchase_requests
+                   SET status = :status, admin_id = :admin_id,
+                       admin_notes = COALESCE(:notes, admin_notes),
+                       approved_at = CASE WHEN :status = 'approved' THEN :now ELSE approved_at END,
+                       completed_at = CASE WHEN :status = 'completed' THEN :now ELSE completed_at END
+                   WHERE id IN (SELECT value FROM json_each(:ids)) AND status = :from_status""",
+                {"status": status, "admin_id": admin_id, "notes": payload.get("adminNotes"), "now": now,
+                 "ids": changed, "from_status": from_status},
+            ).rowcount
+            # One notification per cook, listing their products
+            db.execute(
+                """INSERT INTO notifications (user_id, type, title, message, is_read, link, created_at)
+                   SELECT cook_id, 'system', 'Статус заявки изменен',
+                          CASE WHEN COUNT(1) = 1 THEN 'Ваша заявка на ' || MIN(TRIM(product_name)) || ' была ' || :one
+                               ELSE 'Ваши заявки ' || :many || ': ' || group_concat(TRIM(product_name), ', ') END,
+                          0, '/cook.html', :now
+                   FROM purchase_requests WHERE id IN (SELECT value FROM json_each(:ids))
+                   GROUP BY cook_id""",
+                {"one": status_text, "many": status_text_many, "now": now, "ids": changed},
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return jsonify({"ok": True, "updated": updated, "skipped": len(json.loads(ids_json)) - updated})
+
     @app.post("/api/purchase_requests")
     def api_add_purchase_request():
         payload = request.get_json(silent=True) or {}
@@ -1242,6 +2726,95 @@ def create_app() -> Flask:
         row2 = db.execute("SELECT * FROM notifications WHERE id = ?", (notif_id,)).fetchone()
         return jsonify({"ok": True, "notification": notification_row_to_api(row2)})
 
+    # ---- API: critical events ----
+    @app.get("/api/critical_events")
+    def api_get_critical_events():
+        """Open events by default (highest priority, newest first); `status=all` for history."""
+        status = request.args.get("status") or "open"
+        if status not in ("open", "resolved", "ignored", "all"):
+            return api_error("status must be open, resolved, ignored or all", 400)
+        try:
+            limit = min(max(int(request.args.get("limit") or 50), 1), 500)
+        except ValueError:
+            return api_error("limit must be integer", 400)
+
+        db = get_db()
+        tenant = current_tenant()
+        # Without the scheduler the time-based sweep piggybacks on reads, at most once per
+        # interval, and always on the first read: stock can enter the expiry window after
+        # the sweep in open_tenant and before the interval has passed.
+        due = tenant.last_critical_sweep is None or (
+            time.monotonic() - tenant.last_critical_sweep >= app.config["CRITICAL_SWEEP_SECONDS"])
+        if tenant.scheduler is None and due:
+            tenant.last_critical_sweep = time.monotonic()
+            sweep_critical_events(db, app.config["CRITICAL_EXPIRY_DAYS"], app.config["CRITICAL_OVERDUE_HOURS"])
+
+        if status == "all":
+            rows = db.execute("SELECT * FROM critical_events ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            # Walks idx_critical_events_status: cost depends on `limit`, not on history size
+            rows = db.execute(
+                "SELECT * FROM critical_events WHERE status = ? ORDER BY severity DESC, created_at DESC LIMIT ?",
+                (status, limit),
+            ).fetchall()
+        return jsonify({"ok": True, "events": [event_row_to_api(r) for r in rows]})
+
+    def _set_critical_event_status(event_id: int, status: str):
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        db = get_db()
+        cur = db.execute(
+            "UPDATE critical_events SET status = ?, resolved_by = ?, resolved_at = ? WHERE id = ?",
+            (status, int(request.headers.get("X-User-Id") or request.args.get("adminId")), utcnow_iso(), event_id),
+        )
+        if cur.rowcount == 0:
+            return api_error("Событие не найдено", 404)
+        db.commit()
+        row = db.execute("SELECT * FROM critical_events WHERE id = ?", (event_id,)).fetchone()
+        return jsonify({"ok": True, "event": event_row_to_api(row)})
+
+    @app.post("/api/critical_events/<int:event_id>/resolve")
+    def api_resolve_critical_event(event_id: int):
+        return _set_critical_event_status(event_id, "resolved")
+
+    @app.post("/api/critical_events/<int:event_id>/ignore")
+    def api_ignore_critical_event(event_id: int):
+        return _set_critical_event_status(event_id, "ignored")
+
+    @app.post("/api/admin/critical_events/sweep")
+    def api_sweep_critical_events():
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        current_tenant().last_critical_sweep = time.monotonic()
+        created = sweep_critical_events(get_db(), app.config["CRITICAL_EXPIRY_DAYS"], app.config["CRITICAL_OVERDUE_HOURS"])
+        return jsonify({"ok": True, "created": created})
+
+    # ---- API: demand forecast ----
+    @app.get("/api/forecast")
+    def api_forecast():
+        """Expected portions per menu item and ingredient needs for the next `days` days."""
+        try:
+            start = date.fromisoformat(request.args["start"]) if request.args.get("start") else date.today()
+            days = min(max(int(request.args.get("days") or 7), 1), 31)
+        except ValueError:
+            return api_error("start must be YYYY-MM-DD, days an integer", 400)
+        db = get_db()
+        # Folds in the days closed since the last call (yesterday at most); no-op otherwise
+        model = current_tenant().forecast_cache.model(db)
+        return jsonify({"ok": True, "forecast": model.predict(db, start, days)})
+
+    @app.post("/api/admin/forecast/rebuild")
+    def api_forecast_rebuild():
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        started = time.perf_counter()
+        model = current_tenant().forecast_cache.model(get_db(), rebuild=True)
+        return jsonify({"ok": True, "series": int(len(model.keys)), "closedThrough": model.closed_through or None,
+                        "seconds": round(time.perf_counter() - started, 3)})
+
     # ---- API: settings ----
     @app.get("/api/settings")
     def api_get_settings():
@@ -1297,9 +2870,9 @@ def create_app() -> Flask:
 
         if min_balance is not None:
             try:
-                set_if("min_balance", int(min_balance))
+                set_if("min_balance", to_kopecks(min_balance))
             except Exception:
-                return api_error("minBalance must be integer", 400)
+                return api_error("minBalance must be a number", 400)
 
         if notifications_enabled is not None:
             set_if("notifications_enabled", 1 if bool(notifications_enabled) else 0)
@@ -1322,13 +2895,75 @@ def create_app() -> Flask:
         row2 = db.execute("SELECT * FROM settings WHERE id = 1").fetchone()
         return jsonify({"ok": True, "settings": settings_row_to_api(row2)})
 
+    # ---- API: sync (client mirrors) ----
+    # API name -> (table, the SELECT of its list endpoint, id column, serializer)
+    sync_sources = {
+        "users": ("users", "SELECT * FROM users", "id", user_row_to_api),
+        "menu": ("menu_items",
+                 "SELECT m.*, r.review_count, r.rating_sum FROM menu_items m "
+                 "LEFT JOIN menu_item_ratings r ON r.menu_item_id = m.id",
+                 "m.id", menu_row_to_api),
+        "orders": ("orders",
+                   "SELECT o.*, u.full_name AS student_name, u.class AS student_class, m.name AS menu_name "
+                   "FROM orders o JOIN users u ON u.id = o.student_id JOIN menu_items m ON m.id = o.menu_item_id",
+                   "o.id", order_row_to_api),
+        "inventory": ("inventory", "SELECT * FROM inventory", "id", inventory_row_to_api),
+        "purchase_requests": ("purchase_requests",
+                              "SELECT pr.*, u.full_name AS cook_name FROM purchase_requests pr "
+                              "JOIN users u ON u.id = pr.cook_id",
+                              "pr.id", purchase_row_to_api),
+        "reviews": ("reviews", REVIEW_SELECT, "rv.id", review_row_to_api),
+    }
+
+    @app.get("/api/sync")
+    def api_sync():
+        """Rows changed since `since` (the `version` of the previous call), per table.
+
+        `reset: true` means the rows are the whole tables and the client should
+        replace its copy (no `since`, or one older than the kept tombstones).
+        """
+        names = [t for t in (request.args.get("tables") or ",".join(sync_sources)).split(",") if t]
+        unknown = [t for t in names if t not in sync_sources]
+        if unknown:
+            return api_error(f"unknown tables: {', '.join(unknown)}", 400)
+        try:
+            since = int(request.args["since"]) if request.args.get("since") else None
+            limit = min(max(int(request.args.get("limit") or 1000), 1), 10000)
+        except ValueError:
+            return api_error("since and limit must be integers", 400)
+
+        db = get_db()
+        sources = {name: sync_sources[name] for name in dict.fromkeys(names)}
+        if since is None or since < purged_through(db) or since > current_version(db):
+            # Version first: anything written while the tables are read is sent again next time
+            version = current_version(db)
+            result = {
+                name: {"rows": [to_api(r) for r in db.execute(sql)], "deletes": []}
+                for name, (_table, sql, _id_col, to_api) in sources.items()
+            }
+            return jsonify({"ok": True, "reset": True, "version": version, "hasMore": False, "changes": result})
+
+        changes, version, has_more = read_changes(db, since, [src[0] for src in sources.values()], limit)
+        result = {}
+        for name, (table, sql, id_col, to_api) in sources.items():
+            ids = changes[table]["upserts"]
+            rows = db.execute(
+                f"{sql} WHERE {id_col} IN (SELECT value FROM json_each(?))", (json.dumps(ids),)
+            ).fetchall() if ids else []
+            result[name] = {"rows": [to_api(r) for r in rows], "deletes": changes[table]["deletes"]}
+        return jsonify({"ok": True, "reset": False, "version": version, "hasMore": has_more, "changes": result})
+
     # ---- API: statistics ----
     @app.get("/api/statistics")
     def api_statistics():
         db = get_db()
         total_students = db.execute("SELECT COUNT(1) FROM users WHERE role='student' AND is_active=1").fetchone()[0]
-        total_orders = db.execute("SELECT COUNT(1) FROM orders").fetchone()[0]
-        total_revenue = db.execute("SELECT COALESCE(SUM(total_price), 0) FROM orders WHERE status IN ('paid','received')").fetchone()[0]
+        # All-time totals: the archived years are counted from their catalog rows
+        archived_orders, archived_revenue = archived_totals(db)
+        total_orders = db.execute("SELECT COUNT(1) FROM orders").fetchone()[0] + archived_orders
+        total_revenue = db.execute(
+            "SELECT COALESCE(SUM(total_price), 0) FROM orders WHERE status IN ('paid','received')"
+        ).fetchone()[0] + archived_revenue
 
         today = today_str()
         today_attendance = db.execute(
@@ -1343,12 +2978,295 @@ def create_app() -> Flask:
             "statistics": {
                 "totalStudents": int(total_students),
                 "totalOrders": int(total_orders),
-                "totalRevenue": float(total_revenue or 0),
+                "totalRevenue": to_rubles(total_revenue),
                 "todayAttendance": int(today_attendance),
                 "pendingRequests": int(pending_requests),
             },
         })
 
+    @app.get("/api/statistics/daily")
+    def api_statistics_daily():
+        """Per-day rollups written by the `statistics_rollup` job, newest first."""
+        try:
+            days = min(max(int(request.args.get("days") or 30), 1), 366)
+        except ValueError:
+            return api_error("days must be integer", 400)
+        rows = get_db().execute("SELECT * FROM statistics ORDER BY date DESC LIMIT ?", (days,)).fetchall()
+        return jsonify({"ok": True, "days": [statistics_row_to_api(r) for r in rows]})
+
+    # ---- API: meal analytics ----
+    def _analytics_args(dimensions: dict[str, str]) -> tuple[list[str], str, str, Optional[list[str]], Optional[str]]:
+        """(group_by, from, to, classes, meal_type) from the query string; ValueError with the API message."""
+        group_by = [d for d in (request.args.get("groupBy") or "").split(",") if d]
+        if any(d not in dimensions for d in group_by):
+            raise ValueError(f"groupBy must be a list of {'|'.join(dimensions)}")
+        try:
+            date_to = date.fromisoformat(request.args.get("to") or today_str())
+            date_from = date.fromisoformat(request.args["from"]) if request.args.get("from") else date_to - timedelta(days=29)
+        except ValueError:
+            raise ValueError("from and to must be YYYY-MM-DD") from None
+        if date_from > date_to or (date_to - date_from).days > 731:
+            raise ValueError("from..to must be a range of at most two years")
+        meal_type = request.args.get("mealType") or request.args.get("type") or None
+        if meal_type not in (None, "breakfast", "lunch"):
+            raise ValueError("type must be breakfast|lunch")
+        classes = [c.strip() for c in (request.args.get("class") or "").split(",") if c.strip()] or None
+        return list(dict.fromkeys(group_by)), date_from.isoformat(), date_to.isoformat(), classes, meal_type
+
+    @app.get("/api/analytics/meals")
+    def api_meal_cube():
+        """Orders, portions and calories sliced by `groupBy` (date, week, month, class, mealType,
+        status, menuId); filters `from`, `to`, `class`, `mealType`, `status`, `menuId` (lists
+        comma-separated)."""
+        try:
+            group_by, date_from, date_to, classes, meal_type = _analytics_args(CUBE_DIMENSIONS)
+        except ValueError as e:
+            return api_error(str(e), 400)
+        statuses = [x for x in (request.args.get("status") or "").split(",") if x] or None
+        menu_ids = request.args.get("menuId") or ""
+        if not all(x.isdigit() for x in menu_ids.split(",") if x):
+            return api_error("menuId must be a list of ids", 400)
+        rows = query_cube(get_db(), group_by, date_from, date_to, classes=classes, meal_type=meal_type,
+                          statuses=statuses, menu_ids=[int(x) for x in menu_ids.split(",") if x] or None)
+        return jsonify({"ok": True, "from": date_from, "to": date_to, "groupBy": group_by, "rows": rows})
+
+    @app.get("/api/analytics/coverage")
+    def api_meal_coverage():
+        """Students who ate per `groupBy` (date, week, month, class) against the class size:
+        `groupBy=class,week` over a school year is the coverage heatmap."""
+        try:
+            group_by, date_from, date_to, classes, meal_type = _analytics_args(COVERAGE_DIMENSIONS)
+        except ValueError as e:
+            return api_error(str(e), 400)
+        rows = meal_coverage(get_db(), group_by, date_from, date_to, classes=classes, meal_type=meal_type)
+        return jsonify({"ok": True, "from": date_from, "to": date_to, "groupBy": group_by, "rows": rows})
+
+    @app.get("/api/users/<int:user_id>/calories")
+    def api_student_calories(user_id: int):
+        """The student's meals and calories per week (default: the last 8 weeks)."""
+        try:
+            date_to = date.fromisoformat(request.args.get("to") or today_str())
+            date_from = (date.fromisoformat(request.args["from"]) if request.args.get("from")
+                         else week_start(date_to.isoformat()) - timedelta(weeks=7))
+        except ValueError:
+            return api_error("from and to must be YYYY-MM-DD", 400)
+        db = get_db()
+        if not db.execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone():
+            return api_error("Пользователь не найден", 404)
+        weeks = student_weeks(db, user_id, date_from.isoformat(), date_to.isoformat())
+        return jsonify({"ok": True, "from": date_from.isoformat(), "to": date_to.isoformat(), "weeks": weeks})
+
+    @app.post("/api/admin/analytics/rebuild")
+    def api_meal_analytics_rebuild():
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        return jsonify({"ok": True, **rebuild_meal_analytics(get_db())})
+
+    @app.get("/api/admin/archive")
+    def api_order_archives():
+        """Archived school years; the `orders_archive` job moves new ones."""
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        db = get_db()
+        hot = db.execute("SELECT COUNT(1), MIN(order_date), MAX(order_date) FROM orders").fetchone()
+        return jsonify({
+            "ok": True,
+            "keepDays": app.config["ARCHIVE_KEEP_DAYS"],
+            "hot": {"orders": hot[0], "dateFrom": hot[1], "dateTo": hot[2]},
+            "archives": [archive_row_to_api(r) for r in archived_years(db)],
+        })
+
+    @app.get("/api/admin/backup")
+    def api_backup_status():
+        """Backup files of this school and the last run of the `db_backup` job."""
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        tenant = current_tenant()
+        job = None
+        if tenant.scheduler is not None:
+            job = next((j for j in tenant.scheduler.status(get_db())["jobs"] if j["name"] == "db_backup"), None)
+        return jsonify({
+            "ok": True,
+            "enabled": tenant.scheduler is not None and app.config["BACKUP_KEEP"] > 0,
+            "keep": app.config["BACKUP_KEEP"],
+            "job": job,
+            "backups": list_backups(backup_dir(tenant.name, tenant.db_path)),
+        })
+
+    @app.post("/api/admin/backup")
+    def api_backup_run():
+        """Queued for the scheduler leader when the `db_backup` job exists; otherwise (SCHEDULER_ENABLED=0,
+        BACKUP_KEEP=0) taken in this request. Either way the copy is made in small steps without
+        stopping writers."""
+        denied = _require_admin()
+        if denied is not None:
+            return denied
+        tenant = current_tenant()
+        db = get_db()
+        if tenant.scheduler is not None and "db_backup" in tenant.scheduler.jobs:
+            job = db.execute("SELECT running_on FROM scheduler_jobs WHERE name = 'db_backup'").fetchone()
+            if job is not None and job["running_on"] is not None:
+                return api_error("Резервное копирование уже идёт", 409)
+            request_job_run(db, "db_backup")
+            return jsonify({"ok": True, "queued": "db_backup"}), 202
+
+        if not tenant.backup_lock.acquire(blocking=False):
+            return api_error("Резервное копирование уже идёт", 409)
+        try:
+            result = run_backup(db, backup_dir(tenant.name, tenant.db_path), keep=max(app.config["BACKUP_KEEP"], 1),
+                                step_pages=app.config["BACKUP_STEP_PAGES"], pause=app.config["BACKUP_PAUSE_MS"] / 1000)
+        finally:
+            tenant.backup_lock.release()
+        return jsonify({"ok": True, "backup": result}), 201
+
+    # ---- API: district (every school) ----
+    @app.get("/api/district/summary")
+    def api_district_summary():
+        """Totals of every school for `from`..`to` (default: the last 30 days), read in parallel."""
+        denied = _require_district_admin()
+        if denied is not None:
+            return denied
+        try:
+            date_to = date.fromisoformat(request.args["to"]) if request.args.get("to") else date.today()
+            date_from = date.fromisoformat(request.args["from"]) if request.args.get("from") else \
+                date_to - timedelta(days=29)
+        except ValueError:
+            return api_error("from and to must be YYYY-MM-DD", 400)
+        if date_from > date_to:
+            return api_error("from must not be after to", 400)
+
+        results = tenants.fan_out(lambda conn: school_summary(conn, date_from.isoformat(), date_to.isoformat()))
+        schools = []
+        totals = {"students": 0, "orders": 0, "cancelled": 0, "portions": 0, "calories": 0, "revenue": 0.0,
+                  "studentsAte": 0}
+        for name, outcome in results.items():
+            if "error" in outcome:
+                schools.append({"school": name, "error": outcome["error"]})
+                continue
+            summary = outcome["result"]
+            schools.append({"school": name, **summary})
+            for key in totals:
+                totals[key] += summary[key]
+        totals["revenue"] = round(totals["revenue"], 2)
+        totals["coverage"] = round(totals["studentsAte"] / totals["students"], 4) if totals["students"] else None
+        return jsonify({"ok": True, "from": date_from.isoformat(), "to": date_to.isoformat(),
+                        "schools": schools, "totals": totals})
+
+    def _require_district_admin():
+        """Like _require_admin, but only for admins of the default DB (a school's admin manages one school)."""
+        if current_tenant().name != DEFAULT_TENANT:
+            return api_error("Требуются права администратора района", 403)
+        return _require_admin()
+
+    @app.get("/api/admin/schools")
+    def api_list_schools():
+        denied = _require_district_admin()
+        if denied is not None:
+            return denied
+        return jsonify({"ok": True, "enabled": tenants.enabled,
+                        "schools": [n for n in tenants.names() if n != DEFAULT_TENANT]})
+
+    @app.post("/api/admin/schools")
+    def api_create_school():
+        """New school {name, adminLogin, adminEmail, adminPassword, adminName}: its DB and first admin."""
+        denied = _require_district_admin()
+        if denied is not None:
+            return denied
+        if not tenants.enabled:
+            return api_error("Режим нескольких школ выключен (TENANTS_DIR)", 409)
+        payload = request.get_json(silent=True) or {}
+        name = (payload.get("name") or "").strip()
+        login = (payload.get("adminLogin") or "").strip()
+        password = payload.get("adminPassword") or ""
+        if not name or not login or not password:
+            return api_error("name, adminLogin, adminPassword обязательны", 400)
+        email = (payload.get("adminEmail") or "").strip() or f"{login}@{name}"
+        try:
+            tenants.create(name, login, email, password, (payload.get("adminName") or "").strip() or "Администратор школы")
+        except UnknownTenant:
+            return api_error("name must be lowercase latin letters, digits and '-' (and listed in TENANTS)", 400)
+        except TenantExists:
+            return api_error("Школа уже существует", 409)
+        return jsonify({"ok": True, "school": name, "adminLogin": login}), 201
+
+    # ---- API: admin diagnostics ----
+    @app.get("/api/admin/scheduler")
+    def api_scheduler_status():
+        denied = _require_admin()
+        if denied:
+            return denied
+        scheduler = current_tenant().scheduler
+        if scheduler is None:
+            return jsonify({"ok": True, "enabled": False, "jobs": []})
+        return jsonify({"ok": True, "enabled": True, **scheduler.status(get_db())})
+
+    @app.post("/api/admin/scheduler/jobs/<name>/run")
+    def api_scheduler_run_job(name: str):
+        """Queued for the leader's next tick (about a second), whichever worker gets this request."""
+        denied = _require_admin()
+        if denied:
+            return denied
+        if current_tenant().scheduler is None:
+            return api_error("Планировщик отключён", 409)
+        if not request_job_run(get_db(), name):
+            return api_error("Задача не найдена", 404)
+        return jsonify({"ok": True, "queued": name}), 202
+
+    @app.get("/api/admin/slow_queries")
+    def api_get_slow_queries():
+        denied = _require_admin()
+        if denied:
+            return denied
+        if slow_log is None:
+            return jsonify({"ok": True, "enabled": False, "queries": []})
+        limit = request.args.get("limit", type=int)
+        return jsonify({
+            "ok": True,
+            "enabled": True,
+            "thresholdMs": app.config["SLOW_QUERY_MS"],
+            "queries": slow_log.entries(limit),
+        })
+
+    @app.delete("/api/admin/slow_queries")
+    def api_reset_slow_queries():
+        denied = _require_admin()
+        if denied:
+            return denied
+        if slow_log is not None:
+            slow_log.reset()
+        return jsonify({"ok": True, "reset": True})
+
+    @app.get("/api/admin/profiles")
+    def api_list_profiles():
+        denied = _require_admin()
+        if denied:
+            return denied
+        return jsonify({"ok": True, "sampleRate": profile_sample_rate, "profiles": profile_store.list()})
+
+    @app.get("/api/admin/profiles/<profile_id>")
+    def api_get_profile(profile_id: str):
+        denied = _require_admin()
+        if denied:
+            return denied
+        meta = profile_store.get(profile_id)
+        if meta is None:
+            return api_error("Профиль не найден", 404)
+        return jsonify({"ok": True, "profile": meta})
+
+    @app.get("/api/admin/profiles/<profile_id>/download")
+    def api_download_profile(profile_id: str):
+        denied = _require_admin()
+        if denied:
+            return denied
+        path = profile_store.stats_path(profile_id)
+        if path is None:
+            return api_error("Профиль не найден", 404)
+        # pstats/cProfile binary format: `python -m pstats <file>` or snakeviz
+        return send_file(path, mimetype="application/octet-stream", as_attachment=True, download_name=f"{profile_id}.prof")
+
     # ---- Frontend serving ----
     @app.get("/")
     def serve_index():
@@ -1362,8 +3280,6 @@ def create_app() -> Flask:
     return app
 
 
-app = create_app()
-
-
+# Importing this module builds nothing; WSGI servers load `wsgi:app`.
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,281 @@
+"""Order archive: closed history leaves the hot tables for per-year files.
+
+Orders dated before the cutoff (today minus ARCHIVE_KEEP_DAYS, about one
+term), and order notifications created before it, move into one SQLite file
+per school year (September to August, `orders-2025.sqlite3` holds
+2025-09-01..2026-08-31). Each chunk of CHUNK_ROWS rows is copied and
+deleted in one transaction, so a row is never lost and writers wait for one
+chunk at most; a chunk is copied with INSERT OR REPLACE, so a run
+interrupted at any point is finished by the next one.
+
+The move leaves the meal analytics tables alone (they keep the whole
+history; `analytics.py rebuild` reads the archives too). Sync clients get
+tombstones and drop the rows from their copies, like the API list does.
+
+`order_archives` lists the files with their order counts and revenue, which
+the statistics add to the hot totals. Queries that span history attach the
+files they need read-only (`attached`) and read `orders_source`, the union
+of `orders` and the archives:
+
+    with attached(conn, "2024-09-01", "2025-05-31") as schemas:
+        rows = conn.execute(f"SELECT ... FROM {orders_source(conn, schemas)} o WHERE ...")
+
+    python backend/archive.py run [--keep-days 120 | --before 2025-09-01]
+    python backend/archive.py list
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Any, Iterator, Optional
+from urllib.parse import quote
+
+from db import connect, initialize_database, to_rubles, utcnow_iso
+
+CHUNK_ROWS = 5000
+KEEP_DAYS = 120
+SCHOOL_YEAR_START_MONTH = 9
+
+# Hot table -> (date column, extra condition) of the rows that move
+ARCHIVED_TABLES = {
+    "orders": ("order_date", ""),
+    "notifications": ("created_at", " AND type = 'order'"),
+}
+
+_ARCHIVE_INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS {schema}.idx_orders_id ON orders(id)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_orders_date ON orders(order_date)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_orders_student ON orders(student_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS {schema}.idx_notifications_id ON notifications(id)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_notifications_user ON notifications(user_id)",
+)
+
+# Deleting archived orders must not take them out of the meal analytics
+_MEAL_DELETE_TRIGGER = "trg_meal_orders_delete"
+
+
+def school_year(day: date) -> int:
+    return day.year if day.month >= SCHOOL_YEAR_START_MONTH else day.year - 1
+
+
+def year_bounds(year: int) -> tuple[date, date]:
+    """First day of school year `year` and first day of the next one."""
+    return date(year, SCHOOL_YEAR_START_MONTH, 1), date(year + 1, SCHOOL_YEAR_START_MONTH, 1)
+
+
+def _db_dir(conn: sqlite3.Connection) -> str:
+    main_file = next(r[2] for r in conn.execute("PRAGMA database_list") if r[1] == "main")
+    return os.path.dirname(os.path.abspath(main_file))
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> list[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _create_archive_tables(conn: sqlite3.Connection, schema: str) -> None:
+    """Tables of an archive file: the hot tables' columns, without constraints."""
+    for table in ARCHIVED_TABLES:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.{table} AS SELECT * FROM main.{table} WHERE 0")
+        have = set(_columns(conn, schema, table))
+        for r in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+            if r[1] not in have:
+                conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {r[1]} {r[2]}")
+    for sql in _ARCHIVE_INDEXES:
+        conn.execute(sql.format(schema=schema))
+
+
+def _move(conn: sqlite3.Connection, table: str, first: str, upto: str, chunk_rows: int) -> int:
+    """Move the rows of `table` dated in [first, upto) into `archive`, a chunk per transaction."""
+    column, extra = ARCHIVED_TABLES[table]
+    columns = ", ".join(_columns(conn, "main", table))
+    trigger = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'trigger' AND name = ?", (_MEAL_DELETE_TRIGGER,)
+    ).fetchone() if table == "orders" else None
+    moved = 0
+    while True:
+        ids = [r[0] for r in conn.execute(
+            f"SELECT id FROM main.{table} WHERE {column} >= ? AND {column} < ?{extra} LIMIT ?",
+            (first, upto, chunk_rows),
+        )]
+        if not ids:
+            return moved
+        params = (json.dumps(ids),)
+        try:
+            conn.execute(
+                f"INSERT OR REPLACE INTO archive.{table} ({columns}) "
+                f"SELECT {columns} FROM main.{table} WHERE id IN (SELECT value FROM json_each(?))",
+                params,
+            )
+            # Dropped and recreated inside the chunk's transaction: no other writer sees it missing
+            if trigger:
+                conn.execute(f"DROP TRIGGER main.{_MEAL_DELETE_TRIGGER}")
+            conn.execute(f"DELETE FROM main.{table} WHERE id IN (SELECT value FROM json_each(?))", params)
+            if trigger:
+                conn.execute(trigger[0])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        moved += len(ids)
+
+
+def _has_rows(conn: sqlite3.Connection, first: str, upto: str) -> bool:
+    return any(
+        conn.execute(f"SELECT 1 FROM main.{table} WHERE {column} >= ? AND {column} < ?{extra} LIMIT 1",
+                     (first, upto)).fetchone()
+        for table, (column, extra) in ARCHIVED_TABLES.items()
+    )
+
+
+def archive_orders(conn: sqlite3.Connection, directory: str, before: date,
+                   chunk_rows: int = CHUNK_ROWS) -> dict[str, int]:
+    """Move orders dated before `before` (and order notifications created before
+    it) into the year files in `directory`; returns the rows moved."""
+    cutoff = before.isoformat()
+    oldest = [
+        conn.execute(f"SELECT MIN(substr({column}, 1, 10)) FROM {table} WHERE {column} < ?{extra}", (cutoff,)).fetchone()[0]
+        for table, (column, extra) in ARCHIVED_TABLES.items()
+    ]
+    oldest = [d for d in oldest if d]
+    result = {"years": 0, "orders": 0, "notifications": 0}
+    if not oldest:
+        return result
+
+    os.makedirs(directory, exist_ok=True)
+    base = _db_dir(conn)
+    for year in range(school_year(date.fromisoformat(min(oldest))), school_year(before - timedelta(days=1)) + 1):
+        start, next_start = year_bounds(year)
+        first, upto = start.isoformat(), min(next_start, before).isoformat()
+        if not _has_rows(conn, first, upto):
+            continue
+        path = os.path.join(os.path.abspath(directory), f"orders-{year}.sqlite3")
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            _create_archive_tables(conn, "archive")
+            conn.commit()
+            for table in ARCHIVED_TABLES:
+                result[table] += _move(conn, table, first, upto, chunk_rows)
+            totals = conn.execute(
+                """SELECT COUNT(1), MIN(order_date), MAX(order_date),
+                          COALESCE(SUM(CASE WHEN status IN ('paid','received') THEN total_price END), 0),
+                          (SELECT COUNT(1) FROM archive.notifications)
+                   FROM archive.orders"""
+            ).fetchone()
+            conn.execute(
+                """INSERT INTO order_archives (year, path, date_from, date_to, orders, revenue, notifications, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(year) DO UPDATE SET
+                       path = excluded.path, date_from = excluded.date_from, date_to = excluded.date_to,
+                       orders = excluded.orders, revenue = excluded.revenue,
+                       notifications = excluded.notifications, updated_at = excluded.updated_at""",
+                (year, os.path.relpath(path, base), totals[1], totals[2], totals[0], totals[3], totals[4], utcnow_iso()),
+            )
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE archive")
+        result["years"] += 1
+    return result
+
+
+def archived_years(conn: sqlite3.Connection, date_from: Optional[str] = None,
+                   date_to: Optional[str] = None) -> list[sqlite3.Row]:
+    """Catalog rows of the archives with orders in [date_from, date_to] (open ends: all)."""
+    return conn.execute(
+        """SELECT * FROM order_archives
+           WHERE orders > 0 AND (? IS NULL OR date_to >= ?) AND (? IS NULL OR date_from <= ?)
+           ORDER BY year""",
+        (date_from, date_from, date_to, date_to),
+    ).fetchall()
+
+
+def archived_totals(conn: sqlite3.Connection) -> tuple[int, int]:
+    """Orders and revenue in kopecks (paid and received orders) of all archives."""
+    row = conn.execute("SELECT COALESCE(SUM(orders), 0), COALESCE(SUM(revenue), 0) FROM order_archives").fetchone()
+    return int(row[0]), int(row[1])
+
+
+@contextmanager
+def attached(conn: sqlite3.Connection, date_from: Optional[str] = None,
+             date_to: Optional[str] = None) -> Iterator[list[str]]:
+    """Attach read-only the archives with orders in [date_from, date_to]; yields
+    their schema names (none when the range is all hot). Must not be entered
+    inside a write transaction."""
+    base = _db_dir(conn)
+    schemas: list[str] = []
+    try:
+        for r in archived_years(conn, date_from, date_to):
+            path = os.path.join(base, r["path"])
+            if not os.path.exists(path):
+                continue
+            schema = f"archive_{r['year']}"
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"file:{quote(os.path.abspath(path))}?mode=ro",))
+            schemas.append(schema)
+        yield schemas
+    finally:
+        for schema in schemas:
+            conn.execute(f"DETACH DATABASE {schema}")
+
+
+def orders_source(conn: sqlite3.Connection, schemas: list[str]) -> str:
+    """`orders`, or the union of `orders` and the attached archives (as a subquery
+    with the same columns; columns an older archive lacks are NULL)."""
+    if not schemas:
+        return "orders"
+    columns = _columns(conn, "main", "orders")
+    parts = [f"SELECT {', '.join(columns)} FROM main.orders"]
+    for schema in schemas:
+        have = set(_columns(conn, schema, "orders"))
+        parts.append(f"SELECT {', '.join(c if c in have else f'NULL AS {c}' for c in columns)} FROM {schema}.orders")
+    return f"({' UNION ALL '.join(parts)})"
+
+
+def archive_row_to_api(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "year": row["year"],
+        "path": row["path"],
+        "dateFrom": row["date_from"],
+        "dateTo": row["date_to"],
+        "orders": row["orders"],
+        "revenue": to_rubles(row["revenue"]),
+        "notifications": row["notifications"],
+        "updatedAt": row["updated_at"],
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Archive old orders into per-year files")
+    parser.add_argument("command", choices=("run", "list"))
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    parser.add_argument("--dir", help="archive directory (default: archive/ next to the DB)")
+    parser.add_argument("--keep-days", type=int, default=KEEP_DAYS, help="days of orders that stay hot")
+    parser.add_argument("--before", help="archive orders dated before this day, YYYY-MM-DD (overrides --keep-days)")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    directory = args.dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), "archive")
+    initialize_database(db_path)
+    conn = connect(db_path)
+    try:
+        if args.command == "list":
+            for r in archived_years(conn):
+                print(f"{r['year']}  {r['date_from']}..{r['date_to']}  orders={r['orders']} "
+                      f"notifications={r['notifications']}  {r['path']}")
+            return 0
+        before = date.fromisoformat(args.before) if args.before else date.today() - timedelta(days=args.keep_days)
+        result = archive_orders(conn, directory, before)
+    finally:
+        conn.close()
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""Online backups of the live DB with the SQLite backup API.
+
+The copy is made STEP_PAGES pages at a time (4 MB with 4 KiB pages, a few
+milliseconds) with a PAUSE between steps. Each step holds a read lock only
+while it runs, so writers wait for one step at most and the service stays
+up. The result is a consistent snapshot of the moment the last step ran:
+when another connection commits between steps, SQLite restarts the copy.
+At night that rarely happens; under a steady stream of writes the copy could
+restart forever, so after MAX_RESTARTS restarts the last attempt copies the
+file in one step (writers then wait once, about 0.15 s for an 80 MB file).
+
+The copy is checked with `PRAGMA integrity_check` (which is exactly what a
+restore would bring back), gzipped into `<db>-YYYYmmdd-HHMMSS.sqlite3.gz`
+and only then appears under its final name. The newest KEEP backups stay.
+
+    python backend/backup.py run [--dir backups] [--keep 7] [--no-compress]
+    python backend/backup.py list
+    python backend/backup.py verify backups/school_food-20250901-043000.sqlite3.gz
+    python backend/backup.py restore backups/school_food-20250901-043000.sqlite3.gz --db restored.sqlite3
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from db import connect, initialize_database
+
+KEEP = 7
+STEP_PAGES = 1024
+PAUSE = 0.02
+MAX_RESTARTS = 3
+SUFFIXES = (".sqlite3.gz", ".sqlite3")
+# Step results that only mean "try again": SQLITE_BUSY, SQLITE_LOCKED
+_RETRY_STATUSES = (5, 6)
+
+
+class _Restarted(Exception):
+    """Another connection wrote between two steps; the copy starts over."""
+
+
+def _copy(conn: sqlite3.Connection, target_path: str, step_pages: int, pause: float) -> dict[str, Any]:
+    """Backup API copy of `conn`'s main DB into `target_path` (one step once it restarted too often)."""
+    restarts = steps = 0
+    while True:
+        last_remaining: Optional[int] = None
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal last_remaining, steps
+            if status in _RETRY_STATUSES:
+                return
+            steps += 1
+            if last_remaining is not None and remaining > last_remaining:
+                raise _Restarted()
+            last_remaining = remaining
+            if remaining and pause:
+                time.sleep(pause)
+
+        target = sqlite3.connect(target_path)
+        try:
+            conn.backup(target, pages=step_pages if restarts < MAX_RESTARTS else -1, progress=progress,
+                        sleep=0.005)
+            pages = target.execute("PRAGMA page_count").fetchone()[0]
+            return {"pages": pages, "steps": steps, "restarts": restarts}
+        except _Restarted:
+            restarts += 1
+        finally:
+            target.close()
+
+
+def check(path: str) -> str:
+    """`PRAGMA integrity_check` of an SQLite file: "ok" or the problems found."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return "; ".join(r[0] for r in conn.execute("PRAGMA integrity_check"))
+    finally:
+        conn.close()
+
+
+def _stem(conn: sqlite3.Connection) -> str:
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    return os.path.splitext(os.path.basename(path))[0] if path else "school_food"
+
+
+def backup(conn: sqlite3.Connection, directory: str, keep: int = KEEP, compress: bool = True,
+           step_pages: int = STEP_PAGES, pause: float = PAUSE) -> dict[str, Any]:
+    """Snapshot `conn`'s DB into `directory`, check it, compress it, drop old backups."""
+    os.makedirs(directory, exist_ok=True)
+    started = time.perf_counter()
+    stem = _stem(conn)
+    name = f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S')}" + (".sqlite3.gz" if compress else ".sqlite3")
+    path = os.path.join(directory, name)
+    fd, copy_path = tempfile.mkstemp(prefix=f".{stem}-", suffix=".sqlite3.tmp", dir=directory)
+    os.close(fd)
+    try:
+        result = _copy(conn, copy_path, step_pages, pause)
+        copied = time.perf_counter()
+        integrity = check(copy_path)
+        if integrity != "ok":
+            raise sqlite3.DatabaseError(f"backup copy failed integrity_check: {integrity}")
+        if compress:
+            tmp_path = path + ".tmp"
+            with open(copy_path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.replace(tmp_path, path)
+        else:
+            os.replace(copy_path, path)
+    finally:
+        for leftover in (copy_path, path + ".tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    removed = rotate(directory, stem, keep)
+    return {
+        "file": name,
+        "bytes": os.path.getsize(path),
+        **result,
+        "copySeconds": round(copied - started, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+        "integrity": integrity,
+        "removed": removed,
+    }
+
+
+def list_backups(directory: str, stem: Optional[str] = None) -> list[dict[str, Any]]:
+    """Finished backups in `directory`, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    backups = []
+    for name in os.listdir(directory):
+        if name.startswith(".") or not name.endswith(SUFFIXES) or (stem and not name.startswith(stem + "-")):
+            continue
+        stat = os.stat(os.path.join(directory, name))
+        backups.append({
+            "file": name,
+            "bytes": stat.st_size,
+            "compressed": name.endswith(".gz"),
+            "createdAt": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(timespec="seconds"),
+        })
+    backups.sort(key=lambda b: (b["createdAt"], b["file"]), reverse=True)
+    return backups
+
+
+def rotate(directory: str, stem: str, keep: int) -> int:
+    """Delete all but the `keep` newest backups of `stem`; returns how many went."""
+    old = list_backups(directory, stem)[max(keep, 1):]
+    for b in old:
+        os.remove(os.path.join(directory, b["file"]))
+    return len(old)
+
+
+def _unpacked(path: str, directory: str) -> str:
+    """A plain SQLite copy of backup `path` in `directory` (caller removes it)."""
+    fd, out_path = tempfile.mkstemp(prefix=".restore-", suffix=".sqlite3", dir=directory)
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as src, os.fdopen(fd, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    return out_path
+
+
+def verify(path: str) -> str:
+    """Unpack backup `path` as a restore would and run `PRAGMA integrity_check` on it."""
+    out_path = _unpacked(path, tempfile.gettempdir())
+    try:
+        return check(out_path)
+    finally:
+        os.remove(out_path)
+
+
+def restore(path: str, db_path: str) -> dict[str, Any]:
+    """Overwrite `db_path` with backup `path` after checking it. Stop the app first."""
+    directory = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(directory, exist_ok=True)
+    out_path = _unpacked(path, directory)
+    try:
+        integrity = check(out_path)
+        if integrity != "ok":
+            raise sqlite3.DatabaseError(f"backup failed integrity_check: {integrity}")
+        # Through the backup API rather than a file rename, so SQLite deals with any journal of the old file
+        src, dst = sqlite3.connect(out_path), sqlite3.connect(db_path)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+    finally:
+        os.remove(out_path)
+    return {"restored": db_path, "from": path, "integrity": integrity}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Back up the DB without stopping the app")
+    parser.add_argument("command", choices=("run", "list", "verify", "restore"))
+    parser.add_argument("file", nargs="?", help="verify/restore: the backup file")
+    parser.add_argument("--db", help="SQLite file (default: the app DB); restore writes it")
+    parser.add_argument("--dir", help="backup directory (default: backups/ next to the DB)")
+    parser.add_argument("--keep", type=int, default=KEEP, help="backups to keep")
+    parser.add_argument("--no-compress", action="store_true", help="store the plain SQLite file")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    directory = args.dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), "backups")
+    if args.command in ("verify", "restore"):
+        if not args.file:
+            parser.error(f"{args.command} needs the backup file")
+        if args.command == "verify":
+            integrity = verify(args.file)
+            print(f"integrity={integrity}")
+            return 0 if integrity == "ok" else 1
+        result = restore(args.file, db_path)
+    elif args.command == "list":
+        for b in list_backups(directory):
+            print(f"{b['createdAt']}  {b['bytes']:>12}  {b['file']}")
+        return 0
+    else:
+        initialize_database(db_path)
+        conn = connect(db_path)
+        try:
+            result = backup(conn, directory, keep=args.keep, compress=not args.no_compress)
+        finally:
+            conn.close()
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
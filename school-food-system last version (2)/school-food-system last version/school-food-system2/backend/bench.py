@@ -0,0 +1,468 @@
+"""Lunch-rush benchmark for the School Food System backend.
+
+Starts the real Flask app from `create_app()` against a temporary SQLite DB,
+serves it with a threaded Werkzeug server in a child process and drives it
+over HTTP with virtual users that behave like the front-end pages:
+
+- students: load `/api/menu`, poll `/api/notifications`, check their orders and
+  place orders (`POST /api/orders`, then `POST /api/payments` charging the
+  order with the idempotency key `order-<id>`, as js/student.js does);
+- cooks: load today's orders and move them through preparing/ready/received;
+- admins: load `/api/statistics` and build reports from orders, purchase
+  requests and users (the js/admin.js report fallback).
+
+Results (throughput, p50/p95/p99 latency, error rate per operation) are printed
+and can be saved as JSON and compared with a stored baseline:
+
+    python backend/bench.py --duration 30 --output bench.json
+    python backend/bench.py --duration 30 --baseline bench.json   # exit 1 on regression
+
+Runs are reproducible for a given `--seed`: the dataset and every virtual
+user's choice of operations are derived from it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from typing import Any, Callable, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+DISHES = [
+    ("breakfast", "Каша овсяная", 90.0, ["молоко"]),
+    ("breakfast", "Сырники", 120.0, ["молоко", "глютен"]),
+    ("breakfast", "Омлет", 110.0, ["яйца", "молоко"]),
+    ("lunch", "Борщ", 150.0, []),
+    ("lunch", "Куриный суп", 140.0, []),
+    ("lunch", "Плов", 180.0, []),
+    ("lunch", "Рыба с рисом", 200.0, ["рыба"]),
+    ("lunch", "Макароны по-флотски", 160.0, ["глютен"]),
+]
+ALLERGIES = [[], [], [], ["молоко"], ["глютен"], ["орехи"], ["рыба"]]
+NEXT_STATUS = {"pending": "preparing", "paid": "preparing", "preparing": "ready", "ready": "received"}
+# Kopecks; enough that no student runs out of money during a run
+STUDENT_BALANCE = 10000000
+
+
+# ---- dataset ----
+def seed_bench_data(db_path: str, students: int, cooks: int, seed: int) -> dict[str, list[int]]:
+    """Insert users, today's menu and some order history directly (setup is not measured)."""
+    from werkzeug.security import generate_password_hash
+
+    from db import connect, dump_json, today_str, utcnow_iso
+
+    rng = random.Random(seed)
+    now = utcnow_iso()
+    today = today_str()
+    pw = generate_password_hash("password")
+
+    conn = connect(db_path)
+    try:
+        conn.executemany(
+            """INSERT INTO users (email, login, password_hash, full_name, role, class, allergies, balance, is_active, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 'student', ?, ?, ?, 1, ?, ?)""",
+            [
+                (
+                    f"bench{i}@school.ru", f"bench{i}", pw, f"Ученик {i}",
+                    f"{rng.randint(5, 11)}{rng.choice('АБВ')}", dump_json(rng.choice(ALLERGIES)),
+                    STUDENT_BALANCE, now, now,
+                )
+                for i in range(students)
+            ],
+        )
+        conn.executemany(
+            """INSERT INTO users (email, login, password_hash, full_name, role, specialization, is_active, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 'cook', 'Повар', 1, ?, ?)""",
+            [(f"benchcook{i}@school.ru", f"benchcook{i}", pw, f"Повар {i}", now, now) for i in range(cooks)],
+        )
+        conn.executemany(
+            """INSERT INTO menu_items (date, meal_type, name, description, price, calories, allergens, is_available, created_at)
+               VALUES (?, ?, ?, '', ?, ?, ?, 1, ?)""",
+            [(today, t, name, round(price * 100), rng.randint(250, 700), dump_json(allergens), now)
+             for t, name, price, allergens in DISHES],
+        )
+        conn.commit()
+
+        ids = {
+            role: [r[0] for r in conn.execute("SELECT id FROM users WHERE role = ? ORDER BY id", (role,))]
+            for role in ("student", "cook", "admin")
+        }
+        ids["menu"] = [r[0] for r in conn.execute("SELECT id FROM menu_items WHERE date = ? ORDER BY id", (today,))]
+
+        # Earlier orders, so that listings and statistics have something to chew on.
+        history = []
+        menu_rows = conn.execute("SELECT id, meal_type, price FROM menu_items").fetchall()
+        for _ in range(students * 5):
+            m = rng.choice(menu_rows)
+            history.append((rng.choice(ids["student"]), m["id"], today, m["meal_type"], m["price"], rng.choice(["paid", "received"]), now))
+        conn.executemany(
+            """INSERT INTO orders (student_id, menu_item_id, order_date, meal_type, quantity, total_price, status, payment_type, created_at)
+               VALUES (?, ?, ?, ?, 1, ?, ?, 'one_time', ?)""",
+            history,
+        )
+        conn.commit()
+        return ids
+    finally:
+        conn.close()
+
+
+# ---- HTTP client ----
+class Client:
+    """Keep-alive JSON client for one virtual user."""
+
+    def __init__(self, host: str, port: int, user_id: int) -> None:
+        self.host, self.port = host, port
+        self.user_id = user_id
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, body: Any = None) -> tuple[int, Any]:
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json", "X-User-Id": str(self.user_id)}
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                resp = self.conn.getresponse()
+                data = resp.read()
+                if resp.getheader("Connection", "").lower() == "close" or resp.version == 10:
+                    self.close()
+                return resp.status, (json.loads(data) if data else None)
+            except (http.client.HTTPException, ConnectionError, OSError):
+                self.close()
+                if attempt:
+                    raise
+        raise RuntimeError("unreachable")
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# ---- workload ----
+class Recorder:
+    """Collects latencies and errors per operation (thread-safe)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.active = False
+
+    def add(self, op: str, seconds: float, ok: bool) -> None:
+        if not self.active:
+            return
+        with self._lock:
+            self.latencies.setdefault(op, []).append(seconds)
+            if not ok:
+                self.errors[op] = self.errors.get(op, 0) + 1
+
+
+def timed(rec: Recorder, op: str, client: Client, method: str, path: str, body: Any = None) -> Any:
+    t0 = time.perf_counter()
+    try:
+        status, data = client.request(method, path, body)
+        ok = 200 <= status < 300
+    except Exception:
+        data, ok = None, False
+    rec.add(op, time.perf_counter() - t0, ok)
+    return data if ok else None
+
+
+def student_session(rec: Recorder, client: Client, rng: random.Random, ids: dict[str, list[int]]) -> None:
+    uid = client.user_id
+    today = date.today().isoformat()
+    roll = rng.random()
+    if roll < 0.35:
+        timed(rec, "student.menu", client, "GET", f"/api/menu?date={today}")
+    elif roll < 0.65:
+        timed(rec, "student.notifications", client, "GET", f"/api/notifications?userId={uid}")
+    elif roll < 0.80:
+        timed(rec, "student.orders", client, "GET", f"/api/orders?studentId={uid}")
+    else:
+        menu = timed(rec, "student.menu", client, "GET", "/api/menu")
+        items = (menu or {}).get("menu") or []
+        if not items:
+            return
+        item = rng.choice(items)
+        placed = timed(rec, "student.place_order", client, "POST", "/api/orders",
+                       {"studentId": uid, "menuId": item["id"], "type": item["type"], "paymentType": "one_time"})
+        if placed:
+            order = placed["order"]
+            timed(rec, "student.charge", client, "POST", "/api/payments",
+                  {"userId": uid, "amount": order["price"], "type": "debit", "transactionId": f"order-{order['id']}",
+                   "description": f"Заказ: {item['name']}"})
+
+
+def cook_session(rec: Recorder, client: Client, rng: random.Random, ids: dict[str, list[int]]) -> None:
+    today = date.today().isoformat()
+    data = timed(rec, "cook.today_orders", client, "GET", f"/api/orders?date={today}")
+    orders = [o for o in (data or {}).get("orders") or [] if o["status"] in NEXT_STATUS]
+    if rng.random() < 0.2:
+        timed(rec, "cook.inventory", client, "GET", "/api/inventory")
+    for order in rng.sample(orders, min(len(orders), 3)):
+        timed(rec, "cook.update_status", client, "PUT", f"/api/orders/{order['id']}", {"status": NEXT_STATUS[order["status"]]})
+
+
+def admin_session(rec: Recorder, client: Client, rng: random.Random, ids: dict[str, list[int]]) -> None:
+    if rng.random() < 0.7:
+        timed(rec, "admin.statistics", client, "GET", "/api/statistics")
+    else:
+        # Report page: the client builds reports from full listings.
+        timed(rec, "admin.report.orders", client, "GET", "/api/orders")
+        timed(rec, "admin.report.purchases", client, "GET", "/api/purchase_requests")
+        timed(rec, "admin.report.users", client, "GET", "/api/users")
+
+
+SCENARIOS: dict[str, Callable[[Recorder, Client, random.Random, dict[str, list[int]]], None]] = {
+    "student": student_session,
+    "cook": cook_session,
+    "admin": admin_session,
+}
+
+
+def run_virtual_user(role: str, user_id: int, seed: int, host: str, port: int, rec: Recorder,
+                     ids: dict[str, list[int]], stop: threading.Event, think: float) -> None:
+    rng = random.Random(seed)
+    client = Client(host, port, user_id)
+    scenario = SCENARIOS[role]
+    try:
+        while not stop.is_set():
+            scenario(rec, client, rng, ids)
+            if think:
+                stop.wait(rng.uniform(0, 2 * think))
+    finally:
+        client.close()
+
+
+# ---- statistics ----
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> dict[str, Any]:
+    values = sorted(latencies)
+    n = len(values)
+    return {
+        "requests": n,
+        "errors": errors,
+        "errorRate": errors / n if n else 0.0,
+        "throughput": n / duration if duration else 0.0,
+        "meanMs": (sum(values) / n * 1000) if n else 0.0,
+        "p50Ms": percentile(values, 50) * 1000,
+        "p95Ms": percentile(values, 95) * 1000,
+        "p99Ms": percentile(values, 99) * 1000,
+        "maxMs": values[-1] * 1000 if n else 0.0,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], tolerance: float, min_samples: int = 50) -> list[str]:
+    """Regressions of `current` against `baseline` (latency, throughput, errors).
+
+    Operations with fewer than `min_samples` requests in either run are skipped:
+    their tail percentiles are a single request and only add noise.
+    """
+    problems = []
+    pairs = [("overall", current["overall"], baseline.get("overall"))]
+    pairs += [(op, s, baseline.get("operations", {}).get(op)) for op, s in current["operations"].items()]
+    for name, cur, base in pairs:
+        if not base or min(cur["requests"], base["requests"]) < min_samples:
+            continue
+        for key in ("p50Ms", "p95Ms", "p99Ms"):
+            if base[key] > 0 and cur[key] > base[key] * (1 + tolerance):
+                problems.append(f"{name}: {key} {base[key]:.1f} -> {cur[key]:.1f}")
+        if base["throughput"] > 0 and cur["throughput"] < base["throughput"] * (1 - tolerance):
+            problems.append(f"{name}: throughput {base['throughput']:.1f} -> {cur['throughput']:.1f} req/s")
+        if cur["errorRate"] > base["errorRate"] + 0.01:
+            problems.append(f"{name}: error rate {base['errorRate']:.2%} -> {cur['errorRate']:.2%}")
+    return problems
+
+
+def print_report(result: dict[str, Any]) -> None:
+    header = f"{'operation':<26}{'reqs':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'err%':>7}"
+    print(header)
+    print("-" * len(header))
+    rows = sorted(result["operations"].items()) + [("overall", result["overall"])]
+    for op, s in rows:
+        print(f"{op:<26}{s['requests']:>8}{s['throughput']:>9.1f}{s['p50Ms']:>9.1f}{s['p95Ms']:>9.1f}{s['p99Ms']:>9.1f}{s['errorRate'] * 100:>7.2f}")
+
+
+# ---- server ----
+def serve(db_path: str, port_file: str) -> None:
+    """Run the app on a free port (in a child process) and publish the port."""
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    logging.getLogger("slowlog").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, create_app(db_path), threaded=True)
+    tmp = port_file + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(str(server.server_port))
+    os.replace(tmp, port_file)
+    server.serve_forever()
+
+
+def start_server(db_path: str, workdir: str) -> tuple[subprocess.Popen, int]:
+    """Start `serve()` in a separate process so that clients and server do not share a GIL."""
+    port_file = os.path.join(workdir, "port")
+    # Background jobs off: the numbers should measure the request path only
+    env = dict(os.environ, SCHOOL_FOOD_DB=db_path, PROFILE_DIR=os.path.join(workdir, "profiles"), SCHEDULER_ENABLED="0")
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", db_path, port_file], env=env)
+    deadline = time.monotonic() + 30
+    while not os.path.exists(port_file):
+        if proc.poll() is not None or time.monotonic() > deadline:
+            proc.kill()
+            raise RuntimeError("benchmark server failed to start")
+        time.sleep(0.05)
+    with open(port_file) as f:
+        return proc, int(f.read())
+
+
+# ---- main ----
+def run_benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="sfs-bench-")
+    db_path = os.path.join(workdir, "bench.sqlite3")
+    proc = None
+    try:
+        if args.db:
+            shutil.copyfile(args.db, db_path)
+        else:
+            from db import initialize_database
+
+            initialize_database(db_path)
+            seed_bench_data(db_path, args.students, args.cooks, args.seed)
+
+        conn = sqlite3.connect(db_path)
+        # Orders are charged to the balance: no student (seed data, --db copy) may run out mid-run
+        conn.execute("UPDATE users SET balance = ? WHERE role = 'student'", (STUDENT_BALANCE,))
+        conn.commit()
+        ids = {
+            role: [r[0] for r in conn.execute("SELECT id FROM users WHERE role = ? AND is_active = 1 ORDER BY id", (role,))]
+            for role in ("student", "cook", "admin")
+        }
+        conn.close()
+
+        proc, port = start_server(db_path, workdir)
+        host = "127.0.0.1"
+
+        rec = Recorder()
+        stop = threading.Event()
+        plan = (
+            [("student", uid) for uid in ids["student"][: args.students]]
+            + [("cook", uid) for uid in ids["cook"][: args.cooks]]
+            + [("admin", uid) for uid in ids["admin"][: args.admins]]
+        )
+        threads = [
+            threading.Thread(
+                target=run_virtual_user,
+                args=(role, uid, args.seed * 100003 + i, host, port, rec, ids, stop, args.think_ms / 1000.0),
+                daemon=True,
+            )
+            for i, (role, uid) in enumerate(plan)
+        ]
+        for t in threads:
+            t.start()
+
+        time.sleep(args.warmup)
+        rec.active = True
+        t0 = time.perf_counter()
+        time.sleep(args.duration)
+        rec.active = False
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        for t in threads:
+            t.join(timeout=30)
+
+        all_latencies = [v for values in rec.latencies.values() for v in values]
+        return {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "duration": elapsed,
+                "virtualUsers": {"student": args.students, "cook": args.cooks, "admin": args.admins},
+                "thinkMs": args.think_ms,
+                "db": args.db,
+            },
+            "overall": summarize(all_latencies, sum(rec.errors.values()), elapsed),
+            "operations": {
+                op: summarize(values, rec.errors.get(op, 0), elapsed) for op, values in sorted(rec.latencies.items())
+            },
+        }
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Lunch-rush benchmark for the School Food System API")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds (default 20)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before measuring")
+    parser.add_argument("--students", type=int, default=40, help="student virtual users")
+    parser.add_argument("--cooks", type=int, default=2, help="cook virtual users")
+    parser.add_argument("--admins", type=int, default=1, help="admin virtual users")
+    parser.add_argument("--think-ms", type=float, default=50.0, help="mean pause between user actions")
+    parser.add_argument("--seed", type=int, default=1, help="dataset and workload seed")
+    parser.add_argument("--db", help="benchmark a copy of this DB instead of a generated one")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown (default 0.25)")
+    parser.add_argument("--min-samples", type=int, default=50, help="ignore operations with fewer requests when comparing")
+    parser.add_argument("--serve", nargs=2, metavar=("DB", "PORT_FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(*args.serve)
+        return 0
+
+    result = run_benchmark(args)
+    print_report(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.tolerance, args.min_samples)
+        if problems:
+            print(f"\nRegressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for p in problems:
+                print("  " + p)
+            return 1
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
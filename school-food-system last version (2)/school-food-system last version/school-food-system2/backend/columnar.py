@@ -0,0 +1,357 @@
+"""Columnar snapshot of orders, dishes, users and payments for offline analysis.
+
+The export is a directory of compressed NumPy `.npz` parts plus `manifest.json`:
+
+- integers stay integers (ids, quantities, allergen masks; NULL is -1);
+- dates are day numbers since 1970-01-01 (`int32`, `datetime64[D]` after
+  `.astype("datetime64[D]")`), timestamps are seconds (`int64`, NULL is the
+  minimum int64, which NumPy reads as NaT);
+- strings with few distinct values (statuses, meal types, classes, dish
+  names, ...) are dictionary-encoded: an `int32` code per row, -1 for NULL,
+  and the values in the manifest. Dictionaries only grow, so codes in
+  older parts stay valid;
+- money is `float64` rubles (the DB keeps kopecks). Names, emails and free text are not exported.
+
+Orders (including the archived school years, see archive.py) and dishes
+are exported by closed day (up to yesterday), one part per month; payments
+(an append-only ledger, never updated) by id; users are rewritten on every
+run. Each run appends only what is new since the manifest's watermarks,
+reading the DB in chunks of CHUNK_ROWS, so the nightly job costs one day of
+data. A day's orders that change after it was exported (a late
+cancellation) keep their exported state until `--rebuild`.
+
+Loading a year is a few `np.load` calls, without touching the DB:
+
+    from columnar import load
+    orders = load("data/columnar", "orders", decode=True)
+    df = pandas.DataFrame(orders)
+
+    python backend/columnar.py export --out data/columnar
+    python backend/columnar.py export --out data/columnar --rebuild
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from archive import attached, orders_source
+from db import connect, initialize_database
+
+FORMAT_VERSION = 1
+CHUNK_ROWS = 50000
+MANIFEST = "manifest.json"
+NULL_TIME = np.iinfo(np.int64).min
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    sql: str
+    kind: str            # int16|int32|int64|float64|bool|day|time|dict:<dictionary>
+
+
+@dataclass(frozen=True)
+class Table:
+    name: str
+    source: str          # FROM ... (no WHERE)
+    split: str           # "day": by `key` date, "id": by `key` > watermark, "full": rewritten each run
+    key: str
+    columns: tuple[Column, ...]
+    archived: bool = False  # also read the archived school years (archive.py)
+
+
+_META_SQL = "CASE WHEN json_valid(p.metadata) THEN json_extract(p.metadata, '$.{key}') END"
+
+TABLES = {
+    t.name: t for t in (
+        Table("orders", "orders o", "day", "o.order_date", (
+            Column("id", "o.id", "int64"),
+            Column("student_id", "o.student_id", "int32"),
+            Column("menu_item_id", "o.menu_item_id", "int32"),
+            Column("day", "o.order_date", "day"),
+            Column("meal_type", "o.meal_type", "dict:meal_type"),
+            Column("quantity", "o.quantity", "int16"),
+            Column("total_price", "o.total_price / 100.0", "float64"),
+            Column("status", "o.status", "dict:order_status"),
+            Column("payment_type", "o.payment_type", "dict:payment_type"),
+            Column("subscription_id", "o.subscription_id", "int32"),
+            Column("created_at", "o.created_at", "time"),
+            Column("received_at", "o.received_at", "time"),
+        ), archived=True),
+        Table("menu_items", "menu_items m", "day", "m.date", (
+            Column("id", "m.id", "int64"),
+            Column("day", "m.date", "day"),
+            Column("meal_type", "m.meal_type", "dict:meal_type"),
+            Column("name", "m.name", "dict:menu_name"),
+            Column("price", "m.price / 100.0", "float64"),
+            Column("calories", "m.calories", "int32"),
+            Column("allergen_mask", "m.allergen_mask", "int64"),
+            Column("is_available", "m.is_available", "bool"),
+        )),
+        Table("payments", "payments p", "id", "p.id", (
+            Column("id", "p.id", "int64"),
+            Column("user_id", "p.user_id", "int32"),
+            Column("amount", "p.amount / 100.0", "float64"),
+            Column("method", "p.payment_method", "dict:payment_method"),
+            Column("status", "p.status", "dict:payment_status"),
+            Column("kind", _META_SQL.format(key="kind"), "dict:payment_kind"),
+            Column("order_id", _META_SQL.format(key="orderId"), "int64"),
+            Column("created_at", "p.created_at", "time"),
+        )),
+        Table("users", "users u", "full", "u.id", (
+            Column("id", "u.id", "int64"),
+            Column("role", "u.role", "dict:role"),
+            Column("class", "u.class", "dict:class"),
+            Column("is_active", "u.is_active", "bool"),
+            Column("allergy_mask", "u.allergy_mask", "int64"),
+            Column("balance", "u.balance / 100.0", "float64"),
+            Column("created_at", "u.created_at", "time"),
+        )),
+    )
+}
+
+
+# ---- manifest ----
+def read_manifest(directory: str) -> dict[str, Any]:
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {"format": FORMAT_VERSION, "tables": {}, "dictionaries": {}}
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path}: format {manifest.get('format')}, expected {FORMAT_VERSION} (export with --rebuild)")
+    return manifest
+
+
+def _write_manifest(directory: str, manifest: dict[str, Any]) -> None:
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _write_part(directory: str, filename: str, arrays: dict[str, np.ndarray]) -> None:
+    # Written under a temporary name: a part is either complete or absent
+    tmp = os.path.join(directory, filename + ".tmp.npz")
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, os.path.join(directory, filename))
+
+
+# ---- encoding ----
+def _encode_dict(values: list[Any], dictionary: list[str]) -> np.ndarray:
+    index = {v: i for i, v in enumerate(dictionary)}
+    for v in dict.fromkeys(values):
+        if v is not None and str(v) not in index:
+            index[str(v)] = len(dictionary)
+            dictionary.append(str(v))
+    index[None] = -1
+    return np.fromiter((index[v if v is None else str(v)] for v in values), dtype=np.int32, count=len(values))
+
+
+def _encode(kind: str, values: list[Any], dictionaries: dict[str, list[str]]) -> np.ndarray:
+    if kind.startswith("dict:"):
+        return _encode_dict(values, dictionaries.setdefault(kind[5:], []))
+    if kind == "day":
+        return np.array(values, dtype="datetime64[D]").astype(np.int32)
+    if kind == "time":
+        return np.array(values, dtype="datetime64[s]").astype(np.int64)
+    if kind == "float64":
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if kind == "bool":
+        return np.array([bool(v) for v in values], dtype=bool)
+    return np.array([-1 if v is None else v for v in values], dtype=kind)
+
+
+def _read(conn: sqlite3.Connection, table: Table, where: str, params: Iterable[Any],
+          dictionaries: dict[str, list[str]], source: Optional[str] = None) -> dict[str, np.ndarray]:
+    """Rows of `table` matching `where` as one array per column, fetched CHUNK_ROWS at a time."""
+    cur = conn.execute(
+        f"SELECT {', '.join(c.sql for c in table.columns)} FROM {source or table.source} WHERE {where} "
+        f"ORDER BY {table.key}",
+        tuple(params),
+    )
+    chunks: list[list[np.ndarray]] = []
+    while True:
+        rows = cur.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        chunks.append([_encode(c.kind, [r[i] for r in rows], dictionaries) for i, c in enumerate(table.columns)])
+    if not chunks:
+        return {}
+    return {c.name: np.concatenate([chunk[i] for chunk in chunks]) for i, c in enumerate(table.columns)}
+
+
+# ---- export ----
+def _months(first: date, last: date) -> Iterable[tuple[date, date]]:
+    start = first
+    while start <= last:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        end = min(next_month - timedelta(days=1), last)
+        yield start, end
+        start = end + timedelta(days=1)
+
+
+def _export_days(conn: sqlite3.Connection, directory: str, table: Table, state: dict[str, Any],
+                 dictionaries: dict[str, list[str]], through: date) -> int:
+    if not table.archived:
+        return _export_day_range(conn, directory, table, state, dictionaries, through, table.source)
+    with attached(conn, state.get("through"), through.isoformat()) as schemas:
+        alias = table.source.split()[-1]
+        return _export_day_range(conn, directory, table, state, dictionaries, through,
+                                 f"{orders_source(conn, schemas)} {alias}")
+
+
+def _export_day_range(conn: sqlite3.Connection, directory: str, table: Table, state: dict[str, Any],
+                      dictionaries: dict[str, list[str]], through: date, source: str) -> int:
+    column = table.key
+    if state.get("through"):
+        first = date.fromisoformat(state["through"]) + timedelta(days=1)
+    else:
+        oldest = conn.execute(f"SELECT MIN({column}) FROM {source}").fetchone()[0]
+        if oldest is None:
+            return 0
+        first = date.fromisoformat(oldest)
+    rows = 0
+    for start, end in _months(first, through):
+        arrays = _read(conn, table, f"{column} BETWEEN ? AND ?", (start.isoformat(), end.isoformat()),
+                       dictionaries, source)
+        if arrays:
+            filename = f"{table.name}-{start.isoformat()}_{end.isoformat()}.npz"
+            _write_part(directory, filename, arrays)
+            state.setdefault("parts", []).append(filename)
+            n = len(arrays["id"])
+            state["rows"] = state.get("rows", 0) + n
+            rows += n
+        state["through"] = end.isoformat()
+    return rows
+
+
+def _export_ids(conn: sqlite3.Connection, directory: str, table: Table, state: dict[str, Any],
+                dictionaries: dict[str, list[str]]) -> int:
+    last_id = state.get("lastId", 0)
+    arrays = _read(conn, table, f"{table.key} > ?", (last_id,), dictionaries)
+    if not arrays:
+        return 0
+    first, last = int(arrays["id"][0]), int(arrays["id"][-1])
+    filename = f"{table.name}-{first}_{last}.npz"
+    _write_part(directory, filename, arrays)
+    state.setdefault("parts", []).append(filename)
+    state["rows"] = state.get("rows", 0) + len(arrays["id"])
+    state["lastId"] = last
+    return len(arrays["id"])
+
+
+def _export_full(conn: sqlite3.Connection, directory: str, table: Table, state: dict[str, Any],
+                 dictionaries: dict[str, list[str]]) -> int:
+    arrays = _read(conn, table, "1", (), dictionaries)
+    filename = f"{table.name}.npz"
+    if arrays:
+        _write_part(directory, filename, arrays)
+    state["parts"] = [filename] if arrays else []
+    state["rows"] = len(arrays["id"]) if arrays else 0
+    return state["rows"]
+
+
+def clear(directory: str) -> None:
+    """Remove an export (the manifest and the parts it lists)."""
+    if not os.path.exists(os.path.join(directory, MANIFEST)):
+        return
+    manifest = read_manifest(directory)
+    for state in manifest["tables"].values():
+        for filename in state.get("parts", []):
+            path = os.path.join(directory, filename)
+            if os.path.exists(path):
+                os.remove(path)
+    os.remove(os.path.join(directory, MANIFEST))
+
+
+def export(conn: sqlite3.Connection, directory: str, through: Optional[date] = None,
+           tables: Optional[list[str]] = None) -> dict[str, int]:
+    """Append everything new up to `through` (default: yesterday) to the export in
+    `directory`; returns the rows written per table."""
+    through = through or date.today() - timedelta(days=1)
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    dictionaries: dict[str, list[str]] = manifest["dictionaries"]
+    written: dict[str, int] = {}
+    for name in tables or list(TABLES):
+        table = TABLES[name]
+        state = manifest["tables"].setdefault(name, {"split": table.split})
+        if table.split == "day":
+            written[name] = _export_days(conn, directory, table, state, dictionaries, through)
+        elif table.split == "id":
+            written[name] = _export_ids(conn, directory, table, state, dictionaries)
+        else:
+            written[name] = _export_full(conn, directory, table, state, dictionaries)
+        # After every table: the parts written so far are never orphaned by a later failure
+        _write_manifest(directory, manifest)
+    return written
+
+
+# ---- loading ----
+def load(directory: str, table: str, columns: Optional[list[str]] = None,
+         decode: bool = False) -> dict[str, np.ndarray]:
+    """All parts of `table` as one array per column. With `decode`, dictionary
+    columns come back as object arrays of strings (None for NULL)."""
+    manifest = read_manifest(directory)
+    spec = TABLES[table]
+    wanted = [c for c in spec.columns if columns is None or c.name in columns]
+    parts: list[dict[str, np.ndarray]] = []
+    for filename in manifest["tables"].get(table, {}).get("parts", []):
+        with np.load(os.path.join(directory, filename), allow_pickle=False) as data:
+            parts.append({c.name: data[c.name] for c in wanted})
+    result = {
+        c.name: np.concatenate([p[c.name] for p in parts]) if parts else np.zeros(0, dtype=np.int32)
+        for c in wanted
+    }
+    if decode:
+        for c in wanted:
+            if c.kind.startswith("dict:"):
+                values = np.array(manifest["dictionaries"].get(c.kind[5:], []) + [None], dtype=object)
+                result[c.name] = values[result[c.name]]      # code -1 picks the trailing None
+    return result
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Columnar (NumPy .npz) snapshot for offline analysis")
+    parser.add_argument("command", choices=("export", "info"))
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    parser.add_argument("--out", default=None, help="export directory (default: data/columnar next to the DB)")
+    parser.add_argument("--through", help="last day to export, YYYY-MM-DD (default: yesterday)")
+    parser.add_argument("--rebuild", action="store_true", help="drop the existing export and start over")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(db_path)), "columnar")
+    if args.command == "info":
+        manifest = read_manifest(out)
+        for name, state in manifest["tables"].items():
+            print(f"{name:<12} rows={state.get('rows', 0)} parts={len(state.get('parts', []))} "
+                  f"through={state.get('through') or state.get('lastId') or '-'}")
+        return 0
+
+    initialize_database(db_path)
+    conn = connect(db_path)
+    try:
+        if args.rebuild:
+            clear(out)
+        result = export(conn, out, date.fromisoformat(args.through) if args.through else None)
+    finally:
+        conn.close()
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Critical events for the admin dashboard.
+
+Conditions are detected when the data changes, not when the dashboard is
+opened. Triggers in `db.SCHEMA_SQL` raise and clear events on the writes that
+cause them:
+
+- `out_of_stock`: an inventory row goes to status `out_of_stock`;
+- `low_balance`: a student's balance drops below `settings.min_balance`
+  (changing the threshold re-evaluates everyone once).
+
+Two conditions depend on the clock rather than on a write, so `sweep()`
+raises them with index range scans over the few qualifying rows:
+
+- `expiring`: stock with `expiration_date` within `expiry_days`;
+- `purchase_overdue`: a `high`-urgency purchase request still `pending`
+  after `overdue_hours`.
+
+The partial unique index on `(kind, subject_id) WHERE cleared_at IS NULL`
+allows one live event per condition, so every raise is `INSERT OR IGNORE`
+and an event the admin resolved or ignored is not raised again until the
+condition clears and comes back. The sweep also backfills the write-driven
+kinds, which covers rows written before the triggers existed.
+
+    python backend/critical.py      # e.g. from cron every 10 minutes
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+from typing import Any, Optional
+
+from db import connect, initialize_database, utcnow_iso
+
+EVENT_KINDS = ("out_of_stock", "expiring", "purchase_overdue", "low_balance")
+EVENT_TYPE_LABELS = {
+    "out_of_stock": "Склад",
+    "expiring": "Срок годности",
+    "purchase_overdue": "Закупки",
+    "low_balance": "Баланс",
+}
+PRIORITIES = {3: "high", 2: "medium", 1: "low"}
+
+DEFAULT_EXPIRY_DAYS = 3
+DEFAULT_OVERDUE_HOURS = 24
+
+_SWEEP_STATEMENTS = (
+    # expiring stock; already expired is high priority
+    """INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+       SELECT 'expiring', id, CASE WHEN expiration_date < :today THEN 3 ELSE 2 END,
+              CASE WHEN expiration_date < :today THEN 'Истёк срок годности: ' ELSE 'Истекает срок годности: ' END
+                  || product_name || ' (' || expiration_date || ')',
+              :now
+       FROM inventory
+       WHERE expiration_date IS NOT NULL AND quantity > 0 AND expiration_date <= :expiry_limit""",
+    """INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+       SELECT 'purchase_overdue', id, 3,
+              'Срочная заявка не рассмотрена: ' || product_name || ' (' || quantity || ' ' || unit || ')', :now
+       FROM purchase_requests
+       WHERE status = 'pending' AND urgency = 'high' AND created_at <= :overdue_before""",
+    """INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+       SELECT 'out_of_stock', id, 3, 'Нет на складе: ' || product_name, :now
+       FROM inventory WHERE status = 'out_of_stock'""",
+    """INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+       SELECT 'low_balance', id, 1, 'Низкий баланс: ' || full_name, :now
+       FROM users
+       WHERE role = 'student' AND balance < COALESCE((SELECT min_balance FROM settings WHERE id = 1), 0)""",
+)
+
+
+def sweep(conn: sqlite3.Connection, expiry_days: int = DEFAULT_EXPIRY_DAYS,
+          overdue_hours: float = DEFAULT_OVERDUE_HOURS, today: Optional[date] = None) -> int:
+    """Raise events for conditions that became true; returns how many were new."""
+    today = today or date.today()
+    params = {
+        "now": utcnow_iso(),
+        "today": today.isoformat(),
+        "expiry_limit": (today + timedelta(days=expiry_days)).isoformat(),
+        "overdue_before": (datetime.utcnow() - timedelta(hours=overdue_hours)).replace(microsecond=0).isoformat(),
+    }
+    created = 0
+    try:
+        for sql in _SWEEP_STATEMENTS:
+            created += conn.execute(sql, params).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return created
+
+
+def event_row_to_api(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "id": row["id"],
+        "type": row["kind"],
+        "typeLabel": EVENT_TYPE_LABELS.get(row["kind"], row["kind"]),
+        "subjectId": row["subject_id"],
+        "priority": PRIORITIES.get(row["severity"], "low"),
+        "description": row["description"],
+        "status": row["status"],
+        "active": row["cleared_at"] is None,
+        "date": row["created_at"],
+        "resolvedBy": row["resolved_by"],
+        "resolvedAt": row["resolved_at"],
+        "clearedAt": row["cleared_at"],
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Raise time-based critical events (expiring stock, overdue requests)")
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    parser.add_argument("--expiry-days", type=int, default=DEFAULT_EXPIRY_DAYS)
+    parser.add_argument("--overdue-hours", type=float, default=DEFAULT_OVERDUE_HOURS)
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    initialize_database(db_path)
+    conn = connect(db_path)
+    try:
+        print(f"new events: {sweep(conn, args.expiry_days, args.overdue_hours)}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""Synthetic large-school dataset generator.
+
+`seed_data()` only creates the demo accounts. This script fills a DB with a
+district-sized, realistic volume of data for scale testing:
+
+- students spread over classes (1А..11Г) with allergy profiles and balances;
+- cooks and admins (plus the usual demo accounts, password `password`);
+- breakfast and lunch menus for every school day of the period;
+- orders for every school day with a realistic status mix;
+- notifications, purchase requests and inventory.
+
+Rows are inserted with `executemany` inside large transactions; secondary
+indexes (and the sync change-log and meal analytics triggers) are dropped
+before loading and rebuilt (followed by ANALYZE) at the end, which is several
+times faster than maintaining them row by row. Allergen masks and the meal
+analytics tables are filled in once all rows are loaded. The output is fully determined by `--seed` and `--today`.
+
+    python backend/datagen.py --db /tmp/district.sqlite3 --students 5000 --days 365
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Iterator
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from allergens import index_missing as index_allergen_masks  # noqa: E402
+from analytics import rebuild as rebuild_meal_analytics  # noqa: E402
+from db import (  # noqa: E402
+    connect,
+    create_meal_triggers,
+    create_schema,
+    create_sync_triggers,
+    dump_json,
+    ensure_dir,
+    seed_data,
+)
+
+ALLERGENS = ["молоко", "глютен", "орехи", "яйца", "рыба", "соя", "мёд", "цитрусовые"]
+# (number of allergies, weight) — most students have none
+ALLERGY_PROFILES = [(0, 70), (1, 20), (2, 8), (3, 2)]
+
+BREAKFAST_DISHES = [
+    ("Каша овсяная", 90, 320, ["молоко"]),
+    ("Каша рисовая", 85, 300, ["молоко"]),
+    ("Каша гречневая", 85, 290, []),
+    ("Сырники со сметаной", 120, 410, ["молоко", "глютен", "яйца"]),
+    ("Омлет", 110, 280, ["яйца", "молоко"]),
+    ("Блины с мёдом", 115, 430, ["глютен", "молоко", "мёд"]),
+    ("Запеканка творожная", 120, 390, ["молоко", "яйца"]),
+    ("Бутерброд с сыром", 70, 250, ["глютен", "молоко"]),
+    ("Фруктовый салат", 95, 180, ["цитрусовые"]),
+    ("Гранола с йогуртом", 125, 350, ["орехи", "молоко"]),
+]
+LUNCH_DISHES = [
+    ("Борщ", 150, 350, []),
+    ("Щи из свежей капусты", 140, 300, []),
+    ("Куриный суп с лапшой", 140, 320, ["глютен"]),
+    ("Плов с курицей", 180, 560, []),
+    ("Рыба с рисом", 200, 480, ["рыба"]),
+    ("Макароны по-флотски", 160, 590, ["глютен"]),
+    ("Котлета с пюре", 185, 610, ["глютен", "яйца", "молоко"]),
+    ("Гуляш с гречкой", 190, 580, []),
+    ("Тефтели в соусе", 175, 540, ["глютен", "яйца"]),
+    ("Овощное рагу", 140, 310, []),
+    ("Салат витаминный", 80, 120, []),
+    ("Пирожок с капустой", 60, 260, ["глютен", "яйца"]),
+    ("Соевый гуляш", 170, 450, ["соя"]),
+]
+PRODUCTS = [
+    # name, category, unit, supplier, typical quantity
+    ("Молоко", "Молочные продукты", "л", "Молочный завод №1", 200),
+    ("Творог", "Молочные продукты", "кг", "Молочный завод №1", 40),
+    ("Сметана", "Молочные продукты", "кг", "Молочный завод №1", 25),
+    ("Сыр", "Молочные продукты", "кг", "Молочный завод №1", 30),
+    ("Масло сливочное", "Молочные продукты", "кг", "Молочный завод №1", 20),
+    ("Яйца", "Яйца", "шт", "Птицефабрика «Заря»", 1500),
+    ("Курица", "Мясо", "кг", "Птицефабрика «Заря»", 120),
+    ("Говядина", "Мясо", "кг", "Мясокомбинат «Север»", 90),
+    ("Фарш", "Мясо", "кг", "Мясокомбинат «Север»", 70),
+    ("Рыба (филе)", "Рыба", "кг", "Рыбторг", 60),
+    ("Рис", "Крупы", "кг", "Оптовая база", 150),
+    ("Гречка", "Крупы", "кг", "Оптовая база", 150),
+    ("Овсяные хлопья", "Крупы", "кг", "Оптовая база", 100),
+    ("Макароны", "Крупы", "кг", "Оптовая база", 120),
+    ("Мука", "Бакалея", "кг", "Оптовая база", 150),
+    ("Сахар", "Бакалея", "кг", "Оптовая база", 80),
+    ("Соль", "Бакалея", "кг", "Оптовая база", 30),
+    ("Мёд", "Бакалея", "кг", "Пасека «Липовая»", 10),
+    ("Картофель", "Овощи", "кг", "Овощебаза №3", 400),
+    ("Капуста", "Овощи", "кг", "Овощебаза №3", 200),
+    ("Морковь", "Овощи", "кг", "Овощебаза №3", 150),
+    ("Свёкла", "Овощи", "кг", "Овощебаза №3", 120),
+    ("Лук", "Овощи", "кг", "Овощебаза №3", 100),
+    ("Яблоки", "Фрукты", "кг", "Овощебаза №3", 150),
+    ("Апельсины", "Фрукты", "кг", "Овощебаза №3", 80),
+    ("Хлеб", "Хлеб", "шт", "Хлебозавод", 600),
+    ("Соевое мясо", "Бакалея", "кг", "Оптовая база", 20),
+]
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов",
+              "Михайлов", "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов"]
+FIRST_NAMES = ["Иван", "Анна", "Алексей", "Мария", "Дмитрий", "Елена", "Сергей", "Ольга",
+               "Артём", "Дарья", "Максим", "Софья", "Никита", "Полина", "Егор", "Виктория"]
+# Share of orders by status for days that are already over
+PAST_STATUSES = [("received", 88), ("cancelled", 6), ("paid", 6)]
+TODAY_STATUSES = [("pending", 15), ("paid", 35), ("preparing", 25), ("ready", 15), ("received", 10)]
+
+
+def _weighted(rng: random.Random, choices: list[tuple[Any, int]]) -> Any:
+    return rng.choices([c for c, _ in choices], weights=[w for _, w in choices])[0]
+
+
+def _ts(day: date, rng: random.Random, start_hour: int = 7, end_hour: int = 13) -> str:
+    t = datetime(day.year, day.month, day.day, start_hour) + timedelta(seconds=rng.randrange((end_hour - start_hour) * 3600))
+    return t.isoformat()
+
+
+def _chunks(rows: Iterator[tuple], size: int) -> Iterator[list[tuple]]:
+    chunk: list[tuple] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def school_days(start: date, end: date, weekends: bool = False) -> list[date]:
+    days = []
+    d = start
+    while d <= end:
+        if weekends or d.weekday() < 5:
+            days.append(d)
+        d += timedelta(days=1)
+    return days
+
+
+class Generator:
+    def __init__(self, conn, args: argparse.Namespace) -> None:
+        self.conn = conn
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.today = date.fromisoformat(args.today) if args.today else date.today()
+        self.now = datetime(self.today.year, self.today.month, self.today.day, 7).isoformat()
+        self.counts: dict[str, int] = {}
+
+    def insert(self, table: str, sql: str, rows: Iterator[tuple]) -> None:
+        """Bulk insert, committing every `--batch` rows."""
+        total = 0
+        for chunk in _chunks(rows, self.args.batch):
+            self.conn.executemany(sql, chunk)
+            total += len(chunk)
+            if total % (self.args.batch * 10) < len(chunk):
+                self.conn.commit()
+        self.conn.commit()
+        self.counts[table] = self.counts.get(table, 0) + total
+
+    # ---- users ----
+    def users(self) -> None:
+        from werkzeug.security import generate_password_hash
+
+        rng = self.rng
+        pw = generate_password_hash("password")
+        classes = [f"{grade}{letter}" for grade in range(1, 12) for letter in "АБВГ"][: self.args.classes]
+
+        def students() -> Iterator[tuple]:
+            for i in range(self.args.students):
+                n_allergies = _weighted(rng, ALLERGY_PROFILES)
+                allergies = rng.sample(ALLERGENS, n_allergies)
+                name = f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}"
+                yield (
+                    f"student{i:05d}@gen.school.ru", f"gen_student{i:05d}", pw, name, classes[i % len(classes)],
+                    dump_json(allergies), round(rng.uniform(0, 3000) * 100), self.now, self.now,
+                )
+
+        self.insert("users", """INSERT INTO users (email, login, password_hash, full_name, role, class, allergies, balance, is_active, created_at, updated_at)
+                                VALUES (?, ?, ?, ?, 'student', ?, ?, ?, 1, ?, ?)""", students())
+        self.insert("users", """INSERT INTO users (email, login, password_hash, full_name, role, specialization, position, is_active, created_at, updated_at)
+                                VALUES (?, ?, ?, ?, 'cook', 'Повар', 'Повар', 1, ?, ?)""",
+                    ((f"cook{i:03d}@gen.school.ru", f"gen_cook{i:03d}", pw, f"{rng.choice(LAST_NAMES)}а {rng.choice(FIRST_NAMES)}", self.now, self.now)
+                     for i in range(self.args.cooks)))
+        self.insert("users", """INSERT INTO users (email, login, password_hash, full_name, role, position, permission_level, is_active, created_at, updated_at)
+                                VALUES (?, ?, ?, ?, 'admin', 'Администратор', 'full', 1, ?, ?)""",
+                    ((f"admin{i:03d}@gen.school.ru", f"gen_admin{i:03d}", pw, f"Администратор {i}", self.now, self.now)
+                     for i in range(self.args.admins)))
+
+    # ---- menu + orders ----
+    def menus_and_orders(self, days: list[date]) -> None:
+        rng = self.rng
+        students = self.conn.execute("SELECT id FROM users WHERE role = 'student'").fetchall()
+        student_ids = [r[0] for r in students]
+
+        def menu_rows() -> Iterator[tuple]:
+            for day in days:
+                for meal_type, catalog, k in (("breakfast", BREAKFAST_DISHES, self.args.breakfast_dishes),
+                                              ("lunch", LUNCH_DISHES, self.args.lunch_dishes)):
+                    for name, price, calories, allergens in rng.sample(catalog, min(k, len(catalog))):
+                        yield (day.isoformat(), meal_type, name, "", price * 100, calories, dump_json(allergens), self.now)
+
+        self.insert("menu_items", """INSERT INTO menu_items (date, meal_type, name, description, price, calories, allergens, is_available, created_at)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)""", menu_rows())
+
+        menu_by_day: dict[tuple[str, str], list[tuple[int, int]]] = {}
+        for r in self.conn.execute("SELECT id, date, meal_type, price FROM menu_items"):
+            menu_by_day.setdefault((r[1], r[2]), []).append((r[0], r[3]))
+
+        p_breakfast, p_lunch = self.args.breakfast_rate, self.args.lunch_rate
+
+        def order_rows() -> Iterator[tuple]:
+            for day in days:
+                if day > self.today:
+                    continue
+                statuses = TODAY_STATUSES if day == self.today else PAST_STATUSES
+                iso = day.isoformat()
+                breakfast = menu_by_day.get((iso, "breakfast"), [])
+                lunch = menu_by_day.get((iso, "lunch"), [])
+                for sid in student_ids:
+                    for meal_type, dishes, p in (("breakfast", breakfast, p_breakfast), ("lunch", lunch, p_lunch)):
+                        if not dishes or rng.random() >= p:
+                            continue
+                        menu_id, price = dishes[rng.randrange(len(dishes))]
+                        status = _weighted(rng, statuses)
+                        created = _ts(day, rng, 7, 12)
+                        received = created if status == "received" else None
+                        yield (sid, menu_id, iso, meal_type, price, status, received, created)
+
+        self.insert("orders", """INSERT INTO orders (student_id, menu_item_id, order_date, meal_type, quantity, total_price, status, payment_type, received_at, created_at)
+                                 VALUES (?, ?, ?, ?, 1, ?, ?, 'one_time', ?, ?)""", order_rows())
+
+    # ---- notifications ----
+    def notifications(self, days: list[date]) -> None:
+        rng = self.rng
+        user_ids = [r[0] for r in self.conn.execute("SELECT id FROM users")]
+        past = [d for d in days if d <= self.today] or [self.today]
+        templates = [
+            ("order", "Новый заказ", "Ваш заказ принят", "/student.html"),
+            ("order", "Заказ получен", "Ваш заказ был успешно получен", "/student.html"),
+            ("payment", "Пополнение баланса", "Баланс пополнен", "/student.html"),
+            ("system", "Статус заявки изменен", "Ваша заявка была одобрена", "/cook.html"),
+            ("warning", "Низкий баланс", "Пополните баланс", "/student.html"),
+        ]
+
+        def rows() -> Iterator[tuple]:
+            for uid in user_ids:
+                for _ in range(self.args.notifications_per_user):
+                    n_type, title, message, link = rng.choice(templates)
+                    day = rng.choice(past)
+                    is_read = 1 if (self.today - day).days > 7 or rng.random() < 0.5 else 0
+                    yield (uid, n_type, title, message, is_read, link, _ts(day, rng, 7, 18))
+
+        self.insert("notifications", """INSERT INTO notifications (user_id, type, title, message, is_read, link, created_at)
+                                        VALUES (?, ?, ?, ?, ?, ?, ?)""", rows())
+
+    # ---- inventory + purchase requests ----
+    def inventory(self) -> None:
+        rng = self.rng
+
+        def rows() -> Iterator[tuple]:
+            for name, category, unit, supplier, typical in PRODUCTS:
+                qty = round(typical * rng.choice([0, 0.1, 0.3, 0.6, 1.0, 1.4]) * rng.uniform(0.8, 1.2), 1)
+                min_qty = round(typical * 0.3, 1)
+                status = "out_of_stock" if qty <= 0 else ("low_stock" if qty <= min_qty else "in_stock")
+                expires = (self.today + timedelta(days=rng.randint(-3, 60))).isoformat()
+                restocked = (self.today - timedelta(days=rng.randint(0, 14))).isoformat()
+                yield (name, category, qty, unit, min_qty, expires, supplier, restocked, status, self.now, self.now)
+
+        self.insert("inventory", """INSERT INTO inventory (product_name, category, quantity, unit, min_quantity, expiration_date, supplier, last_restocked, status, created_at, updated_at)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows())
+
+    def purchase_requests(self, days: list[date]) -> None:
+        rng = self.rng
+        cooks = [r[0] for r in self.conn.execute("SELECT id FROM users WHERE role = 'cook'")]
+        admins = [r[0] for r in self.conn.execute("SELECT id FROM users WHERE role = 'admin'")]
+        past = [d for d in days if d <= self.today]
+        if not cooks or not past:
+            return
+
+        def rows() -> Iterator[tuple]:
+            for day in past:
+                if day.weekday() not in (0, 3):  # requests are filed twice a week
+                    continue
+                for cook in cooks:
+                    for _ in range(rng.randint(1, self.args.requests_per_cook)):
+                        name, _cat, unit, _sup, typical = rng.choice(PRODUCTS)
+                        urgency = _weighted(rng, [("low", 30), ("medium", 50), ("high", 20)])
+                        created = _ts(day, rng, 12, 17)
+                        if (self.today - day).days < 3:
+                            status, admin, approved, completed = "pending", None, None, None
+                        else:
+                            status = _weighted(rng, [("completed", 70), ("approved", 10), ("rejected", 20)])
+                            admin = rng.choice(admins) if admins else None
+                            approved = _ts(day + timedelta(days=1), rng, 8, 12) if status in ("approved", "completed") else None
+                            completed = _ts(day + timedelta(days=3), rng, 8, 12) if status == "completed" else None
+                        yield (cook, name, round(typical * rng.uniform(0.2, 0.8), 1), unit, "Пополнение запасов",
+                               urgency, status, admin, approved, completed, created)
+
+        self.insert("purchase_requests", """INSERT INTO purchase_requests (cook_id, product_name, quantity, unit, reason, urgency, status, admin_id, approved_at, completed_at, created_at)
+                                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows())
+
+
+def drop_indexes(conn) -> list[str]:
+    """Drop all explicitly created indexes; returns their CREATE statements."""
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+    for name, _sql in rows:
+        conn.execute(f'DROP INDEX "{name}"')
+    conn.commit()
+    return [sql for _name, sql in rows]
+
+
+def drop_sync_triggers(conn) -> None:
+    """The sync change log is for live edits; clients start from a full load anyway."""
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_sync_%'").fetchall():
+        conn.execute(f'DROP TRIGGER "{name}"')
+    conn.execute("DELETE FROM sync_changes")
+    conn.commit()
+
+
+def drop_meal_triggers(conn) -> None:
+    """The meal analytics tables are rebuilt in one pass once the orders are in."""
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_meal_%'").fetchall():
+        conn.execute(f'DROP TRIGGER "{name}"')
+    conn.commit()
+
+
+def generate(args: argparse.Namespace) -> dict[str, int]:
+    if os.path.exists(args.db):
+        if not args.overwrite:
+            raise SystemExit(f"{args.db} already exists (use --overwrite to replace it)")
+        os.remove(args.db)
+    ensure_dir(os.path.dirname(os.path.abspath(args.db)))
+
+    conn = connect(args.db)
+    try:
+        # Bulk-load settings: the file is disposable until the script finishes.
+        conn.execute("PRAGMA journal_mode = MEMORY")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -200000")
+        create_schema(conn)
+        seed_data(conn)
+        index_sql = drop_indexes(conn)
+        drop_sync_triggers(conn)
+        drop_meal_triggers(conn)
+
+        gen = Generator(conn, args)
+        end = gen.today + timedelta(days=args.future_days)
+        days = school_days(gen.today - timedelta(days=args.days - 1), end, args.weekends)
+
+        steps = [
+            ("users", gen.users),
+            ("menus + orders", lambda: gen.menus_and_orders(days)),
+            ("notifications", lambda: gen.notifications(days)),
+            ("inventory", gen.inventory),
+            ("purchase requests", lambda: gen.purchase_requests(days)),
+            ("allergen masks", lambda: index_allergen_masks(conn)),
+            ("meal analytics", lambda: rebuild_meal_analytics(conn)),
+        ]
+        for label, step in steps:
+            t0 = time.perf_counter()
+            step()
+            print(f"{label:<20} {time.perf_counter() - t0:7.1f}s", flush=True)
+
+        t0 = time.perf_counter()
+        for sql in index_sql:
+            conn.execute(sql)
+        create_sync_triggers(conn)
+        create_meal_triggers(conn)
+        conn.execute("ANALYZE")
+        conn.commit()
+        print(f"{'indexes + analyze':<20} {time.perf_counter() - t0:7.1f}s", flush=True)
+        return gen.counts
+    finally:
+        conn.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Fill a School Food System DB with synthetic data")
+    parser.add_argument("--db", required=True, help="target SQLite file")
+    parser.add_argument("--overwrite", action="store_true", help="replace the file if it exists")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", help="YYYY-MM-DD the generated history ends on (default: today)")
+    parser.add_argument("--students", type=int, default=3000)
+    parser.add_argument("--classes", type=int, default=40, help="number of classes (max 44)")
+    parser.add_argument("--cooks", type=int, default=8)
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--days", type=int, default=365, help="history length in calendar days, ending today")
+    parser.add_argument("--future-days", type=int, default=7, help="days of menus planned ahead")
+    parser.add_argument("--weekends", action="store_true", help="serve meals on weekends too")
+    parser.add_argument("--breakfast-dishes", type=int, default=3)
+    parser.add_argument("--lunch-dishes", type=int, default=5)
+    parser.add_argument("--breakfast-rate", type=float, default=0.55, help="chance a student orders breakfast on a school day")
+    parser.add_argument("--lunch-rate", type=float, default=0.8, help="chance a student orders lunch on a school day")
+    parser.add_argument("--notifications-per-user", type=int, default=20)
+    parser.add_argument("--requests-per-cook", type=int, default=3, help="max purchase requests per cook per filing day")
+    parser.add_argument("--batch", type=int, default=20000, help="rows per executemany call")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    counts = generate(args)
+    print()
+    for table, n in counts.items():
+        print(f"{table:<20} {n:>10,}")
+    print(f"done in {time.perf_counter() - t0:.1f}s -> {args.db}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
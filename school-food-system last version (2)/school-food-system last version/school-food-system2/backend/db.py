@@ -9,15 +9,20 @@ Design goals:
 - Schema is created automatically on first run.
 
 Note: The DB uses snake_case columns; the front-end expects camelCase fields.
+Money (prices, totals, balances, payment amounts) is stored as integer kopecks
+and converted to rubles only at the API boundary (`to_kopecks` / `to_rubles`),
+so sums are exact integer sums.
 """
 
 from __future__ import annotations
 
 import json
 import os
+import re
 import sqlite3
+import time
 from datetime import datetime, date
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
 
 def utcnow_iso() -> str:
@@ -29,12 +34,189 @@ def today_str() -> str:
     return date.today().isoformat()
 
 
+def to_kopecks(rubles: Any) -> int:
+    """Rubles from the API (number or numeric string) as integer kopecks; raises ValueError."""
+    try:
+        return int(round(float(rubles) * 100))
+    except (TypeError, OverflowError):
+        raise ValueError(f"not an amount of money: {rubles!r}") from None
+
+
+def to_rubles(kopecks: Optional[float]) -> float:
+    """Kopecks from the DB as rubles for the API (NULL is 0)."""
+    return (kopecks or 0) / 100
+
+
 def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def connect(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+# How long a statement may wait for another connection's lock before failing
+# (same as the sqlite3 module default).
+BUSY_TIMEOUT = 5.0
+
+
+class QueryStats:
+    """SQL counters accumulated by one connection (read by the metrics middleware)."""
+
+    __slots__ = ("statements", "sql_seconds", "rows", "lock_wait_seconds", "commits")
+
+    def __init__(self) -> None:
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.lock_wait_seconds = 0.0
+        self.commits = 0
+
+
+_READ_PREFIXES = ("SELECT", "WITH", "EXPLAIN")
+
+
+def _may_deadlock(conn: "TracedConnection", sql: str) -> bool:
+    """A write inside an open transaction, which may already hold a SHARED lock.
+
+    If another connection holds RESERVED, SQLite reports SQLITE_BUSY at once
+    instead of waiting (its busy handler is not called either): neither side
+    can proceed until this transaction rolls back, so retrying cannot succeed.
+    """
+    return conn.in_transaction and not sql.lstrip().upper().startswith(_READ_PREFIXES)
+
+
+def _run_with_lock_wait(conn: "TracedConnection", fn, *args, retry: bool = True):
+    """Call `fn`, retrying while the DB is locked by another connection.
+
+    The connection is opened with timeout=0, so SQLite reports SQLITE_BUSY
+    immediately and the time spent waiting for the lock can be measured here
+    instead of disappearing inside SQLite's own busy handler. With
+    retry=False (a lock-upgrade deadlock, see `_may_deadlock`) the error is
+    raised at once, as SQLite itself would.
+    """
+    started = None
+    delay = 0.001
+    while True:
+        try:
+            result = fn(*args)
+        except sqlite3.OperationalError as exc:
+            if ("locked" not in str(exc) and "busy" not in str(exc)) or not retry:
+                raise
+            now = time.perf_counter()
+            if started is None:
+                started = now
+            if now - started >= BUSY_TIMEOUT:
+                conn.stats.lock_wait_seconds += now - started
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+            continue
+        if started is not None:
+            conn.stats.lock_wait_seconds += time.perf_counter() - started
+        return result
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that reports statement count, time and fetched rows to its connection."""
+
+    def execute(self, sql: str, parameters: Any = ()):
+        conn = self.connection
+        t0 = time.perf_counter()
+        try:
+            return _run_with_lock_wait(conn, super().execute, sql, parameters,
+                                       retry=not _may_deadlock(conn, sql))
+        finally:
+            elapsed = time.perf_counter() - t0
+            conn.stats.statements += 1
+            conn.stats.sql_seconds += elapsed
+            if conn.statement_hook is not None:
+                conn.statement_hook(conn, sql, parameters, elapsed)
+
+    def executemany(self, sql: str, seq_of_parameters: Any):
+        conn = self.connection
+        if conn.statement_hook is not None:
+            # Keep the first parameter set so the hook can describe the statement.
+            seq_of_parameters = list(seq_of_parameters)
+        t0 = time.perf_counter()
+        try:
+            return _run_with_lock_wait(conn, super().executemany, sql, seq_of_parameters,
+                                       retry=not _may_deadlock(conn, sql))
+        finally:
+            elapsed = time.perf_counter() - t0
+            conn.stats.statements += 1
+            conn.stats.sql_seconds += elapsed
+            if conn.statement_hook is not None:
+                conn.statement_hook(conn, sql, seq_of_parameters[0] if seq_of_parameters else (), elapsed)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        stats = self.connection.stats
+        stats.sql_seconds += time.perf_counter() - t0
+        if row is not None:
+            stats.rows += 1
+        return row
+
+    def fetchmany(self, size: int = -1):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(size if size >= 0 else self.arraysize)
+        stats = self.connection.stats
+        stats.sql_seconds += time.perf_counter() - t0
+        stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        stats = self.connection.stats
+        stats.sql_seconds += time.perf_counter() - t0
+        stats.rows += len(rows)
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self.connection.stats.rows += 1
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are counted in `self.stats`.
+
+    `statement_hook(conn, sql, params, seconds)`, when set, is called after every
+    `execute`/`executemany` (time to first row; used by the slow query log).
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = QueryStats()
+        self.statement_hook: Optional[Callable[["TracedConnection", str, Any, float], None]] = None
+
+    def cursor(self, factory=TracedCursor):  # type: ignore[override]
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Any = ()):  # type: ignore[override]
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any):  # type: ignore[override]
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str):  # type: ignore[override]
+        t0 = time.perf_counter()
+        try:
+            return _run_with_lock_wait(self, super().executescript, sql_script)
+        finally:
+            self.stats.statements += 1
+            self.stats.sql_seconds += time.perf_counter() - t0
+
+    def commit(self) -> None:
+        t0 = time.perf_counter()
+        try:
+            _run_with_lock_wait(self, super().commit)
+        finally:
+            self.stats.commits += 1
+            self.stats.sql_seconds += time.perf_counter() - t0
+
+
+def connect(db_path: str, check_same_thread: bool = True) -> TracedConnection:
+    """Open `db_path`; pooled connections (tenants.ConnectionPool) move between threads."""
+    conn = sqlite3.connect(db_path, timeout=0, factory=TracedConnection, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON;")
     return conn
@@ -51,8 +233,9 @@ CREATE TABLE IF NOT EXISTS users (
     role TEXT NOT NULL CHECK (role IN ('student','cook','admin')),
     class TEXT,
     allergies TEXT,
+    allergy_mask INTEGER, -- allergens.py: bits of the dictionary allergens matching `allergies`
     preferences TEXT,
-    balance REAL DEFAULT 0.0,
+    balance INTEGER DEFAULT 0, -- kopecks, like every amount of money below
     specialization TEXT,
     position TEXT,
     permission_level TEXT,
@@ -72,15 +255,18 @@ CREATE TABLE IF NOT EXISTS menu_items (
     meal_type TEXT NOT NULL CHECK (meal_type IN ('breakfast','lunch')),
     name TEXT NOT NULL,
     description TEXT,
-    price REAL NOT NULL,
+    price INTEGER NOT NULL,
     calories INTEGER,
     allergens TEXT,
+    allergen_mask INTEGER, -- allergens.py: bits of `allergens`
     is_available INTEGER DEFAULT 1,
     image_url TEXT,
     created_at TEXT NOT NULL
 );
 
-CREATE INDEX IF NOT EXISTS idx_menu_date ON menu_items(date);
+-- Day and week-range lookups (GET /api/menu?date= / ?from=&to=, week copies)
+CREATE INDEX IF NOT EXISTS idx_menu_date_type ON menu_items(date, meal_type);
+DROP INDEX IF EXISTS idx_menu_date;
 CREATE INDEX IF NOT EXISTS idx_menu_meal_type ON menu_items(meal_type);
 CREATE INDEX IF NOT EXISTS idx_menu_available ON menu_items(is_available);
 
@@ -92,7 +278,7 @@ CREATE TABLE IF NOT EXISTS orders (
     order_date TEXT NOT NULL,
     meal_type TEXT NOT NULL CHECK (meal_type IN ('breakfast','lunch')),
     quantity INTEGER DEFAULT 1,
-    total_price REAL NOT NULL,
+    total_price INTEGER NOT NULL,
     status TEXT DEFAULT 'pending' CHECK (status IN ('pending','paid','preparing','ready','received','cancelled')),
     payment_type TEXT NOT NULL CHECK (payment_type IN ('one_time','subscription')),
     subscription_id INTEGER,
@@ -106,6 +292,10 @@ CREATE TABLE IF NOT EXISTS orders (
 CREATE INDEX IF NOT EXISTS idx_orders_student ON orders(student_id);
 CREATE INDEX IF NOT EXISTS idx_orders_date ON orders(order_date);
 CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
+CREATE INDEX IF NOT EXISTS idx_orders_menu_item ON orders(menu_item_id);
+-- One order per subscription, day and meal: makes daily materialization idempotent
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_subscription_day ON orders(subscription_id, order_date, meal_type)
+    WHERE subscription_id IS NOT NULL;
 
 -- Subscriptions
 CREATE TABLE IF NOT EXISTS subscriptions (
@@ -114,7 +304,7 @@ CREATE TABLE IF NOT EXISTS subscriptions (
     plan_type TEXT NOT NULL CHECK (plan_type IN ('breakfast','lunch','full')),
     start_date TEXT NOT NULL,
     end_date TEXT NOT NULL,
-    price REAL NOT NULL,
+    price INTEGER NOT NULL,
     status TEXT DEFAULT 'active' CHECK (status IN ('active','expired','cancelled')),
     payment_id TEXT,
     created_at TEXT NOT NULL,
@@ -140,6 +330,63 @@ CREATE TABLE IF NOT EXISTS reviews (
 CREATE INDEX IF NOT EXISTS idx_reviews_menu_item ON reviews(menu_item_id);
 CREATE INDEX IF NOT EXISTS idx_reviews_student ON reviews(student_id);
 
+-- Per-dish rating aggregates, maintained by the triggers below (approved reviews only)
+CREATE TABLE IF NOT EXISTS menu_item_ratings (
+    menu_item_id INTEGER PRIMARY KEY,
+    review_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    r1 INTEGER NOT NULL DEFAULT 0,
+    r2 INTEGER NOT NULL DEFAULT 0,
+    r3 INTEGER NOT NULL DEFAULT 0,
+    r4 INTEGER NOT NULL DEFAULT 0,
+    r5 INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (menu_item_id) REFERENCES menu_items(id) ON DELETE CASCADE
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_reviews_rating_insert AFTER INSERT ON reviews
+WHEN NEW.is_approved = 1
+BEGIN
+    INSERT INTO menu_item_ratings (menu_item_id, review_count, rating_sum, r1, r2, r3, r4, r5)
+    VALUES (NEW.menu_item_id, 1, NEW.rating,
+            NEW.rating = 1, NEW.rating = 2, NEW.rating = 3, NEW.rating = 4, NEW.rating = 5)
+    ON CONFLICT(menu_item_id) DO UPDATE SET
+        review_count = review_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        r1 = r1 + excluded.r1, r2 = r2 + excluded.r2, r3 = r3 + excluded.r3,
+        r4 = r4 + excluded.r4, r5 = r5 + excluded.r5;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reviews_rating_delete AFTER DELETE ON reviews
+WHEN OLD.is_approved = 1
+BEGIN
+    UPDATE menu_item_ratings SET
+        review_count = review_count - 1,
+        rating_sum = rating_sum - OLD.rating,
+        r1 = r1 - (OLD.rating = 1), r2 = r2 - (OLD.rating = 2), r3 = r3 - (OLD.rating = 3),
+        r4 = r4 - (OLD.rating = 4), r5 = r5 - (OLD.rating = 5)
+    WHERE menu_item_id = OLD.menu_item_id;
+END;
+
+-- Edits (rating, moderation, moving to another dish): take the old row out, put the new one in.
+CREATE TRIGGER IF NOT EXISTS trg_reviews_rating_update AFTER UPDATE OF rating, is_approved, menu_item_id ON reviews
+BEGIN
+    UPDATE menu_item_ratings SET
+        review_count = review_count - 1,
+        rating_sum = rating_sum - OLD.rating,
+        r1 = r1 - (OLD.rating = 1), r2 = r2 - (OLD.rating = 2), r3 = r3 - (OLD.rating = 3),
+        r4 = r4 - (OLD.rating = 4), r5 = r5 - (OLD.rating = 5)
+    WHERE menu_item_id = OLD.menu_item_id AND OLD.is_approved = 1;
+    INSERT INTO menu_item_ratings (menu_item_id, review_count, rating_sum, r1, r2, r3, r4, r5)
+    SELECT NEW.menu_item_id, 1, NEW.rating,
+           NEW.rating = 1, NEW.rating = 2, NEW.rating = 3, NEW.rating = 4, NEW.rating = 5
+    WHERE NEW.is_approved = 1
+    ON CONFLICT(menu_item_id) DO UPDATE SET
+        review_count = review_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        r1 = r1 + excluded.r1, r2 = r2 + excluded.r2, r3 = r3 + excluded.r3,
+        r4 = r4 + excluded.r4, r5 = r5 + excluded.r5;
+END;
+
 -- Inventory
 CREATE TABLE IF NOT EXISTS inventory (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -158,6 +405,45 @@ CREATE TABLE IF NOT EXISTS inventory (
 
 CREATE INDEX IF NOT EXISTS idx_inventory_status ON inventory(status);
 
+-- Recipes: quantity of an inventory item (in its unit) used by one portion of a dish
+CREATE TABLE IF NOT EXISTS recipes (
+    menu_item_id INTEGER NOT NULL,
+    inventory_id INTEGER NOT NULL,
+    quantity REAL NOT NULL CHECK (quantity > 0),
+    PRIMARY KEY (menu_item_id, inventory_id),
+    FOREIGN KEY (menu_item_id) REFERENCES menu_items(id) ON DELETE CASCADE,
+    FOREIGN KEY (inventory_id) REFERENCES inventory(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_recipes_inventory ON recipes(inventory_id);
+
+-- Stock movements (append-only; inventory.quantity is their running sum)
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    inventory_id INTEGER NOT NULL,
+    delta REAL NOT NULL,
+    reason TEXT NOT NULL CHECK (reason IN ('opening','restock','consumption','adjustment','waste')),
+    order_id INTEGER,
+    batch_id TEXT,
+    note TEXT,
+    created_at TEXT NOT NULL,
+    FOREIGN KEY (inventory_id) REFERENCES inventory(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_movements_item ON stock_movements(inventory_id);
+CREATE INDEX IF NOT EXISTS idx_stock_movements_batch ON stock_movements(batch_id) WHERE batch_id IS NOT NULL;
+-- An order's ingredients are deducted once
+CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_movements_order ON stock_movements(order_id, inventory_id) WHERE reason = 'consumption';
+
+-- Per-item stock level as of a movement id
+CREATE TABLE IF NOT EXISTS stock_snapshots (
+    inventory_id INTEGER PRIMARY KEY,
+    quantity REAL NOT NULL,
+    last_movement_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    FOREIGN KEY (inventory_id) REFERENCES inventory(id) ON DELETE CASCADE
+);
+
 -- Purchase requests
 CREATE TABLE IF NOT EXISTS purchase_requests (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -184,7 +470,7 @@ CREATE INDEX IF NOT EXISTS idx_purchase_cook ON purchase_requests(cook_id);
 CREATE TABLE IF NOT EXISTS payments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
-    amount REAL NOT NULL,
+    amount INTEGER NOT NULL,
     payment_method TEXT NOT NULL CHECK (payment_method IN ('card','sbp','cash','transfer')),
     transaction_id TEXT UNIQUE,
     status TEXT DEFAULT 'pending' CHECK (status IN ('pending','completed','failed','refunded')),
@@ -198,6 +484,15 @@ CREATE TABLE IF NOT EXISTS payments (
 CREATE INDEX IF NOT EXISTS idx_payments_user ON payments(user_id);
 CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status);
 
+-- Per-user balance as of a payment id (ledger reconciliation starts from here)
+CREATE TABLE IF NOT EXISTS balance_snapshots (
+    user_id INTEGER PRIMARY KEY,
+    balance INTEGER NOT NULL,
+    last_payment_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
 -- Notifications
 CREATE TABLE IF NOT EXISTS notifications (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -220,7 +515,7 @@ CREATE TABLE IF NOT EXISTS settings (
     school_name TEXT DEFAULT '',
     work_start TEXT DEFAULT '',
     work_end TEXT DEFAULT '',
-    min_balance INTEGER DEFAULT 50,
+    min_balance INTEGER DEFAULT 5000,
     notifications_enabled INTEGER DEFAULT 1,
     email_notifications INTEGER DEFAULT 1,
     order_notifications INTEGER DEFAULT 1,
@@ -235,15 +530,564 @@ CREATE TABLE IF NOT EXISTS statistics (
     total_students INTEGER DEFAULT 0,
     active_orders INTEGER DEFAULT 0,
     meals_served INTEGER DEFAULT 0,
-    revenue REAL DEFAULT 0.0,
+    revenue INTEGER DEFAULT 0,
     avg_rating REAL DEFAULT 0.0,
     created_at TEXT NOT NULL
 );
+
+-- Critical events (admin dashboard alerts), raised by the triggers below and critical.sweep()
+-- status is what the admin did with the event; cleared_at is set once the condition no longer holds.
+CREATE TABLE IF NOT EXISTS critical_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL CHECK (kind IN ('out_of_stock','expiring','purchase_overdue','low_balance')),
+    subject_id INTEGER NOT NULL,
+    severity INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open','resolved','ignored')),
+    resolved_by INTEGER,
+    resolved_at TEXT,
+    cleared_at TEXT,
+    created_at TEXT NOT NULL
+);
+
+-- One live event per condition: re-raising an existing one is an INSERT OR IGNORE no-op
+CREATE UNIQUE INDEX IF NOT EXISTS idx_critical_events_live ON critical_events(kind, subject_id) WHERE cleared_at IS NULL;
+-- Dashboard order within a status: the list query reads only `limit` index entries
+CREATE INDEX IF NOT EXISTS idx_critical_events_status ON critical_events(status, severity DESC, created_at DESC);
+
+-- Range scans for the sweep (pending purchase requests are already covered by idx_purchase_status)
+CREATE INDEX IF NOT EXISTS idx_inventory_expiration ON inventory(expiration_date) WHERE expiration_date IS NOT NULL AND quantity > 0;
+CREATE INDEX IF NOT EXISTS idx_users_role_balance ON users(role, balance);
+
+CREATE TRIGGER IF NOT EXISTS trg_critical_inventory_insert AFTER INSERT ON inventory
+WHEN NEW.status = 'out_of_stock'
+BEGIN
+    INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+    VALUES ('out_of_stock', NEW.id, 3, 'Нет на складе: ' || NEW.product_name, strftime('%Y-%m-%dT%H:%M:%S', 'now'));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_critical_inventory_update AFTER UPDATE OF status, quantity, expiration_date ON inventory
+BEGIN
+    INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+    SELECT 'out_of_stock', NEW.id, 3, 'Нет на складе: ' || NEW.product_name, strftime('%Y-%m-%dT%H:%M:%S', 'now')
+    WHERE NEW.status = 'out_of_stock';
+    UPDATE critical_events SET cleared_at = strftime('%Y-%m-%dT%H:%M:%S', 'now'),
+        status = CASE WHEN status = 'open' THEN 'resolved' ELSE status END
+    WHERE cleared_at IS NULL AND subject_id = NEW.id
+      AND ((kind = 'out_of_stock' AND NEW.status != 'out_of_stock')
+        -- restocked or re-dated: the sweep raises it again if the new date is still close
+        OR (kind = 'expiring' AND (NEW.quantity <= 0 OR NEW.expiration_date IS NOT OLD.expiration_date)));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_critical_inventory_delete AFTER DELETE ON inventory
+BEGIN
+    UPDATE critical_events SET cleared_at = strftime('%Y-%m-%dT%H:%M:%S', 'now'),
+        status = CASE WHEN status = 'open' THEN 'resolved' ELSE status END
+    WHERE cleared_at IS NULL AND subject_id = OLD.id AND kind IN ('out_of_stock', 'expiring');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_critical_purchase_update AFTER UPDATE OF status, urgency ON purchase_requests
+WHEN NEW.status != 'pending' OR NEW.urgency != 'high'
+BEGIN
+    UPDATE critical_events SET cleared_at = strftime('%Y-%m-%dT%H:%M:%S', 'now'),
+        status = CASE WHEN status = 'open' THEN 'resolved' ELSE status END
+    WHERE cleared_at IS NULL AND kind = 'purchase_overdue' AND subject_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_critical_purchase_delete AFTER DELETE ON purchase_requests
+BEGIN
+    UPDATE critical_events SET cleared_at = strftime('%Y-%m-%dT%H:%M:%S', 'now'),
+        status = CASE WHEN status = 'open' THEN 'resolved' ELSE status END
+    WHERE cleared_at IS NULL AND kind = 'purchase_overdue' AND subject_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_critical_balance_insert AFTER INSERT ON users
+WHEN NEW.role = 'student' AND COALESCE(NEW.balance, 0) < COALESCE((SELECT min_balance FROM settings WHERE id = 1), 0)
+BEGIN
+    INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+    VALUES ('low_balance', NEW.id, 1, 'Низкий баланс: ' || NEW.full_name, strftime('%Y-%m-%dT%H:%M:%S', 'now'));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_critical_balance_update AFTER UPDATE OF balance ON users
+WHEN NEW.role = 'student'
+BEGIN
+    INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+    SELECT 'low_balance', NEW.id, 1, 'Низкий баланс: ' || NEW.full_name, strftime('%Y-%m-%dT%H:%M:%S', 'now')
+    WHERE COALESCE(NEW.balance, 0) < COALESCE((SELECT min_balance FROM settings WHERE id = 1), 0);
+    UPDATE critical_events SET cleared_at = strftime('%Y-%m-%dT%H:%M:%S', 'now'),
+        status = CASE WHEN status = 'open' THEN 'resolved' ELSE status END
+    WHERE cleared_at IS NULL AND kind = 'low_balance' AND subject_id = NEW.id
+      AND COALESCE(NEW.balance, 0) >= COALESCE((SELECT min_balance FROM settings WHERE id = 1), 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_critical_users_delete AFTER DELETE ON users
+BEGIN
+    UPDATE critical_events SET cleared_at = strftime('%Y-%m-%dT%H:%M:%S', 'now'),
+        status = CASE WHEN status = 'open' THEN 'resolved' ELSE status END
+    WHERE cleared_at IS NULL AND kind = 'low_balance' AND subject_id = OLD.id;
+END;
+
+-- A new threshold re-evaluates every student once (rare, admin-only write)
+CREATE TRIGGER IF NOT EXISTS trg_critical_min_balance AFTER UPDATE OF min_balance ON settings
+WHEN NEW.min_balance IS NOT OLD.min_balance
+BEGIN
+    UPDATE critical_events SET cleared_at = strftime('%Y-%m-%dT%H:%M:%S', 'now'),
+        status = CASE WHEN status = 'open' THEN 'resolved' ELSE status END
+    WHERE cleared_at IS NULL AND kind = 'low_balance'
+      AND subject_id IN (SELECT id FROM users WHERE role = 'student' AND balance >= COALESCE(NEW.min_balance, 0));
+    INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+    SELECT 'low_balance', id, 1, 'Низкий баланс: ' || full_name, strftime('%Y-%m-%dT%H:%M:%S', 'now')
+    FROM users WHERE role = 'student' AND balance < COALESCE(NEW.min_balance, 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_critical_settings_insert AFTER INSERT ON settings
+BEGIN
+    INSERT OR IGNORE INTO critical_events (kind, subject_id, severity, description, created_at)
+    SELECT 'low_balance', id, 1, 'Низкий баланс: ' || full_name, strftime('%Y-%m-%dT%H:%M:%S', 'now')
+    FROM users WHERE role = 'student' AND balance < COALESCE(NEW.min_balance, 0);
+END;
+
+-- The settings row always exists, so the low-balance triggers see the default threshold
+INSERT OR IGNORE INTO settings (id, updated_at) VALUES (1, strftime('%Y-%m-%dT%H:%M:%S', 'now'));
+
+-- Background scheduler (scheduler.py): one lease row names the worker that runs jobs
+CREATE TABLE IF NOT EXISTS scheduler_lease (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+-- Last run of every job; survives restarts so that missed runs are caught up once
+CREATE TABLE IF NOT EXISTS scheduler_jobs (
+    name TEXT PRIMARY KEY,
+    schedule TEXT NOT NULL,
+    last_started_at TEXT,
+    last_finished_at TEXT,
+    last_status TEXT CHECK (last_status IN ('ok','error')),
+    last_error TEXT,
+    last_duration_ms REAL,
+    last_result TEXT,
+    run_count INTEGER NOT NULL DEFAULT 0,
+    fail_count INTEGER NOT NULL DEFAULT 0,
+    running_on TEXT,
+    run_requested INTEGER NOT NULL DEFAULT 0
+);
+
+-- Change log for client mirrors (GET /api/sync): one entry per row, replaced on every change,
+-- so `version` is the row's last-changed version; deleted rows stay as tombstones (deleted = 1).
+CREATE TABLE IF NOT EXISTS sync_changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    changed_at TEXT NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_changes_row ON sync_changes(table_name, row_id);
+
+-- Tombstones up to this version have been purged; older clients must reload everything
+CREATE TABLE IF NOT EXISTS sync_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    purged_through INTEGER NOT NULL DEFAULT 0
+);
+
+-- Reusable week menus (menus.py); day_offset 0 = Monday. source_item_id is the dish an
+-- item was saved from (its recipe is copied when the template is applied).
+CREATE TABLE IF NOT EXISTS menu_templates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS menu_template_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    template_id INTEGER NOT NULL,
+    day_offset INTEGER NOT NULL CHECK (day_offset BETWEEN 0 AND 6),
+    meal_type TEXT NOT NULL CHECK (meal_type IN ('breakfast','lunch')),
+    name TEXT NOT NULL,
+    description TEXT,
+    price INTEGER NOT NULL,
+    calories INTEGER,
+    allergens TEXT,
+    image_url TEXT,
+    source_item_id INTEGER,
+    FOREIGN KEY (template_id) REFERENCES menu_templates(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_menu_template_items ON menu_template_items(template_id, day_offset);
+
+-- Allergen dictionary (allergens.py): one bit per normalized name
+CREATE TABLE IF NOT EXISTS allergens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    bit INTEGER NOT NULL UNIQUE CHECK (bit BETWEEN 0 AND 62),
+    created_at TEXT NOT NULL
+);
+
+-- Meal analytics (analytics.py), kept up to date by the triggers from create_meal_triggers.
+-- One row per student and day with an order; `class` is the student's class when the day's
+-- first order was placed, so history stays with the class it was eaten in.
+CREATE TABLE IF NOT EXISTS meal_student_days (
+    student_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    class TEXT NOT NULL,
+    breakfasts INTEGER NOT NULL DEFAULT 0,
+    lunches INTEGER NOT NULL DEFAULT 0,
+    calories INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, date)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_meal_student_days_date ON meal_student_days(date, class, breakfasts, lunches);
+
+-- Orders counted by day x class x meal x status x dish (cancelled ones too)
+CREATE TABLE IF NOT EXISTS meal_cube (
+    date TEXT NOT NULL,
+    class TEXT NOT NULL,
+    meal_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    menu_item_id INTEGER NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    calories INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, class, meal_type, status, menu_item_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_meal_cube_class ON meal_cube(class, date);
+CREATE INDEX IF NOT EXISTS idx_meal_cube_menu_item ON meal_cube(menu_item_id, date);
+
+-- Archived school years (archive.py): orders and order notifications moved to the file at
+-- `path` (relative to this DB's directory), with their totals for reports
+CREATE TABLE IF NOT EXISTS order_archives (
+    year INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    date_from TEXT,
+    date_to TEXT,
+    orders INTEGER NOT NULL DEFAULT 0,
+    revenue INTEGER NOT NULL DEFAULT 0,
+    notifications INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+"""
+
+# Columns added after the tables were first created; CREATE TABLE IF NOT EXISTS
+# leaves existing files without them (see add_missing_columns).
+ADDED_COLUMNS = (
+    ("users", "allergy_mask", "INTEGER"),
+    ("menu_items", "allergen_mask", "INTEGER"),
+)
+
+# Tables whose changes are recorded in `sync_changes` (see create_sync_triggers)
+SYNCED_TABLES = ("users", "menu_items", "orders", "inventory", "purchase_requests", "reviews")
+
+# DELETE + INSERT rather than INSERT OR REPLACE: an OR clause on the outer statement
+# (e.g. INSERT OR IGNORE INTO orders) would override the one inside the trigger.
+_SYNC_STAMP_SQL = """
+    DELETE FROM sync_changes WHERE table_name = '{table}' AND row_id = {row_id};
+    INSERT INTO sync_changes (table_name, row_id, deleted, changed_at)
+    VALUES ('{table}', {row_id}, {deleted}, strftime('%Y-%m-%dT%H:%M:%S', 'now'));"""
+
+_SYNC_TRIGGER_SQL = """
+CREATE TRIGGER IF NOT EXISTS trg_sync_{table}_insert AFTER INSERT ON {table}
+BEGIN{insert}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sync_{table}_update AFTER UPDATE ON {table}
+BEGIN{update}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sync_{table}_delete AFTER DELETE ON {table}
+BEGIN{delete}
+END;
+"""
+
+# A dish's rating is part of its API row, so rating changes re-stamp the dish (unless it was
+# just deleted: the cascade to its reviews must not overwrite the tombstone).
+_SYNC_RATING_TRIGGER_SQL = """
+CREATE TRIGGER IF NOT EXISTS trg_sync_menu_item_ratings_insert AFTER INSERT ON menu_item_ratings
+WHEN EXISTS (SELECT 1 FROM menu_items WHERE id = NEW.menu_item_id)
+BEGIN{stamp}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sync_menu_item_ratings_update AFTER UPDATE ON menu_item_ratings
+WHEN EXISTS (SELECT 1 FROM menu_items WHERE id = NEW.menu_item_id)
+BEGIN{stamp}
+END;
+"""
+
+# Order, review and purchase request rows carry the names of their student, cook and dish
+# (and the student's class): renaming one re-stamps the rows that show it.
+_SYNC_DEPENDENTS_STAMP_SQL = """
+    DELETE FROM sync_changes WHERE table_name = '{table}' AND row_id IN (SELECT id FROM {table} WHERE {fk} = NEW.id);
+    INSERT INTO sync_changes (table_name, row_id, deleted, changed_at)
+    SELECT '{table}', id, 0, strftime('%Y-%m-%dT%H:%M:%S', 'now') FROM {table} WHERE {fk} = NEW.id;"""
+
+_SYNC_NAME_TRIGGER_SQL = """
+CREATE TRIGGER IF NOT EXISTS trg_sync_users_rename AFTER UPDATE OF full_name, class ON users
+WHEN NEW.full_name IS NOT OLD.full_name OR NEW.class IS NOT OLD.class
+BEGIN{users}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sync_menu_items_rename AFTER UPDATE OF name ON menu_items
+WHEN NEW.name IS NOT OLD.name
+BEGIN{menu_items}
+END;
 """
 
 
+def create_sync_triggers(conn: sqlite3.Connection) -> None:
+    sql = [
+        _SYNC_TRIGGER_SQL.format(
+            table=table,
+            insert=_SYNC_STAMP_SQL.format(table=table, row_id="NEW.id", deleted=0),
+            update=_SYNC_STAMP_SQL.format(table=table, row_id="NEW.id", deleted=0),
+            delete=_SYNC_STAMP_SQL.format(table=table, row_id="OLD.id", deleted=1),
+        )
+        for table in SYNCED_TABLES
+    ]
+    sql.append(_SYNC_RATING_TRIGGER_SQL.format(
+        stamp=_SYNC_STAMP_SQL.format(table="menu_items", row_id="NEW.menu_item_id", deleted=0)))
+    sql.append(_SYNC_NAME_TRIGGER_SQL.format(
+        users="".join(_SYNC_DEPENDENTS_STAMP_SQL.format(table=t, fk=fk) for t, fk in
+                      (("orders", "student_id"), ("reviews", "student_id"), ("purchase_requests", "cook_id"))),
+        menu_items="".join(_SYNC_DEPENDENTS_STAMP_SQL.format(table=t, fk="menu_item_id") for t in ("orders", "reviews")),
+    ))
+    conn.executescript("".join(sql))
+
+
+# An order's calories are its dish's current calories times its quantity; only orders
+# that are not cancelled count towards a student's day.
+_MEAL_CALORIES_SQL = "COALESCE((SELECT calories FROM menu_items WHERE id = {row}.menu_item_id), 0) * COALESCE({row}.quantity, 1)"
+_MEAL_CLASS_SQL = "(SELECT class FROM meal_student_days WHERE student_id = {row}.student_id AND date = {row}.order_date)"
+
+_MEAL_ADD_SQL = """
+    INSERT INTO meal_student_days (student_id, date, class)
+    VALUES ({row}.student_id, {row}.order_date, COALESCE((SELECT class FROM users WHERE id = {row}.student_id), ''))
+    ON CONFLICT(student_id, date) DO NOTHING;
+    UPDATE meal_student_days SET
+        breakfasts = breakfasts + ({row}.meal_type = 'breakfast' AND {row}.status != 'cancelled'),
+        lunches = lunches + ({row}.meal_type = 'lunch' AND {row}.status != 'cancelled'),
+        calories = calories + CASE WHEN {row}.status != 'cancelled' THEN {calories} ELSE 0 END
+    WHERE student_id = {row}.student_id AND date = {row}.order_date;
+    INSERT INTO meal_cube (date, class, meal_type, status, menu_item_id, orders, quantity, calories)
+    SELECT {row}.order_date, {klass}, {row}.meal_type, {row}.status, {row}.menu_item_id, 1,
+           COALESCE({row}.quantity, 1), {calories}
+    WHERE 1
+    ON CONFLICT(date, class, meal_type, status, menu_item_id) DO UPDATE SET
+        orders = orders + 1, quantity = quantity + excluded.quantity, calories = calories + excluded.calories;"""
+
+_MEAL_REMOVE_SQL = """
+    UPDATE meal_cube SET
+        orders = orders - 1, quantity = quantity - COALESCE({row}.quantity, 1), calories = calories - {calories}
+    WHERE date = {row}.order_date AND class = {klass} AND meal_type = {row}.meal_type
+      AND status = {row}.status AND menu_item_id = {row}.menu_item_id;
+    DELETE FROM meal_cube
+    WHERE date = {row}.order_date AND class = {klass} AND meal_type = {row}.meal_type
+      AND status = {row}.status AND menu_item_id = {row}.menu_item_id AND orders <= 0;
+    UPDATE meal_student_days SET
+        breakfasts = breakfasts - ({row}.meal_type = 'breakfast' AND {row}.status != 'cancelled'),
+        lunches = lunches - ({row}.meal_type = 'lunch' AND {row}.status != 'cancelled'),
+        calories = calories - CASE WHEN {row}.status != 'cancelled' THEN {calories} ELSE 0 END
+    WHERE student_id = {row}.student_id AND date = {row}.order_date;
+    DELETE FROM meal_student_days
+    WHERE student_id = {row}.student_id AND date = {row}.order_date
+      AND NOT EXISTS (SELECT 1 FROM orders WHERE student_id = {row}.student_id AND order_date = {row}.order_date);"""
+
+# A dish's calories changing (or the dish going away, before its orders cascade)
+# moves the calories of every order of it.
+_MEAL_SHIFT_SQL = """
+    UPDATE meal_cube SET calories = calories + ({diff}) * quantity WHERE menu_item_id = {item};
+    UPDATE meal_student_days SET calories = calories + ({diff}) * (
+        SELECT SUM(COALESCE(o.quantity, 1)) FROM orders o
+        WHERE o.student_id = meal_student_days.student_id AND o.order_date = meal_student_days.date
+          AND o.menu_item_id = {item} AND o.status != 'cancelled')
+    WHERE (student_id, date) IN (
+        SELECT student_id, order_date FROM orders WHERE menu_item_id = {item} AND status != 'cancelled');"""
+
+_MEAL_TRIGGER_SQL = """
+CREATE TRIGGER IF NOT EXISTS trg_meal_orders_insert AFTER INSERT ON orders
+BEGIN{add_new}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_meal_orders_delete AFTER DELETE ON orders
+BEGIN{remove_old}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_meal_orders_update
+AFTER UPDATE OF student_id, menu_item_id, order_date, meal_type, quantity, status ON orders
+WHEN OLD.student_id IS NOT NEW.student_id OR OLD.menu_item_id IS NOT NEW.menu_item_id
+  OR OLD.order_date IS NOT NEW.order_date OR OLD.meal_type IS NOT NEW.meal_type
+  OR OLD.quantity IS NOT NEW.quantity OR OLD.status IS NOT NEW.status
+BEGIN{remove_old}{add_new}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_meal_menu_calories AFTER UPDATE OF calories ON menu_items
+WHEN OLD.calories IS NOT NEW.calories
+BEGIN{shift_update}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_meal_menu_delete BEFORE DELETE ON menu_items
+BEGIN{shift_delete}
+END;
+"""
+
+
+def create_meal_triggers(conn: sqlite3.Connection) -> None:
+    def fill(template: str, row: str) -> str:
+        return template.format(row=row, klass=_MEAL_CLASS_SQL.format(row=row),
+                               calories=_MEAL_CALORIES_SQL.format(row=row))
+
+    conn.executescript(_MEAL_TRIGGER_SQL.format(
+        add_new=fill(_MEAL_ADD_SQL, "NEW"),
+        remove_old=fill(_MEAL_REMOVE_SQL, "OLD"),
+        shift_update=_MEAL_SHIFT_SQL.format(diff="COALESCE(NEW.calories, 0) - COALESCE(OLD.calories, 0)", item="NEW.id"),
+        shift_delete=_MEAL_SHIFT_SQL.format(diff="-COALESCE(OLD.calories, 0)", item="OLD.id"),
+    ))
+
+
 def create_schema(conn: sqlite3.Connection) -> None:
+    new = conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone() is None
+    # Only takes effect on a new, empty file; lets the maintenance job return free pages
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
     conn.executescript(SCHEMA_SQL)
+    add_missing_columns(conn)
+    create_sync_triggers(conn)
+    create_meal_triggers(conn)
+    if new:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def add_missing_columns(conn: sqlite3.Connection) -> None:
+    for table, column, decl in ADDED_COLUMNS:
+        if column not in {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# `PRAGMA user_version` of an up-to-date file. New files start there (create_schema);
+# initialize_database runs the MIGRATIONS an older file has not had yet.
+SCHEMA_VERSION = 1
+
+# Money columns, integer kopecks since version 1 (REAL rubles before)
+MONEY_COLUMNS = (
+    ("users", "balance"),
+    ("menu_items", "price"),
+    ("orders", "total_price"),
+    ("subscriptions", "price"),
+    ("payments", "amount"),
+    ("balance_snapshots", "balance"),
+    ("statistics", "revenue"),
+    ("settings", "min_balance"),
+    ("menu_template_items", "price"),
+    ("order_archives", "revenue"),
+)
+
+_RUBLE_MIN_BALANCE_SQL = "min_balance INTEGER DEFAULT 50,"
+
+
+def _kopecks_sql(column: str) -> str:
+    return f"{column} = CAST(ROUND({column} * 100) AS INTEGER)"
+
+
+def _rebuild_money_table(conn: sqlite3.Connection, table: str, columns: list[str], schema: str = "main") -> None:
+    """Recreate `table` with INTEGER money columns and the kopeck min_balance default.
+
+    SQLite cannot change a column's type or default in place: the table is
+    copied into a new one and swapped in (https://sqlite.org/lang_altertable.html#otheralter).
+    The caller has turned foreign keys off and dropped the triggers.
+    """
+    master = f"{schema}.sqlite_master"
+    (table_sql,) = conn.execute(f"SELECT sql FROM {master} WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    new_sql = table_sql
+    for column in columns:
+        new_sql = re.sub(rf"\b({column}\s+)REAL\b", r"\1INTEGER", new_sql)
+    new_sql = new_sql.replace(_RUBLE_MIN_BALANCE_SQL, "min_balance INTEGER DEFAULT 5000,")
+    if new_sql == table_sql:
+        return
+
+    indexes = [sql for (sql,) in conn.execute(
+        f"SELECT sql FROM {master} WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))]
+    # Dropping the table drops its AUTOINCREMENT counter; ids of deleted rows must not come back
+    sequence = None
+    if conn.execute(f"SELECT 1 FROM {master} WHERE name = 'sqlite_sequence'").fetchone():
+        sequence = conn.execute(f"SELECT seq FROM {schema}.sqlite_sequence WHERE name = ?", (table,)).fetchone()
+
+    copy = f"{table}_kopecks"
+    conn.execute(re.sub(rf'^CREATE TABLE\s+(IF NOT EXISTS\s+)?"?{table}"?', f"CREATE TABLE {schema}.{copy}",
+                        new_sql, count=1))
+    conn.execute(f"INSERT INTO {schema}.{copy} SELECT * FROM {schema}.{table}")
+    conn.execute(f"DROP TABLE {schema}.{table}")
+    conn.execute(f"ALTER TABLE {schema}.{copy} RENAME TO {table}")
+    for sql in indexes:
+        conn.execute(re.sub(r"^(CREATE\s+(UNIQUE\s+)?INDEX\s+(IF NOT EXISTS\s+)?)", rf"\g<1>{schema}.", sql, count=1))
+    if sequence is not None:
+        conn.execute(f"UPDATE {schema}.sqlite_sequence SET seq = ? WHERE name = ?", (sequence[0], table))
+
+
+def _money_to_kopecks(conn: sqlite3.Connection, db_path: str) -> None:
+    """Version 1: money columns from REAL rubles to INTEGER kopecks, here and in the order archives."""
+    # Archive files first, each in its own transaction (ATTACH cannot run inside one);
+    # a converted file is marked, so an interrupted migration skips it next time.
+    # BEGIN IMMEDIATE + reading the version inside the transaction: another process
+    # starting at the same time waits and then finds the work done.
+    # Foreign keys are off while tables are swapped: dropping a parent table would
+    # otherwise delete (or refuse to delete) its children. It cannot change inside a transaction.
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        directory = os.path.dirname(os.path.abspath(db_path))
+        for (path,) in conn.execute("SELECT path FROM order_archives").fetchall():
+            path = os.path.join(directory, path)
+            if not os.path.exists(path):
+                continue
+            conn.execute("ATTACH DATABASE ? AS money_archive", (path,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("PRAGMA money_archive.user_version").fetchone()[0] < 1:
+                    conn.execute(f"UPDATE money_archive.orders SET {_kopecks_sql('total_price')}")
+                    _rebuild_money_table(conn, "orders", ["total_price"], schema="money_archive")
+                    conn.execute("PRAGMA money_archive.user_version = 1")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("DETACH DATABASE money_archive")
+
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+            conn.rollback()
+            return
+        # All triggers go: the conversion must not fire them (the API values do not
+        # change, so sync clients need no new copy of every row, and low-balance events
+        # compare balance and min_balance, which are converted one after the other),
+        # and a table swap fails on triggers that name the table being replaced.
+        # create_schema puts them back.
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+        for table, column in MONEY_COLUMNS:
+            conn.execute(f"UPDATE {table} SET {_kopecks_sql(column)} WHERE {column} IS NOT NULL")
+        for table in dict.fromkeys(table for table, _ in MONEY_COLUMNS):
+            _rebuild_money_table(conn, table, [c for t, c in MONEY_COLUMNS if t == table])
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+
+MIGRATIONS = (
+    (1, _money_to_kopecks),
+)
+
+
+def migrate(conn: sqlite3.Connection, db_path: str) -> bool:
+    """Run the migrations newer than the file's `user_version`; True if any ran."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    pending = [step for target, step in MIGRATIONS if target > version]
+    for step in pending:
+        step(conn, db_path)
+    return bool(pending)
 
 
 def parse_json_list(value: Optional[str]) -> list[str]:
@@ -315,7 +1159,7 @@ def seed_data(conn: sqlite3.Connection) -> None:
             "10А",
             ["молоко", "орехи"],
             "Не люблю рыбу",
-            1500.0,
+            150000,
         ),
         (
             "student2@school.ru",
@@ -324,7 +1168,7 @@ def seed_data(conn: sqlite3.Connection) -> None:
             "9Б",
             ["глютен"],
             "Вегетарианское питание",
-            800.0,
+            80000,
         ),
         (
             "student3@school.ru",
@@ -333,7 +1177,7 @@ def seed_data(conn: sqlite3.Connection) -> None:
             "11В",
             [],
             "",
-            1200.0,
+            120000,
         ),
     ]
 
@@ -361,14 +1205,18 @@ def seed_data(conn: sqlite3.Connection) -> None:
     conn.commit()
 
 
-def initialize_database(db_path: str) -> None:
-    """Create schema + seed data if DB file does not exist."""
+def initialize_database(db_path: str, seed: bool = True) -> None:
+    """Create or migrate the schema; seed demo data into an empty DB (unless seed=False)."""
 
     ensure_dir(os.path.dirname(db_path))
 
     conn = connect(db_path)
     try:
         create_schema(conn)
-        seed_data(conn)
+        if migrate(conn, db_path):
+            # Put back the triggers a migration dropped
+            create_schema(conn)
+        if seed:
+            seed_data(conn)
     finally:
         conn.close()
@@ -0,0 +1,358 @@
+"""Demand forecast for menu items and ingredients.
+
+A series is one dish (menu item name + meal type) for one class. Its model
+is seasonal exponential smoothing:
+
+    forecast(series, day) = level(series) * season(meal type, weekday)
+
+`season` is the average number of portions ordered on a weekday relative to
+the average school day, per meal type. `level` is an exponentially weighted
+average of the deseasonalized portions on the days the dish was on the menu
+(days it was not offered say nothing about demand). Weights are
+`(1 - alpha) ** k`, k being the number of later observations of the same
+series, so the state is two sums per series (weighted portions and weights)
+and closing new days only needs those days' orders:
+
+    num = (1 - alpha) ** m * num + sum(w * x)      # m new observations
+    den = (1 - alpha) ** m * den + sum(w)
+
+All series are updated together with NumPy arrays; there is no per-dish
+Python loop. A dish never seen before gets the average level of its meal
+type and class.
+
+The state is kept in an `.npz` file next to the DB and brought up to date
+(yesterday is the last closed day) by the scheduler's nightly job, or on the
+next read if that has not run yet.
+
+    python backend/forecast.py                  # update the cache, print next week
+    python backend/forecast.py --rebuild --start 2025-09-01
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+from datetime import date, timedelta
+from typing import Any, Optional
+
+import numpy as np
+
+from archive import attached, orders_source
+from db import connect, initialize_database
+
+DEFAULT_ALPHA = 0.3
+MEAL_TYPES = ("breakfast", "lunch")
+_SEP = "\x1f"
+NO_CLASS = "—"
+
+
+def _keys(*columns: np.ndarray) -> np.ndarray:
+    out = columns[0].astype(str)
+    for col in columns[1:]:
+        out = np.char.add(np.char.add(out, _SEP), col.astype(str))
+    return out
+
+
+def _weekdays(days: np.ndarray) -> np.ndarray:
+    # 1970-01-01 was a Thursday (weekday 3)
+    return (days.astype("datetime64[D]").astype(np.int64) + 3) % 7
+
+
+class ForecastModel:
+    """Smoothing state for every (dish, meal type, class) series."""
+
+    def __init__(self, alpha: float = DEFAULT_ALPHA) -> None:
+        self.alpha = alpha
+        self.keys = np.array([], dtype=str)         # sorted "name<SEP>meal<SEP>class"
+        self.num = np.zeros(0)
+        self.den = np.zeros(0)
+        self.season_sum = np.zeros((len(MEAL_TYPES), 7))
+        self.season_days = np.zeros((len(MEAL_TYPES), 7))
+        self.closed_through = ""                     # last day included, YYYY-MM-DD
+
+    # ---- persistence ----
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, keys=self.keys, num=self.num, den=self.den, season_sum=self.season_sum,
+                 season_days=self.season_days, alpha=np.array(self.alpha),
+                 closed_through=np.array(self.closed_through))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ForecastModel":
+        with np.load(path, allow_pickle=False) as data:
+            model = cls(float(data["alpha"]))
+            model.keys = data["keys"]
+            model.num = data["num"]
+            model.den = data["den"]
+            model.season_sum = data["season_sum"]
+            model.season_days = data["season_days"]
+            model.closed_through = str(data["closed_through"])
+        return model
+
+    def season(self) -> np.ndarray:
+        """(meal type, weekday) multipliers; 1 where there is no data."""
+        per_day = np.divide(self.season_sum, self.season_days, out=np.zeros_like(self.season_sum),
+                            where=self.season_days > 0)
+        overall = np.divide(self.season_sum.sum(1), self.season_days.sum(1),
+                            out=np.zeros(len(MEAL_TYPES)), where=self.season_days.sum(1) > 0)
+        index = np.divide(per_day, overall[:, None], out=np.ones_like(per_day), where=overall[:, None] > 0)
+        index[self.season_days == 0] = 1.0
+        return np.maximum(index, 0.05)
+
+    # ---- fitting ----
+    def update(self, conn: sqlite3.Connection, through: date, window_days: int = 28) -> int:
+        """Fold the days after `closed_through` up to `through` into the state; returns days added.
+
+        History is read in windows of `window_days` so that a full refit of a
+        large DB does not build one (dish x class x day) array for all of it.
+        """
+        if self.closed_through:
+            start = date.fromisoformat(self.closed_through) + timedelta(days=1)
+        else:
+            first = conn.execute("SELECT MIN(date) FROM menu_items").fetchone()[0]
+            if first is None:
+                self.closed_through = through.isoformat()
+                return 0
+            start = date.fromisoformat(first)
+        added = 0
+        if start > through:
+            return added
+        # A refit reaches back into archived school years
+        with attached(conn, start.isoformat(), through.isoformat()) as schemas:
+            orders_sql = orders_source(conn, schemas)
+            while start <= through:
+                end = min(start + timedelta(days=window_days - 1), through)
+                added += self._update_window(conn, start, end, orders_sql)
+                start = end + timedelta(days=1)
+        return added
+
+    def _update_window(self, conn: sqlite3.Connection, first: date, last: date, orders_sql: str = "orders") -> int:
+        since, upto = first.isoformat(), last.isoformat()
+        menu = conn.execute(
+            "SELECT date, meal_type, name FROM menu_items WHERE date >= ? AND date <= ?", (since, upto)
+        ).fetchall()
+        orders = conn.execute(
+            """SELECT o.order_date, o.meal_type, m.name, COALESCE(u.class, ?), SUM(o.quantity)
+               FROM {orders} o
+               JOIN menu_items m ON m.id = o.menu_item_id
+               JOIN users u ON u.id = o.student_id
+               WHERE o.order_date >= ? AND o.order_date <= ? AND o.status != 'cancelled'
+               GROUP BY 1, 2, 3, 4""".format(orders=orders_sql),
+            (NO_CLASS, since, upto),
+        ).fetchall()
+        self.closed_through = upto
+        if not menu and not orders:
+            return 0
+
+        classes = np.array(sorted(
+            {r[0] for r in conn.execute("SELECT DISTINCT COALESCE(class, ?) FROM users WHERE role = 'student'", (NO_CLASS,))}
+            | {r[3] for r in orders}
+        ))
+        menu_a = np.array(menu, dtype=str).reshape(-1, 3)
+        ord_a = np.array([r[:4] for r in orders], dtype=str).reshape(-1, 4)
+        qty = np.array([r[4] for r in orders], dtype=float)
+
+        # Dish and day indexes for both inputs at once
+        dish_keys, dish_inv = np.unique(np.concatenate([_keys(menu_a[:, 2], menu_a[:, 1]), _keys(ord_a[:, 2], ord_a[:, 1])]),
+                                        return_inverse=True)
+        day_keys, day_inv = np.unique(np.concatenate([menu_a[:, 0], ord_a[:, 0]]), return_inverse=True)
+        n_menu = len(menu_a)
+        n_dish, n_day, n_class = len(dish_keys), len(day_keys), len(classes)
+        meal_idx = np.searchsorted(np.array(MEAL_TYPES), np.char.rpartition(dish_keys, _SEP)[:, 2])
+
+        offered = np.zeros((n_dish, n_day), dtype=bool)
+        offered[dish_inv[:n_menu], day_inv[:n_menu]] = True
+        offered[dish_inv[n_menu:], day_inv[n_menu:]] = True
+        class_inv = np.searchsorted(classes, ord_a[:, 3])
+        portions = np.zeros((n_dish, n_class, n_day))
+        np.add.at(portions, (dish_inv[n_menu:], class_inv, day_inv[n_menu:]), qty)
+
+        # Season: daily totals per meal type and weekday, for days that meal was served
+        weekday = _weekdays(day_keys)
+        meal_day_total = np.zeros((len(MEAL_TYPES), n_day))
+        np.add.at(meal_day_total, meal_idx, portions.sum(1))
+        meal_served = np.zeros((len(MEAL_TYPES), n_day), dtype=bool)
+        np.logical_or.at(meal_served, meal_idx, offered)
+        for m in range(len(MEAL_TYPES)):
+            np.add.at(self.season_sum[m], weekday, np.where(meal_served[m], meal_day_total[m], 0.0))
+            np.add.at(self.season_days[m], weekday, meal_served[m].astype(float))
+        season = self.season()
+
+        # Level: weighted sums of deseasonalized portions, per (dish, class) series
+        x = portions / season[meal_idx][:, weekday][:, None, :]
+        mask = np.broadcast_to(offered[:, None, :], x.shape)
+        beta = 1.0 - self.alpha
+        later = np.cumsum(mask[..., ::-1], axis=-1)[..., ::-1] - mask   # observations after each day
+        w = np.where(mask, beta ** later, 0.0)
+        block_num = (w * x).sum(-1).ravel()
+        block_den = w.sum(-1).ravel()
+        block_m = mask.sum(-1).ravel()
+        block_keys = _keys(np.repeat(dish_keys, n_class), np.tile(classes, n_dish))
+
+        keep = block_m > 0
+        self._merge(block_keys[keep], block_num[keep], block_den[keep], block_m[keep])
+        return n_day
+
+    def _merge(self, keys: np.ndarray, num: np.ndarray, den: np.ndarray, m: np.ndarray) -> None:
+        all_keys = np.union1d(self.keys, keys)
+        if len(all_keys) != len(self.keys):
+            old_pos = np.searchsorted(all_keys, self.keys)
+            grown_num, grown_den = np.zeros(len(all_keys)), np.zeros(len(all_keys))
+            grown_num[old_pos], grown_den[old_pos] = self.num, self.den
+            self.keys, self.num, self.den = all_keys, grown_num, grown_den
+        pos = np.searchsorted(self.keys, keys)
+        decay = (1.0 - self.alpha) ** m
+        self.num[pos] = decay * self.num[pos] + num
+        self.den[pos] = decay * self.den[pos] + den
+
+    # ---- prediction ----
+    def levels(self, keys: np.ndarray, fallback_keys: np.ndarray) -> np.ndarray:
+        """Level per key; unseen keys get the mean level of their `fallback_keys` group (meal type + class)."""
+        level = np.divide(self.num, self.den, out=np.zeros_like(self.num), where=self.den > 0)
+        if len(self.keys):
+            pos = np.clip(np.searchsorted(self.keys, keys), 0, len(self.keys) - 1)
+            found = self.keys[pos] == keys
+        else:
+            pos, found = np.zeros(len(keys), dtype=int), np.zeros(len(keys), dtype=bool)
+        out = np.where(found, level[pos] if len(level) else 0.0, np.nan)
+
+        if (~found).any() and len(self.keys):
+            parts = np.char.partition(self.keys, _SEP)
+            groups, group_inv = np.unique(parts[:, 2], return_inverse=True)      # "meal<SEP>class"
+            group_mean = np.bincount(group_inv, weights=level) / np.maximum(np.bincount(group_inv), 1)
+            gpos = np.clip(np.searchsorted(groups, fallback_keys), 0, len(groups) - 1)
+            gfound = groups[gpos] == fallback_keys
+            out = np.where(np.isnan(out) & gfound, group_mean[gpos], out)
+        return np.nan_to_num(out, nan=0.0)
+
+    def predict(self, conn: sqlite3.Connection, start: date, days: int = 7) -> dict[str, Any]:
+        end = start + timedelta(days=days - 1)
+        menu = conn.execute(
+            "SELECT id, date, meal_type, name FROM menu_items WHERE date >= ? AND date <= ? ORDER BY date, meal_type, id",
+            (start.isoformat(), end.isoformat()),
+        ).fetchall()
+        class_rows = conn.execute(
+            "SELECT COALESCE(class, ?), COUNT(1) FROM users WHERE role = 'student' AND is_active = 1 GROUP BY 1", (NO_CLASS,)
+        ).fetchall()
+        result: dict[str, Any] = {"closedThrough": self.closed_through or None, "start": start.isoformat(),
+                                  "end": end.isoformat(), "dishes": [], "ingredients": []}
+        if not menu or not class_rows:
+            return result
+
+        ids = np.array([r[0] for r in menu], dtype=np.int64)
+        menu_a = np.array([r[1:] for r in menu], dtype=str)
+        classes = np.array([r[0] for r in class_rows], dtype=str)
+        n_menu, n_class = len(menu_a), len(classes)
+
+        name_r, meal_r = np.repeat(menu_a[:, 2], n_class), np.repeat(menu_a[:, 1], n_class)
+        class_r = np.tile(classes, n_menu)
+        level = self.levels(_keys(name_r, meal_r, class_r), _keys(meal_r, class_r)).reshape(n_menu, n_class)
+        meal_idx = np.searchsorted(np.array(MEAL_TYPES), menu_a[:, 1])
+        factor = self.season()[meal_idx, _weekdays(menu_a[:, 0])]
+        portions = level.sum(1) * factor
+
+        result["dishes"] = [
+            {"menuItemId": int(i), "date": str(d), "mealType": str(m), "name": str(n), "portions": round(float(p), 1)}
+            for i, (d, m, n), p in zip(ids, menu_a, portions)
+        ]
+
+        period = (start.isoformat(), end.isoformat())
+        recipe = conn.execute(
+            "SELECT r.menu_item_id, r.inventory_id, r.quantity FROM recipes r JOIN menu_items m ON m.id = r.menu_item_id "
+            "WHERE m.date >= ? AND m.date <= ?", period
+        ).fetchall()
+        if recipe:
+            rec = np.array(recipe, dtype=float)
+            order = np.argsort(ids)
+            menu_pos = order[np.searchsorted(ids, rec[:, 0].astype(np.int64), sorter=order)]
+            inv_ids, inv_inv = np.unique(rec[:, 1].astype(np.int64), return_inverse=True)
+            need = np.bincount(inv_inv, weights=portions[menu_pos] * rec[:, 2], minlength=len(inv_ids))
+            stock = {r[0]: r for r in conn.execute(
+                "SELECT id, product_name, unit, quantity FROM inventory WHERE id IN ("
+                "SELECT r.inventory_id FROM recipes r JOIN menu_items m ON m.id = r.menu_item_id "
+                "WHERE m.date >= ? AND m.date <= ?)", period
+            )}
+            for inv_id, n in zip(inv_ids, need):
+                row = stock.get(int(inv_id))
+                if row is None:
+                    continue
+                have = float(row[3])
+                result["ingredients"].append({
+                    "inventoryId": int(inv_id), "productName": row[1], "unit": row[2],
+                    "need": round(float(n), 3), "inStock": have, "shortfall": round(max(float(n) - have, 0.0), 3),
+                })
+            result["ingredients"].sort(key=lambda r: -r["shortfall"])
+        return result
+
+
+class ForecastCache:
+    """Process-wide model kept in sync with the `.npz` file; thread-safe."""
+
+    def __init__(self, path: str, alpha: float = DEFAULT_ALPHA) -> None:
+        self.path = path
+        self.alpha = alpha
+        self._model: Optional[ForecastModel] = None
+        self._mtime = 0.0  # of the file our model was loaded from or saved to
+        self._lock = threading.Lock()
+
+    def model(self, conn: sqlite3.Connection, today: Optional[date] = None, rebuild: bool = False) -> ForecastModel:
+        """The model with every day before `today` folded in."""
+        closed = (today or date.today()) - timedelta(days=1)
+        with self._lock:
+            model = self._model
+            if rebuild:
+                model = ForecastModel(self.alpha)
+            elif os.path.exists(self.path) and (model is None or os.path.getmtime(self.path) > self._mtime):
+                # Another process (the scheduler's leader) may have brought the file up to date
+                try:
+                    self._mtime = os.path.getmtime(self.path)
+                    model = ForecastModel.load(self.path)
+                except (OSError, ValueError, KeyError):
+                    model = None
+            if model is None or model.alpha != self.alpha:
+                model = ForecastModel(self.alpha)
+            if rebuild or model.closed_through < closed.isoformat():
+                model.update(conn, closed)
+                model.save(self.path)
+                self._mtime = os.path.getmtime(self.path)
+            self._model = model
+            return model
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Update the demand forecast cache and print the coming week")
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    parser.add_argument("--cache", help="model cache (default: data/forecast.npz next to the DB)")
+    parser.add_argument("--start", help="first forecast day YYYY-MM-DD (default: today)")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    parser.add_argument("--rebuild", action="store_true", help="refit from the whole order history")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    initialize_database(db_path)
+    start = date.fromisoformat(args.start) if args.start else date.today()
+    cache = ForecastCache(args.cache or os.path.join(os.path.dirname(os.path.abspath(db_path)), "forecast.npz"), args.alpha)
+    conn = connect(db_path)
+    try:
+        model = cache.model(conn, today=start, rebuild=args.rebuild)
+        result = model.predict(conn, start, args.days)
+    finally:
+        conn.close()
+
+    print(f"history through {result['closedThrough']}, {len(model.keys)} series")
+    for d in result["dishes"]:
+        print(f"{d['date']} {d['mealType']:<9} {d['portions']:>8.1f}  {d['name']}")
+    for ing in result["ingredients"]:
+        print(f"{ing['productName']}: need {ing['need']} {ing['unit']}, in stock {ing['inStock']}, short {ing['shortfall']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
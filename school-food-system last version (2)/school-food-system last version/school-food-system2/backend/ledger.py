@@ -0,0 +1,279 @@
+"""Balance ledger: every balance change is a row in `payments`.
+
+Rows are append-only. `amount` is signed kopecks (credits > 0, debits < 0) and
+`users.balance` is a cache of the sum, updated in the same transaction as the
+insert. `transaction_id` is the idempotency key: posting the same key twice
+returns the first row and does not touch the balance again.
+
+`balance_snapshots` keeps, per user, the balance as of a payment id. The
+nightly snapshot and the reconciliation both read only the payments after
+the user's snapshot (`idx_payments_user` is on `user_id`, so rows are
+already in id order within a user), not the whole history.
+
+    python backend/ledger.py snapshot
+    python backend/ledger.py reconcile
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import uuid
+from typing import Any, Optional
+
+from db import connect, initialize_database, to_rubles, utcnow_iso
+
+PAYMENT_METHODS = ("card", "sbp", "cash", "transfer")
+# Balance movements inside the system (orders, subscriptions, refunds, admin corrections)
+INTERNAL_METHOD = "transfer"
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def post_entry(
+    conn: sqlite3.Connection,
+    user_id: int,
+    amount: int,
+    *,
+    transaction_id: Optional[str] = None,
+    method: str = INTERNAL_METHOD,
+    description: Optional[str] = None,
+    metadata: Optional[dict[str, Any]] = None,
+    allow_negative: bool = False,
+) -> tuple[sqlite3.Row, bool]:
+    """Append a ledger row of `amount` kopecks and apply it to the cached balance (no commit).
+
+    Returns `(row, created)`; `created` is False when `transaction_id` was
+    already posted. Raises InsufficientFunds if a debit would take the
+    balance below zero (unless `allow_negative`) and LookupError for an
+    unknown user. On these errors the caller must roll back.
+    """
+    amount = int(amount)
+    transaction_id = transaction_id or uuid.uuid4().hex
+    now = utcnow_iso()
+    try:
+        # Insert first: it takes the write lock, so a concurrent post of the
+        # same key fails here on the UNIQUE constraint instead of double-charging.
+        cur = conn.execute(
+            """INSERT INTO payments (user_id, amount, payment_method, transaction_id, status, description, metadata,
+                                     created_at, completed_at)
+               VALUES (?, ?, ?, ?, 'completed', ?, ?, ?, ?)""",
+            (user_id, amount, method, transaction_id, description,
+             json.dumps(metadata, ensure_ascii=False) if metadata else None, now, now),
+        )
+    except sqlite3.IntegrityError:
+        row = conn.execute("SELECT * FROM payments WHERE transaction_id = ?", (transaction_id,)).fetchone()
+        if row is None:
+            raise LookupError(f"user {user_id} not found") from None
+        return row, False
+
+    updated = conn.execute(
+        "UPDATE users SET balance = COALESCE(balance, 0) + ?, updated_at = ? "
+        "WHERE id = ? AND (? >= 0 OR ? OR COALESCE(balance, 0) + ? >= 0)",
+        (amount, now, user_id, amount, 1 if allow_negative else 0, amount),
+    ).rowcount
+    if updated != 1:
+        exists = conn.execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone()
+        if exists is None:
+            raise LookupError(f"user {user_id} not found")
+        raise InsufficientFunds(f"balance of user {user_id} does not cover {-amount}")
+
+    row = conn.execute("SELECT * FROM payments WHERE id = ?", (cur.lastrowid,)).fetchone()
+    return row, True
+
+
+def post_entries(conn: sqlite3.Connection, entries: list[dict[str, Any]]) -> int:
+    """Append many ledger rows at once (no commit): one `executemany` for the
+    rows and one for the balances.
+
+    Each entry has `user_id`, `amount` (kopecks) and optionally `transaction_id`,
+    `description`, `metadata`. Keys must be new (a repeated key raises
+    IntegrityError); a debit that would take a balance below zero raises
+    InsufficientFunds. On either error the caller must roll back.
+    """
+    now = utcnow_iso()
+    rows = [
+        (e["user_id"], int(e["amount"]), INTERNAL_METHOD, e.get("transaction_id") or uuid.uuid4().hex,
+         e.get("description"), json.dumps(e["metadata"], ensure_ascii=False) if e.get("metadata") else None, now, now)
+        for e in entries
+    ]
+    conn.executemany(
+        """INSERT INTO payments (user_id, amount, payment_method, transaction_id, status, description, metadata,
+                                 created_at, completed_at)
+           VALUES (?, ?, ?, ?, 'completed', ?, ?, ?, ?)""",
+        rows,
+    )
+    updated = conn.executemany(
+        "UPDATE users SET balance = COALESCE(balance, 0) + ?, updated_at = ? "
+        "WHERE id = ? AND (? >= 0 OR COALESCE(balance, 0) + ? >= 0)",
+        [(r[1], now, r[0], r[1], r[1]) for r in rows],
+    ).rowcount
+    if updated != len(rows):
+        raise InsufficientFunds(f"{len(rows) - updated} of {len(rows)} balances do not cover their debit")
+    return len(rows)
+
+
+def set_balance(conn: sqlite3.Connection, user_id: int, new_balance: int, description: str) -> Optional[sqlite3.Row]:
+    """Post the adjustment that brings the balance to `new_balance` kopecks (no commit)."""
+    row = conn.execute("SELECT balance FROM users WHERE id = ?", (user_id,)).fetchone()
+    if row is None:
+        raise LookupError(f"user {user_id} not found")
+    delta = int(new_balance - (row["balance"] or 0))
+    if delta == 0:
+        return None
+    entry, _created = post_entry(conn, user_id, delta, description=description,
+                                 metadata={"kind": "adjustment"}, allow_negative=True)
+    return entry
+
+
+def record_opening_balances(conn: sqlite3.Connection) -> int:
+    """One 'opening balance' row per user whose balance predates the ledger (no commit).
+
+    Balances set before the ledger existed (seed data, imports) would otherwise
+    show up as reconciliation errors. Idempotent via the transaction id.
+    """
+    return conn.execute(
+        """INSERT OR IGNORE INTO payments (user_id, amount, payment_method, transaction_id, status, description,
+                                          metadata, created_at, completed_at)
+           SELECT u.id, u.balance - COALESCE((SELECT SUM(p.amount) FROM payments p WHERE p.user_id = u.id), 0),
+                  ?, 'opening-' || u.id, 'completed', 'Начальный баланс', '{"kind": "opening"}', ?, ?
+           FROM users u
+           WHERE COALESCE(u.balance, 0) - COALESCE((SELECT SUM(p.amount) FROM payments p WHERE p.user_id = u.id), 0) != 0
+             AND NOT EXISTS (SELECT 1 FROM payments p WHERE p.user_id = u.id AND p.transaction_id = 'opening-' || u.id)""",
+        (INTERNAL_METHOD, utcnow_iso(), utcnow_iso()),
+    ).rowcount
+
+
+# Balance as of the snapshot plus everything posted after it, per user.
+_LEDGER_BALANCE_SQL = """
+SELECT u.id AS user_id,
+       COALESCE(s.balance, 0) + COALESCE((
+           SELECT SUM(p.amount) FROM payments p
+           WHERE p.user_id = u.id AND p.id > COALESCE(s.last_payment_id, 0) AND p.id <= :upto
+       ), 0) AS balance,
+       COALESCE((SELECT MAX(p.id) FROM payments p WHERE p.user_id = u.id AND p.id <= :upto),
+                s.last_payment_id, 0) AS last_payment_id
+FROM users u
+LEFT JOIN balance_snapshots s ON s.user_id = u.id
+"""
+
+
+def snapshot_balances(conn: sqlite3.Connection) -> int:
+    """Roll every user's snapshot forward to the latest payment; returns users updated."""
+    upto = conn.execute("SELECT COALESCE(MAX(id), 0) FROM payments").fetchone()[0]
+    cur = conn.execute(
+        f"""INSERT INTO balance_snapshots (user_id, balance, last_payment_id, created_at)
+            SELECT user_id, balance, last_payment_id, :now FROM ({_LEDGER_BALANCE_SQL}) t
+            WHERE last_payment_id > 0
+              AND last_payment_id > COALESCE((SELECT last_payment_id FROM balance_snapshots s2 WHERE s2.user_id = t.user_id), 0)
+            ON CONFLICT(user_id) DO UPDATE SET balance = excluded.balance,
+                                               last_payment_id = excluded.last_payment_id,
+                                               created_at = excluded.created_at""",
+        {"upto": upto, "now": utcnow_iso()},
+    )
+    conn.commit()
+    return cur.rowcount
+
+
+def reconcile(conn: sqlite3.Connection, user_id: Optional[int] = None) -> list[dict[str, Any]]:
+    """Users whose cached balance differs from snapshot + later payments."""
+    upto = conn.execute("SELECT COALESCE(MAX(id), 0) FROM payments").fetchone()[0]
+    sql = f"""SELECT t.user_id, t.balance AS ledger_balance, COALESCE(u.balance, 0) AS cached_balance
+              FROM ({_LEDGER_BALANCE_SQL}) t JOIN users u ON u.id = t.user_id
+              WHERE t.balance != COALESCE(u.balance, 0)"""
+    params: dict[str, Any] = {"upto": upto}
+    if user_id is not None:
+        sql += " AND t.user_id = :user_id"
+        params["user_id"] = user_id
+    return [
+        {"userId": r["user_id"], "ledgerBalance": to_rubles(r["ledger_balance"]),
+         "cachedBalance": to_rubles(r["cached_balance"]),
+         "difference": to_rubles(r["cached_balance"] - r["ledger_balance"])}
+        for r in conn.execute(sql, params)
+    ]
+
+
+def statement(conn: sqlite3.Connection, user_id: int, before_id: Optional[int] = None, limit: int = 50
+              ) -> tuple[list[dict[str, Any]], Optional[int]]:
+    """One page of a user's payments, newest first (keyset on id).
+
+    Each entry carries the balance right after it, derived from the current
+    balance minus everything posted later. Returns `(entries, next_before_id)`.
+    """
+    sql = "SELECT * FROM payments WHERE user_id = ?"
+    params: list[Any] = [user_id]
+    if before_id is not None:
+        sql += " AND id < ?"
+        params.append(before_id)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], None
+
+    balance = conn.execute("SELECT COALESCE(balance, 0) FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+    later = conn.execute(
+        "SELECT COALESCE(SUM(amount), 0) FROM payments WHERE user_id = ? AND id > ?", (user_id, rows[0]["id"])
+    ).fetchone()[0]
+    running = balance - later
+
+    entries = []
+    for r in rows:
+        entries.append(dict(payment_row_to_api(r), balanceAfter=to_rubles(running)))
+        running -= r["amount"]
+    return entries, (rows[-1]["id"] if has_more else None)
+
+
+def payment_row_to_api(row: sqlite3.Row) -> dict[str, Any]:
+    try:
+        metadata = json.loads(row["metadata"]) if row["metadata"] else None
+    except ValueError:
+        metadata = None
+    return {
+        "id": row["id"],
+        "userId": row["user_id"],
+        "amount": to_rubles(row["amount"]),
+        "type": "credit" if row["amount"] >= 0 else "debit",
+        "method": row["payment_method"],
+        "transactionId": row["transaction_id"],
+        "status": row["status"],
+        "description": row["description"],
+        "metadata": metadata,
+        "createdAt": row["created_at"],
+        "completedAt": row["completed_at"],
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Balance ledger maintenance")
+    parser.add_argument("command", choices=("snapshot", "reconcile"))
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    initialize_database(db_path)
+    conn = connect(db_path)
+    try:
+        if args.command == "snapshot":
+            print(f"snapshots updated: {snapshot_balances(conn)}")
+            return 0
+        problems = reconcile(conn)
+        for p in problems:
+            print(f"user {p['userId']}: cached {p['cachedBalance']} ledger {p['ledgerBalance']} diff {p['difference']}")
+        print(f"mismatches: {len(problems)}")
+        return 1 if problems else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
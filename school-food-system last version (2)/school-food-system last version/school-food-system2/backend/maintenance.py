@@ -0,0 +1,184 @@
+"""Maintenance jobs run by the scheduler (see `scheduler.py`).
+
+Each job takes a connection, commits its own work and returns a small dict
+for the job log. They can also be run by hand:
+
+    python backend/maintenance.py statistics [--date 2025-09-01]
+    python backend/maintenance.py notifications [--days 90]
+    python backend/maintenance.py stock [--write-off-expired]
+    python backend/maintenance.py optimize
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+from typing import Any, Optional
+
+from db import connect, initialize_database, to_rubles, utcnow_iso
+from stock import STATUS_SQL, record_movement
+
+DEFAULT_NOTIFICATION_DAYS = 90
+PURGE_BATCH = 5000
+# Pages released per run by the incremental vacuum (4 KiB each: ~40 MB)
+VACUUM_PAGES = 10000
+
+# One row per day in `statistics`; rerunning for the same day overwrites it.
+_ROLLUP_SQL = """
+INSERT INTO statistics (date, total_students, active_orders, meals_served, revenue, avg_rating, created_at)
+SELECT :day,
+       (SELECT COUNT(1) FROM users WHERE role = 'student' AND is_active = 1),
+       (SELECT COUNT(1) FROM orders WHERE order_date = :day AND status IN ('pending','paid','preparing','ready')),
+       (SELECT COALESCE(SUM(quantity), 0) FROM orders WHERE order_date = :day AND status = 'received'),
+       (SELECT COALESCE(SUM(total_price), 0) FROM orders WHERE order_date = :day AND status IN ('paid','received')),
+       (SELECT COALESCE(ROUND(1.0 * SUM(rating_sum) / NULLIF(SUM(review_count), 0), 2), 0) FROM menu_item_ratings),
+       :now
+ON CONFLICT(date) DO UPDATE SET total_students = excluded.total_students,
+                                active_orders = excluded.active_orders,
+                                meals_served = excluded.meals_served,
+                                revenue = excluded.revenue,
+                                avg_rating = excluded.avg_rating,
+                                created_at = excluded.created_at
+"""
+
+
+def rollup_statistics(conn: sqlite3.Connection, today: Optional[date] = None) -> dict[str, Any]:
+    """Refresh the daily rows for yesterday (now final) and today (so far)."""
+    today = today or date.today()
+    days = [(today - timedelta(days=1)).isoformat(), today.isoformat()]
+    now = utcnow_iso()
+    try:
+        for day in days:
+            conn.execute(_ROLLUP_SQL, {"day": day, "now": now})
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"days": days}
+
+
+def statistics_row_to_api(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "date": row["date"],
+        "totalStudents": row["total_students"],
+        "activeOrders": row["active_orders"],
+        "mealsServed": row["meals_served"],
+        "revenue": to_rubles(row["revenue"]),
+        "avgRating": float(row["avg_rating"] or 0),
+        "updatedAt": row["created_at"],
+    }
+
+
+def purge_notifications(conn: sqlite3.Connection, days: int = DEFAULT_NOTIFICATION_DAYS) -> dict[str, int]:
+    """Delete read notifications older than `days` and unread ones older than 3 * `days`.
+
+    Works in batches of PURGE_BATCH rows, one commit each, so writers from
+    the request path never wait long for the lock.
+    """
+    cutoff_read = (datetime.utcnow() - timedelta(days=days)).replace(microsecond=0).isoformat()
+    cutoff_unread = (datetime.utcnow() - timedelta(days=3 * days)).replace(microsecond=0).isoformat()
+    deleted = 0
+    while True:
+        n = conn.execute(
+            """DELETE FROM notifications WHERE id IN (
+                   SELECT id FROM notifications
+                   WHERE created_at < :unread OR (is_read = 1 AND created_at < :read)
+                   LIMIT :batch)""",
+            {"read": cutoff_read, "unread": cutoff_unread, "batch": PURGE_BATCH},
+        ).rowcount
+        conn.commit()
+        deleted += n
+        if n < PURGE_BATCH:
+            return {"deleted": deleted}
+
+
+def expire_stock(conn: sqlite3.Connection, today: Optional[date] = None, write_off: bool = False) -> dict[str, int]:
+    """Bring inventory `status` in line with quantities; optionally write off expired stock.
+
+    With `write_off`, what is left of each item past its `expiration_date`
+    goes out through a `waste` movement in the stock ledger, which makes the
+    item `out_of_stock` (and raises its critical event). Without it, expired
+    stock stays and is reported by the critical-event sweep.
+    """
+    today = today or date.today()
+    written_off = 0
+    try:
+        if write_off:
+            expired = conn.execute(
+                "SELECT id, quantity, expiration_date FROM inventory "
+                "WHERE expiration_date IS NOT NULL AND expiration_date < ? AND quantity > 0",
+                (today.isoformat(),),
+            ).fetchall()
+            for r in expired:
+                record_movement(conn, r["id"], -r["quantity"], "waste",
+                                note=f"Списание: истёк срок годности ({r['expiration_date']})")
+            written_off = len(expired)
+        # Rows edited outside the API (imports, manual SQL) can carry a stale status.
+        status = STATUS_SQL.format(q="quantity")
+        fixed = conn.execute(
+            f"UPDATE inventory SET status = {status}, updated_at = ? WHERE status IS NOT {status}",
+            (utcnow_iso(),),
+        ).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"writtenOff": written_off, "statusFixed": fixed}
+
+
+def optimize_database(conn: sqlite3.Connection, pages: int = VACUUM_PAGES) -> dict[str, Any]:
+    """`PRAGMA optimize`, then give free pages back to the filesystem.
+
+    The incremental vacuum only works on files created with
+    `auto_vacuum = INCREMENTAL` (new databases are); older files report
+    their free pages and are left as they are.
+    """
+    conn.execute("PRAGMA optimize")
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if mode == 2 and free_before:
+        # The pragma frees one page per step and execute() steps once; executescript runs it to the end.
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "autoVacuum": {0: "none", 1: "full", 2: "incremental"}.get(mode, str(mode)),
+        "freePagesBefore": free_before,
+        "freePagesAfter": free_after,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run one maintenance job now")
+    parser.add_argument("job", choices=("statistics", "notifications", "stock", "optimize"))
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    parser.add_argument("--date", help="statistics/stock: YYYY-MM-DD taken as today")
+    parser.add_argument("--days", type=int, default=DEFAULT_NOTIFICATION_DAYS, help="notifications: retention")
+    parser.add_argument("--write-off-expired", action="store_true", help="stock: write off expired goods")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    initialize_database(db_path)
+    conn = connect(db_path)
+    day = date.fromisoformat(args.date) if args.date else None
+    try:
+        if args.job == "statistics":
+            result = rollup_statistics(conn, day)
+        elif args.job == "notifications":
+            result = purge_notifications(conn, args.days)
+        elif args.job == "stock":
+            result = expire_stock(conn, day, args.write_off_expired)
+        else:
+            result = optimize_database(conn)
+    finally:
+        conn.close()
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""Menu planning: week copies and reusable week templates.
+
+Weeks start on Monday; any date inside a week names that week. Copying a
+week (to one or several following weeks) and applying a template are one
+`INSERT ... SELECT` each, with a recursive CTE producing the week numbers,
+so planning a month is one statement instead of a request per dish.
+Recipes follow the copied dishes (see `_COPY_RECIPES_SQL`).
+
+A template stores its dishes by day offset (0 = Monday) and remembers the
+dish each one was saved from, so applying it also brings that dish's recipe
+while the dish still exists.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import date, timedelta
+from typing import Any, Optional
+
+from db import dump_json, parse_json_list, to_kopecks, to_rubles, utcnow_iso
+
+MAX_WEEKS = 52
+MAX_BULK_ITEMS = 2000
+
+MENU_COLUMNS = ("date", "meal_type", "name", "description", "price", "calories", "allergens",
+                "is_available", "image_url", "created_at")
+
+
+def week_start(value: str) -> date:
+    """Monday of the week that contains `value` (YYYY-MM-DD)."""
+    day = date.fromisoformat(value)
+    return day - timedelta(days=day.weekday())
+
+
+def menu_item_values(payload: dict[str, Any], default_date: Optional[str]) -> dict[str, Any]:
+    """Validated column values of a new dish (API field names in, columns out).
+
+    Raises ValueError with the message for the API error.
+    """
+    meal_type = payload.get("type") or payload.get("mealType")
+    name = (payload.get("name") or "").strip()
+    if meal_type not in ("breakfast", "lunch"):
+        raise ValueError("type must be breakfast|lunch")
+    if not name:
+        raise ValueError("name required")
+    try:
+        price = to_kopecks(payload.get("price"))
+    except Exception:
+        raise ValueError("price must be number") from None
+    calories = payload.get("calories")
+    try:
+        calories = int(calories) if calories not in (None, "") else None
+    except (TypeError, ValueError):
+        raise ValueError("calories must be integer") from None
+    allergens = payload.get("allergens")
+    is_available = payload.get("isAvailable")
+    return {
+        "date": payload.get("date") or default_date,
+        "meal_type": meal_type,
+        "name": name,
+        "description": payload.get("description"),
+        "price": price,
+        "calories": calories,
+        "allergens": dump_json(allergens) if isinstance(allergens, (list, dict)) else (
+            dump_json(parse_json_list(allergens)) if isinstance(allergens, str) and allergens else None),
+        "is_available": 1 if is_available is None or bool(is_available) else 0,
+        "image_url": payload.get("imageUrl") or payload.get("image_url"),
+        "created_at": utcnow_iso(),
+    }
+
+
+def insert_menu_items(conn: sqlite3.Connection, values: list[dict[str, Any]]) -> list[int]:
+    """Insert dishes from `menu_item_values`; returns their ids (caller commits)."""
+    sql = f"INSERT INTO menu_items ({', '.join(MENU_COLUMNS)}) VALUES ({', '.join(':' + c for c in MENU_COLUMNS)})"
+    return [conn.execute(sql, v).lastrowid for v in values]
+
+
+def week_has_menu(conn: sqlite3.Connection, start: date, weeks: int) -> bool:
+    end = start + timedelta(days=7 * weeks - 1)
+    return conn.execute(
+        "SELECT 1 FROM menu_items WHERE date BETWEEN ? AND ? LIMIT 1", (start.isoformat(), end.isoformat())
+    ).fetchone() is not None
+
+
+_WEEKS_CTE = "WITH RECURSIVE n(k) AS (SELECT 0 UNION ALL SELECT k + 1 FROM n WHERE k + 1 < :weeks)"
+
+_COPY_WEEK_SQL = f"""
+INSERT INTO menu_items (date, meal_type, name, description, price, calories, allergens, allergen_mask,
+                        is_available, image_url, created_at)
+{_WEEKS_CTE}
+SELECT date(m.date, printf('%+d days', :shift + 7 * n.k)), m.meal_type, m.name, m.description, m.price,
+       m.calories, m.allergens, m.allergen_mask, m.is_available, m.image_url, :now
+FROM menu_items m CROSS JOIN n
+WHERE m.date BETWEEN :src_start AND :src_end
+ORDER BY n.k, m.date, m.id
+"""
+
+# The dishes one INSERT ... SELECT created (ids :first..:last, consecutive while it holds
+# the write lock) get the recipe of the dish they were made from: same meal and name on
+# the same weekday of the source week.
+_COPY_RECIPES_SQL = """
+INSERT OR IGNORE INTO recipes (menu_item_id, inventory_id, quantity)
+SELECT new.id, r.inventory_id, r.quantity
+FROM menu_items new
+JOIN menu_items old
+  ON old.date = date(:src_start, printf('+%d days', CAST(julianday(new.date) - julianday(:dst_start) AS INTEGER) % 7))
+ AND old.meal_type = new.meal_type AND old.name = new.name
+JOIN recipes r ON r.menu_item_id = old.id
+WHERE new.id BETWEEN :first AND :last
+"""
+
+
+def copy_weeks(conn: sqlite3.Connection, src: date, dst: date, weeks: int = 1) -> int:
+    """Copy the menu of week `src` into `weeks` weeks starting at `dst` (caller commits)."""
+    params = {
+        "src_start": src.isoformat(),
+        "src_end": (src + timedelta(days=6)).isoformat(),
+        "dst_start": dst.isoformat(),
+        "shift": (dst - src).days,
+        "weeks": weeks,
+        "now": utcnow_iso(),
+    }
+    return _insert_with_recipes(conn, _COPY_WEEK_SQL, _COPY_RECIPES_SQL, params)
+
+
+def _insert_with_recipes(conn: sqlite3.Connection, insert_sql: str, recipes_sql: str,
+                         params: dict[str, Any]) -> int:
+    cur = conn.execute(insert_sql, params)
+    created = cur.rowcount
+    if created > 0:
+        conn.execute(recipes_sql, dict(params, first=cur.lastrowid - created + 1, last=cur.lastrowid))
+    return created
+
+
+_SAVE_TEMPLATE_SQL = """
+INSERT INTO menu_template_items (template_id, day_offset, meal_type, name, description, price, calories,
+                                 allergens, image_url, source_item_id)
+SELECT :template_id, CAST(julianday(m.date) - julianday(:start) AS INTEGER), m.meal_type, m.name,
+       m.description, m.price, m.calories, m.allergens, m.image_url, m.id
+FROM menu_items m
+WHERE m.date BETWEEN :start AND :end
+ORDER BY m.date, m.id
+"""
+
+_APPLY_TEMPLATE_SQL = f"""
+INSERT INTO menu_items (date, meal_type, name, description, price, calories, allergens,
+                        is_available, image_url, created_at)
+{_WEEKS_CTE}
+SELECT date(:start, printf('+%d days', t.day_offset + 7 * n.k)), t.meal_type, t.name, t.description,
+       t.price, t.calories, t.allergens, 1, t.image_url, :now
+FROM menu_template_items t CROSS JOIN n
+WHERE t.template_id = :template_id
+ORDER BY n.k, t.day_offset, t.id
+"""
+
+_APPLY_RECIPES_SQL = """
+INSERT OR IGNORE INTO recipes (menu_item_id, inventory_id, quantity)
+SELECT new.id, r.inventory_id, r.quantity
+FROM menu_items new
+JOIN menu_template_items t
+  ON t.template_id = :template_id
+ AND t.day_offset = CAST(julianday(new.date) - julianday(:start) AS INTEGER) % 7
+ AND t.meal_type = new.meal_type AND t.name = new.name
+JOIN recipes r ON r.menu_item_id = t.source_item_id
+WHERE new.id BETWEEN :first AND :last
+"""
+
+
+def create_template(conn: sqlite3.Connection, name: str, description: Optional[str],
+                    week: Optional[date] = None, items: Optional[list[dict[str, Any]]] = None) -> int:
+    """New template from the menu of `week`, or from `items` (`menu_item_values`
+    plus `day_offset`). Caller commits; a duplicate name raises IntegrityError."""
+    template_id = conn.execute(
+        "INSERT INTO menu_templates (name, description, created_at) VALUES (?, ?, ?)",
+        (name, description, utcnow_iso()),
+    ).lastrowid
+    if week is not None:
+        conn.execute(_SAVE_TEMPLATE_SQL, {
+            "template_id": template_id,
+            "start": week.isoformat(),
+            "end": (week + timedelta(days=6)).isoformat(),
+        })
+    for item in items or []:
+        conn.execute(
+            """INSERT INTO menu_template_items (template_id, day_offset, meal_type, name, description, price,
+                                                calories, allergens, image_url)
+               VALUES (:template_id, :day_offset, :meal_type, :name, :description, :price,
+                       :calories, :allergens, :image_url)""",
+            dict(item, template_id=template_id),
+        )
+    return template_id
+
+
+def apply_template(conn: sqlite3.Connection, template_id: int, start: date, weeks: int = 1) -> int:
+    """Create the template's dishes for `weeks` weeks from `start` (caller commits).
+
+    The new dishes have no allergen mask yet: index them afterwards
+    (`allergens.index_menu_items`).
+    """
+    params = {"template_id": template_id, "start": start.isoformat(), "weeks": weeks, "now": utcnow_iso()}
+    return _insert_with_recipes(conn, _APPLY_TEMPLATE_SQL, _APPLY_RECIPES_SQL, params)
+
+
+def template_row_to_api(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "description": row["description"] or "",
+        "itemCount": row["item_count"],
+        "createdAt": row["created_at"],
+    }
+
+
+def template_item_to_api(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "id": row["id"],
+        "dayOffset": row["day_offset"],
+        "type": row["meal_type"],
+        "name": row["name"],
+        "description": row["description"] or "",
+        "price": to_rubles(row["price"]),
+        "calories": row["calories"],
+        "allergens": parse_json_list(row["allergens"]),
+        "imageUrl": row["image_url"],
+    }
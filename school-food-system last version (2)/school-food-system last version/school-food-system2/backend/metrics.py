@@ -0,0 +1,304 @@
+"""Request metrics for the School Food System backend.
+
+Counters and histograms are kept in memory per process. When the app runs
+under several worker processes, set `METRICS_DIR` to a directory shared by
+the workers: each process periodically dumps its own snapshot there
+(`<pid>-<started>.json`) and `/api/metrics` merges all snapshots before
+rendering, so the scrape shows totals for the whole deployment no matter which
+worker answers it. The start time in the name keeps a new process that got a
+recycled pid from overwriting (and so lowering) an old one's counters.
+
+Snapshots of processes that are no longer running are folded into
+`accumulated.json` and then removed, so totals never go down when a worker is
+recycled (Prometheus would read that as a counter reset). Every series here is
+a counter or a histogram; a gauge would have to be dropped instead of folded.
+
+Only the Python stdlib is used; the output is the Prometheus text format.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: pids are never reported dead there, nothing is folded
+    fcntl = None  # type: ignore[assignment]
+
+# Seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# SQL statements per request (helps spot N+1 loops)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+# Counters and histograms of processes that have exited, inside METRICS_DIR
+ACCUMULATED_FILE = "accumulated.json"
+
+METRIC_HELP: dict[str, tuple[str, str]] = {
+    "http_requests_total": ("counter", "HTTP requests by method, route and status."),
+    "http_request_duration_seconds": ("histogram", "Request latency by method and route."),
+    "http_response_bytes_total": ("counter", "Response body bytes by route."),
+    "http_request_sql_statements": ("histogram", "SQL statements executed per request."),
+    "sql_statements_total": ("counter", "SQL statements executed by route."),
+    "sql_time_seconds_total": ("counter", "Time spent executing SQL and fetching rows by route."),
+    "sql_rows_total": ("counter", "Rows fetched from SQLite by route."),
+    "sqlite_lock_wait_seconds_total": ("counter", "Time spent waiting for the SQLite lock by route."),
+    "sqlite_commits_total": ("counter", "Transactions committed by route."),
+    "scheduler_job_duration_seconds": ("histogram", "Background job run time by job and status."),
+}
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """Thread-safe in-process store of counters and histograms."""
+
+    def __init__(self, metrics_dir: Optional[str] = None, flush_interval: float = 1.0) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[LabelKey, float]] = {}
+        # name -> labels -> {"buckets": [...upper bounds], "counts": [...], "sum": float, "count": int}
+        self._histograms: dict[str, dict[LabelKey, dict[str, Any]]] = {}
+        self.metrics_dir = metrics_dir
+        self.flush_interval = flush_interval
+        self._last_flush = 0.0
+        self._started = int(time.time() * 1000)
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+            atexit.register(self.flush)
+
+    # ---- recording ----
+    def inc(self, name: str, labels: dict[str, Any], value: float = 1.0) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: dict[str, Any], value: float, buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                bounds = list(buckets)
+                h = series[key] = {"buckets": bounds, "counts": [0] * len(bounds), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(h["buckets"]):
+                if value <= bound:
+                    h["counts"][i] += 1
+                    break
+            h["sum"] += value
+            h["count"] += 1
+
+    # ---- snapshots / multi-process ----
+    def snapshot(self) -> dict[str, Any]:
+        """JSON-serializable copy of all series."""
+        with self._lock:
+            return {
+                "counters": {
+                    name: [[list(map(list, key)), v] for key, v in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: [[list(map(list, key)), dict(h, counts=list(h["counts"]))] for key, h in series.items()]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def flush(self) -> None:
+        """Write this process' snapshot to `metrics_dir` (atomic rename)."""
+        if not self.metrics_dir:
+            return
+        path = os.path.join(self.metrics_dir, f"{os.getpid()}-{self._started}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self) -> None:
+        if self.metrics_dir and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def collect(self) -> dict[str, Any]:
+        """Snapshot for the whole deployment (all worker processes)."""
+        if not self.metrics_dir:
+            return self.snapshot()
+
+        self.flush()
+        # Under the lock, so that two scrapes neither fold the same dead worker
+        # twice nor read its snapshot and the accumulated file that already has it.
+        with self._dir_lock():
+            accumulated = _read_json(os.path.join(self.metrics_dir, ACCUMULATED_FILE)) or {}
+            folded = set(accumulated.get("folded", ()))
+            live, dead = [], []
+            for path in glob.glob(os.path.join(self.metrics_dir, "*.json")):
+                name = os.path.basename(path)
+                if name == ACCUMULATED_FILE:
+                    continue
+                if name in folded:
+                    # Folded by a scrape that stopped before removing the file.
+                    _remove(path)
+                elif _process_alive(name.split("-")[0]):
+                    live.append(path)
+                else:
+                    dead.append(path)
+            if dead:
+                accumulated = self._fold(accumulated, dead)
+
+            snapshots = [accumulated]
+            for path in live:
+                snap = _read_json(path)
+                # None: a worker may be replacing its file right now; it is picked up next scrape.
+                if snap is not None:
+                    snapshots.append(snap)
+        return merge_snapshots(snapshots)
+
+    def _fold(self, accumulated: dict[str, Any], dead: list[str]) -> dict[str, Any]:
+        """Add the snapshots of finished processes to the accumulated file and remove them."""
+        snapshots = [accumulated]
+        names = []
+        for path in dead:
+            snap = _read_json(path)
+            if snap is not None:
+                snapshots.append(snap)
+                names.append(os.path.basename(path))
+        merged = merge_snapshots(snapshots)
+        # The names are kept until their files are gone, so a crash between the
+        # write and the removals cannot count a snapshot twice.
+        merged["folded"] = sorted(
+            set(n for n in accumulated.get("folded", ()) if os.path.exists(os.path.join(self.metrics_dir, n)))
+            | set(names)
+        )
+        path = os.path.join(self.metrics_dir, ACCUMULATED_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(merged, f)
+        os.replace(tmp, path)
+        for name in names:
+            _remove(os.path.join(self.metrics_dir, name))
+        return merged
+
+    @contextlib.contextmanager
+    def _dir_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.metrics_dir, "metrics.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_json(path: str) -> Optional[dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _process_alive(pid: str) -> bool:
+    """Whether the process that wrote a snapshot is still running (unknown counts as yes)."""
+    if not pid.isdigit() or os.name == "nt":
+        # os.kill would terminate the process on Windows
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # PermissionError: running under another user
+        return True
+    return True
+
+
+def merge_snapshots(snapshots: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    """Sum counters and histogram buckets of several process snapshots."""
+    counters: dict[str, dict[LabelKey, float]] = {}
+    histograms: dict[str, dict[LabelKey, dict[str, Any]]] = {}
+
+    for snap in snapshots:
+        for name, series in snap.get("counters", {}).items():
+            dst = counters.setdefault(name, {})
+            for key, value in series:
+                k = tuple(tuple(p) for p in key)
+                dst[k] = dst.get(k, 0.0) + value
+        for name, series in snap.get("histograms", {}).items():
+            dst_h = histograms.setdefault(name, {})
+            for key, h in series:
+                k = tuple(tuple(p) for p in key)
+                cur = dst_h.get(k)
+                if cur is None:
+                    dst_h[k] = {"buckets": list(h["buckets"]), "counts": list(h["counts"]), "sum": h["sum"], "count": h["count"]}
+                else:
+                    cur["counts"] = [a + b for a, b in zip(cur["counts"], h["counts"])]
+                    cur["sum"] += h["sum"]
+                    cur["count"] += h["count"]
+
+    return {
+        "counters": {name: [[list(map(list, k)), v] for k, v in s.items()] for name, s in counters.items()},
+        "histograms": {name: [[list(map(list, k)), h] for k, h in s.items()] for name, s in histograms.items()},
+    }
+
+
+def _format_labels(pairs: Iterable[Iterable[str]], extra: Optional[tuple[str, str]] = None) -> str:
+    items = [tuple(p) for p in pairs]
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in items
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus(snapshot: dict[str, Any]) -> str:
+    """Render a snapshot in the Prometheus text exposition format (0.0.4)."""
+    lines: list[str] = []
+
+    for name in sorted(snapshot.get("counters", {})):
+        kind, help_text = METRIC_HELP.get(name, ("counter", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(snapshot["counters"][name], key=lambda s: s[0]):
+            lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+    for name in sorted(snapshot.get("histograms", {})):
+        kind, help_text = METRIC_HELP.get(name, ("histogram", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, h in sorted(snapshot["histograms"][name], key=lambda s: s[0]):
+            cumulative = 0
+            for bound, count in zip(h["buckets"], h["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {h['count']}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_value(h['sum'])}")
+            lines.append(f"{name}_count{_format_labels(key)} {h['count']}")
+
+    return "\n".join(lines) + "\n"
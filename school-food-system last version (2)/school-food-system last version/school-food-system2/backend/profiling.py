@@ -0,0 +1,163 @@
+"""On-demand request profiling for the School Food System backend.
+
+A request is profiled when an admin asks for it (`X-Profile: 1` header or
+`?_profile=1`) or when it is picked by sampling (`PROFILE_SAMPLE_RATE`). The
+handler runs under cProfile; the stats file and a JSON summary (timings,
+hottest functions, every SQL statement with its duration) are written to a
+bounded on-disk ring buffer that admins can list and download.
+
+When neither trigger fires, the request pays for a header lookup and a
+float comparison; no profiler is created. Only one request per process is
+profiled at a time; a request that overlaps it is served unprofiled.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import glob
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from typing import Any, Optional
+
+from db import utcnow_iso
+
+_ID_RE = re.compile(r"^[0-9]+-[0-9]+-[0-9]+$")
+_counter = itertools.count()
+
+
+class ProfileStore:
+    """Directory holding at most `capacity` profiles; the oldest are dropped first."""
+
+    def __init__(self, directory: str, capacity: int = 50) -> None:
+        self.directory = directory
+        self.capacity = capacity
+        self._lock = threading.Lock()
+
+    def _paths(self, profile_id: str) -> tuple[str, str]:
+        base = os.path.join(self.directory, profile_id)
+        return base + ".prof", base + ".json"
+
+    def save(self, profiler: cProfile.Profile, meta: dict[str, Any]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        # Millisecond timestamp first, so that name order is age order.
+        profile_id = f"{int(time.time() * 1000)}-{os.getpid()}-{next(_counter)}"
+        prof_path, meta_path = self._paths(profile_id)
+
+        profiler.dump_stats(prof_path)
+        meta = dict(meta, id=profile_id, topFunctions=top_functions(profiler))
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, meta_path)
+
+        self._trim()
+        return profile_id
+
+    def _trim(self) -> None:
+        with self._lock:
+            metas = sorted(glob.glob(os.path.join(self.directory, "*.json")))
+            for path in metas[: max(len(metas) - self.capacity, 0)]:
+                for p in self._paths(os.path.basename(path)[: -len(".json")]):
+                    try:
+                        os.remove(p)
+                    except FileNotFoundError:
+                        pass
+
+    def list(self) -> list[dict[str, Any]]:
+        """Summaries (without SQL/function details), newest first."""
+        items = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json")), reverse=True):
+            meta = self._read(path)
+            if meta is not None:
+                items.append({k: v for k, v in meta.items() if k not in ("sql", "topFunctions")})
+        return items
+
+    def get(self, profile_id: str) -> Optional[dict[str, Any]]:
+        if not _ID_RE.match(profile_id):
+            return None
+        return self._read(self._paths(profile_id)[1])
+
+    def stats_path(self, profile_id: str) -> Optional[str]:
+        if not _ID_RE.match(profile_id):
+            return None
+        path = self._paths(profile_id)[0]
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def _read(path: str) -> Optional[dict[str, Any]]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def top_functions(profiler: cProfile.Profile, limit: int = 25) -> list[dict[str, Any]]:
+    """Hottest functions by cumulative time."""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, lineno, func), (cc, nc, tt, ct, _callers) in stats.stats.items():  # type: ignore[attr-defined]
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{lineno}({func})",
+            "calls": nc,
+            "primitiveCalls": cc,
+            "totalMs": round(tt * 1000, 3),
+            "cumulativeMs": round(ct * 1000, 3),
+        })
+    rows.sort(key=lambda r: r["cumulativeMs"], reverse=True)
+    return rows[:limit]
+
+
+# One profiled request at a time per process: from Python 3.12 cProfile is a
+# process-wide sys.monitoring tool, and a second enable() raises ValueError.
+_active = threading.Lock()
+
+
+class RequestProfile:
+    """Profiler and SQL trace for one request."""
+
+    def __init__(self, trigger: str) -> None:
+        self.trigger = trigger
+        self.started_at = utcnow_iso()
+        self.sql: list[dict[str, Any]] = []
+        self.profiler = cProfile.Profile()
+        self._t0 = time.perf_counter()
+        self._running = False
+
+    @classmethod
+    def start(cls, trigger: str) -> Optional["RequestProfile"]:
+        """Start profiling, or return None when another request is being profiled.
+
+        Profiling is best effort: a request that cannot be profiled is served
+        normally.
+        """
+        if not _active.acquire(blocking=False):
+            return None
+        profile = cls(trigger)
+        try:
+            profile.profiler.enable()
+        except ValueError:
+            # Another profiler (a debugger, coverage) holds the hook.
+            _active.release()
+            return None
+        profile._running = True
+        return profile
+
+    def record_statement(self, sql: str, seconds: float) -> None:
+        self.sql.append({"sql": " ".join(sql.split()), "ms": round(seconds * 1000, 3)})
+
+    def stop(self) -> float:
+        """Stop profiling; returns elapsed seconds. Safe to call twice."""
+        if self._running:
+            self._running = False
+            try:
+                self.profiler.disable()
+            finally:
+                _active.release()
+        return time.perf_counter() - self._t0
@@ -0,0 +1,105 @@
+"""API traffic recorder for the School Food System backend.
+
+When `RECORD_TRAFFIC` points to a file, every `/api/...` request (except the
+diagnostics endpoints) is appended to it as one compact JSON line: arrival
+time, duration, method, route, path, query, body, status, the acting user id
+and an anonymous client key. `backend/replay.py` re-issues the file against
+a DB snapshot.
+
+Identities are anonymized before anything touches the disk: passwords are
+dropped, emails/logins/names are replaced by stable keyed pseudonyms (the
+same value always maps to the same pseudonym within one salt) and free-text
+fields by same-length filler. Numeric ids are kept as they are, so the
+requests stay valid against a snapshot of the same DB.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlencode
+
+SECRET_KEYS = {"password", "newPassword"}
+PSEUDONYM_KEYS = {"login", "fullName", "full_name", "q"}
+EMAIL_KEYS = {"email"}
+FREE_TEXT_KEYS = {"specialInstructions", "special_instructions", "message", "reason", "adminNotes", "admin_notes", "comment"}
+
+# Not replayable workload: scrapes and admin diagnostics
+SKIP_PREFIXES = ("/api/metrics", "/api/admin/")
+
+
+class TrafficRecorder:
+    """Appends anonymized request records to a JSONL file (one write per line)."""
+
+    def __init__(self, path: str, salt: Optional[str] = None) -> None:
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Without a configured salt pseudonyms are stable only within this process.
+        self._key = (salt or os.urandom(16).hex()).encode("utf-8")
+        self._lock = threading.Lock()
+        # O_APPEND + a single write per record keeps lines whole with several workers.
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    @staticmethod
+    def wants(path: str) -> bool:
+        return path.startswith("/api/") and not path.startswith(SKIP_PREFIXES)
+
+    def pseudonym(self, value: str) -> str:
+        digest = hmac.new(self._key, value.strip().lower().encode("utf-8"), hashlib.sha256).hexdigest()
+        return "anon-" + digest[:12]
+
+    def anonymize(self, value: Any, key: Optional[str] = None) -> Any:
+        if isinstance(value, dict):
+            return {k: self.anonymize(v, k) for k, v in value.items() if k not in SECRET_KEYS}
+        if isinstance(value, list):
+            return [self.anonymize(v, key) for v in value]
+        if not isinstance(value, str) or not value:
+            return value
+        if key in EMAIL_KEYS:
+            return self.pseudonym(value) + "@example.invalid"
+        if key in PSEUDONYM_KEYS:
+            return self.pseudonym(value)
+        if key in FREE_TEXT_KEYS:
+            return "x" * len(value)
+        return value
+
+    def anonymize_query(self, query: str) -> str:
+        pairs = parse_qsl(query, keep_blank_values=True)
+        return urlencode([(k, self.anonymize(v, k)) for k, v in pairs if k not in SECRET_KEYS])
+
+    def record(self, entry: dict[str, Any]) -> None:
+        line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            os.write(self._fd, line)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd >= 0:
+                os.close(self._fd)
+                self._fd = -1
+
+
+def snapshot_path(log_path: str) -> str:
+    """Where the DB snapshot matching a traffic log is kept."""
+    return log_path + ".sqlite3"
+
+
+def snapshot_db(db_path: str, dest: str) -> None:
+    """Consistent copy of the live DB via the SQLite backup API."""
+    tmp = dest + ".tmp"
+    src = sqlite3.connect(db_path)
+    try:
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    os.replace(tmp, dest)
@@ -0,0 +1,243 @@
+"""Replay recorded API traffic against a DB snapshot.
+
+Reads a log written by the traffic recorder (`RECORD_TRAFFIC`, see
+`recorder.py`), copies the DB snapshot taken when recording started, starts
+the app on the copy (same child-process server as `bench.py`) and re-issues
+every request at its original offset. Requests are dispatched on a thread
+pool rather than one connection per client, so requests that overlapped in
+the recording overlap again. `--speed 2` replays twice as fast, `--speed 0`
+as fast as the server answers.
+
+    python backend/replay.py traffic.jsonl
+    python backend/replay.py traffic.jsonl --speed 4 --output replay.json
+    python backend/replay.py traffic.jsonl --baseline replay.json   # exit 1 on regression
+
+Passwords are not recorded: logins are replayed as the snapshot user that
+originally logged in, with `--password` (default `password`, as in the demo
+seed, `datagen.py` and `bench.py`).
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from bench import compare, percentile, print_report, start_server, summarize
+from recorder import snapshot_path
+
+
+def load_log(path: str) -> list[dict[str, Any]]:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # A worker killed mid-write leaves a truncated last line.
+                continue
+    entries.sort(key=lambda e: e["ts"])
+    return entries
+
+
+def peak_concurrency(entries: list[dict[str, Any]]) -> int:
+    """Most requests in flight at once in the recording."""
+    events = []
+    for e in entries:
+        events.append((e["ts"], 1))
+        events.append((e["ts"] + (e.get("ms") or 0) / 1000.0, -1))
+    events.sort()
+    cur = peak = 0
+    for _t, delta in events:
+        cur += delta
+        peak = max(peak, cur)
+    return peak
+
+
+class Replayer:
+    """Issues recorded requests; one keep-alive connection per pool thread."""
+
+    def __init__(self, host: str, port: int, logins: dict[int, str], password: str) -> None:
+        self.host, self.port = host, port
+        self.logins = logins
+        self.password = password
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.mismatches: dict[str, int] = {}
+        self.lag: list[float] = []
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return conn
+
+    def _drop_conn(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def build(self, e: dict[str, Any]) -> tuple[str, Optional[bytes], dict[str, str]]:
+        path = e["p"] + ("?" + e["q"] if e.get("q") else "")
+        body = e.get("b")
+        if e["p"] == "/api/auth/login" and isinstance(body, dict):
+            login = self.logins.get(e.get("u") or -1)
+            body = dict(body, password=self.password, **({"login": login} if login else {}))
+        headers = {"Content-Type": "application/json"}
+        if e.get("u") is not None and e["p"] != "/api/auth/login":
+            headers["X-User-Id"] = str(e["u"])
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        return path, payload, headers
+
+    def issue(self, e: dict[str, Any], due: float) -> None:
+        op = f"{e['m']} {e.get('r') or e['p']}"
+        path, payload, headers = self.build(e)
+        t0 = time.perf_counter()
+        lag = t0 - due
+        status = None
+        for attempt in (0, 1):
+            try:
+                conn = self._conn()
+                conn.request(e["m"], path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+                break
+            except (http.client.HTTPException, ConnectionError, OSError):
+                self._drop_conn()
+                if attempt:
+                    break
+        elapsed = time.perf_counter() - t0
+
+        with self._lock:
+            self.lag.append(lag)
+            self.latencies.setdefault(op, []).append(elapsed)
+            if status is None or status >= 500:
+                self.errors[op] = self.errors.get(op, 0) + 1
+            if status != e.get("s"):
+                self.mismatches[op] = self.mismatches.get(op, 0) + 1
+
+
+def run_replay(args: argparse.Namespace) -> dict[str, Any]:
+    entries = load_log(args.log)
+    if args.limit:
+        entries = entries[: args.limit]
+    if not entries:
+        raise SystemExit(f"{args.log}: no requests recorded")
+    snapshot = args.db or snapshot_path(args.log)
+    if not os.path.exists(snapshot):
+        raise SystemExit(f"DB snapshot not found: {snapshot} (use --db)")
+
+    workdir = tempfile.mkdtemp(prefix="sfs-replay-")
+    db_path = os.path.join(workdir, "replay.sqlite3")
+    proc = None
+    try:
+        shutil.copyfile(snapshot, db_path)
+        conn = sqlite3.connect(db_path)
+        logins = {row[0]: row[1] for row in conn.execute("SELECT id, login FROM users")}
+        conn.close()
+
+        proc, port = start_server(db_path, workdir)
+        replayer = Replayer("127.0.0.1", port, logins, args.password)
+        workers = args.workers or max(peak_concurrency(entries) * 2, 8)
+
+        t_first = entries[0]["ts"]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            start = time.perf_counter()
+            for e in entries:
+                due = start + ((e["ts"] - t_first) / args.speed if args.speed > 0 else 0.0)
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(replayer.issue, e, due if args.speed > 0 else time.perf_counter())
+        elapsed = time.perf_counter() - start
+
+        all_latencies = [v for values in replayer.latencies.values() for v in values]
+        lag = sorted(replayer.lag)
+        return {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "log": os.path.abspath(args.log),
+                "requests": len(entries),
+                "recordedSeconds": entries[-1]["ts"] - t_first,
+                "speed": args.speed,
+                "workers": workers,
+                "duration": elapsed,
+                "statusMismatches": sum(replayer.mismatches.values()),
+                "dispatchLagP95Ms": percentile(lag, 95) * 1000,
+            },
+            "overall": summarize(all_latencies, sum(replayer.errors.values()), elapsed),
+            "operations": {
+                op: summarize(values, replayer.errors.get(op, 0), elapsed)
+                for op, values in sorted(replayer.latencies.items())
+            },
+            "mismatches": dict(sorted(replayer.mismatches.items())),
+        }
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded School Food System API traffic")
+    parser.add_argument("log", help="traffic log written with RECORD_TRAFFIC")
+    parser.add_argument("--db", help="DB snapshot to replay against (default: <log>.sqlite3)")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression factor; 0 = no pacing")
+    parser.add_argument("--workers", type=int, default=0, help="client threads (default: 2x recorded peak concurrency)")
+    parser.add_argument("--password", default="password", help="password used to replay logins")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N requests")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare with a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (default 0.25)")
+    parser.add_argument("--min-samples", type=int, default=50, help="skip operations with fewer requests in comparisons")
+    args = parser.parse_args(argv)
+
+    result = run_replay(args)
+    meta = result["meta"]
+    print(f"replayed {meta['requests']} requests ({meta['recordedSeconds']:.1f}s recorded) in {meta['duration']:.1f}s "
+          f"at speed {meta['speed']:g}, {meta['workers']} workers")
+    print_report(result)
+    print(f"\ndispatch lag p95: {meta['dispatchLagP95Ms']:.1f} ms; status differs from recording: {meta['statusMismatches']}")
+    for op, n in result["mismatches"].items():
+        print(f"  {op}: {n}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.tolerance, args.min_samples)
+        if problems:
+            print("\nREGRESSIONS against baseline:")
+            for p in problems:
+                print("  " + p)
+            return 1
+        print("\nno regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""Background jobs: maintenance that must not run inside request handlers.
+
+Every process that builds the app starts a `Scheduler`, but only one of
+them runs jobs: the holder of the `scheduler_lease` row. The lease is taken
+and renewed with a single conditional upsert (it succeeds if the row is
+ours or has expired), so a crashed leader is replaced within `lease_ttl`
+seconds and two workers never run maintenance at the same time.
+
+A job runs either every `interval` seconds or on a cron schedule
+(`"minute hour day month weekday"`, local time; `*`, `*/n`, `a-b` and
+lists), plus a random delay of up to `jitter` seconds. At most
+`max_workers` jobs run at once and a job never overlaps itself. The last
+run of each job is kept in `scheduler_jobs`, so after a restart a job that
+missed its time runs once and the others wait for their next slot.
+Durations go to the metrics registry (`scheduler_job_duration_seconds`).
+
+Setting `run_requested` on a job row (the admin API does) makes the leader
+run it on its next tick, whichever worker received the request.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+
+from db import connect, utcnow_iso
+
+logger = logging.getLogger(__name__)
+
+# Seconds; maintenance jobs range from milliseconds to minutes
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0)
+LEASE_NAME = "scheduler"
+
+
+class CronSpec:
+    """Five-field cron expression evaluated in local time."""
+
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr: str) -> None:
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        fields = [self._parse(p, lo, hi) for p, (lo, hi) in zip(parts, self._RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        # cron: 0 and 7 are Sunday; Python: Monday is 0
+        self.weekdays = {(d - 1) % 7 for d in weekdays}
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse(field_expr: str, lo: int, hi: int) -> set[int]:
+        values: set[int] = set()
+        for item in field_expr.split(","):
+            spec, _, step_s = item.partition("/")
+            step = int(step_s) if step_s else 1
+            if spec == "*":
+                start, end = lo, hi
+            elif "-" in spec:
+                start, end = (int(x) for x in spec.split("-", 1))
+            else:
+                start = end = int(spec)
+            if not (lo <= start <= end <= hi) or step < 1:
+                raise ValueError(f"cron field out of range: {item!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        # Same rule as cron: with both fields restricted, either may match
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after `moment` (naive local time)."""
+        t = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 4)
+        while t < limit:
+            if t.month not in self.months or not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron expression never matches: {self.expr!r}")
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[sqlite3.Connection], Any]
+    interval: Optional[float] = None
+    cron: Optional[CronSpec] = None
+    jitter: float = 0.0
+    next_due: Optional[datetime] = field(default=None, repr=False)
+
+    def schedule(self, last_started: Optional[datetime], now: datetime) -> None:
+        """Set `next_due` from the previous start (None: never ran, due now)."""
+        if last_started is None:
+            due = now
+        elif self.interval is not None:
+            due = last_started + timedelta(seconds=self.interval)
+        else:
+            due = self.cron.next_after(last_started)
+        self.next_due = due + timedelta(seconds=random.uniform(0, self.jitter))
+
+
+def _utc_to_local(value: str) -> datetime:
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+class Scheduler:
+    """Leader-elected runner of periodic maintenance jobs; thread-based."""
+
+    def __init__(self, db_path: str, metrics: Any = None, max_workers: int = 2,
+                 lease_ttl: float = 30.0, tick: float = 1.0, labels: Optional[dict[str, str]] = None) -> None:
+        self.db_path = db_path
+        self.metrics = metrics
+        self.labels = labels or {}  # added to the metric labels (e.g. the school of a multi-school app)
+        self.lease_ttl = lease_ttl
+        self.tick = tick
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: dict[str, Job] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scheduler-job")
+        self._running: set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._leader_until = 0.0  # time.monotonic() up to which our lease is known to hold
+        self._next_renew = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- configuration ----
+    def add(self, name: str, func: Callable[[sqlite3.Connection], Any], *, interval: Optional[float] = None,
+            cron: Optional[str] = None, jitter: float = 0.0) -> Job:
+        if (interval is None) == (cron is None):
+            raise ValueError("a job needs exactly one of interval or cron")
+        job = Job(name, func, interval, CronSpec(cron) if cron else None, jitter)
+        self.jobs[name] = job
+        return job
+
+    def start(self) -> None:
+        conn = connect(self.db_path)
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO scheduler_jobs (name, schedule) VALUES (?, ?)",
+                [(job.name, job.cron.expr if job.cron else f"every {job.interval:g}s") for job in self.jobs.values()],
+            )
+            conn.commit()
+            now = datetime.now()
+            for row in conn.execute("SELECT name, last_started_at FROM scheduler_jobs"):
+                job = self.jobs.get(row["name"])
+                if job is not None:
+                    job.schedule(_utc_to_local(row["last_started_at"]) if row["last_started_at"] else None, now)
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self._leader_until:
+            conn = connect(self.db_path)
+            try:
+                conn.execute("DELETE FROM scheduler_lease WHERE name = ? AND holder = ?", (LEASE_NAME, self.holder))
+                conn.commit()
+            except sqlite3.Error:
+                pass  # the lease simply expires
+            finally:
+                conn.close()
+
+    # ---- leader election ----
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._leader_until
+
+    def _renew_lease(self, conn: sqlite3.Connection) -> bool:
+        started = time.monotonic()
+        now = time.time()
+        acquired = conn.execute(
+            """INSERT INTO scheduler_lease (name, holder, expires_at) VALUES (:name, :holder, :expires)
+               ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+               WHERE scheduler_lease.holder = excluded.holder OR scheduler_lease.expires_at < :now""",
+            {"name": LEASE_NAME, "holder": self.holder, "expires": now + self.lease_ttl, "now": now},
+        ).rowcount == 1
+        conn.commit()
+        was_leader = self.is_leader
+        # Leave a margin so that we stop before another worker may take over.
+        self._leader_until = started + self.lease_ttl * 0.8 if acquired else 0.0
+        if acquired != was_leader:
+            logger.info("scheduler %s: %s", self.holder, "became leader" if acquired else "lost leadership")
+        return acquired
+
+    # ---- main loop ----
+    def _run(self) -> None:
+        conn = connect(self.db_path)
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._tick(conn)
+                except sqlite3.OperationalError as exc:
+                    # Busy DB: try again next tick; the lease margin covers a few misses.
+                    conn.rollback()
+                    logger.warning("scheduler tick skipped: %s", exc)
+                except Exception:
+                    conn.rollback()
+                    logger.exception("scheduler tick failed")
+                self._stop.wait(self.tick)
+        finally:
+            conn.close()
+
+    def _tick(self, conn: sqlite3.Connection) -> None:
+        if time.monotonic() >= self._next_renew:
+            self._next_renew = time.monotonic() + self.lease_ttl / 3
+            self._renew_lease(conn)
+        if not self.is_leader:
+            return
+
+        requested = {r[0] for r in conn.execute("SELECT name FROM scheduler_jobs WHERE run_requested = 1")}
+        now = datetime.now()
+        for job in self.jobs.values():
+            if job.name in requested or (job.next_due is not None and job.next_due <= now):
+                self._submit(job)
+
+    def _submit(self, job: Job) -> None:
+        with self._lock:
+            if job.name in self._running:
+                return
+            self._running.add(job.name)
+        # Scheduled now so that a slow or failing job is not resubmitted every tick.
+        job.schedule(datetime.now(), datetime.now())
+        try:
+            self._pool.submit(self._execute, job)
+        except RuntimeError:  # pool shut down
+            with self._lock:
+                self._running.discard(job.name)
+
+    def _execute(self, job: Job) -> None:
+        conn = connect(self.db_path)
+        started = time.perf_counter()
+        status, result, error = "ok", None, None
+        try:
+            conn.execute(
+                "UPDATE scheduler_jobs SET last_started_at = ?, run_requested = 0, running_on = ? WHERE name = ?",
+                (utcnow_iso(), self.holder, job.name),
+            )
+            conn.commit()
+            result = job.func(conn)
+        except Exception as exc:
+            conn.rollback()
+            status, error = "error", f"{type(exc).__name__}: {exc}"
+            logger.exception("scheduled job %s failed", job.name)
+        seconds = time.perf_counter() - started
+        try:
+            conn.execute(
+                """UPDATE scheduler_jobs
+                   SET last_finished_at = ?, last_status = ?, last_error = ?, last_duration_ms = ?, last_result = ?,
+                       running_on = NULL, run_count = run_count + 1,
+                       fail_count = fail_count + (CASE WHEN ? = 'error' THEN 1 ELSE 0 END)
+                   WHERE name = ?""",
+                (utcnow_iso(), status, error, round(seconds * 1000, 1),
+                 json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                 status, job.name),
+            )
+            conn.commit()
+        except sqlite3.Error:
+            logger.exception("could not record the run of job %s", job.name)
+        finally:
+            conn.close()
+            with self._lock:
+                self._running.discard(job.name)
+        if self.metrics is not None:
+            self.metrics.observe("scheduler_job_duration_seconds", {"job": job.name, "status": status, **self.labels},
+                                 seconds, JOB_BUCKETS)
+            self.metrics.maybe_flush()
+
+    # ---- introspection ----
+    def status(self, conn: sqlite3.Connection) -> dict[str, Any]:
+        lease = conn.execute("SELECT holder, expires_at FROM scheduler_lease WHERE name = ?", (LEASE_NAME,)).fetchone()
+        jobs = []
+        for r in conn.execute("SELECT * FROM scheduler_jobs ORDER BY name"):
+            job = self.jobs.get(r["name"])
+            jobs.append({
+                "name": r["name"],
+                "schedule": r["schedule"],
+                "lastStartedAt": r["last_started_at"],
+                "lastFinishedAt": r["last_finished_at"],
+                "lastStatus": r["last_status"],
+                "lastError": r["last_error"],
+                "lastDurationMs": r["last_duration_ms"],
+                "lastResult": json.loads(r["last_result"]) if r["last_result"] else None,
+                "runCount": r["run_count"],
+                "failCount": r["fail_count"],
+                "running": r["running_on"] is not None,
+                "runRequested": bool(r["run_requested"]),
+                # Known only to the leader; other workers report None
+                "nextDue": job.next_due.isoformat(timespec="seconds") if job and self.is_leader and job.next_due else None,
+            })
+        return {
+            "worker": self.holder,
+            "leader": lease["holder"] if lease and lease["expires_at"] > time.time() else None,
+            "isLeader": self.is_leader,
+            "jobs": jobs,
+        }
+
+
+def request_run(conn: sqlite3.Connection, name: str) -> bool:
+    """Ask the leader to run `name` on its next tick (commits); False if there is no such job."""
+    updated = conn.execute("UPDATE scheduler_jobs SET run_requested = 1 WHERE name = ?", (name,)).rowcount
+    conn.commit()
+    return updated == 1
@@ -0,0 +1,136 @@
+"""Slow query log for the School Food System backend.
+
+Most SQL in `app.py` is assembled from optional filters (`WHERE 1=1 AND ...`),
+so the same handler produces different statements depending on the query
+string. The log groups slow statements by fingerprint (literals and IN-lists
+normalized away), remembers which parameter shapes were seen and keeps the
+`EXPLAIN QUERY PLAN` captured on the first slow run, which shows whether the
+filter combination was served by an index or by a full table scan.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import sqlite3
+import threading
+from typing import Any, Optional
+
+from db import utcnow_iso
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+# Statements EXPLAIN QUERY PLAN can describe.
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+
+def fingerprint(sql: str) -> str:
+    """Normalize a statement so that variants differing only in literals match."""
+    fp = _STRING_RE.sub("?", sql)
+    fp = _NUMBER_RE.sub("?", fp)
+    fp = _IN_LIST_RE.sub("IN (...)", fp)
+    return _SPACE_RE.sub(" ", fp).strip()
+
+
+def param_shape(params: Any) -> str:
+    """Describe bound parameters by type only, e.g. `(int, str, NoneType)`."""
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in sorted(params.items())) + "}"
+    try:
+        return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+    except TypeError:
+        return type(params).__name__
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Any) -> list[str]:
+    """Return the `EXPLAIN QUERY PLAN` detail lines, or [] if not explainable."""
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return []
+    try:
+        # sqlite3.Connection.execute bypasses the traced cursor: the plan lookup
+        # is not counted as a statement and does not re-enter the hook.
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error as exc:
+        return [f"<explain failed: {exc}>"]
+    return [row[3] for row in rows]
+
+
+def is_full_scan(plan: list[str]) -> bool:
+    """True if some step reads a whole table (`SCAN t` without an index)."""
+    return any(step.startswith("SCAN ") and "USING" not in step for step in plan)
+
+
+class SlowQueryLog:
+    """Thread-safe aggregate of statements slower than `threshold_ms`."""
+
+    def __init__(self, threshold_ms: float, max_entries: int = 500) -> None:
+        self.threshold = threshold_ms / 1000.0
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, Any]] = {}
+
+    def record(self, conn: sqlite3.Connection, sql: str, params: Any, seconds: float) -> None:
+        """Statement hook for `TracedConnection`."""
+        if seconds < self.threshold:
+            return
+
+        fp = fingerprint(sql)
+        shape = param_shape(params)
+        logger.warning("slow query %.1f ms %s %s", seconds * 1000, shape, fp)
+
+        with self._lock:
+            entry = self._entries.get(fp)
+            is_new = entry is None
+            if is_new:
+                entry = {
+                    "fingerprint": fp,
+                    "example": sql,
+                    "paramShapes": [],
+                    "count": 0,
+                    "totalMs": 0.0,
+                    "maxMs": 0.0,
+                    "plan": None,
+                    "fullScan": None,
+                    "firstSeen": utcnow_iso(),
+                    "lastSeen": None,
+                }
+                self._evict()
+                self._entries[fp] = entry
+            entry["count"] += 1
+            entry["totalMs"] += seconds * 1000
+            entry["maxMs"] = max(entry["maxMs"], seconds * 1000)
+            entry["lastSeen"] = utcnow_iso()
+            if shape not in entry["paramShapes"]:
+                entry["paramShapes"].append(shape)
+
+        if is_new:
+            # Outside the lock: EXPLAIN runs on the caller's connection.
+            plan = explain(conn, sql, params)
+            with self._lock:
+                entry["plan"] = plan
+                entry["fullScan"] = is_full_scan(plan)
+
+    def _evict(self) -> None:
+        """Make room for one more entry by dropping the cheapest fingerprint."""
+        if len(self._entries) < self.max_entries:
+            return
+        victim = min(self._entries.values(), key=lambda e: e["totalMs"])
+        self._entries.pop(victim["fingerprint"], None)
+
+    def entries(self, limit: Optional[int] = None) -> list[dict[str, Any]]:
+        """Aggregated entries, slowest total time first."""
+        with self._lock:
+            items = [dict(e, paramShapes=list(e["paramShapes"])) for e in self._entries.values()]
+        items.sort(key=lambda e: e["totalMs"], reverse=True)
+        for e in items:
+            e["avgMs"] = e["totalMs"] / e["count"] if e["count"] else 0.0
+        return items[:limit] if limit else items
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
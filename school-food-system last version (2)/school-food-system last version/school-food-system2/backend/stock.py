@@ -0,0 +1,212 @@
+"""Stock ledger: every inventory quantity change is a row in `stock_movements`.
+
+Same shape as the balance ledger (`ledger.py`): movements are append-only,
+`delta` is signed and `inventory.quantity` is a cache of the sum, updated in
+the same transaction. `stock_snapshots` keeps the level as of a movement id,
+so the current level is the snapshot plus the movements after it.
+
+Recipes (`recipes`) give the quantity of each inventory item used by one
+portion of a menu item. When orders reach `preparing` or `received`,
+`consume_orders()` deducts the ingredients of the whole batch with one
+`INSERT ... SELECT` into the ledger and one `UPDATE` of the affected
+inventory rows, which also recomputes their `status`. The partial unique
+index on `(order_id, inventory_id)` for consumption rows makes an order
+deduct its ingredients once, whichever of the two statuses comes first.
+
+Stock may go negative: that means the recorded stock was wrong, and the
+ledger shows by how much.
+
+    python backend/stock.py snapshot
+    python backend/stock.py reconcile
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import uuid
+from typing import Any, Iterable, Optional
+
+from db import connect, initialize_database, utcnow_iso
+
+MOVEMENT_REASONS = ("opening", "restock", "consumption", "adjustment", "waste")
+# Order statuses at which the kitchen has used the ingredients
+CONSUMING_STATUSES = ("preparing", "received")
+
+# Same rule as the inventory API: nothing left / at or below the minimum / fine
+STATUS_SQL = "CASE WHEN {q} <= 0 THEN 'out_of_stock' WHEN {q} <= min_quantity THEN 'low_stock' ELSE 'in_stock' END"
+
+
+def _qty(value: float) -> float:
+    return round(float(value), 3)
+
+
+def record_movement(
+    conn: sqlite3.Connection,
+    inventory_id: int,
+    delta: float,
+    reason: str,
+    *,
+    note: Optional[str] = None,
+    update_status: bool = True,
+) -> sqlite3.Row:
+    """Append one movement and apply it to the cached quantity (no commit).
+
+    Raises LookupError for an unknown inventory item.
+    """
+    if reason not in MOVEMENT_REASONS:
+        raise ValueError(f"unknown reason {reason!r}")
+    delta = _qty(delta)
+    now = utcnow_iso()
+    status_set = f", status = {STATUS_SQL.format(q='ROUND(quantity + :delta, 3)')}" if update_status else ""
+    updated = conn.execute(
+        f"UPDATE inventory SET quantity = ROUND(quantity + :delta, 3){status_set}, updated_at = :now WHERE id = :id",
+        {"delta": delta, "now": now, "id": inventory_id},
+    ).rowcount
+    if updated != 1:
+        raise LookupError(f"inventory item {inventory_id} not found")
+    cur = conn.execute(
+        "INSERT INTO stock_movements (inventory_id, delta, reason, note, created_at) VALUES (?, ?, ?, ?, ?)",
+        (inventory_id, delta, reason, note, now),
+    )
+    return conn.execute("SELECT * FROM stock_movements WHERE id = ?", (cur.lastrowid,)).fetchone()
+
+
+def record_opening_stock(conn: sqlite3.Connection) -> int:
+    """One 'opening' movement per item whose quantity predates the ledger (no commit)."""
+    return conn.execute(
+        """INSERT INTO stock_movements (inventory_id, delta, reason, note, created_at)
+           SELECT i.id, ROUND(i.quantity - COALESCE((SELECT SUM(m.delta) FROM stock_movements m WHERE m.inventory_id = i.id), 0), 3),
+                  'opening', 'Начальный остаток', ?
+           FROM inventory i
+           WHERE ROUND(i.quantity - COALESCE((SELECT SUM(m.delta) FROM stock_movements m WHERE m.inventory_id = i.id), 0), 3) != 0
+             AND NOT EXISTS (SELECT 1 FROM stock_movements m WHERE m.inventory_id = i.id AND m.reason = 'opening')""",
+        (utcnow_iso(),),
+    ).rowcount
+
+
+def consume_orders(conn: sqlite3.Connection, order_ids: Iterable[int]) -> dict[str, int]:
+    """Deduct recipe ingredients for a batch of orders (no commit).
+
+    Orders that were already deducted are skipped. Returns the number of
+    movements written and inventory rows touched.
+    """
+    ids = sorted({int(i) for i in order_ids})
+    if not ids:
+        return {"movements": 0, "items": 0}
+    batch_id = uuid.uuid4().hex
+    params = {"ids": json.dumps(ids), "batch": batch_id, "now": utcnow_iso()}
+    movements = conn.execute(
+        """INSERT OR IGNORE INTO stock_movements (inventory_id, delta, reason, order_id, batch_id, created_at)
+           SELECT r.inventory_id, ROUND(-r.quantity * o.quantity, 3), 'consumption', o.id, :batch, :now
+           FROM orders o
+           JOIN recipes r ON r.menu_item_id = o.menu_item_id
+           WHERE o.id IN (SELECT value FROM json_each(:ids))""",
+        params,
+    ).rowcount
+    if not movements:
+        return {"movements": 0, "items": 0}
+    # Only the rows this batch touched; status follows the new quantity.
+    items = conn.execute(
+        f"""UPDATE inventory
+               SET quantity = ROUND(quantity + d.delta, 3),
+                   status = {STATUS_SQL.format(q='ROUND(quantity + d.delta, 3)')},
+                   updated_at = :now
+              FROM (SELECT inventory_id, SUM(delta) AS delta FROM stock_movements
+                    WHERE batch_id = :batch GROUP BY inventory_id) AS d
+             WHERE inventory.id = d.inventory_id""",
+        params,
+    ).rowcount
+    return {"movements": movements, "items": items}
+
+
+# Level as of the snapshot plus everything moved after it, per item.
+_LEDGER_LEVEL_SQL = """
+SELECT i.id AS inventory_id,
+       ROUND(COALESCE(s.quantity, 0) + COALESCE((
+           SELECT SUM(m.delta) FROM stock_movements m
+           WHERE m.inventory_id = i.id AND m.id > COALESCE(s.last_movement_id, 0) AND m.id <= :upto
+       ), 0), 3) AS quantity,
+       COALESCE((SELECT MAX(m.id) FROM stock_movements m WHERE m.inventory_id = i.id AND m.id <= :upto),
+                s.last_movement_id, 0) AS last_movement_id
+FROM inventory i
+LEFT JOIN stock_snapshots s ON s.inventory_id = i.id
+"""
+
+
+def snapshot_stock(conn: sqlite3.Connection) -> int:
+    """Roll every item's snapshot forward to the latest movement; returns items updated."""
+    upto = conn.execute("SELECT COALESCE(MAX(id), 0) FROM stock_movements").fetchone()[0]
+    cur = conn.execute(
+        f"""INSERT INTO stock_snapshots (inventory_id, quantity, last_movement_id, created_at)
+            SELECT inventory_id, quantity, last_movement_id, :now FROM ({_LEDGER_LEVEL_SQL}) t
+            WHERE last_movement_id > 0
+              AND last_movement_id > COALESCE((SELECT last_movement_id FROM stock_snapshots s2
+                                               WHERE s2.inventory_id = t.inventory_id), 0)
+            ON CONFLICT(inventory_id) DO UPDATE SET quantity = excluded.quantity,
+                                                    last_movement_id = excluded.last_movement_id,
+                                                    created_at = excluded.created_at""",
+        {"upto": upto, "now": utcnow_iso()},
+    )
+    conn.commit()
+    return cur.rowcount
+
+
+def reconcile(conn: sqlite3.Connection, inventory_id: Optional[int] = None) -> list[dict[str, Any]]:
+    """Items whose cached quantity differs from snapshot + later movements."""
+    upto = conn.execute("SELECT COALESCE(MAX(id), 0) FROM stock_movements").fetchone()[0]
+    sql = f"""SELECT t.inventory_id, t.quantity AS ledger_quantity, ROUND(i.quantity, 3) AS cached_quantity
+              FROM ({_LEDGER_LEVEL_SQL}) t JOIN inventory i ON i.id = t.inventory_id
+              WHERE t.quantity != ROUND(i.quantity, 3)"""
+    params: dict[str, Any] = {"upto": upto}
+    if inventory_id is not None:
+        sql += " AND t.inventory_id = :inventory_id"
+        params["inventory_id"] = inventory_id
+    return [
+        {"inventoryId": r["inventory_id"], "ledgerQuantity": r["ledger_quantity"],
+         "cachedQuantity": r["cached_quantity"], "difference": round(r["cached_quantity"] - r["ledger_quantity"], 3)}
+        for r in conn.execute(sql, params)
+    ]
+
+
+def movement_row_to_api(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "id": row["id"],
+        "inventoryId": row["inventory_id"],
+        "delta": float(row["delta"]),
+        "reason": row["reason"],
+        "orderId": row["order_id"],
+        "note": row["note"],
+        "createdAt": row["created_at"],
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stock ledger maintenance")
+    parser.add_argument("command", choices=("snapshot", "reconcile"))
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    initialize_database(db_path)
+    conn = connect(db_path)
+    try:
+        if args.command == "snapshot":
+            print(f"snapshots updated: {snapshot_stock(conn)}")
+            return 0
+        problems = reconcile(conn)
+        for p in problems:
+            print(f"item {p['inventoryId']}: cached {p['cachedQuantity']} ledger {p['ledgerQuantity']} diff {p['difference']}")
+        print(f"mismatches: {len(problems)}")
+        return 1 if problems else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Meal subscriptions: turning active plans into daily orders.
+
+A subscription (`breakfast`, `lunch` or `full`) is paid for up front and
+covers every school day (Monday to Friday) between `start_date` and
+`end_date`. Once a day, `run_daily()`:
+
+1. expires plans whose `end_date` has passed (one UPDATE);
+2. materializes that day's orders for every active subscriber with a single
+   `INSERT ... SELECT`: for each plan and meal type it picks the first
+   available dish of the day (lowest id) that contains none of the
+   student's allergens. Students without a safe dish are skipped.
+
+Both steps run in one transaction. The partial unique index on
+`orders(subscription_id, order_date, meal_type)` together with
+`INSERT OR IGNORE` makes reruns for the same day harmless.
+
+Subscription orders are created as `paid` with `total_price = 0`: the money
+was taken when the plan was bought.
+
+    python backend/subscriptions.py              # today
+    python backend/subscriptions.py --date 2025-09-01
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import date, timedelta
+from typing import Any, Optional
+
+from allergens import index_missing
+from db import connect, initialize_database, utcnow_iso
+
+PLAN_MEALS = {"breakfast": ("breakfast",), "lunch": ("lunch",), "full": ("breakfast", "lunch")}
+
+
+def is_school_day(day: date) -> bool:
+    return day.weekday() < 5
+
+
+def add_school_days(start: date, days: int) -> date:
+    """Date of the `days`-th school day counting from `start` (inclusive)."""
+    d = start
+    while not is_school_day(d):
+        d += timedelta(days=1)
+    left = days - 1
+    while left > 0:
+        d += timedelta(days=1)
+        if is_school_day(d):
+            left -= 1
+    return d
+
+
+def count_school_days(start: date, end: date) -> int:
+    """School days in [start, end]; 0 if the range is empty."""
+    if end < start:
+        return 0
+    total = (end - start).days + 1
+    weeks, rest = divmod(total, 7)
+    count = weeks * 5
+    for i in range(rest):
+        if is_school_day(start + timedelta(days=weeks * 7 + i)):
+            count += 1
+    return count
+
+
+# A dish is safe when it shares no allergen bit with the student (allergens.py);
+# rows whose masks are not filled in yet are never picked.
+MATERIALIZE_SQL = """
+INSERT OR IGNORE INTO orders (student_id, menu_item_id, order_date, meal_type, quantity, total_price,
+                              status, payment_type, subscription_id, created_at)
+SELECT student_id, menu_item_id, :day, meal_type, 1, 0, 'paid', 'subscription', subscription_id, :now
+FROM (
+    SELECT s.id AS subscription_id, s.student_id, mt.meal_type,
+           (SELECT m.id FROM menu_items m
+             WHERE m.date = :day AND m.meal_type = mt.meal_type AND m.is_available = 1
+               AND m.allergen_mask & u.allergy_mask = 0
+             ORDER BY m.id LIMIT 1) AS menu_item_id
+    FROM subscriptions s
+    JOIN users u ON u.id = s.student_id AND u.is_active = 1
+    JOIN (SELECT 'breakfast' AS meal_type UNION ALL SELECT 'lunch') mt
+      ON s.plan_type = mt.meal_type OR s.plan_type = 'full'
+    WHERE s.status = 'active' AND s.start_date <= :day AND s.end_date >= :day
+)
+WHERE menu_item_id IS NOT NULL
+"""
+
+# Subscriber meals for the day (same plan filter as above), to report skips.
+DUE_MEALS_SQL = """
+SELECT COUNT(1)
+FROM subscriptions s
+JOIN users u ON u.id = s.student_id AND u.is_active = 1
+JOIN (SELECT 'breakfast' AS meal_type UNION ALL SELECT 'lunch') mt
+  ON s.plan_type = mt.meal_type OR s.plan_type = 'full'
+WHERE s.status = 'active' AND s.start_date <= :day AND s.end_date >= :day
+"""
+
+
+def expire_subscriptions(conn: sqlite3.Connection, today: date) -> int:
+    cur = conn.execute(
+        "UPDATE subscriptions SET status = 'expired' WHERE status = 'active' AND end_date < ?",
+        (today.isoformat(),),
+    )
+    return cur.rowcount
+
+
+def materialize_orders(conn: sqlite3.Connection, day: date) -> dict[str, int]:
+    """Create the day's subscription orders (no commit)."""
+    params = {"day": day.isoformat(), "now": utcnow_iso()}
+    due = conn.execute(DUE_MEALS_SQL, params).fetchone()[0]
+    already = conn.execute(
+        "SELECT COUNT(1) FROM orders WHERE subscription_id IS NOT NULL AND order_date = ?", (params["day"],)
+    ).fetchone()[0]
+    created = conn.execute(MATERIALIZE_SQL, params).rowcount
+    return {"due": due, "created": created, "existing": already, "skipped": max(due - created - already, 0)}
+
+
+def run_daily(conn: sqlite3.Connection, day: Optional[date] = None) -> dict[str, Any]:
+    """Expire finished plans and materialize `day`'s orders in one transaction."""
+    day = day or date.today()
+    try:
+        expired = expire_subscriptions(conn, day)
+        if is_school_day(day):
+            result = materialize_orders(conn, day)
+        else:
+            result = {"due": 0, "created": 0, "existing": 0, "skipped": 0}
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"date": day.isoformat(), "schoolDay": is_school_day(day), "expired": expired, **result}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Expire subscriptions and create today's subscription orders")
+    parser.add_argument("--date", help="YYYY-MM-DD (default: today)")
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    args = parser.parse_args(argv)
+
+    # Same default as app.py (importing app would build the whole Flask app)
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    initialize_database(db_path)
+    conn = connect(db_path)
+    try:
+        index_missing(conn)
+        result = run_daily(conn, date.fromisoformat(args.date) if args.date else None)
+    finally:
+        conn.close()
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Change log for client-side mirrors (`GET /api/sync`).
+
+Triggers on the tables in `db.SYNCED_TABLES` stamp every inserted, updated
+or deleted row into `sync_changes`. The log holds one entry per row: a
+change replaces the row's entry, so its `version` (AUTOINCREMENT, never
+reused) is the version of the row's last change, and a deleted row keeps a
+tombstone (`deleted = 1`). Renaming a user or a dish also re-stamps the
+orders, reviews and purchase requests that show the name.
+
+A client that has applied everything up to version V asks for the entries
+after V: a range scan of the primary key whose cost depends on the number
+of changes, not on the size of the tables. Rows changed several times in
+between are sent once. A client without a version, or with one older than
+the purged tombstones, has to reload the tables in full (`reset`).
+
+    python backend/sync.py purge --days 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from db import connect, initialize_database
+
+DEFAULT_TOMBSTONE_DAYS = 30
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM sync_changes").fetchone()[0]
+
+
+def purged_through(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT purged_through FROM sync_state WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def read_changes(conn: sqlite3.Connection, since: int, tables: list[str], limit: int
+                 ) -> tuple[dict[str, dict[str, list[int]]], int, bool]:
+    """Changed and deleted row ids per table after `since`, oldest first.
+
+    Returns `(changes, version, has_more)`; `version` is the version the
+    client is at once it has applied `changes` (pass it as the next `since`).
+    """
+    upto = current_version(conn)
+    rows = conn.execute(
+        f"""SELECT version, table_name, row_id, deleted FROM sync_changes
+            WHERE version > ? AND version <= ? AND table_name IN ({", ".join("?" * len(tables))})
+            ORDER BY version LIMIT ?""",
+        (since, upto, *tables, limit + 1),
+    ).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes: dict[str, dict[str, list[int]]] = {t: {"upserts": [], "deletes": []} for t in tables}
+    for r in rows:
+        changes[r["table_name"]]["deletes" if r["deleted"] else "upserts"].append(r["row_id"])
+    return changes, (rows[-1]["version"] if has_more else upto), has_more
+
+
+def purge_tombstones(conn: sqlite3.Connection, days: int = DEFAULT_TOMBSTONE_DAYS) -> dict[str, int]:
+    """Forget deletes older than `days`; clients that last synced before them get a reset."""
+    cutoff = (datetime.utcnow() - timedelta(days=days)).replace(microsecond=0).isoformat()
+    try:
+        last = conn.execute(
+            "SELECT MAX(version) FROM sync_changes WHERE deleted = 1 AND changed_at < ?", (cutoff,)
+        ).fetchone()[0]
+        if last is None:
+            return {"deleted": 0, "purgedThrough": purged_through(conn)}
+        deleted = conn.execute("DELETE FROM sync_changes WHERE deleted = 1 AND version <= ?", (last,)).rowcount
+        conn.execute(
+            "INSERT INTO sync_state (id, purged_through) VALUES (1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET purged_through = MAX(purged_through, excluded.purged_through)",
+            (last,),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"deleted": deleted, "purgedThrough": last}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sync change log maintenance")
+    parser.add_argument("command", choices=("purge", "version"))
+    parser.add_argument("--db", help="SQLite file (default: the app DB)")
+    parser.add_argument("--days", type=int, default=DEFAULT_TOMBSTONE_DAYS, help="purge: keep tombstones this long")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get("SCHOOL_FOOD_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "school_food.sqlite3"
+    )
+    initialize_database(db_path)
+    conn = connect(db_path)
+    try:
+        result: dict[str, Any]
+        if args.command == "purge":
+            result = purge_tombstones(conn, args.days)
+        else:
+            result = {"version": current_version(conn), "purgedThrough": purged_through(conn)}
+    finally:
+        conn.close()
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
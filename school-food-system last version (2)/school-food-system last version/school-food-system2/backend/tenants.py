@@ -0,0 +1,306 @@
+"""Multi-school tenancy: one SQLite file, and so one write lock, per school.
+
+With TENANTS_DIR set, a request is routed to a school ("tenant") by
+
+- a path prefix: `/s/<school>/api/...` and `/s/<school>/admin.html`
+  (`TenantPathMiddleware` moves the prefix into SCRIPT_NAME, so the routes
+  and the frontend's relative links are unchanged), or
+- the host: with TENANT_HOST_SUFFIX=".food.example.org", the host
+  `school12.food.example.org` is the school `school12`.
+
+Requests that name no school use the default DB (DB_PATH), so a single-school
+deployment works as before. A school's files live in `TENANTS_DIR/<school>/`
+(`school_food.sqlite3`, its forecast cache, its order archive). Routing only
+opens (and migrates) schools whose DB exists; a school is created explicitly,
+with its first admin account and no demo data, by `TenantRegistry.create`
+(`POST /api/admin/schools` or the CLI below). `TENANTS` restricts which
+names may be created. Writers of different schools never wait for each other.
+
+Each open tenant keeps a pool of idle connections, reused across requests,
+plus its own activity buffer, forecast cache and scheduler (the app builds
+those in its `open_tenant` callback). `TenantRegistry.fan_out` runs a
+read-only function against every school in parallel for district reports.
+
+    python backend/tenants.py create school12 --admin-password '...' [--admin-login admin] [--admin-email ...]
+    python backend/tenants.py list
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from db import QueryStats, TracedConnection, connect, initialize_database, utcnow_iso
+
+DEFAULT_TENANT = "default"
+TENANT_DB_FILE = "school_food.sqlite3"
+PATH_PREFIX = "/s/"
+ENVIRON_KEY = "school_food.tenant"
+MAX_FAN_OUT = 8
+
+_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9-]{0,62}$")
+
+
+class UnknownTenant(LookupError):
+    """The request names a school that does not exist (or, for `create`, may not be created)."""
+
+
+class TenantExists(ValueError):
+    """`create` was asked for a school that already has a DB."""
+
+
+class ConnectionPool:
+    """Idle connections to one DB file, handed from request to request (and thread to thread)."""
+
+    def __init__(self, db_path: str, max_idle: int = 8) -> None:
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self._idle: deque[TracedConnection] = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> TracedConnection:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = connect(self.db_path, check_same_thread=False)
+        conn.stats = QueryStats()
+        return conn
+
+    def release(self, conn: TracedConnection) -> None:
+        # Whatever the request left uncommitted is discarded, as closing would
+        if conn.in_transaction:
+            conn.rollback()
+        conn.statement_hook = None
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+
+@dataclass
+class Tenant:
+    name: str
+    db_path: str
+    pool: ConnectionPool
+    activity: Any
+    forecast_cache: Any
+    scheduler: Any = None
+    # monotonic() of the last sweep run by a read; None until the first read sweeps
+    last_critical_sweep: Optional[float] = None
+    # Held by a backup taken in a request (no scheduler), so two do not overlap
+    backup_lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def valid_name(name: str) -> bool:
+    return bool(_NAME_RE.match(name)) and name != DEFAULT_TENANT
+
+
+def create_school_db(db_path: str, login: str, email: str, password: str, full_name: str) -> None:
+    """A new school DB at `db_path`: the schema and one admin account.
+
+    Built under a temporary name and renamed into place, so the school never
+    appears half-created.
+    """
+    from werkzeug.security import generate_password_hash
+
+    tmp_path = db_path + ".new"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    initialize_database(tmp_path, seed=False)
+    conn = connect(tmp_path)
+    try:
+        now = utcnow_iso()
+        conn.execute(
+            """INSERT INTO users (email, login, password_hash, full_name, role, permission_level, is_active, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 'admin', 'full', 1, ?, ?)""",
+            (email, login, generate_password_hash(password), full_name, now, now),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+
+
+class TenantPathMiddleware:
+    """WSGI middleware: `/s/<school>/rest` is served as `/rest` for that school."""
+
+    def __init__(self, wsgi_app: Callable) -> None:
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable) -> Any:
+        path = environ.get("PATH_INFO") or ""
+        if path.startswith(PATH_PREFIX):
+            name, _, rest = path[len(PATH_PREFIX):].partition("/")
+            if name:
+                environ[ENVIRON_KEY] = name
+                environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + PATH_PREFIX + name
+                environ["PATH_INFO"] = "/" + rest
+        return self.wsgi_app(environ, start_response)
+
+
+class TenantRegistry:
+    """Open tenants by name; opens (creating if allowed) on first use."""
+
+    def __init__(self, default_db_path: str, open_tenant: Callable[[str, str], Tenant],
+                 root: Optional[str] = None, host_suffix: Optional[str] = None,
+                 allowed: Optional[set[str]] = None) -> None:
+        self.default_db_path = default_db_path
+        self.root = os.path.abspath(root) if root else None
+        self.host_suffix = host_suffix.lower() if host_suffix else None
+        self.allowed = allowed
+        self._open_tenant = open_tenant
+        self._tenants: dict[str, Tenant] = {}
+        self._lock = threading.Lock()
+        self._opening: dict[str, threading.Lock] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.root is not None
+
+    def db_path(self, name: str) -> str:
+        if name == DEFAULT_TENANT:
+            return self.default_db_path
+        return os.path.join(self.root, name, TENANT_DB_FILE)
+
+    def resolve(self, environ: dict[str, Any]) -> str:
+        """School named by the request (path prefix first, then host), or the default."""
+        if not self.enabled:
+            return DEFAULT_TENANT
+        name = environ.get(ENVIRON_KEY)
+        if name is None and self.host_suffix:
+            host = (environ.get("HTTP_HOST") or "").split(":")[0].lower()
+            if host.endswith(self.host_suffix) and len(host) > len(self.host_suffix):
+                name = host[:-len(self.host_suffix)]
+        return name if name is not None else DEFAULT_TENANT
+
+    def names(self) -> list[str]:
+        """The default DB plus every school in `root` that has a DB file."""
+        if not self.enabled or not os.path.isdir(self.root):
+            return [DEFAULT_TENANT]
+        return [DEFAULT_TENANT] + sorted(
+            n for n in os.listdir(self.root)
+            if valid_name(n) and os.path.exists(os.path.join(self.root, n, TENANT_DB_FILE)))
+
+    def get(self, name: str) -> Tenant:
+        tenant = self._tenants.get(name)
+        if tenant is not None:
+            return tenant
+        # Only schools that exist: a request must not be able to create DBs (and their threads)
+        if name != DEFAULT_TENANT and not (self.enabled and valid_name(name) and os.path.exists(self.db_path(name))):
+            raise UnknownTenant(name)
+        # One lock per school: opening (and migrating) a school does not hold up the others
+        with self._name_lock(name):
+            tenant = self._tenants.get(name)
+            if tenant is None:
+                db_path = self.db_path(name)
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+                tenant = self._open_tenant(name, db_path)
+                with self._lock:
+                    self._tenants[name] = tenant
+        return tenant
+
+    def create(self, name: str, login: str, email: str, password: str,
+               full_name: str = "Администратор школы") -> str:
+        """Create school `name` with its first admin account; returns its DB path.
+
+        UnknownTenant if the name is invalid or not in `allowed`, TenantExists
+        if the school already has a DB.
+        """
+        if not self.enabled or not valid_name(name) or (self.allowed is not None and name not in self.allowed):
+            raise UnknownTenant(name)
+        db_path = self.db_path(name)
+        with self._name_lock(name):
+            if os.path.exists(db_path):
+                raise TenantExists(name)
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            create_school_db(db_path, login, email, password, full_name)
+        return db_path
+
+    def _name_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._opening.setdefault(name, threading.Lock())
+
+    def open_tenants(self) -> list[Tenant]:
+        with self._lock:
+            return list(self._tenants.values())
+
+    def fan_out(self, func: Callable[[TracedConnection], Any],
+                names: Optional[list[str]] = None) -> dict[str, dict[str, Any]]:
+        """`func(conn)` for every school in parallel: {school: {"result": ...} or {"error": ...}}."""
+        names = self.names() if names is None else names
+
+        def run(name: str) -> dict[str, Any]:
+            try:
+                pool = self.get(name).pool
+                conn = pool.acquire()
+                try:
+                    return {"result": func(conn)}
+                finally:
+                    pool.release(conn)
+            except Exception as e:
+                return {"error": str(e) or e.__class__.__name__}
+
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(MAX_FAN_OUT, len(names)), thread_name_prefix="fan-out") as pool:
+            return dict(zip(names, pool.map(run, names)))
+
+    def close(self) -> None:
+        for tenant in self.open_tenants():
+            tenant.pool.close()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Schools of a multi-school deployment")
+    parser.add_argument("command", choices=("create", "list"))
+    parser.add_argument("name", nargs="?", help="create: the school, e.g. school12")
+    parser.add_argument("--dir", help="schools directory (default: TENANTS_DIR)")
+    parser.add_argument("--admin-login", default="admin")
+    parser.add_argument("--admin-email", help="default: <login>@<school>")
+    parser.add_argument("--admin-password", help="default: the SCHOOL_ADMIN_PASSWORD environment variable")
+    parser.add_argument("--admin-name", default="Администратор школы")
+    args = parser.parse_args(argv)
+
+    root = args.dir or os.environ.get("TENANTS_DIR")
+    if not root:
+        parser.error("--dir or TENANTS_DIR is required")
+    allowed = {t.strip() for t in os.environ["TENANTS"].split(",") if t.strip()} if os.environ.get("TENANTS") else None
+    # Only create/names are used: nothing is opened here
+    registry = TenantRegistry("", lambda name, db_path: None, root=root, allowed=allowed)
+    if args.command == "list":
+        for name in registry.names()[1:]:
+            print(f"{name}  {registry.db_path(name)}")
+        return 0
+
+    password = args.admin_password or os.environ.get("SCHOOL_ADMIN_PASSWORD")
+    if not args.name or not password:
+        parser.error("create needs the school name and an admin password")
+    try:
+        db_path = registry.create(args.name, args.admin_login, args.admin_email or f"{args.admin_login}@{args.name}",
+                                  password, args.admin_name)
+    except UnknownTenant:
+        print(f"invalid or not allowed (TENANTS) school name: {args.name}", file=sys.stderr)
+        return 1
+    except TenantExists:
+        print(f"school already exists: {args.name}", file=sys.stderr)
+        return 1
+    print(f"school={args.name} db={db_path} admin={args.admin_login}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
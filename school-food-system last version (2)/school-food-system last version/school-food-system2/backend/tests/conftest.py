@@ -0,0 +1,49 @@
+"""Fixtures: a throwaway seeded database and an app without background threads."""
+
+from __future__ import annotations
+
+import pytest
+
+from app import create_app
+from db import connect, initialize_database
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "school_food.sqlite3")
+    initialize_database(path)
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def app(db_path, tmp_path, monkeypatch):
+    # Every file the app writes goes under tmp_path; nothing runs in the background.
+    monkeypatch.setenv("SCHEDULER_ENABLED", "0")
+    monkeypatch.setenv("SLOW_QUERY_MS", "-1")
+    for name in ("PROFILE_DIR", "FORECAST_CACHE", "ARCHIVE_DIR", "BACKUP_DIR"):
+        monkeypatch.setenv(name, str(tmp_path / name.lower()))
+    for name in ("METRICS_DIR", "TENANTS_DIR", "TENANTS", "RECORD_TRAFFIC", "ANALYTICS_EXPORT_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    return create_app(db_path)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_headers(conn):
+    admin_id = conn.execute("SELECT id FROM users WHERE login = 'admin'").fetchone()[0]
+    return {"X-User-Id": str(admin_id)}
+
+
+@pytest.fixture
+def student_id(conn):
+    return conn.execute("SELECT id FROM users WHERE login = 'student1'").fetchone()[0]
@@ -0,0 +1,155 @@
+"""Balance ledger (ledger.py, /api/payments): idempotency keys, refunds, reconciliation."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from db import connect
+from ledger import InsufficientFunds, post_entry, reconcile, snapshot_balances
+
+
+def _balance(conn, user_id: int) -> int:
+    return conn.execute("SELECT balance FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+
+
+def _payments(conn, transaction_id: str) -> int:
+    return conn.execute("SELECT COUNT(*) FROM payments WHERE transaction_id = ?", (transaction_id,)).fetchone()[0]
+
+
+def test_same_key_posts_once(conn, student_id):
+    start = _balance(conn, student_id)
+
+    first, created = post_entry(conn, student_id, 1000, transaction_id="topup-1")
+    conn.commit()
+    again, created_again = post_entry(conn, student_id, 1000, transaction_id="topup-1")
+    conn.commit()
+
+    assert created and not created_again
+    assert again["id"] == first["id"]
+    assert _balance(conn, student_id) == start + 1000
+    assert _payments(conn, "topup-1") == 1
+
+
+def test_repeated_key_keeps_the_first_amount(conn, student_id):
+    start = _balance(conn, student_id)
+    post_entry(conn, student_id, 1000, transaction_id="topup-1")
+    conn.commit()
+
+    row, created = post_entry(conn, student_id, 5000, transaction_id="topup-1")
+    conn.commit()
+
+    assert not created
+    assert row["amount"] == 1000
+    assert _balance(conn, student_id) == start + 1000
+
+
+def test_overdraft_is_refused(conn, student_id):
+    start = _balance(conn, student_id)
+
+    with pytest.raises(InsufficientFunds):
+        post_entry(conn, student_id, -(start + 1), transaction_id="order-1")
+    conn.rollback()
+
+    assert _balance(conn, student_id) == start
+    assert _payments(conn, "order-1") == 0
+
+
+def test_unknown_user(conn):
+    with pytest.raises(LookupError):
+        post_entry(conn, 10 ** 9, 100)
+    conn.rollback()
+
+
+def test_concurrent_posts_of_one_key(db_path, student_id):
+    start_conn = connect(db_path)
+    start = _balance(start_conn, student_id)
+    barrier = threading.Barrier(4)
+    results: list[bool] = []
+
+    def post():
+        conn = connect(db_path)
+        try:
+            barrier.wait()
+            _row, created = post_entry(conn, student_id, 700, transaction_id="topup-race")
+            conn.commit()
+            results.append(created)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=post) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(results) == [False, False, False, True]
+    assert _balance(start_conn, student_id) == start + 700
+    start_conn.close()
+
+
+def test_retried_top_up_credits_once(client, conn, student_id):
+    start = _balance(conn, student_id)
+    body = {"userId": student_id, "amount": "150.50", "transactionId": "pay-1"}
+
+    first = client.post("/api/payments", json=body).get_json()
+    retry = client.post("/api/payments", json=body).get_json()
+
+    assert first["ok"] and not first["duplicate"]
+    assert retry["ok"] and retry["duplicate"]
+    assert retry["payment"]["id"] == first["payment"]["id"]
+    assert first["payment"]["amount"] == 150.5
+    assert _balance(conn, student_id) == start + 15050
+    assert retry["balance"] == (start + 15050) / 100
+
+
+def test_debit_without_funds(client, conn, student_id):
+    start = _balance(conn, student_id)
+
+    r = client.post("/api/payments", json={
+        "userId": student_id, "type": "debit", "amount": start / 100 + 1, "transactionId": "order-big"})
+
+    assert r.status_code == 400
+    assert _balance(conn, student_id) == start
+    assert _payments(conn, "order-big") == 0
+
+
+def test_refund_is_idempotent(client, conn, student_id):
+    client.post("/api/payments", json={"userId": student_id, "amount": 100, "transactionId": "pay-2"})
+    topped_up = _balance(conn, student_id)
+    client.post("/api/payments", json={
+        "userId": student_id, "type": "debit", "amount": 40, "transactionId": "order-42"})
+    assert _balance(conn, student_id) == topped_up - 4000
+
+    first = client.post("/api/payments/order-42/refund").get_json()
+    retry = client.post("/api/payments/order-42/refund").get_json()
+
+    assert not first["duplicate"] and retry["duplicate"]
+    assert first["payment"]["amount"] == 40
+    assert _balance(conn, student_id) == topped_up
+    assert _payments(conn, "order-42:refund") == 1
+
+
+def test_only_debits_are_refunded(client, student_id):
+    assert client.post("/api/payments/pay-3/refund").status_code == 404
+    client.post("/api/payments", json={"userId": student_id, "amount": 10, "transactionId": "pay-3"})
+    assert client.post("/api/payments/pay-3/refund").status_code == 400
+
+
+def test_ledger_matches_cached_balances(client, conn, student_id):
+    client.post("/api/payments", json={"userId": student_id, "amount": 250, "transactionId": "pay-4"})
+    client.post("/api/payments", json={"userId": student_id, "type": "debit", "amount": 99.99,
+                                       "transactionId": "order-7"})
+    client.post("/api/payments/order-7/refund")
+    assert reconcile(conn) == []
+
+    snapshot_balances(conn)
+    client.post("/api/payments", json={"userId": student_id, "type": "debit", "amount": 0.01,
+                                       "transactionId": "order-8"})
+    assert reconcile(conn) == []
+
+    # A balance written around the ledger is reported
+    conn.execute("UPDATE users SET balance = balance + 1 WHERE id = ?", (student_id,))
+    conn.commit()
+    assert [r["userId"] for r in reconcile(conn)] == [student_id]
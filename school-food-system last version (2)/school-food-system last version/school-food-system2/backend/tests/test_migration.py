@@ -0,0 +1,171 @@
+"""Version 1 migration: REAL rubles to INTEGER kopecks (db._money_to_kopecks)."""
+
+from __future__ import annotations
+
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from db import MONEY_COLUMNS, SCHEMA_VERSION, connect, create_schema, initialize_database, migrate
+
+# The demo DB as first shipped: REAL rubles, user_version 0. Tests copy it, never open it.
+LEGACY_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "school_food.sqlite3")
+
+
+@pytest.fixture
+def legacy_path(tmp_path):
+    path = str(tmp_path / "legacy.sqlite3")
+    shutil.copyfile(LEGACY_DB, path)
+    raw = sqlite3.connect(path)
+    try:
+        if raw.execute("PRAGMA user_version").fetchone()[0] != 0:
+            pytest.skip("data/school_food.sqlite3 is no longer a version 0 file")
+    finally:
+        raw.close()
+    return path
+
+
+def _money(path: str) -> dict[tuple[str, str], list]:
+    raw = sqlite3.connect(path)
+    try:
+        tables = {r[0] for r in raw.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return {
+            (table, column): raw.execute(f"SELECT {column} FROM {table} ORDER BY rowid").fetchall()
+            for table, column in MONEY_COLUMNS if table in tables
+        }
+    finally:
+        raw.close()
+
+
+def _declared_type(conn: sqlite3.Connection, table: str, column: str, schema: str = "main") -> str:
+    return next(r[2] for r in conn.execute(f"PRAGMA {schema}.table_info({table})") if r[1] == column)
+
+
+def test_values_become_integer_kopecks(legacy_path):
+    before = _money(legacy_path)
+    assert any(rows for rows in before.values())
+
+    initialize_database(legacy_path, seed=False)
+
+    after = _money(legacy_path)
+    conn = connect(legacy_path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        for (table, column), rows in before.items():
+            assert after[(table, column)] == [
+                (None if v is None else int(round(v * 100)),) for (v,) in rows
+            ], f"{table}.{column}"
+        for table, column in MONEY_COLUMNS:
+            assert _declared_type(conn, table, column) == "INTEGER", f"{table}.{column}"
+            kinds = {r[0] for r in conn.execute(f"SELECT DISTINCT typeof({column}) FROM {table}")}
+            assert kinds <= {"integer", "null"}, f"{table}.{column}: {kinds}"
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    finally:
+        conn.close()
+
+
+def test_runs_once(legacy_path):
+    initialize_database(legacy_path, seed=False)
+    converted = _money(legacy_path)
+
+    initialize_database(legacy_path, seed=False)
+
+    assert _money(legacy_path) == converted
+
+
+def test_new_settings_row_defaults_to_kopecks(legacy_path):
+    initialize_database(legacy_path, seed=False)
+    conn = connect(legacy_path)
+    try:
+        conn.execute("DELETE FROM settings")
+        conn.execute("INSERT INTO settings (id, updated_at) VALUES (1, '2025-01-01T00:00:00')")
+        assert conn.execute("SELECT min_balance FROM settings").fetchone()[0] == 5000
+    finally:
+        conn.close()
+
+
+def test_schema_matches_a_new_file(legacy_path, tmp_path):
+    fresh = str(tmp_path / "fresh.sqlite3")
+    initialize_database(fresh, seed=False)
+    initialize_database(legacy_path, seed=False)
+
+    def objects(path, kind):
+        raw = sqlite3.connect(path)
+        try:
+            return {r[0] for r in raw.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+        finally:
+            raw.close()
+
+    assert objects(legacy_path, "trigger") == objects(fresh, "trigger")
+    assert objects(fresh, "index") <= objects(legacy_path, "index")
+
+
+def test_conversion_fires_no_triggers(legacy_path):
+    conn = connect(legacy_path)
+    try:
+        create_schema(conn)
+        conn.commit()
+        changes = conn.execute("SELECT COUNT(*), COALESCE(MAX(version), 0) FROM sync_changes").fetchone()[:]
+        events = conn.execute("SELECT COUNT(*) FROM critical_events").fetchone()[0]
+
+        assert migrate(conn, legacy_path)
+        create_schema(conn)
+        conn.commit()
+
+        assert conn.execute("SELECT COUNT(*), COALESCE(MAX(version), 0) FROM sync_changes").fetchone()[:] == changes
+        assert conn.execute("SELECT COUNT(*) FROM critical_events").fetchone()[0] == events
+    finally:
+        conn.close()
+
+
+def test_keeps_autoincrement_counters(legacy_path):
+    conn = connect(legacy_path)
+    try:
+        create_schema(conn)
+        # A deleted order above the highest live id: its id must not be handed out again
+        last = conn.execute("SELECT MAX(id) FROM orders").fetchone()[0]
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'orders'", (last + 10,))
+        conn.commit()
+
+        migrate(conn, legacy_path)
+
+        assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'orders'").fetchone()[0] == last + 10
+    finally:
+        conn.close()
+
+
+def test_converts_archive_files(legacy_path, tmp_path):
+    os.makedirs(tmp_path / "archive")
+    archive = sqlite3.connect(str(tmp_path / "archive" / "orders-2024.sqlite3"))
+    archive.executescript("""
+        CREATE TABLE orders(id INT, student_id INT, order_date TEXT, total_price REAL, status TEXT);
+        CREATE UNIQUE INDEX idx_orders_id ON orders(id);
+        INSERT INTO orders VALUES (1, 1, '2024-10-01', 150.5, 'paid'), (2, 1, '2024-10-02', 99.99, 'paid');
+    """)
+    archive.close()
+
+    conn = connect(legacy_path)
+    try:
+        create_schema(conn)
+        conn.execute(
+            "INSERT INTO order_archives (year, path, orders, revenue, updated_at) "
+            "VALUES (2024, 'archive/orders-2024.sqlite3', 2, 250.49, '2025-01-01T00:00:00')"
+        )
+        conn.commit()
+        migrate(conn, legacy_path)
+        assert conn.execute("SELECT revenue FROM order_archives WHERE year = 2024").fetchone()[0] == 25049
+    finally:
+        conn.close()
+
+    archive = sqlite3.connect(str(tmp_path / "archive" / "orders-2024.sqlite3"))
+    try:
+        assert archive.execute("SELECT total_price, typeof(total_price) FROM orders ORDER BY id").fetchall() == [
+            (15050, "integer"), (9999, "integer")]
+        assert _declared_type(archive, "orders", "total_price") == "INTEGER"
+        assert archive.execute("PRAGMA user_version").fetchone()[0] == 1
+        assert archive.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall() == [("idx_orders_id",)]
+    finally:
+        archive.close()
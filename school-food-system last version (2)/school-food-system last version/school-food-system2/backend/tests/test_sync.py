@@ -0,0 +1,180 @@
+"""Change log for client mirrors (sync.py, /api/sync)."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from sync import current_version, purge_tombstones, read_changes
+
+NOW = "2025-01-01T00:00:00"
+
+
+def _add_dish(conn, name: str = "Суп") -> int:
+    dish = conn.execute(
+        "INSERT INTO menu_items (date, meal_type, name, price, created_at) VALUES ('2025-01-10', 'lunch', ?, 5000, ?)",
+        (name, NOW),
+    ).lastrowid
+    conn.commit()
+    return dish
+
+
+@pytest.fixture
+def dish_id(conn):
+    return _add_dish(conn)
+
+
+@pytest.fixture
+def cook_id(conn):
+    return conn.execute("SELECT id FROM users WHERE login = 'cook'").fetchone()[0]
+
+
+@pytest.fixture
+def history(conn, student_id, dish_id, cook_id):
+    """Two orders and a review of student1 for the dish, one purchase request of the cook."""
+    orders = [
+        conn.execute(
+            "INSERT INTO orders (student_id, menu_item_id, order_date, meal_type, quantity, total_price, status, "
+            "payment_type, created_at) VALUES (?, ?, ?, 'lunch', 1, 10000, 'pending', 'one_time', ?)",
+            (student_id, dish_id, day, NOW),
+        ).lastrowid
+        for day in ("2025-01-10", "2025-01-11")
+    ]
+    review = conn.execute(
+        "INSERT INTO reviews (student_id, menu_item_id, rating, created_at) VALUES (?, ?, 5, ?)",
+        (student_id, dish_id, NOW),
+    ).lastrowid
+    request = conn.execute(
+        "INSERT INTO purchase_requests (cook_id, product_name, quantity, unit, created_at) "
+        "VALUES (?, 'Молоко', 10, 'л', ?)",
+        (cook_id, NOW),
+    ).lastrowid
+    conn.commit()
+    return {"orders": orders, "review": review, "request": request}
+
+
+def _sync(client, **params):
+    r = client.get("/api/sync", query_string=params)
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def _upserts(conn, since: int, table: str) -> list[int]:
+    changes, _version, _more = read_changes(conn, since, [table], 1000)
+    return sorted(changes[table]["upserts"])
+
+
+def test_first_call_is_a_full_reload(client, conn):
+    body = _sync(client)
+
+    assert body["reset"] is True
+    assert body["version"] == current_version(conn)
+    assert len(body["changes"]["users"]["rows"]) == conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+def test_unknown_or_future_version(client, conn):
+    assert client.get("/api/sync?tables=nope").status_code == 400
+    assert _sync(client, since=current_version(conn) + 100)["reset"] is True
+
+
+def test_changes_after_a_version(client, conn, dish_id):
+    since = _sync(client)["version"]
+
+    assert client.put(f"/api/menu/{dish_id}", json={"price": 99.5}).status_code == 200
+    body = _sync(client, since=since, tables="menu")
+
+    assert body["reset"] is False
+    assert [row["id"] for row in body["changes"]["menu"]["rows"]] == [dish_id]
+    assert body["changes"]["menu"]["rows"][0]["price"] == 99.5
+    assert body["version"] > since
+    # Applied: nothing left after the new version
+    assert _sync(client, since=body["version"], tables="menu")["changes"]["menu"]["rows"] == []
+
+
+def test_row_changed_twice_is_sent_once(conn, dish_id):
+    since = current_version(conn)
+    conn.execute("UPDATE menu_items SET price = price + 100 WHERE id = ?", (dish_id,))
+    conn.execute("UPDATE menu_items SET price = price + 100 WHERE id = ?", (dish_id,))
+    conn.commit()
+
+    assert _upserts(conn, since, "menu_items") == [dish_id]
+    assert conn.execute(
+        "SELECT COUNT(*) FROM sync_changes WHERE table_name = 'menu_items' AND row_id = ?", (dish_id,)
+    ).fetchone()[0] == 1
+
+
+def test_delete_leaves_a_tombstone(client, conn):
+    dish = _add_dish(conn)
+    since = _sync(client)["version"]
+
+    assert client.delete(f"/api/menu/{dish}").status_code == 200
+    body = _sync(client, since=since, tables="menu")
+
+    assert body["changes"]["menu"] == {"rows": [], "deletes": [dish]}
+
+
+def test_renaming_a_student_restamps_their_rows(client, conn, student_id, history):
+    since = current_version(conn)
+
+    assert client.put(f"/api/users/{student_id}", json={"fullName": "Новое Имя"}).status_code == 200
+    body = _sync(client, since=since, tables="users,orders,reviews")
+
+    assert [row["id"] for row in body["changes"]["users"]["rows"]] == [student_id]
+    orders = body["changes"]["orders"]["rows"]
+    assert sorted(row["id"] for row in orders) == history["orders"]
+    assert {row["studentName"] for row in orders} == {"Новое Имя"}
+    assert [row["id"] for row in body["changes"]["reviews"]["rows"]] == [history["review"]]
+
+
+def test_renaming_a_dish_restamps_orders_and_reviews(conn, dish_id, history):
+    since = current_version(conn)
+    conn.execute("UPDATE menu_items SET name = 'Борщ' WHERE id = ?", (dish_id,))
+    conn.commit()
+
+    assert _upserts(conn, since, "orders") == history["orders"]
+    assert _upserts(conn, since, "reviews") == [history["review"]]
+
+
+def test_renaming_a_cook_restamps_purchase_requests(conn, cook_id, history):
+    since = current_version(conn)
+    conn.execute("UPDATE users SET full_name = 'Новый Повар' WHERE id = ?", (cook_id,))
+    conn.commit()
+
+    assert _upserts(conn, since, "purchase_requests") == [history["request"]]
+
+
+def test_other_user_changes_do_not_restamp(conn, student_id, history):
+    since = current_version(conn)
+    conn.execute("UPDATE users SET balance = balance + 100 WHERE id = ?", (student_id,))
+    conn.commit()
+
+    assert _upserts(conn, since, "users") == [student_id]
+    assert _upserts(conn, since, "orders") == []
+    assert _upserts(conn, since, "reviews") == []
+
+
+def test_paging(client, conn, history):
+    since = current_version(conn)
+    for order_id in history["orders"]:
+        conn.execute("UPDATE orders SET status = 'paid' WHERE id = ?", (order_id,))
+    conn.commit()
+
+    first = _sync(client, since=since, tables="orders", limit=1)
+    rest = _sync(client, since=first["version"], tables="orders", limit=1)
+
+    assert first["hasMore"] is True and rest["hasMore"] is False
+    assert sorted(row["id"] for page in (first, rest) for row in page["changes"]["orders"]["rows"]) == history["orders"]
+
+
+def test_purged_tombstones_force_a_reload(client, conn, history):
+    since = current_version(conn)
+    conn.execute("DELETE FROM orders WHERE id = ?", (history["orders"][0],))
+    old = (datetime.utcnow() - timedelta(days=60)).replace(microsecond=0).isoformat()
+    conn.execute("UPDATE sync_changes SET changed_at = ? WHERE deleted = 1", (old,))
+    conn.commit()
+
+    result = purge_tombstones(conn, days=30)
+
+    assert result["deleted"] >= 1 and result["purgedThrough"] > since
+    assert _sync(client, since=since, tables="orders")["reset"] is True
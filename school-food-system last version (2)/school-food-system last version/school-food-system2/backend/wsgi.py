@@ -0,0 +1,9 @@
+"""WSGI entry point: `gunicorn -w 4 wsgi:app` (run from backend/).
+
+The app is built here rather than in app.py, so tools that import app.py
+(bench.py, a REPL) do not open the DB or start background threads.
+"""
+
+from app import create_app
+
+app = create_app()
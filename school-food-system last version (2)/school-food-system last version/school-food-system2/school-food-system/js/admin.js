@@ -1115,6 +1115,72 @@ function showAddUserModal() {
     }
 }
 
+const CLASS_ORDER_STATUS = {
+    created: ['Заказано', 'badge-success'],
+    allergy: ['Аллергия', 'badge-danger'],
+    insufficient_funds: ['Недостаточно средств', 'badge-warning'],
+    duplicate: ['Уже заказано', 'badge-info'],
+    inactive: ['Неактивен', 'badge-info'],
+    not_found: ['Не найден', 'badge-info']
+};
+
+function showClassOrderModal() {
+    const modal = document.getElementById('class-order-modal');
+    if (!modal) return;
+    document.getElementById('class-order-date').value = new Date().toISOString().split('T')[0];
+    document.getElementById('class-order-result').innerHTML = '';
+    loadClassOrderMenu();
+    modal.style.display = 'block';
+}
+
+function loadClassOrderMenu() {
+    const date = document.getElementById('class-order-date').value;
+    const select = document.getElementById('class-order-menu');
+    const items = date ? Database.getMenu(date) : [];
+    select.innerHTML = items.length
+        ? items.map(item => `<option value="${item.id}">${item.name} — ${item.price} ₽</option>`).join('')
+        : '<option value="">Нет блюд на эту дату</option>';
+}
+
+function placeClassOrder() {
+    const className = document.getElementById('class-order-class').value.trim();
+    const menuId = document.getElementById('class-order-menu').value;
+    if (!className || !menuId) {
+        showNotification('Укажите класс и блюдо', 'warning');
+        return;
+    }
+    let result;
+    try {
+        result = Database.placeClassOrder({
+            className: className,
+            menuId: Number(menuId),
+            date: document.getElementById('class-order-date').value,
+            charge: document.getElementById('class-order-charge').checked
+        });
+    } catch (error) {
+        showNotification('Ошибка заказа на класс: ' + error.message, 'error');
+        return;
+    }
+    if (!result) {
+        showNotification('Не удалось оформить заказ', 'error');
+        return;
+    }
+    document.getElementById('class-order-result').innerHTML = `
+        <p>Заказано: <strong>${result.created}</strong>, пропущено: <strong>${result.skipped}</strong>,
+           списано: <strong>${result.totalCharged} ₽</strong></p>
+        <table class="table">
+            <tbody>
+                ${result.results.map(r => {
+                    const [label, badge] = CLASS_ORDER_STATUS[r.status] || [r.status, 'badge-info'];
+                    const extra = r.conflictAllergens ? ` (${r.conflictAllergens.join(', ')})` : '';
+                    return `<tr><td>${r.name || r.studentId}</td><td><span class="${badge}">${label}${extra}</span></td></tr>`;
+                }).join('')}
+            </tbody>
+        </table>`;
+    showNotification(`Заказ на класс ${className}: ${result.created} из ${result.results.length}`,
+        result.created ? 'success' : 'warning');
+}
+
 function saveNewUser() {
     const role = document.getElementById('new-user-role')?.value;
     const name = document.getElementById('new-user-name')?.value;
@@ -1231,6 +1297,11 @@ function setupEventListeners() {
     document.getElementById('add-user-btn').addEventListener('click', showAddUserModal);
     document.getElementById('save-user-btn').addEventListener('click', saveNewUser);
     
+    // Заказ на класс
+    document.getElementById('class-order-btn').addEventListener('click', showClassOrderModal);
+    document.getElementById('class-order-date').addEventListener('change', loadClassOrderMenu);
+    document.getElementById('class-order-confirm').addEventListener('click', placeClassOrder);
+    
     // Изменение роли в форме добавления пользователя
     document.getElementById('new-user-role').addEventListener('change', function() {
         const role = this.value;
@@ -2109,52 +2180,83 @@ function searchPurchases() {
 
 // 11. Критические события (добавляем недостающую функцию)
 function loadCriticalEvents() {
-    // Загрузка критических событий для дашборда
+    // Открытые события уже посчитаны сервером (по мере изменения данных), здесь только вывод
     const events = Database.getCriticalEvents ? Database.getCriticalEvents() : [];
-    const container = document.getElementById('critical-events');
+    const tbody = document.querySelector('#critical-events-table tbody');
     
-    if (container) {
-        container.innerHTML = '';
+    if (tbody) {
+        tbody.innerHTML = '';
         
         if (events.length === 0) {
-            container.innerHTML = '<div class="text-center text-muted">Нет критических событий</div>';
+            tbody.innerHTML = '<tr><td colspan="6" class="text-center text-muted">Нет критических событий</td></tr>';
             return;
         }
         
-        events.slice(0, 5).forEach(event => {
-            const item = document.createElement('div');
-            item.className = 'event-item';
+        events.slice(0, 10).forEach(event => {
+            const row = document.createElement('tr');
             
             const date = new Date(event.date || Date.now());
-            const timeString = date.toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit' });
+            const dateString = date.toLocaleString('ru-RU', {
+                day: '2-digit', month: '2-digit', hour: '2-digit', minute: '2-digit'
+            });
             
             let icon = 'fa-exclamation-circle';
             let color = '#ffc107';
+            let priorityText = 'Средний';
             
             switch(event.priority) {
-                case 'high': icon = 'fa-exclamation-triangle'; color = '#dc3545'; break;
-                case 'medium': icon = 'fa-exclamation-circle'; color = '#ffc107'; break;
-                case 'low': icon = 'fa-info-circle'; color = '#17a2b8'; break;
+                case 'high': icon = 'fa-exclamation-triangle'; color = '#dc3545'; priorityText = 'Высокий'; break;
+                case 'medium': icon = 'fa-exclamation-circle'; color = '#ffc107'; priorityText = 'Средний'; break;
+                case 'low': icon = 'fa-info-circle'; color = '#17a2b8'; priorityText = 'Низкий'; break;
             }
             
-            item.innerHTML = `
-                <div style="display: flex; align-items: center; gap: 10px;">
-                    <i class="fas ${icon}" style="color: ${color};"></i>
-                    <div style="flex: 1;">
-                        <strong>${event.description || 'Событие'}</strong>
-                        <div style="font-size: 12px; color: #666;">${timeString}</div>
-                    </div>
-                    <button class="btn btn-sm btn-outline-primary resolve-btn" data-id="${event.id}">
+            row.innerHTML = `
+                <td>${dateString}</td>
+                <td>${event.typeLabel || event.type || ''}</td>
+                <td>${event.description || 'Событие'}</td>
+                <td><i class="fas ${icon}" style="color: ${color};"></i> ${priorityText}</td>
+                <td>${event.active === false ? 'Устранено' : 'Открыто'}</td>
+                <td>
+                    <button class="btn btn-sm btn-outline-primary resolve-event-btn" data-id="${event.id}">
                         Решить
                     </button>
-                </div>
+                    <button class="btn btn-sm btn-outline-secondary ignore-event-btn" data-id="${event.id}">
+                        Игнорировать
+                    </button>
+                </td>
             `;
             
-            container.appendChild(item);
+            tbody.appendChild(row);
+        });
+        
+        tbody.querySelectorAll('.resolve-event-btn').forEach(btn => {
+            btn.addEventListener('click', function() {
+                updateCriticalEvent(this.getAttribute('data-id'), 'resolve');
+            });
+        });
+        tbody.querySelectorAll('.ignore-event-btn').forEach(btn => {
+            btn.addEventListener('click', function() {
+                updateCriticalEvent(this.getAttribute('data-id'), 'ignore');
+            });
         });
     }
 }
 
+function updateCriticalEvent(eventId, action) {
+    try {
+        if (action === 'resolve') {
+            Database.resolveCriticalEvent(eventId);
+            showNotification('Событие отмечено как решённое', 'success');
+        } else {
+            Database.ignoreCriticalEvent(eventId);
+            showNotification('Событие скрыто', 'success');
+        }
+    } catch (e) {
+        showNotification(e.message || 'Не удалось обновить событие', 'error');
+    }
+    loadCriticalEvents();
+}
+
 // 12. Остальные функции (добавляем недостающие)
 function initializeCharts() {
     updateCharts();
@@ -2207,7 +2309,10 @@ function updateCharts() {
     // График динамики заказов
     const trendCtx = document.getElementById('ordersTrendChart');
     if (trendCtx) {
-        const orders = Database.getOrders();
+        // С архивом: при коротком ARCHIVE_KEEP_DAYS часть недели уже перенесена
+        const since = new Date();
+        since.setDate(since.getDate() - 7);
+        const orders = Database.getOrderHistory({ from: since.toISOString().slice(0, 10) });
         const last7Days = Array.from({length: 7}, (_, i) => {
             const d = new Date();
             d.setDate(d.getDate() - (6 - i));
@@ -2662,6 +2767,9 @@ function loadPurchaseRequests(status) {
         // Обновляем сводку
         updatePurchasesSummary(allRequests);
 
+        // Сводная закупка — только на вкладке ожидающих
+        renderPurchaseGroups(status === 'pending' ? Database.getPurchaseRequestGroups('pending') : []);
+
     } catch (error) {
         console.error('Ошибка загрузки заявок:', error);
         showNotification('Ошибка загрузки заявок: ' + error.message, 'error');
@@ -2887,6 +2995,77 @@ function updatePurchasesSummary(allRequests) {
     `;
 }
 
+// ---------- Сводная закупка ----------
+function renderPurchaseGroups(groups) {
+    const container = document.getElementById('purchase-groups-container');
+    const tbody = document.getElementById('purchase-groups-tbody');
+    if (!container || !tbody) return;
+
+    // Группа из одной заявки ничего не сводит — показываем только настоящие сводки
+    const merged = (groups || []).filter(g => g.requestCount > 1);
+    container.style.display = merged.length ? 'block' : 'none';
+    if (!merged.length) {
+        tbody.innerHTML = '';
+        return;
+    }
+
+    const urgencyLabels = {
+        high:   '<span style="color:#dc3545; font-weight:600;">Высокая</span>',
+        medium: '<span style="color:#fd7e14;">Средняя</span>',
+        low:    '<span style="color:#28a745;">Низкая</span>'
+    };
+
+    tbody.innerHTML = merged.map((g, i) => `
+        <tr style="border-bottom:1px solid #f0f0f0;">
+            <td style="padding:12px 16px; font-weight:600;">${g.productName}</td>
+            <td style="padding:12px 16px;">${g.supplier || '<span style="color:#999;">не указан</span>'}</td>
+            <td style="padding:12px 16px;">${g.totalQuantity} ${g.unit}</td>
+            <td style="padding:12px 16px;">${g.requestCount} / ${g.cookCount}</td>
+            <td style="padding:12px 16px;">${urgencyLabels[g.urgency] || g.urgency}</td>
+            <td style="padding:12px 16px; text-align:center; white-space:nowrap;">
+                <button class="btn btn-sm btn-success group-approve-btn" data-group="${i}" title="Одобрить группу">
+                    <i class="fas fa-check"></i>
+                </button>
+                <button class="btn btn-sm btn-danger group-reject-btn" data-group="${i}" title="Отклонить группу">
+                    <i class="fas fa-times"></i>
+                </button>
+            </td>
+        </tr>
+    `).join('');
+
+    tbody.querySelectorAll('.group-approve-btn, .group-reject-btn').forEach(btn => {
+        btn.addEventListener('click', function (e) {
+            e.preventDefault();
+            const group = merged[parseInt(this.getAttribute('data-group'))];
+            const approve = this.classList.contains('group-approve-btn');
+            updatePurchaseGroup(group, approve ? 'approved' : 'rejected');
+        });
+    });
+}
+
+function updatePurchaseGroup(group, status) {
+    const verb = status === 'approved' ? 'Одобрить' : 'Отклонить';
+    if (!confirm(`${verb} ${group.requestCount} заявок на «${group.productName}» (${group.totalQuantity} ${group.unit})?`)) return;
+
+    let notes = null;
+    if (status === 'rejected') {
+        notes = prompt('Причина отклонения:', '');
+        if (notes === null) return;
+    }
+
+    try {
+        const result = Database.bulkUpdatePurchaseRequests(group.requestIds, status, notes);
+        const done = result ? result.updated : 0;
+        showNotification(
+            status === 'approved' ? `Одобрено заявок: ${done}` : `Отклонено заявок: ${done}`,
+            'success'
+        );
+    } catch (e) {
+        showNotification(e.message || 'Не удалось обновить заявки', 'error');
+    }
+    loadPurchaseRequests('pending');
+}
+
 // ============================================================
 //  ОБРАБОТЧИКИ КНОПОК
 // ============================================================
@@ -599,6 +599,24 @@ class CookDashboard {
             });
         }
 
+        // Планирование недель
+        const copyWeekBtn = document.getElementById('copy-week-btn');
+        if (copyWeekBtn) {
+            copyWeekBtn.addEventListener('click', () => this.copyMenuWeek());
+        }
+        const applyTemplateBtn = document.getElementById('apply-template-btn');
+        if (applyTemplateBtn) {
+            applyTemplateBtn.addEventListener('click', () => this.applyMenuTemplate());
+        }
+        const saveTemplateBtn = document.getElementById('save-template-btn');
+        if (saveTemplateBtn) {
+            saveTemplateBtn.addEventListener('click', () => this.saveMenuTemplate());
+        }
+        const deleteTemplateBtn = document.getElementById('delete-template-btn');
+        if (deleteTemplateBtn) {
+            deleteTemplateBtn.addEventListener('click', () => this.deleteMenuTemplate());
+        }
+
         // Фильтр заказов
         const orderFilter = document.getElementById('order-type-filter');
         if (orderFilter) {
@@ -753,6 +771,7 @@ class CookDashboard {
                 break;
             case 'menu-management':
                 this.loadMenu();
+                this.loadMenuTemplates();
                 break;
             case 'orders':
                 this.loadOrders();
@@ -997,6 +1016,85 @@ class CookDashboard {
         this.initDishActions();
     }
 
+    // ===== Планирование недель =====
+
+    loadMenuTemplates() {
+        const select = document.getElementById('menu-template-select');
+        if (!select || typeof Database.getMenuTemplates !== 'function') return;
+        const templates = Database.getMenuTemplates();
+        select.innerHTML = templates.length
+            ? templates.map(t => `<option value="${t.id}">${t.name} (${t.itemCount} блюд)</option>`).join('')
+            : '<option value="">Шаблонов пока нет</option>';
+    }
+
+    getPlanWeeks() {
+        const weeks = parseInt(document.getElementById('plan-weeks')?.value, 10) || 1;
+        return Math.min(Math.max(weeks, 1), 52);
+    }
+
+    copyMenuWeek() {
+        const fromWeek = document.getElementById('plan-source-week')?.value;
+        const toWeek = document.getElementById('plan-target-week')?.value;
+        if (!fromWeek || !toWeek) {
+            showNotification('Выберите неделю-образец и неделю, куда копировать', 'error');
+            return;
+        }
+        try {
+            const created = Database.copyMenuWeek(fromWeek, toWeek, this.getPlanWeeks());
+            showNotification(`Скопировано блюд: ${created}`, 'success');
+            this.loadMenu();
+        } catch (err) {
+            showNotification(err.message, 'error');
+        }
+    }
+
+    applyMenuTemplate() {
+        const templateId = document.getElementById('menu-template-select')?.value;
+        const weekStart = document.getElementById('plan-target-week')?.value;
+        if (!templateId || !weekStart) {
+            showNotification('Выберите шаблон и неделю', 'error');
+            return;
+        }
+        try {
+            const created = Database.applyMenuTemplate(templateId, weekStart, this.getPlanWeeks());
+            showNotification(`Добавлено блюд из шаблона: ${created}`, 'success');
+            this.loadMenu();
+        } catch (err) {
+            showNotification(err.message, 'error');
+        }
+    }
+
+    saveMenuTemplate() {
+        const name = document.getElementById('new-template-name')?.value.trim();
+        const week = document.getElementById('plan-source-week')?.value;
+        if (!name || !week) {
+            showNotification('Укажите название шаблона и неделю-образец', 'error');
+            return;
+        }
+        try {
+            const template = Database.saveMenuTemplate(name, week);
+            if (template) {
+                showNotification(`Шаблон «${template.name}» сохранён (${template.itemCount} блюд)`, 'success');
+                document.getElementById('new-template-name').value = '';
+                this.loadMenuTemplates();
+            }
+        } catch (err) {
+            showNotification(err.message, 'error');
+        }
+    }
+
+    deleteMenuTemplate() {
+        const select = document.getElementById('menu-template-select');
+        if (!select || !select.value) return;
+        if (!confirm('Удалить выбранный шаблон?')) return;
+        try {
+            Database.deleteMenuTemplate(select.value);
+            this.loadMenuTemplates();
+        } catch (err) {
+            showNotification(err.message, 'error');
+        }
+    }
+
     createDishCard(dish) {
         return `
             <div class="food-card">
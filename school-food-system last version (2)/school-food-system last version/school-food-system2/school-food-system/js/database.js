@@ -6,8 +6,11 @@
     // Конфигурация
     // ================================================================
 
+    // Страницы школы открываются как /s/<школа>/admin.html — её API на том же префиксе
+    const TENANT_PREFIX = (window.location.pathname.match(/^\/s\/[a-z0-9-]+(?=\/)/) || [''])[0];
+
     /** @type {string} Базовый путь API */
-    const API_BASE = '/api';
+    const API_BASE = TENANT_PREFIX + '/api';
 
     // ================================================================
     // Внутренние утилиты
@@ -29,6 +32,13 @@
         xhr.open(method, API_BASE + path, false); // синхронный запрос
         xhr.setRequestHeader('Content-Type', 'application/json;charset=UTF-8');
 
+        // Сессий на сервере нет: передаём id вошедшего пользователя,
+        // по нему backend проверяет доступ к административным эндпоинтам.
+        const currentUser = getCurrentUserSafe();
+        if (currentUser && currentUser.id !== undefined && currentUser.id !== null) {
+            xhr.setRequestHeader('X-User-Id', String(currentUser.id));
+        }
+
         try {
             xhr.send(body !== undefined ? JSON.stringify(body) : null);
         } catch (err) {
@@ -127,6 +137,119 @@
         return texts[status] || status;
     }
 
+    // ================================================================
+    // Локальная копия таблиц (дельта-синхронизация, GET /api/sync)
+    // ================================================================
+
+    /**
+     * Порядок строк, в котором их отдают списочные эндпоинты.
+     */
+    function newestFirst(a, b) {
+        if (a.createdAt !== b.createdAt) return a.createdAt < b.createdAt ? 1 : -1;
+        return b.id - a.id;
+    }
+
+    const SYNC_ORDER = {
+        users: function (a, b) { return a.id - b.id; },
+        menu: function (a, b) {
+            if (a.date !== b.date) return a.date < b.date ? 1 : -1;
+            return a.id - b.id;
+        },
+        orders: newestFirst,
+        inventory: function (a, b) {
+            const c = String(a.name || '').toLowerCase().localeCompare(String(b.name || '').toLowerCase());
+            return c || (a.id - b.id);
+        },
+        purchase_requests: newestFirst,
+        reviews: newestFirst
+    };
+
+    /**
+     * Копии таблиц: { таблица: { version, rows: { id: строка } } }.
+     * У каждой таблицы своя версия, поэтому запрос одной таблицы
+     * не тянет изменения остальных.
+     */
+    let syncMirror = {};
+
+    /**
+     * Догоняет копию таблицы до сервера: в первый раз (или после reset)
+     * приходит вся таблица, дальше — только изменённые и удалённые строки.
+     *
+     * @param {string} table — имя таблицы API (users, menu, orders, ...)
+     * @returns {Object|null} — запись syncMirror или null при ошибке
+     */
+    function syncTable(table) {
+        let entry = syncMirror[table] || null;
+        let more = true;
+        while (more) {
+            const qs = buildQueryString({ tables: table, since: entry ? entry.version : null });
+            const res = apiRequest('GET', '/sync' + qs);
+            if (!res || !res.ok || !res.changes || !res.changes[table]) return null;
+
+            const delta = res.changes[table];
+            if (res.reset || !entry) entry = { version: 0, rows: {} };
+            delta.rows.forEach(function (row) { entry.rows[row.id] = row; });
+            delta.deletes.forEach(function (id) { delete entry.rows[id]; });
+            entry.version = res.version;
+            syncMirror[table] = entry;
+            more = !!res.hasMore;
+        }
+        return entry;
+    }
+
+    /**
+     * Строки таблицы из локальной копии (после синхронизации)
+     * в порядке списочного эндпоинта.
+     *
+     * @param {string} table
+     * @returns {Array<Object>|null} — копии строк или null, если синхронизация не удалась
+     */
+    function mirroredRows(table) {
+        const entry = syncTable(table);
+        if (!entry) return null;
+        return Object.keys(entry.rows)
+            .map(function (id) { return Object.assign({}, entry.rows[id]); })
+            .sort(SYNC_ORDER[table]);
+    }
+
+    // ================================================================
+    // Тепловая карта охвата питанием (GET /api/analytics/coverage)
+    // ================================================================
+
+    /**
+     * Таблица «класс × неделя» с долей учеников, которые питались.
+     *
+     * @param {Array<Object>} rows — строки coverage с groupBy=class,week
+     * @returns {string} — HTML
+     */
+    function coverageHeatmapHtml(rows) {
+        const classes = [];
+        const weeks = [];
+        const cells = {};
+        rows.forEach(function (r) {
+            if (classes.indexOf(r.class) === -1) classes.push(r.class);
+            if (weeks.indexOf(r.week) === -1) weeks.push(r.week);
+            cells[r.class + '|' + r.week] = r;
+        });
+        classes.sort();
+        weeks.sort();
+
+        const head = weeks.map(function (w) {
+            return '<th title="' + w + '">' + w.slice(8, 10) + '.' + w.slice(5, 7) + '</th>';
+        }).join('');
+        const body = classes.map(function (c) {
+            return '<tr><th>' + (c || '—') + '</th>' + weeks.map(function (w) {
+                const cell = cells[c + '|' + w];
+                if (!cell || cell.dailyCoverage === null) return '<td></td>';
+                const pct = Math.round(cell.dailyCoverage * 100);
+                return '<td title="' + cell.students + ' из ' + cell.classSize + '" ' +
+                    'style="background: hsl(' + Math.round(pct * 1.2) + ', 70%, 80%); text-align: center;">' + pct + '</td>';
+            }).join('') + '</tr>';
+        }).join('');
+        return '<div style="overflow-x: auto;"><table class="table" style="font-size: 12px;">' +
+            '<thead><tr><th>Класс</th>' + head + '</tr></thead><tbody>' + body + '</tbody></table></div>';
+    }
+
     // ================================================================
     // Объект Database — единый публичный API
     // ================================================================
@@ -195,6 +318,10 @@
          */
         getUsers: function (role) {
             if (role === undefined) role = null;
+            if (role === null) {
+                const rows = mirroredRows('users');
+                if (rows) return rows;
+            }
             const qs = buildQueryString({ role });
             const res = apiRequest('GET', '/users' + qs);
             return (res && res.ok && Array.isArray(res.users)) ? res.users : [];
@@ -407,13 +534,17 @@
         // ============================================================
 
         /**
-         * Возвращает последние действия пользователя.
+         * Возвращает последние действия пользователя (новые первыми).
+         * Следующая страница: before = id последнего элемента.
          *
-         * @param {string|number} userId — идентификатор
+         * @param {string|number} userId   — идентификатор
+         * @param {string}        [before] — id последнего действия предыдущей страницы
+         * @param {number}        [limit]  — размер страницы (по умолчанию 50)
          * @returns {Array<Object>}
          */
-        getUserActivity: function (userId) {
-            var res = apiRequest('GET', '/users/' + encodeURIComponent(userId) + '/activity');
+        getUserActivity: function (userId, before, limit) {
+            var qs = buildQueryString({ before: before, limit: limit });
+            var res = apiRequest('GET', '/users/' + encodeURIComponent(userId) + '/activity' + qs);
             if (res && res.ok && Array.isArray(res.activities)) {
                 return res.activities;
             }
@@ -453,11 +584,30 @@
         getMenu: function (date, type) {
             if (date === undefined) date = null;
             if (type === undefined) type = null;
+            if (date === null && type === null) {
+                var rows = mirroredRows('menu');
+                if (rows) return rows;
+            }
             var qs = buildQueryString({ date: date, type: type });
             var res = apiRequest('GET', '/menu' + qs);
             return (res && res.ok && Array.isArray(res.menu)) ? res.menu : [];
         },
 
+        /**
+         * Меню, проверенное сервером на аллергии ученика: у каждого блюда
+         * есть allergyConflict и conflictAllergens.
+         *
+         * @param {string|number} studentId — ID ученика
+         * @param {string|null}   [date]    — фильтр по дате (YYYY-MM-DD)
+         * @param {boolean}       [safeOnly] — только блюда без его аллергенов
+         * @returns {Array<Object>}
+         */
+        getMenuForStudent: function (studentId, date, safeOnly) {
+            var qs = buildQueryString({ studentId: studentId, date: date, safeOnly: safeOnly ? 1 : null });
+            var res = apiRequest('GET', '/menu' + qs);
+            return (res && res.ok && Array.isArray(res.menu)) ? res.menu : [];
+        },
+
         /**
          * Добавляет новое блюдо в меню.
          *
@@ -514,6 +664,108 @@
             return null;
         },
 
+        /**
+         * Меню за период (неделя, месяц) одним запросом.
+         *
+         * @param {string}      from   — первая дата (YYYY-MM-DD)
+         * @param {string}      to     — последняя дата (YYYY-MM-DD)
+         * @param {string|null} [type] — breakfast | lunch
+         * @returns {Array<Object>}
+         */
+        getMenuRange: function (from, to, type) {
+            var qs = buildQueryString({ from: from, to: to, type: type });
+            var res = apiRequest('GET', '/menu' + qs);
+            return (res && res.ok && Array.isArray(res.menu)) ? res.menu : [];
+        },
+
+        /**
+         * Добавляет много блюд одной транзакцией.
+         *
+         * @param {Array<Object>} items — блюда в формате addMenuItem (с date)
+         * @returns {Array<Object>} — созданные блюда
+         * @throws {Error}
+         */
+        addMenuItems: function (items) {
+            var res = apiRequest('POST', '/menu/bulk', { items: items });
+            if (res && res.ok) return res.items;
+            if (res && res.error) throw new Error(res.error);
+            return [];
+        },
+
+        /**
+         * Копирует меню недели на другую неделю (и на weeks недель подряд).
+         * Недели задаются любой своей датой; целевые недели должны быть пустыми.
+         *
+         * @param {string} fromWeek
+         * @param {string} toWeek
+         * @param {number} [weeks=1]
+         * @returns {number} — сколько блюд создано
+         * @throws {Error}
+         */
+        copyMenuWeek: function (fromWeek, toWeek, weeks) {
+            var res = apiRequest('POST', '/menu/copy', { fromWeek: fromWeek, toWeek: toWeek, weeks: weeks || 1 });
+            if (res && res.ok) return res.created;
+            if (res && res.error) throw new Error(res.error);
+            return 0;
+        },
+
+        /**
+         * Список шаблонов меню.
+         *
+         * @returns {Array<Object>} — { id, name, description, itemCount }
+         */
+        getMenuTemplates: function () {
+            var res = apiRequest('GET', '/menu/templates');
+            return (res && res.ok && Array.isArray(res.templates)) ? res.templates : [];
+        },
+
+        /**
+         * Сохраняет меню недели как шаблон.
+         *
+         * @param {string} name
+         * @param {string} week — любая дата недели
+         * @param {string} [description]
+         * @returns {Object|null}
+         * @throws {Error}
+         */
+        saveMenuTemplate: function (name, week, description) {
+            var res = apiRequest('POST', '/menu/templates', { name: name, fromWeek: week, description: description });
+            if (res && res.ok) return res.template;
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        /**
+         * Создаёт блюда шаблона на неделе weekStart (и weeks недель подряд).
+         *
+         * @param {string|number} templateId
+         * @param {string}        weekStart — любая дата недели
+         * @param {number}        [weeks=1]
+         * @returns {number} — сколько блюд создано
+         * @throws {Error}
+         */
+        applyMenuTemplate: function (templateId, weekStart, weeks) {
+            var res = apiRequest('POST', '/menu/templates/' + encodeURIComponent(templateId) + '/apply',
+                { weekStart: weekStart, weeks: weeks || 1 });
+            if (res && res.ok) return res.created;
+            if (res && res.error) throw new Error(res.error);
+            return 0;
+        },
+
+        /**
+         * Удаляет шаблон меню.
+         *
+         * @param {string|number} templateId
+         * @returns {boolean}
+         * @throws {Error}
+         */
+        deleteMenuTemplate: function (templateId) {
+            var res = apiRequest('DELETE', '/menu/templates/' + encodeURIComponent(templateId));
+            if (res && res.ok) return true;
+            if (res && res.error) throw new Error(res.error);
+            return false;
+        },
+
         // ============================================================
         // Инвентарь (склад)
         // ============================================================
@@ -528,6 +780,10 @@
         getInventory: function (status, q) {
             if (status === undefined) status = null;
             if (q === undefined) q = null;
+            if (status === null && q === null) {
+                var rows = mirroredRows('inventory');
+                if (rows) return rows;
+            }
             var qs = buildQueryString({ status: status, q: q });
             var res = apiRequest('GET', '/inventory' + qs);
             return (res && res.ok && Array.isArray(res.inventory)) ? res.inventory : [];
@@ -576,6 +832,71 @@
             return false;
         },
 
+        /**
+         * Движения по позиции склада, постранично (новые первыми).
+         *
+         * @param {string|number} itemId   — ID позиции
+         * @param {number|null}   [before] — nextBefore предыдущей страницы
+         * @param {number}        [limit]  — размер страницы (по умолчанию 50)
+         * @returns {Object} — { movements, nextBefore }
+         */
+        getStockMovements: function (itemId, before, limit) {
+            var qs = buildQueryString({ before: before, limit: limit });
+            var res = apiRequest('GET', '/inventory/' + encodeURIComponent(itemId) + '/movements' + qs);
+            if (res && res.ok) return { movements: res.movements || [], nextBefore: res.nextBefore };
+            return { movements: [], nextBefore: null };
+        },
+
+        /**
+         * Поступление, списание или корректировка остатка.
+         *
+         * @param {string|number} itemId — ID позиции
+         * @param {number}        delta  — изменение (поступление > 0, списание < 0)
+         * @param {string}        [reason='restock'] — 'restock' | 'waste' | 'adjustment'
+         * @param {string}        [note] — комментарий
+         * @returns {Object|null} — обновлённая позиция
+         * @throws {Error}
+         */
+        addStockMovement: function (itemId, delta, reason, note) {
+            var res = apiRequest('POST', '/inventory/' + encodeURIComponent(itemId) + '/movements', {
+                delta: delta,
+                reason: reason || 'restock',
+                note: note
+            });
+            if (res && res.ok) return res.item;
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        /**
+         * Рецептура блюда: расход продуктов со склада на одну порцию.
+         *
+         * @param {string|number} menuItemId — ID блюда
+         * @returns {Array<Object>} — [{ inventoryId, productName, quantity, unit }]
+         */
+        getRecipe: function (menuItemId) {
+            var res = apiRequest('GET', '/menu/' + encodeURIComponent(menuItemId) + '/recipe');
+            if (res && res.ok && Array.isArray(res.ingredients)) return res.ingredients;
+            return [];
+        },
+
+        /**
+         * Заменяет рецептуру блюда.
+         *
+         * @param {string|number} menuItemId  — ID блюда
+         * @param {Array<Object>} ingredients — [{ inventoryId, quantity }]
+         * @returns {Array<Object>|null}
+         * @throws {Error}
+         */
+        setRecipe: function (menuItemId, ingredients) {
+            var res = apiRequest('PUT', '/menu/' + encodeURIComponent(menuItemId) + '/recipe', {
+                ingredients: ingredients
+            });
+            if (res && res.ok) return res.ingredients;
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
         // ============================================================
         // Заказы
         // ============================================================
@@ -592,11 +913,29 @@
             if (studentId === undefined) studentId = null;
             if (status === undefined) status = null;
             if (date === undefined) date = null;
+            if (studentId === null && status === null && date === null) {
+                var rows = mirroredRows('orders');
+                if (rows) return rows;
+            }
             var qs = buildQueryString({ studentId: studentId, status: status, date: date });
             var res = apiRequest('GET', '/orders' + qs);
             return (res && res.ok && Array.isArray(res.orders)) ? res.orders : [];
         },
 
+        /**
+         * Заказы вместе с архивом прошлых учебных лет (getOrders видит
+         * только заказы последних месяцев). Без дат читает весь архив.
+         *
+         * @param {Object} [filters] — { studentId, status, from, to } (даты YYYY-MM-DD)
+         * @returns {Array<Object>}
+         */
+        getOrderHistory: function (filters) {
+            var f = filters || {};
+            var qs = buildQueryString({ studentId: f.studentId, status: f.status, from: f.from, to: f.to, history: 1 });
+            var res = apiRequest('GET', '/orders' + qs);
+            return (res && res.ok && Array.isArray(res.orders)) ? res.orders : [];
+        },
+
         /**
          * Алиас: получить заказы пользователя (совместимость с student.js).
          *
@@ -632,6 +971,22 @@
             return null;
         },
 
+        /**
+         * Заказывает одно блюдо целому классу или списку учеников
+         * (только администратор). Ученики с аллергией на блюдо, уже
+         * заказавшие его на эту дату или без денег на балансе пропускаются.
+         *
+         * @param {Object} data — { className | studentIds, menuId, date?, charge? (по умолчанию true) }
+         * @returns {Object|null} — { created, skipped, totalCharged, results: [{ studentId, name, status, orderId? }] }
+         * @throws {Error}
+         */
+        placeClassOrder: function (data) {
+            var res = apiRequest('POST', '/orders/batch', data);
+            if (res && res.ok) return res;
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
         /**
          * Обновляет заказ.
          *
@@ -647,6 +1002,220 @@
             return null;
         },
 
+        /**
+         * Переводит пачку заказов в один статус одной транзакцией
+         * (при 'preparing'/'received' продукты списываются со склада по рецептурам).
+         *
+         * @param {Array<string|number>} orderIds — ID заказов
+         * @param {string}               status   — новый статус
+         * @returns {Object|null} — { updated, stock }
+         * @throws {Error}
+         */
+        updateOrdersStatus: function (orderIds, status) {
+            var res = apiRequest('POST', '/orders/status', { orderIds: orderIds, status: status });
+            if (res && res.ok) return { updated: res.updated, stock: res.stock };
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        // ============================================================
+        // Отзывы
+        // ============================================================
+
+        /**
+         * Возвращает отзывы (новые первыми) с опциональными фильтрами.
+         *
+         * @param {string|number|null} [studentId]  — ID ученика
+         * @param {string|number|null} [menuItemId] — ID блюда
+         * @returns {Array<Object>}
+         */
+        getReviews: function (studentId, menuItemId) {
+            if (studentId == null && menuItemId == null) {
+                var rows = mirroredRows('reviews');
+                if (rows) return rows;
+            }
+            var qs = buildQueryString({ studentId: studentId, menuItemId: menuItemId });
+            var res = apiRequest('GET', '/reviews' + qs);
+            return (res && res.ok && Array.isArray(res.reviews)) ? res.reviews : [];
+        },
+
+        /**
+         * Добавляет отзыв.
+         *
+         * @param {Object} review — { userId, dishId, rating (1–5), text }
+         * @returns {Object|null}
+         * @throws {Error}
+         */
+        addReview: function (review) {
+            var res = apiRequest('POST', '/reviews', review);
+            if (res && res.ok) return res.review;
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        /**
+         * Удаляет отзыв.
+         *
+         * @param {string|number} reviewId — идентификатор отзыва
+         * @returns {boolean}
+         */
+        deleteReview: function (reviewId) {
+            var res = apiRequest('DELETE', '/reviews/' + encodeURIComponent(reviewId));
+            return !!(res && res.ok);
+        },
+
+        /**
+         * Рейтинг блюда: средняя оценка, число отзывов и распределение оценок.
+         *
+         * @param {string|number} menuItemId — ID блюда
+         * @returns {Object|null} — { rating, reviewCount, histogram }
+         */
+        getDishRating: function (menuItemId) {
+            var res = apiRequest('GET', '/menu/' + encodeURIComponent(menuItemId) + '/rating');
+            return (res && res.ok) ? res : null;
+        },
+
+        // ============================================================
+        // Платежи и баланс
+        // ============================================================
+
+        /**
+         * Проводит операцию по балансу. Повтор с тем же transactionId
+         * не меняет баланс повторно (сервер вернёт первую операцию).
+         *
+         * @param {Object} data — { userId, amount, type: credit|debit, method?, transactionId?, description?, orderId? }
+         * @returns {Object|null} — { payment, balance, duplicate }
+         * @throws {Error}
+         */
+        addPayment: function (data) {
+            var res = apiRequest('POST', '/payments', data);
+            if (res && res.ok) return { payment: res.payment, balance: res.balance, duplicate: res.duplicate };
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        /**
+         * Пополняет баланс.
+         *
+         * @param {string|number} userId        — ID пользователя
+         * @param {number}        amount        — сумма
+         * @param {string}        [method]      — card | sbp | cash | transfer
+         * @param {string}        [transactionId] — ключ идемпотентности
+         * @returns {Object|null}
+         * @throws {Error}
+         */
+        topUpBalance: function (userId, amount, method, transactionId) {
+            return this.addPayment({
+                userId: userId, amount: amount, type: 'credit',
+                method: method || 'card', transactionId: transactionId
+            });
+        },
+
+        /**
+         * Списывает с баланса (сервер проверяет, что средств достаточно).
+         *
+         * @param {string|number} userId        — ID пользователя
+         * @param {number}        amount        — сумма
+         * @param {string}        transactionId — ключ идемпотентности (напр. 'order-15')
+         * @param {string}        [description] — назначение платежа
+         * @returns {Object|null}
+         * @throws {Error}
+         */
+        chargeBalance: function (userId, amount, transactionId, description) {
+            return this.addPayment({
+                userId: userId, amount: amount, type: 'debit',
+                transactionId: transactionId, description: description
+            });
+        },
+
+        /**
+         * Возвращает списание на баланс. Если списания не было — null.
+         *
+         * @param {string} transactionId — ключ исходного списания
+         * @returns {Object|null} — { payment, balance, duplicate }
+         */
+        refundPayment: function (transactionId) {
+            var res = apiRequest('POST', '/payments/' + encodeURIComponent(transactionId) + '/refund');
+            if (res && res.ok) return { payment: res.payment, balance: res.balance, duplicate: res.duplicate };
+            return null;
+        },
+
+        /**
+         * Выписка по балансу, постранично (новые операции первыми).
+         *
+         * @param {string|number} userId   — ID пользователя
+         * @param {number|null}   [before] — nextBefore предыдущей страницы
+         * @param {number}        [limit]  — размер страницы (по умолчанию 50)
+         * @returns {Object} — { balance, entries, nextBefore }
+         */
+        getStatement: function (userId, before, limit) {
+            var qs = buildQueryString({ before: before, limit: limit });
+            var res = apiRequest('GET', '/users/' + encodeURIComponent(userId) + '/statement' + qs);
+            if (res && res.ok) return { balance: res.balance, entries: res.entries || [], nextBefore: res.nextBefore };
+            return { balance: null, entries: [], nextBefore: null };
+        },
+
+        // ============================================================
+        // Абонементы
+        // ============================================================
+
+        /**
+         * Возвращает абонементы ученика.
+         *
+         * @param {string|number} studentId — ID ученика
+         * @param {string|null}   [status]  — active | expired | cancelled
+         * @returns {Array<Object>}
+         */
+        getSubscriptions: function (studentId, status) {
+            if (status === undefined) status = null;
+            var qs = buildQueryString({ studentId: studentId, status: status });
+            var res = apiRequest('GET', '/subscriptions' + qs);
+            return (res && res.ok && Array.isArray(res.subscriptions)) ? res.subscriptions : [];
+        },
+
+        /**
+         * Покупает абонемент: стоимость списывается с баланса на сервере.
+         *
+         * @param {Object} data — { studentId, planType: breakfast|lunch|full, days, price, startDate? }
+         * @returns {Object|null} — { subscription, balance }
+         * @throws {Error}
+         */
+        createSubscription: function (data) {
+            var res = apiRequest('POST', '/subscriptions', data);
+            if (res && res.ok) return { subscription: res.subscription, balance: res.balance };
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        /**
+         * Продлевает абонемент (по умолчанию на тот же срок и за ту же цену).
+         *
+         * @param {string|number} id   — идентификатор абонемента
+         * @param {Object}        [data] — { days?, price? }
+         * @returns {Object|null} — { subscription, balance }
+         * @throws {Error}
+         */
+        renewSubscription: function (id, data) {
+            var res = apiRequest('POST', '/subscriptions/' + encodeURIComponent(id) + '/renew', data || {});
+            if (res && res.ok) return { subscription: res.subscription, balance: res.balance };
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        /**
+         * Отменяет абонемент (будущие заказы по нему отменяются).
+         *
+         * @param {string|number} id — идентификатор абонемента
+         * @returns {Object|null}
+         * @throws {Error}
+         */
+        cancelSubscription: function (id) {
+            var res = apiRequest('POST', '/subscriptions/' + encodeURIComponent(id) + '/cancel');
+            if (res && res.ok) return res.subscription;
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
         // ============================================================
         // Заявки на закупку
         // ============================================================
@@ -670,6 +1239,8 @@
          * @returns {Array<Object>}
          */
         getAllPurchaseRequests: function () {
+            var rows = mirroredRows('purchase_requests');
+            if (rows) return rows;
             var res = apiRequest('GET', '/purchase_requests');
             return (res && res.ok && Array.isArray(res.requests)) ? res.requests : [];
         },
@@ -770,6 +1341,58 @@
             return this.updatePurchaseRequest(id, updates);
         },
 
+        /**
+         * Сводная закупка: заявки, сгруппированные по продукту, единице
+         * измерения и поставщику (из склада).
+         *
+         * @param {string} [status] — статус заявок (по умолчанию 'pending')
+         * @returns {Array} — [{ productName, unit, supplier, totalQuantity, requestCount,
+         *                       cookCount, urgency, oldestAt, requestIds }]
+         */
+        getPurchaseRequestGroups: function (status) {
+            var qs = buildQueryString({ status: status });
+            var res = apiRequest('GET', '/purchase_requests/groups' + qs);
+            return (res && res.ok) ? (res.groups || []) : [];
+        },
+
+        /**
+         * Меняет статус сразу нескольких заявок (например, целой группы)
+         * одной транзакцией; каждый повар получает одно уведомление.
+         *
+         * @param {Array}  ids      — идентификаторы заявок
+         * @param {string} status   — 'approved' | 'rejected' | 'completed'
+         * @param {string} [notes]  — комментарий администратора
+         * @returns {Object|null} — { updated, skipped }
+         * @throws {Error}
+         */
+        bulkUpdatePurchaseRequests: function (ids, status, notes) {
+            var res = apiRequest('POST', '/purchase_requests/bulk', {
+                requestIds: ids,
+                status:     status,
+                adminNotes: notes || null
+            });
+            if (res && res.ok) return { updated: res.updated, skipped: res.skipped };
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        // ============================================================
+        // Прогноз спроса
+        // ============================================================
+
+        /**
+         * Прогноз порций по блюдам меню и потребности в продуктах.
+         *
+         * @param {string} [start] — первый день прогноза YYYY-MM-DD (по умолчанию сегодня)
+         * @param {number} [days]  — число дней (по умолчанию 7)
+         * @returns {Object|null} — { closedThrough, start, end, dishes, ingredients }
+         */
+        getForecast: function (start, days) {
+            var qs = buildQueryString({ start: start, days: days });
+            var res = apiRequest('GET', '/forecast' + qs);
+            return (res && res.ok) ? res.forecast : null;
+        },
+
         // ============================================================
         // Уведомления
         // ============================================================
@@ -835,12 +1458,16 @@
         // ============================================================
 
         /**
-         * Возвращает список критических событий.
+         * Возвращает список критических событий
+         * (по умолчанию открытые: сначала высокий приоритет, затем новые).
          *
+         * @param {string} [status] — 'open' | 'resolved' | 'ignored' | 'all'
+         * @param {number} [limit]  — максимум событий (по умолчанию 50)
          * @returns {Array<Object>}
          */
-        getCriticalEvents: function () {
-            var res = apiRequest('GET', '/critical_events');
+        getCriticalEvents: function (status, limit) {
+            var qs = buildQueryString({ status: status, limit: limit });
+            var res = apiRequest('GET', '/critical_events' + qs);
             if (res && res.ok && Array.isArray(res.events)) {
                 return res.events;
             }
@@ -927,6 +1554,64 @@
             return (res && res.ok) ? res.statistics : null;
         },
 
+        // ============================================================
+        // Аналитика питания
+        // ============================================================
+
+        /**
+         * Заказы, порции и калории в разрезе groupBy
+         * (date, week, month, class, mealType, status, menuId).
+         *
+         * @param {Object} params — { from, to, groupBy, class, mealType, status, menuId } (списки — через запятую)
+         * @returns {Array<Object>|null}
+         */
+        getMealAnalytics: function (params) {
+            var res = apiRequest('GET', '/analytics/meals' + buildQueryString(params || {}));
+            if (res && res.ok) return res.rows;
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        /**
+         * Охват питанием: сколько учеников питалось, в разрезе groupBy
+         * (date, week, month, class) и относительно размера класса.
+         *
+         * @param {Object} params — { from, to, groupBy, class, mealType }
+         * @returns {Array<Object>|null}
+         */
+        getMealCoverage: function (params) {
+            var res = apiRequest('GET', '/analytics/coverage' + buildQueryString(params || {}));
+            if (res && res.ok) return res.rows;
+            if (res && res.error) throw new Error(res.error);
+            return null;
+        },
+
+        /**
+         * Питание и калории ученика по неделям (по умолчанию — последние 8 недель).
+         *
+         * @param {string|number} studentId
+         * @param {string}        [from] — YYYY-MM-DD
+         * @param {string}        [to]   — YYYY-MM-DD
+         * @returns {Array<Object>} — { week, days, breakfasts, lunches, calories, avgDailyCalories }
+         */
+        getStudentCalories: function (studentId, from, to) {
+            var qs = buildQueryString({ from: from, to: to });
+            var res = apiRequest('GET', '/users/' + encodeURIComponent(studentId) + '/calories' + qs);
+            return (res && res.ok) ? res.weeks : [];
+        },
+
+        /**
+         * Сводка по всем школам района (только администратор)
+         * @param {string} [from] - YYYY-MM-DD
+         * @param {string} [to] - YYYY-MM-DD
+         * @returns {Object|null} { from, to, schools: [...], totals }
+         */
+        getDistrictSummary: function (from, to) {
+            var qs = buildQueryString({ from: from, to: to });
+            var res = apiRequest('GET', '/district/summary' + qs);
+            return (res && res.ok) ? res : null;
+        },
+
         // ============================================================
         // Отчёты
         // ============================================================
@@ -955,7 +1640,9 @@
             var start = new Date(startDate);
             var end   = new Date(endDate);
 
-            var orders = this.getOrders(null, null, null).filter(function (o) {
+            // Вместе с архивом: период может быть старше заказов горячей таблицы.
+            // Без `to`: ниже отбор по дате создания, а заказ бывает на более поздний день.
+            var orders = this.getOrderHistory({ from: String(startDate).slice(0, 10) }).filter(function (o) {
                 var d = new Date(o.createdAt || o.date);
                 return d >= start && d <= end;
             });
@@ -1030,8 +1717,42 @@
 
             var periodStr = start.toLocaleDateString('ru-RU') + ' \u2014 ' + end.toLocaleDateString('ru-RU');
 
+            if (type === 'meals') {
+                // Охват и заказы — из серверных агрегатов, тепловая карта — одним запросом
+                var range = { from: String(startDate).slice(0, 10), to: String(endDate).slice(0, 10) };
+                var total = this.getMealCoverage(range);
+                var served = this.getMealAnalytics(Object.assign({ status: 'pending,paid,preparing,ready,received' }, range));
+                var heatmap = this.getMealCoverage(Object.assign({ groupBy: 'class,week' }, range));
+                if (total && served && heatmap) {
+                    var t = total[0];
+                    var ordersCount = served[0].orders;
+                    var perStudent = t.classSize > 0 ? (ordersCount / t.classSize).toFixed(1) : '0';
+                    var pct = t.coverage !== null ? Math.round(t.coverage * 100) : 0;
+                    return {
+                        title: 'Отчет по питанию',
+                        period: periodStr,
+                        summary:
+                            '<p><strong>Всего учеников:</strong> ' + t.classSize + '</p>' +
+                            '<p><strong>Заказывали питание:</strong> ' + t.students + '</p>' +
+                            '<p><strong>Охват питанием:</strong> ' + pct + '%</p>' +
+                            '<p><strong>Среднее кол-во заказов на ученика:</strong> ' + perStudent + '</p>' +
+                            '<p><strong>Средний дневной охват по классам и неделям, %:</strong></p>' +
+                            coverageHeatmapHtml(heatmap),
+                        data: {
+                            totalStudents:           t.classSize,
+                            studentsWithOrders:      t.students,
+                            coveragePercentage:      pct,
+                            totalOrders:             ordersCount,
+                            averageOrdersPerStudent: perStudent,
+                            calories:                served[0].calories
+                        }
+                    };
+                }
+            }
+
             // Общие данные для всех типов
-            var allOrders = this.getOrders(null, null, null).filter(function (o) {
+            // Вместе с архивом, как и в generateReport
+            var allOrders = this.getOrderHistory({ from: String(startDate).slice(0, 10) }).filter(function (o) {
                 var d = new Date(o.createdAt || o.date);
                 return d >= start && d <= end;
             });
@@ -1168,6 +1889,34 @@
             }
         },
 
+        // ============================================================
+        // Синхронизация
+        // ============================================================
+
+        /**
+         * Подтягивает изменения в локальные копии таблиц.
+         * Списки без фильтров (getUsers(), getMenu(), getOrders(), ...)
+         * делают это сами; вызов нужен, чтобы обновить копии заранее.
+         *
+         * @param {Array<string>} [tables] — по умолчанию все таблицы
+         * @returns {Object} — { таблица: версия или null при ошибке }
+         */
+        sync: function (tables) {
+            var result = {};
+            (tables || Object.keys(SYNC_ORDER)).forEach(function (table) {
+                var entry = syncTable(table);
+                result[table] = entry ? entry.version : null;
+            });
+            return result;
+        },
+
+        /**
+         * Сбрасывает локальные копии: следующий список загрузится целиком.
+         */
+        resetSync: function () {
+            syncMirror = {};
+        },
+
         // ============================================================
         // Утилиты
         // ============================================================
@@ -384,11 +384,18 @@ function toggleAllergiesSection() {
 // ========== МЕНЮ (с учётом аллергенов) ===============================
 // =====================================================================
 
+/** Блюда последнего загруженного меню по id (с отметками об аллергенах). */
+var loadedMenuItems = {};
+
 function loadMenu(date) {
     var menuDate = date || new Date().toISOString().split('T')[0];
     var dateInput = document.getElementById('menu-date');
     if (dateInput) dateInput.value = menuDate;
-    var menu = Database.getMenu(menuDate);
+    // Конфликты с аллергиями ученика сервер отмечает сам (allergyConflict)
+    var user = JSON.parse(sessionStorage.getItem('currentUser'));
+    var menu = user ? Database.getMenuForStudent(user.id, menuDate) : Database.getMenu(menuDate);
+    loadedMenuItems = {};
+    menu.forEach(function (item) { loadedMenuItems[item.id] = item; });
     var breakfasts = menu.filter(function (item) { return item.type === 'breakfast'; });
     var lunches    = menu.filter(function (item) { return item.type === 'lunch'; });
     var breakfastContainer = document.getElementById('breakfast-menu');
@@ -432,20 +439,9 @@ function filterMenu(type) {
 }
 
 function createMenuItem(menuItem) {
-    var user = JSON.parse(sessionStorage.getItem('currentUser'));
-    var userAllergies = user ? (user.allergies || []) : [];
     var menuAllergens = menuItem.allergens || [];
-    var matchedAllergens = [];
-    var hasAllergy = userAllergies.some(function (allergy) {
-        return menuAllergens.some(function (menuAllergy) {
-            var match = menuAllergy.toLowerCase().indexOf(allergy.toLowerCase()) !== -1 ||
-                        allergy.toLowerCase().indexOf(menuAllergy.toLowerCase()) !== -1;
-            if (match && matchedAllergens.indexOf(menuAllergy) === -1) {
-                matchedAllergens.push(menuAllergy);
-            }
-            return match;
-        });
-    });
+    var matchedAllergens = menuItem.conflictAllergens || [];
+    var hasAllergy = !!menuItem.allergyConflict;
     var div = document.createElement('div');
     div.className = 'menu-item' + (hasAllergy ? ' has-allergy' : '');
     div.setAttribute('data-type', menuItem.type);
@@ -456,6 +452,12 @@ function createMenuItem(menuItem) {
     } else {
         allergensHtml = '<div class="menu-item-allergens text-success"><i class="fas fa-check"></i> Без аллергенов</div>';
     }
+    // Средняя оценка приходит вместе с меню (агрегат считается на сервере)
+    var ratingHtml = '';
+    if (menuItem.reviewCount) {
+        ratingHtml = '<div class="menu-item-rating mb-2"><span style="color:#f59e0b;">★</span> ' +
+            menuItem.rating.toFixed(1) + ' <span style="color:#94a3b8;">(' + menuItem.reviewCount + ')</span></div>';
+    }
     var allergyWarning = '';
     if (hasAllergy) {
         allergyWarning = '<div class="alert alert-warning mt-2"><i class="fas fa-exclamation-triangle"></i> Содержит ваши аллергены: <strong>' + matchedAllergens.join(', ') + '</strong></div>';
@@ -467,7 +469,7 @@ function createMenuItem(menuItem) {
         '</div>' +
         '<div class="menu-item-description">' + menuItem.description + '</div>' +
         '<div class="menu-item-calories mb-2"><i class="fas fa-fire"></i> ' + menuItem.calories + ' ккал</div>' +
-        allergensHtml + allergyWarning +
+        ratingHtml + allergensHtml + allergyWarning +
         '<div class="menu-item-footer mt-3">' +
             '<button class="btn btn-sm btn-primary order-btn" data-id="' + menuItem.id + '"><i class="fas fa-shopping-cart"></i> Заказать</button>' +
             '<button class="btn btn-sm btn-secondary info-btn" data-id="' + menuItem.id + '"><i class="fas fa-info-circle"></i> Подробнее</button>' +
@@ -485,26 +487,17 @@ function createMenuItem(menuItem) {
 function orderMenuItem(menuId) {
     var user = JSON.parse(sessionStorage.getItem('currentUser'));
     if (!user) return;
-    var allMenu = Database.getMenu();
-    var menuItem = allMenu.find(function (item) { return item.id === menuId; });
+    var menuItem = loadedMenuItems[menuId];
     if (!menuItem) { showNotification('Блюдо не найдено', 'error'); return; }
     if (user.balance < menuItem.price) {
         showNotification('Недостаточно средств на балансе', 'error');
         showPaymentModal();
         return;
     }
-    var userAllergies = user.allergies || [];
-    var menuAllergens = menuItem.allergens || [];
-    var hasAllergy = userAllergies.some(function (allergy) {
-        return menuAllergens.some(function (ma) {
-            return ma.toLowerCase().indexOf(allergy.toLowerCase()) !== -1 ||
-                   allergy.toLowerCase().indexOf(ma.toLowerCase()) !== -1;
-        });
-    });
-    if (hasAllergy) {
+    if (menuItem.allergyConflict) {
         if (!confirm('⚠️ Внимание!\n\nБлюдо "' + menuItem.name + '" содержит ваши аллергены!\n\nВы уверены, что хотите заказать его?')) return;
     }
-    Database.addOrder({
+    var order = Database.addOrder({
         studentId: user.id,
         studentName: user.name,
         menuId: menuId,
@@ -513,9 +506,15 @@ function orderMenuItem(menuId) {
         price: menuItem.price,
         paymentType: 'one_time'
     });
-    var newBalance = user.balance - menuItem.price;
-    Database.updateUser(user.id, { balance: newBalance });
-    user.balance = newBalance;
+    if (!order) { showNotification('Не удалось оформить заказ', 'error'); return; }
+    // Списание на сервере; ключ 'order-<id>' не даст списать за заказ дважды
+    try {
+        var charged = Database.chargeBalance(user.id, order.price, 'order-' + order.id, 'Заказ: ' + menuItem.name);
+        if (charged) user.balance = charged.balance;
+    } catch (err) {
+        showNotification(err.message, 'error');
+        return;
+    }
     sessionStorage.setItem('currentUser', JSON.stringify(user));
     updateUserInfo();
     showNotification('Заказ на "' + menuItem.name + '" оформлен успешно!', 'success');
@@ -608,11 +607,18 @@ function loadUserOrders(userId) {
 function payOrder(orderId) {
     var user = JSON.parse(sessionStorage.getItem('currentUser'));
     if (!user) return;
+    var pending = Database.getUserOrders(user.id).find(function (o) { return o.id === orderId; });
+    if (!pending) return;
+    var charged;
+    try {
+        charged = Database.chargeBalance(user.id, pending.price, 'order-' + orderId, 'Оплата заказа');
+    } catch (err) {
+        showNotification(err.message, 'error');
+        return;
+    }
     var order = Database.updateOrder(orderId, { status: 'paid' });
     if (order) {
-        var newBalance = user.balance - order.price;
-        Database.updateUser(user.id, { balance: newBalance });
-        user.balance = newBalance;
+        if (charged) user.balance = charged.balance;
         sessionStorage.setItem('currentUser', JSON.stringify(user));
         updateUserInfo();
         loadUserOrders(user.id);
@@ -633,10 +639,10 @@ function cancelOrder(orderId) {
     if (!user) return;
     var order = Database.updateOrder(orderId, { status: 'cancelled' });
     if (order) {
-        if (order.status === 'paid') {
-            var newBalance = user.balance + order.price;
-            Database.updateUser(user.id, { balance: newBalance });
-            user.balance = newBalance;
+        // Возврат списания за заказ (если оно было)
+        var refund = Database.refundPayment('order-' + orderId);
+        if (refund) {
+            user.balance = refund.balance;
             sessionStorage.setItem('currentUser', JSON.stringify(user));
             updateUserInfo();
         }
@@ -682,6 +688,8 @@ function showPaymentModal() {
     if (paymentAmount) paymentAmount.value = '100';
     var paymentTotal = document.getElementById('payment-total');
     if (paymentTotal) paymentTotal.textContent = '100';
+    // Один ключ на открытие окна: повторное нажатие не пополнит баланс дважды
+    var topUpTransactionId = 'topup-' + Date.now() + '-' + Math.random().toString(36).substr(2, 8);
     var oldConfirmButton = document.getElementById('confirm-payment');
     if (oldConfirmButton) {
         var newConfirmButton = oldConfirmButton.cloneNode(true);
@@ -711,9 +719,15 @@ function showPaymentModal() {
             }
             var user = JSON.parse(sessionStorage.getItem('currentUser'));
             if (!user) return;
-            var newBalance = (parseFloat(user.balance) || 0) + amount;
-            Database.updateUser(user.id, { balance: newBalance });
-            user.balance = newBalance;
+            var result;
+            try {
+                result = Database.topUpBalance(user.id, amount, 'card', topUpTransactionId);
+            } catch (err) {
+                showNotification(err.message, 'error');
+                return;
+            }
+            if (!result) { showNotification('Не удалось пополнить баланс', 'error'); return; }
+            user.balance = result.balance;
             sessionStorage.setItem('currentUser', JSON.stringify(user));
             updateUserInfo();
             modal.classList.remove('active');
@@ -771,9 +785,10 @@ function showMenuItemInfo(menuId) {
 // ========== ОТЗЫВЫ — ХРАНИЛИЩЕ =======================================
 // =====================================================================
 
-function getStoredReviews() {
+function getStoredReviews(userId) {
     if (typeof Database !== 'undefined' && typeof Database.getReviews === 'function') {
-        return Database.getReviews() || [];
+        // Сервер отдаёт новые первыми, страница ожидает хронологический порядок
+        return (Database.getReviews(userId) || []).slice().reverse();
     }
     try { return JSON.parse(localStorage.getItem('student_reviews')) || []; }
     catch (e) { return []; }
@@ -820,7 +835,7 @@ function loadUserReviews(userId) {
     injectReviewModalStyles();
     var user = JSON.parse(sessionStorage.getItem('currentUser'));
     if (!user) return;
-    var allReviews  = getStoredReviews();
+    var allReviews  = getStoredReviews(userId);
     var userReviews = allReviews.filter(function (r) { return r.userId === userId; });
     var html = '';
     html += '<div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:24px; flex-wrap:wrap; gap:12px;">';
@@ -1030,7 +1045,25 @@ function injectReviewModalStyles() {
 // =====================================================================
 
 function loadUserProfile(userId) {
-    // Профиль подгружается через updateUserInfo()
+    // Профиль подгружается через updateUserInfo(), здесь — калории по неделям
+    var tbody = document.querySelector('#calories-table tbody');
+    if (!tbody) return;
+    var weeks = Database.getStudentCalories(userId).reverse();
+    if (!weeks.length) {
+        tbody.innerHTML = '<tr><td colspan="6" class="text-center">Заказов за последние недели нет</td></tr>';
+        return;
+    }
+    tbody.innerHTML = weeks.map(function (w) {
+        var monday = new Date(w.week);
+        return '<tr>' +
+            '<td>с ' + monday.toLocaleDateString('ru-RU') + '</td>' +
+            '<td>' + w.days + '</td>' +
+            '<td>' + w.breakfasts + '</td>' +
+            '<td>' + w.lunches + '</td>' +
+            '<td>' + w.calories + ' ккал</td>' +
+            '<td>' + w.avgDailyCalories + ' ккал</td>' +
+            '</tr>';
+    }).join('');
 }
 
 
@@ -1054,16 +1087,34 @@ function loadUserProfile(userId) {
 // ========== АБОНЕМЕНТЫ — ХРАНИЛИЩЕ (localStorage) ====================
 // =====================================================================
 
-function subGetActive(userId) {
-    try {
-        return JSON.parse(localStorage.getItem('sub_active_' + userId)) || [];
-    } catch (e) { return []; }
-}
+// Активные абонементы хранятся на сервере (по ним ежедневно создаются заказы),
+// история операций — пока в localStorage.
+var SUB_PLAN_TO_CATALOG_TYPE = { breakfast: 'breakfast', lunch: 'lunch', full: 'complex' };
+var SUB_CATALOG_TYPE_TO_PLAN = { breakfast: 'breakfast', lunch: 'lunch', complex: 'full' };
 
-function subSaveActive(userId, data) {
-    try {
-        localStorage.setItem('sub_active_' + userId, JSON.stringify(data));
-    } catch (e) {}
+function subGetActive(userId) {
+    var subs = Database.getSubscriptions(userId, 'active');
+    var result = [];
+    for (var i = 0; i < subs.length; i++) {
+        var s = subs[i];
+        var catalogType = SUB_PLAN_TO_CATALOG_TYPE[s.planType];
+        var catalogItem = null;
+        for (var j = 0; j < SUB_CATALOG.length; j++) {
+            if (SUB_CATALOG[j].type === catalogType) { catalogItem = SUB_CATALOG[j]; break; }
+        }
+        result.push({
+            id: s.id,
+            name: catalogItem ? catalogItem.name : s.planType,
+            icon: catalogItem ? catalogItem.icon : '🎫',
+            type: catalogType,
+            startDate: s.startDate,
+            endDate: s.endDate,
+            totalDays: s.totalDays,
+            usedDays: s.usedDays,
+            status: s.status
+        });
+    }
+    return result;
 }
 
 function subGetHistory(userId) {
@@ -1657,35 +1708,28 @@ function subCheckout() {
         return;
     }
 
-    // ── Списание баланса ──
-    var newBalance = balance - total;
-    Database.updateUser(user.id, { balance: newBalance });
-    user.balance = newBalance;
-    sessionStorage.setItem('currentUser', JSON.stringify(user));
-
-    // ── Создаём активные абонементы и историю ──
-    var activeSubs = subGetActive(user.id);
-    var now = new Date();
-    var endDate = new Date(now);
-    endDate.setDate(endDate.getDate() + 30);
-    var nowStr = subDateStr(now);
-    var endStr = subDateStr(endDate);
-
+    // ── Создаём абонементы на сервере (стоимость списывается с баланса там же) ──
     for (var j = 0; j < subCart.length; j++) {
         var item = subCart[j];
+        var created;
+        try {
+            created = Database.createSubscription({
+                studentId: user.id,
+                planType: SUB_CATALOG_TYPE_TO_PLAN[item.type],
+                days: item.days,
+                price: item.price
+            });
+        } catch (err) {
+            showNotification('Не удалось оформить «' + item.name + '»: ' + err.message, 'error');
+            subCart = subCart.slice(j);
+            subUpdateCartCount();
+            loadUserSubscriptions(user.id);
+            return;
+        }
+        if (!created) continue;
 
-        // Новый активный абонемент
-        activeSubs.push({
-            id: subUid(),
-            name: item.name,
-            icon: item.icon,
-            type: item.type,
-            startDate: nowStr,
-            endDate: endStr,
-            totalDays: item.days,
-            usedDays: 0,
-            status: 'active'
-        });
+        user.balance = created.balance;
+        sessionStorage.setItem('currentUser', JSON.stringify(user));
 
         // Запись в историю
         subAddHistoryEntry(user.id, {
@@ -1696,8 +1740,6 @@ function subCheckout() {
         });
     }
 
-    subSaveActive(user.id, activeSubs);
-
     // ── Очищаем корзину ──
     subCart = [];
     subUpdateCartCount();